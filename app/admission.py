@@ -0,0 +1,228 @@
+"""
+Контроль допуска к оценке транзакций
+Адаптивный лимит одновременных запросов (AIMD по задержке), короткая очередь
+и быстрый отказ 503 с Retry-After вместо роста очередей и таймаутов
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Sequence
+
+from app.metrics import metrics
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Лимит одновременных запросов, подстраиваемый по задержке (AIMD)
+
+    - Ответ быстрее target_latency_ms при загруженном лимите (занято
+      не меньше половины) - лимит растет на 1/limit, т.е. примерно на 1
+      за каждые limit ответов
+    - Ответ медленнее target_latency_ms или с ошибкой 5xx - лимит
+      умножается на backoff, не чаще раза за target_latency_ms, чтобы
+      одна волна медленных ответов не обрушила лимит до минимума
+    - Сверх лимита запрос ждет в очереди до queue_size мест не дольше
+      queue_timeout_ms; при полной очереди или истечении ожидания -
+      отказ
+    - Синхронная оценка (модель) не отдает управление, и запросы копятся
+      не в очереди лимитера, а в очереди готовых задач цикла событий.
+      Эту очередь видно по задержке цикла (monitor_loop_lag): пока она
+      больше max_loop_lag_ms, новые запросы сразу отклоняются
+    - Задержка сравнивается с одной целью, поэтому запросы разной
+      стоимости (одиночные и пакетные) получают отдельные лимитеры
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 64,
+        min_limit: int = 4,
+        max_limit: int = 1024,
+        target_latency_ms: float = 100.0,
+        backoff: float = 0.9,
+        queue_size: int = 32,
+        queue_timeout_ms: float = 50.0,
+        max_loop_lag_ms: float = 0.0
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.target_latency_ms = target_latency_ms
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.loop_lag_ms = 0.0
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.shed_loop_lag = 0
+        self.decreases = 0
+        self.latency_ms = 0.0  # сглаженная задержка допущенных запросов
+
+    async def acquire(self) -> bool:
+        """Допуск запроса; False - запрос нужно отклонить"""
+        if self.max_loop_lag_ms and self.loop_lag_ms > self.max_loop_lag_ms:
+            self.shed_loop_lag += 1
+            return False
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.shed_timeout += 1
+            return False
+        except asyncio.CancelledError:
+            # Клиент ушел из очереди; место, выданное в тот же момент, возвращается
+            self._discard(waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake_waiters()
+            raise
+        self.admitted += 1
+        return True
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, latency_ms: float, failed: bool = False):
+        """Завершение допущенного запроса"""
+        self.in_flight -= 1
+        self.latency_ms += 0.1 * (latency_ms - self.latency_ms)
+
+        if failed or latency_ms > self.target_latency_ms:
+            now = time.monotonic()
+            if (now - self._last_decrease) * 1000 >= self.target_latency_ms:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.decreases += 1
+        elif self.in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        """Освободившиеся места - ожидающим по порядку"""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def monitor_loop_lag(self, interval: float = 0.01, shared: Sequence["AdaptiveConcurrencyLimiter"] = ()):
+        """Фоновая задача: задержка цикла событий относительно interval (и для лимитеров shared)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag_ms = max(0.0, (loop.time() - started - interval) * 1000)
+            for limiter in shared:
+                limiter.loop_lag_ms = self.loop_lag_ms
+
+    def get_statistics(self) -> Dict:
+        """Лимит, запросы в обработке и в очереди, отказы"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "shed": self.shed_queue_full + self.shed_timeout + self.shed_loop_lag,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "shed_loop_lag": self.shed_loop_lag,
+            "loop_lag_ms": round(self.loop_lag_ms, 3),
+            "limit_decreases": self.decreases,
+            "latency_ms": round(self.latency_ms, 3),
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware: запросы к путям paths (по префиксу) проходят через
+    лимитер, к batch_paths - через batch_limiter со своей целью задержки,
+    остальные - без ограничений (/health, статистика, WebSocket).
+    Отказ - 503 с Retry-After; задержка считается до отправки тела
+    ответа, фоновые задачи ответа в нее не входят.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiter: AdaptiveConcurrencyLimiter,
+        paths: Sequence[str],
+        retry_after: int = 1,
+        batch_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        batch_paths: Sequence[str] = ()
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.paths = tuple(paths)
+        self.batch_limiter = batch_limiter
+        self.batch_paths = tuple(batch_paths) if batch_limiter is not None else ()
+        body = json.dumps({"detail": "Сервис перегружен, повторите запрос позже"}, ensure_ascii=False)
+        self._reject_body = body.encode('utf-8')
+        self._reject_headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(self._reject_body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if self.batch_paths and path.startswith(self.batch_paths):
+            limiter = self.batch_limiter
+        elif path.startswith(self.paths):
+            limiter = self.limiter
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        with metrics.stage("admission"):
+            admitted = await limiter.acquire()
+        if not admitted:
+            await send({"type": "http.response.start", "status": 503, "headers": self._reject_headers})
+            await send({"type": "http.response.body", "body": self._reject_body})
+            return
+
+        started = time.perf_counter()
+        status = 500
+        released = False
+
+        async def send_tracked(message):
+            nonlocal status, released
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body") and not released:
+                released = True
+                limiter.release((time.perf_counter() - started) * 1000, failed=status >= 500)
+
+        try:
+            await self.app(scope, receive, send_tracked)
+        finally:
+            if not released:
+                limiter.release((time.perf_counter() - started) * 1000, failed=True)
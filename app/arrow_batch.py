@@ -0,0 +1,121 @@
+"""
+Колоночный обмен пакетами транзакций в формате Arrow IPC (stream)
+Столбцы запроса - поля TransactionRequest, ответ - столбцы результатов оценки
+"""
+from typing import Dict, List, NamedTuple, Sequence
+
+import numpy as np
+from pydantic import ValidationError
+
+from app.fastpath import transaction_decoder
+from app.ml.preprocessor import TransactionPreprocessor
+from app.models import TransactionRequest, TransactionResponse
+from app.ws_codec import RISK_LEVEL_CODES
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow - опциональная зависимость
+    pa = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Биты столбца flags
+FLAG_FRAUD = 1
+FLAG_REQUIRES_3DS = 2
+FLAG_SHOULD_BLOCK = 4
+
+RESULT_SCHEMA = pa.schema([
+    ("transaction_id", pa.string()),
+    ("fraud_probability", pa.float64()),
+    ("risk_score", pa.float64()),
+    ("risk_level", pa.uint8()),
+    ("flags", pa.uint8()),
+]) if pa is not None else None
+
+
+class ColumnBatch(NamedTuple):
+    """Пакет транзакций из Arrow IPC"""
+    # Числовые столбцы признаков модели (float64 без null - без копирования)
+    columns: Dict[str, np.ndarray]
+    types: List[str]
+    # Транзакции по строкам для анализа рисков и побочных эффектов
+    transactions: List
+    zero_copy_columns: int
+
+
+def read_batch(body: bytes, max_rows: int) -> ColumnBatch:
+    """
+    Разбор потока Arrow IPC
+
+    Каждая строка проверяется по правилам TransactionRequest;
+    null означает отсутствующее значение (значение по умолчанию),
+    лишние столбцы игнорируются.
+
+    Raises:
+        ValueError: некорректный поток, превышен max_rows или ошибка в строке
+    """
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"Некорректный поток Arrow IPC: {str(e)}")
+    if table.num_rows > max_rows:
+        raise ValueError(f"Слишком много строк: {table.num_rows} (максимум {max_rows})")
+
+    names = [name for name in table.column_names if name in TransactionRequest.model_fields]
+    table = table.select(names)
+
+    transactions = []
+    for row_number, row in enumerate(table.to_pylist()):
+        row = {name: value for name, value in row.items() if value is not None}
+        transaction = transaction_decoder.decode_dict(row)
+        if transaction is None:
+            try:
+                transaction = TransactionRequest.model_validate(row)
+            except ValidationError as e:
+                error = e.errors()[0]
+                location = ".".join(str(part) for part in error["loc"])
+                raise ValueError(f"Строка {row_number}, {location}: {error['msg']}")
+        transactions.append(transaction)
+
+    columns = {}
+    zero_copy_columns = 0
+    for name in TransactionPreprocessor.BALANCE_COLUMNS:
+        if name not in table.column_names:
+            continue
+        column = table.column(name)
+        if column.type == pa.float64() and column.null_count == 0 and column.num_chunks == 1:
+            columns[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+            zero_copy_columns += 1
+        else:
+            columns[name] = np.fromiter(
+                (getattr(transaction, name) for transaction in transactions),
+                dtype=np.float64, count=len(transactions)
+            )
+    if "amount" not in columns:
+        columns["amount"] = np.zeros(0)
+
+    types = [transaction.type.value for transaction in transactions]
+    return ColumnBatch(columns, types, transactions, zero_copy_columns)
+
+
+def write_results(responses: Sequence[TransactionResponse]) -> bytes:
+    """Поток Arrow IPC с результатами оценки по строкам запроса"""
+    flags = [
+        (FLAG_FRAUD if response.is_fraud else 0)
+        | (FLAG_REQUIRES_3DS if response.requires_3d_secure else 0)
+        | (FLAG_SHOULD_BLOCK if response.should_block else 0)
+        for response in responses
+    ]
+    batch = pa.record_batch([
+        pa.array([response.transaction_id for response in responses], pa.string()),
+        pa.array([response.fraud_probability for response in responses], pa.float64()),
+        pa.array([response.risk_score for response in responses], pa.float64()),
+        pa.array([RISK_LEVEL_CODES[response.risk_level.value] for response in responses], pa.uint8()),
+        pa.array(flags, pa.uint8()),
+    ], schema=RESULT_SCHEMA)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, RESULT_SCHEMA) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
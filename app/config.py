@@ -2,7 +2,7 @@
 Конфигурация приложения
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -16,11 +16,166 @@ class Settings(BaseSettings):
     # API настройки
     API_V1_PREFIX: str = "/api/v1"
     ALLOWED_ORIGINS: List[str] = ["*"]
+    FAST_DECODE_ENABLED: bool = True  # Разбор /api/v1/analyze без построения Pydantic модели (app/fastpath.py)
+    ARROW_BATCH_MAX_ROWS: int = 20_000  # Строк в пакете /api/v1/batch-analyze/arrow; не больше burst уровня ip
+
+    # Метрики задержки по этапам (app/metrics.py): /metrics в формате Prometheus
+    METRICS_ENABLED: bool = True
+    METRICS_PATHS: List[str] = [  # Пути (точно), для которых считается время запроса
+        "/api/v1/analyze", "/api/v1/batch-analyze", "/api/v1/batch-analyze/arrow"
+    ]
+    SERVER_TIMING_ENABLED: bool = True  # Заголовок Server-Timing с этапами запроса
+    # Скользящие окна 1m/5m/1h/24h в /api/v1/stats (services/live_stats.py)
+    LIVE_STATS_DIR: Optional[str] = "data/live_stats"  # Файлы окон воркеров; None - только свой процесс
+    LIVE_STATS_SCORE_BINS: int = 100  # Ячеек гистограммы вероятности на [0, 1]
+
+    # Ограничение частоты по клиентам: корзины токенов по X-API-Key и IP источника,
+    # пакеты списывают по токену на строку
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PATHS: List[str] = ["/api/v1/analyze", "/api/v1/batch-analyze"]  # Префиксы путей
+    RATE_LIMIT_TIERS: Dict[str, Dict[str, float]] = {  # rate - токенов в секунду, burst - емкость
+        "ip": {"rate": 1000.0, "burst": 20_000.0},  # Для каждого IP источника
+        "default": {"rate": 200.0, "burst": 5_000.0},  # Ключи без уровня в RATE_LIMIT_API_KEYS
+        "premium": {"rate": 2000.0, "burst": 100_000.0},
+    }
+    RATE_LIMIT_API_KEYS: Dict[str, str] = {}  # API-ключ -> уровень
+    RATE_LIMIT_MAX_CLIENTS: int = 100_000  # Корзин в памяти; дольше всех простаивающие вытесняются
+    RATE_LIMIT_BACKEND_URL: str = "memory://"  # redis://host:port - общие корзины для всех воркеров
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # IP из X-Forwarded-For (только за доверенным прокси)
+
+    # Контроль допуска к оценке: адаптивный лимит одновременных запросов (AIMD),
+    # короткая очередь и отказ 503 с Retry-After; /health и статистика не ограничиваются
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_PATHS: List[str] = ["/api/v1/analyze"]  # Префиксы путей
+    ADMISSION_INITIAL_LIMIT: int = 64
+    ADMISSION_MIN_LIMIT: int = 4
+    ADMISSION_MAX_LIMIT: int = 1024
+    ADMISSION_TARGET_LATENCY_MS: float = 100.0  # Ответы дольше уменьшают лимит
+    ADMISSION_BACKOFF: float = 0.9
+    ADMISSION_QUEUE_SIZE: int = 32
+    ADMISSION_QUEUE_TIMEOUT_MS: float = 50.0
+    ADMISSION_MAX_LOOP_LAG_MS: float = 50.0  # Задержка цикла событий, выше которой запросы отклоняются; 0 - выкл.
+    ADMISSION_RETRY_AFTER: int = 1  # Секунды
+    # Пакеты - отдельный лимитер: их задержка растет с числом строк и не должна
+    # уменьшать лимит одиночных запросов; задержка цикла событий - общая
+    ADMISSION_BATCH_PATHS: List[str] = ["/api/v1/batch-analyze"]  # Префиксы путей
+    ADMISSION_BATCH_INITIAL_LIMIT: int = 8
+    ADMISSION_BATCH_MIN_LIMIT: int = 1
+    ADMISSION_BATCH_MAX_LIMIT: int = 64
+    ADMISSION_BATCH_TARGET_LATENCY_MS: float = 2000.0
+    ADMISSION_BATCH_QUEUE_SIZE: int = 8
+    ADMISSION_BATCH_QUEUE_TIMEOUT_MS: float = 200.0
+
+    # Прием транзакций через Unix-сокет для шлюзов на том же хосте (app/uds_client.py)
+    UDS_PATH: Optional[str] = None  # Например /run/fraudguard/scoring.sock; None - выключено
+    UDS_MAX_IN_FLIGHT: int = 256  # Запросов в обработке на соединение
+    UDS_MAX_FRAME_BYTES: int = 1024 * 1024
+
+    # Режим потребителя журнала (consume.py): NDJSON-сегменты -> журнал решений
+    CONSUMER_LOG_DIR: str = "data/stream/in"
+    CONSUMER_OUTPUT_DIR: str = "data/stream/out"
+    CONSUMER_BATCH_SIZE: int = 500
+    CONSUMER_PARALLELISM: int = 4  # Разделов в обработке одновременно
+    CONSUMER_POLL_INTERVAL: float = 0.5
 
     # ML модель
     MODEL_PATH: str = "data/models/fraud_model.json"
     FRAUD_THRESHOLD: float = 0.5  # Порог для классификации как мошенничество
 
+    # Срок ответа /api/v1/analyze и деградация модели
+    REQUEST_DEADLINE_MS: float = 200.0  # Если нет заголовка X-Deadline-Ms
+    DEADLINE_RESERVE_MS: float = 5.0  # Остаток срока на правила и ответ после модели
+    MODEL_CACHE_SIZE: int = 10_000  # Последние предсказания модели по признакам
+    MODEL_BREAKER_SLOW_MS: float = 50.0  # Вызов модели дольше - медленный
+    MODEL_BREAKER_SLOW_RATE: float = 0.5  # Доля медленных вызовов, размыкающая цепь
+    MODEL_BREAKER_WINDOW: int = 20  # Последние вызовы для расчета доли
+    MODEL_BREAKER_OPEN_SECONDS: float = 5.0  # Затем пробные вызовы
+    MODEL_BREAKER_HALF_OPEN_CALLS: int = 3
+
+    # Граф переводов (nameOrig → nameDest)
+    TRANSFER_GRAPH_WINDOW_SECONDS: float = 3600.0  # Окно для входящих/исходящих переводов
+    TRANSFER_GRAPH_RETENTION_SECONDS: float = 7 * 24 * 3600.0
+    TRANSFER_GRAPH_MAX_HOPS: int = 3
+    TRANSFER_GRAPH_ARCHIVE_PATH: Optional[str] = None  # CSV архив PaySim для начальной загрузки
+    TRANSFER_GRAPH_PRUNE_INTERVAL: float = 600.0  # Удаление ребер старше срока хранения, секунды
+    # Подтвержденные мошеннические счета (по счету в строке), общие для воркеров
+    FRAUD_LABELS_PATH: Optional[str] = "data/fraud_labels.txt"
+    FRAUD_LABELS_POLL_INTERVAL: float = 5.0  # Чтение меток других воркеров, секунды
+
+    # Непрерывность балансов счетов
+    BALANCE_TRACKER_MAX_ACCOUNTS: int = 1_000_000
+    BALANCE_TRACKER_SNAPSHOT_PATH: Optional[str] = "data/balances_snapshot.json"  # Файл воркера: balances_snapshot.<pid>.json
+
+    # Локальные индексы обогащения (CSV компилируется в *.idx рядом с файлом)
+    IP_RANGES_PATH: Optional[str] = "data/enrichment/ip_ranges.csv"
+    BIN_RANGES_PATH: Optional[str] = "data/enrichment/bin_ranges.csv"
+    DATA_FILES_RELOAD_INTERVAL: float = 60.0  # Проверка новых файлов индексов и списков, секунды
+
+    # Списки блокировки (<kind>.txt в каталоге импортируются при изменении)
+    BLOCKLIST_DIR: str = "data/blocklists"
+    BLOCKLIST_FP_RATE: float = 0.001  # Вероятность ложного срабатывания фильтра Блума
+
+    # Индекс похожих устройств (MinHash/LSH)
+    DEVICE_INDEX_CAPACITY: int = 200_000  # Бюджет записей: capacity * 32 * 4 байт сигнатур
+    DEVICE_INDEX_WINDOW_SECONDS: float = 24 * 3600.0
+    DEVICE_INDEX_SIMILARITY: float = 0.8
+    DEVICE_INDEX_MAX_CLUSTER_SHARE: float = 0.01  # Больше похожих (доля записей окна) - массовый отпечаток, не сигнал
+
+    # Хранилище доказательств (chargeback)
+    EVIDENCE_DB_PATH: str = "data/evidence.db"
+    EVIDENCE_CACHE_SIZE: int = 10_000  # Горячие записи в памяти
+    EVIDENCE_RETENTION_DAYS: float = 180.0  # Окно chargeback 120+ дней
+    EVIDENCE_BATCH_SIZE: int = 200
+    EVIDENCE_FLUSH_INTERVAL: float = 1.0  # Секунды
+    EVIDENCE_PURGE_INTERVAL: float = 3600.0  # Секунды
+
+    # Индекс сущностей для расследований (IP, устройство, карта, email, получатель)
+    ENTITY_INDEX_SNAPSHOT_PATH: Optional[str] = "data/entity_index.bin"  # Файл воркера: entity_index.<pid>.bin
+    ENTITY_INDEX_MAX_FANOUT: int = 10_000  # Сущности с большим числом транзакций не раскрываются
+    SNAPSHOT_INTERVAL: float = 300.0  # Периодическая запись снимков воркера, секунды
+    LINKED_MAX_HOPS: int = 3
+    LINKED_MAX_LIMIT: int = 10_000  # Наибольший limit в /api/v1/linked
+
+    # Конвейер побочных эффектов после решения (политики: block, drop_oldest, spill)
+    SIDE_EFFECT_QUEUE_SIZE: int = 10_000  # Событий в очереди приемника
+    SIDE_EFFECT_BATCH_SIZE: int = 100
+    SIDE_EFFECT_SPILL_DIR: str = "data/spill"
+    SIDE_EFFECT_DRAIN_TIMEOUT: float = 5.0  # Секунды на обработку очередей при остановке
+    EVIDENCE_SINK_OVERFLOW: str = "spill"
+    BROADCAST_SINK_OVERFLOW: str = "drop_oldest"
+    FRONTEND_FILE_SINK_OVERFLOW: str = "drop_oldest"
+
+    # Двухфазные решения: /api/v1/analyze отвечает предварительным решением
+    # (модель + проверки без состояния), окончательное уходит в webhook и WebSocket
+    TWO_PHASE_ENABLED: bool = False
+    PROVISIONAL_DEADLINE_MS: float = 50.0  # Срок предварительного решения, если нет X-Deadline-Ms
+    REFINEMENT_QUEUE_SIZE: int = 10_000
+    REFINEMENT_BATCH_SIZE: int = 100
+    REFINEMENT_SINK_OVERFLOW: str = "spill"
+    WEBHOOK_URL: Optional[str] = None  # POST {"decisions": [...]}; None - выключено
+    WEBHOOK_BATCH_SIZE: int = 100
+    WEBHOOK_MAX_RETRIES: int = 5
+    WEBHOOK_RETRY_BACKOFF: float = 0.5  # Секунды, удваивается с каждой попыткой
+    WEBHOOK_MAX_RETRY_DELAY: Optional[float] = None  # Предел Retry-After, секунды; None - последний шаг повторов
+    WEBHOOK_TIMEOUT: float = 5.0
+    WEBHOOK_SINK_OVERFLOW: str = "spill"
+
+    # WebSocket: очередь сообщений на клиента и политика для медленных клиентов
+    WS_CLIENT_QUEUE_SIZE: int = 100
+    WS_SLOW_CLIENT_POLICY: str = "drop_oldest"  # drop_oldest или disconnect
+    WS_MIN_FRAME_INTERVAL_MS: int = 50  # Минимальный интервал кадров подписки
+    WS_MAX_EVENTS_PER_FRAME: int = 200  # Остальные события кадра сводятся в summary
+    WS_BINARY_FRAME_INTERVAL_MS: int = 100  # Пакетные кадры бинарного подпротокола
+    WS_REPLAY_BUFFER_SIZE: int = 10_000  # Последние события для переподключения с ?since=<seq>
+
+    # Рассылка между воркерами: memory:// для одного процесса,
+    # redis://host:port для нескольких (Redis или python -m app.pubsub)
+    BROADCAST_URL: str = "memory://"
+    WS_PUBLISH_INTERVAL_MS: int = 20  # Пакетная публикация
+    WS_PUBLISH_BATCH_SIZE: int = 500
+    WS_PUBLISH_MAX_BUFFERED: int = 50_000  # Сообщений в буфере при недоступном pub/sub, сверх - только локальная доставка
+    WS_SUBSCRIBE_TIMEOUT: float = 5.0  # Секунд на подписку при старте воркера
+
     # База данных (опционально)
     DATABASE_URL: str = "sqlite:///./fraudguard.db"
 
@@ -0,0 +1,35 @@
+"""
+Срок обработки запроса
+Бюджет в миллисекундах от момента приема, этапы проверяют остаток
+"""
+import time
+from typing import Optional
+
+
+class Deadline:
+    """
+    Срок ответа на запрос
+
+    Бюджет задается заголовком X-Deadline-Ms (миллисекунды от приема
+    запроса) или настройкой по умолчанию. Этапы оценки сравнивают
+    remaining_ms() с ожидаемой длительностью и при нехватке выбирают
+    более дешевый путь.
+    """
+
+    __slots__ = ("budget_ms", "started", "expires")
+
+    def __init__(self, budget_ms: float, started: Optional[float] = None):
+        self.budget_ms = budget_ms
+        self.started = time.monotonic() if started is None else started
+        self.expires = self.started + budget_ms / 1000
+
+    def remaining_ms(self) -> float:
+        """Остаток бюджета (отрицательный после истечения срока)"""
+        return (self.expires - time.monotonic()) * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
@@ -0,0 +1,280 @@
+"""
+Быстрый путь приема транзакций
+Разбор тела запроса без построения Pydantic модели и кодирование ответа сразу в байты
+"""
+import operator
+import re
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, get_args, get_origin
+
+import orjson
+from annotated_types import Ge, Gt, Le, Lt
+from fastapi import BackgroundTasks, Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+from pydantic_core import PydanticUndefined
+
+from app.config import settings
+from app.metrics import metrics
+from app.models import TransactionRequest
+
+# ISO 8601, который принимают и Pydantic, и datetime.fromisoformat
+_ISO_DATETIME = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?(Z|[+-]\d{2}:\d{2})?"
+)
+
+# Ограничения Field(gt=..., ge=..., lt=..., le=...)
+_BOUNDS = {Gt: operator.gt, Ge: operator.ge, Lt: operator.lt, Le: operator.le}
+
+# Условие приема значения v (канонические JSON-типы) и преобразование
+_TYPE_CHECKS = {
+    str: ("type(v) is str", "v"),
+    int: ("type(v) is int", "v"),
+    bool: ("type(v) is bool", "v"),
+    float: ("type(v) is float or type(v) is int", "float(v)"),
+    datetime: ("type(v) is str and iso_datetime(v) is not None", "datetime.fromisoformat(v)"),
+}
+
+
+def _field_source(name: str, field: FieldInfo, namespace: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
+    """
+    Код разбора одного поля для сгенерированного декодера
+
+    Returns:
+        Строка присваивания значения по умолчанию (None для обязательного
+        поля) и функция set_<поле>(r, v). Функция принимает только
+        канонические JSON-значения (число для float, true/false для bool
+        и т.д.) и возвращает False на остальных, в том числе при ошибке
+        преобразования, - тогда запрос проверяется моделью.
+    """
+    annotation = field.annotation
+    optional = get_origin(annotation) is Union and type(None) in get_args(annotation)
+    if optional:
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        namespace[f"members_{name}"] = {member.value: member for member in annotation}
+        condition = f"type(v) is str and v in members_{name}"
+        value = f"members_{name}[v]"
+    elif annotation in _TYPE_CHECKS:
+        condition, value = _TYPE_CHECKS[annotation]
+    else:
+        raise TypeError(f"Неподдерживаемый тип поля {name}: {annotation}")
+
+    for item in field.metadata:
+        compare = _BOUNDS.get(type(item))
+        if compare is not None:
+            bound = f"bound_{name}_{compare.__name__}"
+            namespace[bound] = getattr(item, compare.__name__)
+            namespace[compare.__name__] = compare
+            condition = f"({condition}) and {compare.__name__}({value}, {bound})"
+
+    if field.is_required():
+        default = None
+    elif field.default_factory is not None:
+        namespace[f"factory_{name}"] = field.default_factory
+        default = f"    r.{name} = factory_{name}()"
+    else:
+        namespace[f"default_{name}"] = None if field.default is PydanticUndefined else field.default
+        default = f"    r.{name} = default_{name}"
+
+    setter = [f"def set_{name}(r, v):"]
+    if optional:
+        setter += ["    if v is None:", f"        r.{name} = None", "        return True"]
+    # Несуществующие даты (2024-02-30, смещение +25:00) проходят шаблон, но не fromisoformat
+    setter += [
+        "    try:",
+        f"        if {condition}:",
+        f"            r.{name} = {value}",
+        "            return True",
+        "    except ValueError:",
+        "        pass",
+        "    return False",
+    ]
+    return default, setter
+
+
+class TransactionRecord:
+    """
+    Транзакция, принятая быстрым путем
+
+    Те же атрибуты, что у TransactionRequest, в __slots__
+    без служебного состояния модели.
+    """
+
+    __slots__ = tuple(TransactionRequest.model_fields)
+
+    def model_dump(self, mode: str = "python") -> Dict[str, Any]:
+        """Поля записи (совместимо с BaseModel.model_dump)"""
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if mode == "json":
+            for name, value in data.items():
+                if isinstance(value, Enum):
+                    data[name] = value.value
+                elif isinstance(value, datetime):
+                    data[name] = value.isoformat()
+        return data
+
+
+class TransactionDecoder:
+    """
+    Декодер тела запроса в TransactionRecord
+
+    Функция разбора генерируется один раз из TransactionRequest.model_fields
+    (типы, Optional, gt/ge, значения по умолчанию) плюс валидатор amount
+    модели; лишние поля игнорируются, как в модели. Запрос, который
+    быстрый путь не принимает, обрабатывается обычным путем FastAPI,
+    поэтому результат и ошибки валидации не меняются.
+    """
+
+    def __init__(self, model=TransactionRequest):
+        self.model = model
+        self._decode_fast = self._compile(model)
+        self.fast = 0
+        self.fallback = 0
+
+    @staticmethod
+    def _compile(model) -> Callable[[Dict[str, Any]], Optional[TransactionRecord]]:
+        """
+        Функция разбора словаря запроса
+
+        Значения по умолчанию присваиваются одной линейной последовательностью,
+        присланные поля проверяются функциями set_<поле> по словарю.
+        """
+        namespace: Dict[str, Any] = {
+            "Record": TransactionRecord,
+            "datetime": datetime,
+            "iso_datetime": _ISO_DATETIME.fullmatch,
+            "validate_amount": model.validate_amount,
+        }
+        setters, defaults, required = [], [], []
+        for name, field in model.model_fields.items():
+            default, setter = _field_source(name, field, namespace)
+            setters += setter
+            if default is None:
+                required.append(name)
+            else:
+                defaults.append(default)
+
+        lines = setters + [
+            "setters_get = {%s}.get" % ", ".join(f"{name!r}: set_{name}" for name in model.model_fields),
+            "def decode_fast(data):",
+            *(f"    if {name!r} not in data: return None" for name in required),
+            "    r = Record()",
+            *defaults,
+            "    for k, v in data.items():",
+            "        setter = setters_get(k)",
+            "        if setter is not None and not setter(r, v):",
+            "            return None",
+            "    try:",
+            "        r.amount = validate_amount(r.amount)",
+            "    except ValueError:",
+            "        return None",
+            "    return r",
+        ]
+        exec(compile("\n".join(lines), f"<{model.__name__} decoder>", "exec"), namespace)
+        return namespace["decode_fast"]
+
+    def decode(self, body: bytes) -> Optional[TransactionRecord]:
+        """
+        Разбор тела запроса
+
+        Returns:
+            Запись транзакции или None, если запрос нужно проверить моделью
+            (некорректный JSON, нестандартные значения, ошибки валидации)
+        """
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            data = None
+        record = self._decode_fast(data) if type(data) is dict else None
+        if record is None:
+            self.fallback += 1
+        else:
+            self.fast += 1
+        return record
+
+    def decode_dict(self, data: Dict[str, Any]) -> Optional[TransactionRecord]:
+        """Запись транзакции из уже разобранных данных (None - проверить моделью)"""
+        return self._decode_fast(data)
+
+    def get_statistics(self) -> Dict[str, int]:
+        """Число запросов, принятых быстрым путем и проверенных моделью"""
+        return {"fast": self.fast, "fallback": self.fallback}
+
+
+transaction_decoder = TransactionDecoder()
+
+
+def encode_response(response: BaseModel) -> bytes:
+    """
+    JSON ответа без повторной валидации response_model
+
+    Модель ответа уже проверена при создании; orjson кодирует
+    перечисления значением и datetime в UTC с суффиксом Z, как Pydantic.
+    """
+    return orjson.dumps(response.__dict__, option=orjson.OPT_UTC_Z)
+
+
+def _is_json(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return True
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type == "application/json" or (
+        media_type.startswith("application/") and media_type.endswith("+json")
+    )
+
+
+class FastDecodeRoute(APIRoute):
+    """
+    Маршрут с быстрым разбором тела запроса
+
+    Эндпоинт вызывается как endpoint(transaction, background_tasks,
+    **заголовки), ответ кодируется encode_response. Параметры-заголовки
+    эндпоинта проверяются их полями FastAPI. Сигнатура, response_model
+    и схема OpenAPI остаются прежними; запросы, не принятые
+    TransactionDecoder, с невалидными заголовками и при
+    FAST_DECODE_ENABLED=false идут через обычный обработчик FastAPI.
+    """
+
+    def get_route_handler(self) -> Callable:
+        default_handler = super().get_route_handler()
+        if not settings.FAST_DECODE_ENABLED:
+            return default_handler
+        endpoint = self.endpoint
+        status_code = self.status_code or 200
+        header_params = self.dependant.header_params
+
+        async def handler(request: Request) -> Response:
+            transaction = None
+            if _is_json(request.headers.get("content-type")):
+                body = await request.body()
+                with metrics.stage("decode"):
+                    transaction = transaction_decoder.decode(body)
+            if transaction is None:
+                return await default_handler(request)
+
+            headers = {}
+            for field in header_params:
+                value = request.headers.get(field.alias)
+                if value is not None:
+                    value, errors = field.validate(value, headers, loc=("header", field.alias))
+                    if errors:
+                        return await default_handler(request)
+                headers[field.name] = field.default if value is None else value
+
+            background_tasks = BackgroundTasks()
+            result = await endpoint(transaction, background_tasks, **headers)
+            with metrics.stage("serialize"):
+                content = encode_response(result)
+            return Response(
+                content,
+                status_code=status_code,
+                media_type="application/json",
+                background=background_tasks
+            )
+
+        return handler
+
@@ -2,28 +2,53 @@
 FraudGuard AI - Главное FastAPI приложение
 Облачный сервис для обнаружения мошенничества в реальном времени
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, FastAPI, HTTPException, BackgroundTasks, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
 import logging
 from datetime import datetime, timezone
-from typing import Optional, List
+from typing import Annotated, Optional, List
 import numpy as np
 
 from app.models import (
     TransactionRequest,
     TransactionResponse,
     RiskAssessment,
-    HealthCheck
+    HealthCheck,
+    BlocklistUpdate,
+    EvidenceExportRequest,
+    FraudLabels
 )
 from app.ml.fraud_detector import FraudDetector
+from app.deadline import Deadline
 from services.risk_analyzer import RiskAnalyzer
 from services.evidence_collector import EvidenceCollector
+from services.evidence_export import stream_export
+from services.transfer_graph import FraudLabelFeed, TransferGraph
+from services.balance_tracker import BalanceTracker
+from services.enrichment import EnrichmentService
+from services.blocklist import BlocklistManager, BLOCKLIST_KINDS
+from services.device_similarity import DeviceSimilarityIndex
+from services.entity_index import EntityIndex
+from services.side_effects import DecisionEvent, SideEffectPipeline, Sink
+from services.refinement import DecisionRefiner
+from services.webhook import WebhookSender
+from services.live_stats import LiveStatistics
 from app.config import settings
-from app.ws import manager, broadcast_analysis
+from app.fastpath import FastDecodeRoute, transaction_decoder
+from app.arrow_batch import ARROW_STREAM_MEDIA_TYPE
+import app.arrow_batch as arrow_batch
+from app.uds import ScoringServer
+from app.admission import AdaptiveConcurrencyLimiter, AdmissionControlMiddleware
+from app.rate_limit import RateLimiter, RateLimitMiddleware, charge_rows
+from app.metrics import MetricsMiddleware, format_metric, metrics
+from app.ws import manager, broadcast_analysis, SubscriptionFilter, start_broadcasting, stop_broadcasting
+import app.ws as ws
+import asyncio
 import json
 import os
+import time
 
 # Настройка логирования
 logging.basicConfig(
@@ -36,12 +61,23 @@ logger = logging.getLogger(__name__)
 fraud_detector: Optional[FraudDetector] = None
 risk_analyzer: Optional[RiskAnalyzer] = None
 evidence_collector: Optional[EvidenceCollector] = None
+blocklist_manager: Optional[BlocklistManager] = None
+fraud_labels: Optional[FraudLabelFeed] = None
+entity_index: Optional[EntityIndex] = None
+side_effects: Optional[SideEffectPipeline] = None
+scoring_server: Optional[ScoringServer] = None
+refiner: Optional[DecisionRefiner] = None
+refinement: Optional[SideEffectPipeline] = None
+webhook_sender: Optional[WebhookSender] = None
+live_stats: Optional[LiveStatistics] = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
-    global fraud_detector, risk_analyzer, evidence_collector
+    global fraud_detector, risk_analyzer, evidence_collector, blocklist_manager, entity_index, side_effects
+    global fraud_labels
+    global scoring_server, refiner, refinement, webhook_sender, live_stats
 
     # Инициализация при запуске
     logger.info("Инициализация FraudGuard AI...")
@@ -52,14 +88,142 @@ async def lifespan(app: FastAPI):
         await fraud_detector.load_model()
         logger.info("✓ Модель машинного обучения загружена")
 
+        # Граф переводов между счетами
+        graph_params = dict(
+            window_seconds=settings.TRANSFER_GRAPH_WINDOW_SECONDS,
+            retention_seconds=settings.TRANSFER_GRAPH_RETENTION_SECONDS,
+            max_hops=settings.TRANSFER_GRAPH_MAX_HOPS
+        )
+        if settings.TRANSFER_GRAPH_ARCHIVE_PATH and os.path.exists(settings.TRANSFER_GRAPH_ARCHIVE_PATH):
+            transfer_graph = TransferGraph.from_archive(settings.TRANSFER_GRAPH_ARCHIVE_PATH, **graph_params)
+        else:
+            transfer_graph = TransferGraph(**graph_params)
+        fraud_labels = FraudLabelFeed(transfer_graph, settings.FRAUD_LABELS_PATH)
+        fraud_labels.poll()
+        graph_task = asyncio.create_task(_maintain_transfer_graph_periodically(transfer_graph, fraud_labels))
+        logger.info("✓ Граф переводов инициализирован")
+
+        # Последние известные балансы счетов
+        balance_tracker = BalanceTracker(
+            max_accounts=settings.BALANCE_TRACKER_MAX_ACCOUNTS,
+            snapshot_path=settings.BALANCE_TRACKER_SNAPSHOT_PATH
+        )
+        balance_tracker.load_snapshot()
+        logger.info("✓ Трекер балансов инициализирован")
+
+        # Локальные индексы IP и BIN
+        enrichment = EnrichmentService(
+            ip_ranges_path=settings.IP_RANGES_PATH,
+            bin_ranges_path=settings.BIN_RANGES_PATH
+        )
+        enrichment.reload()
+        logger.info("✓ Индексы обогащения инициализированы")
+
+        # Списки блокировки
+        blocklist_manager = BlocklistManager(settings.BLOCKLIST_DIR, settings.BLOCKLIST_FP_RATE)
+        blocklist_manager.reload()
+        logger.info("✓ Списки блокировки загружены")
+
+        # Индекс похожих устройств
+        device_index = DeviceSimilarityIndex(
+            capacity=settings.DEVICE_INDEX_CAPACITY,
+            window_seconds=settings.DEVICE_INDEX_WINDOW_SECONDS,
+            similarity_threshold=settings.DEVICE_INDEX_SIMILARITY,
+            max_cluster_share=settings.DEVICE_INDEX_MAX_CLUSTER_SHARE
+        )
+        logger.info("✓ Индекс похожих устройств инициализирован")
+
+        reload_task = asyncio.create_task(
+            _reload_data_files_periodically(enrichment, blocklist_manager)
+        )
+        loop_lag_task = asyncio.create_task(admission_limiter.monitor_loop_lag(shared=[batch_admission_limiter]))
+
+        # Скользящие окна статистики решений (общие для воркеров через LIVE_STATS_DIR)
+        live_stats = LiveStatistics(settings.LIVE_STATS_DIR, score_bins=settings.LIVE_STATS_SCORE_BINS)
+        live_stats_task = asyncio.create_task(_flush_live_stats_periodically(live_stats))
+        logger.info("✓ Скользящие окна статистики инициализированы")
+
         # Инициализация анализатора рисков
-        risk_analyzer = RiskAnalyzer()
+        risk_analyzer = RiskAnalyzer(
+            transfer_graph=transfer_graph,
+            balance_tracker=balance_tracker,
+            enrichment=enrichment,
+            blocklists=blocklist_manager,
+            device_index=device_index
+        )
         logger.info("✓ Анализатор рисков инициализирован")
 
+        # Индекс сущностей для поиска связанных транзакций
+        entity_index = EntityIndex(
+            snapshot_path=settings.ENTITY_INDEX_SNAPSHOT_PATH,
+            max_fanout=settings.ENTITY_INDEX_MAX_FANOUT
+        )
+        entity_index.load_snapshot()
+        snapshot_task = asyncio.create_task(_save_snapshots_periodically(entity_index, balance_tracker))
+        logger.info("✓ Индекс сущностей инициализирован")
+
         # Инициализация сборщика доказательств
-        evidence_collector = EvidenceCollector()
+        evidence_collector = EvidenceCollector(entity_index=entity_index)
+        await evidence_collector.purge_expired()
+        evidence_task = asyncio.create_task(_maintain_evidence_periodically(evidence_collector))
         logger.info("✓ Сборщик доказательств инициализирован")
 
+        # Рассылка результатов через pub/sub (общая для всех воркеров)
+        await start_broadcasting()
+        logger.info(f"✓ Рассылка WebSocket через {settings.BROADCAST_URL.split('://', 1)[0]}")
+
+        # Конвейер побочных эффектов после решения
+        sinks = [
+            _side_effect_sink("evidence", _log_transactions, settings.EVIDENCE_SINK_OVERFLOW),
+            _side_effect_sink("broadcast", _broadcast_analyses, settings.BROADCAST_SINK_OVERFLOW),
+            _side_effect_sink("frontend_file", _save_decisions_to_file, settings.FRONTEND_FILE_SINK_OVERFLOW),
+        ]
+        if settings.WEBHOOK_URL:
+            webhook_sender = WebhookSender(
+                settings.WEBHOOK_URL,
+                timeout=settings.WEBHOOK_TIMEOUT,
+                max_retries=settings.WEBHOOK_MAX_RETRIES,
+                retry_backoff=settings.WEBHOOK_RETRY_BACKOFF,
+                max_retry_delay=settings.WEBHOOK_MAX_RETRY_DELAY
+            )
+            sinks.append(_side_effect_sink(
+                "webhook", webhook_sender.send, settings.WEBHOOK_SINK_OVERFLOW,
+                batch_size=settings.WEBHOOK_BATCH_SIZE
+            ))
+        side_effects = SideEffectPipeline(sinks)
+        side_effects.start()
+        logger.info("✓ Конвейер побочных эффектов запущен")
+
+        # Уточнение предварительных решений
+        if settings.TWO_PHASE_ENABLED:
+            refiner = DecisionRefiner(
+                risk_analyzer,
+                _finalize_decision,
+                _publish_final_decision,
+                deadline_ms=settings.PROVISIONAL_DEADLINE_MS
+            )
+            refinement = SideEffectPipeline([Sink(
+                "refinement",
+                refiner.refine_batch,
+                capacity=settings.REFINEMENT_QUEUE_SIZE,
+                batch_size=settings.REFINEMENT_BATCH_SIZE,
+                overflow=settings.REFINEMENT_SINK_OVERFLOW,
+                spill_dir=settings.SIDE_EFFECT_SPILL_DIR
+            )])
+            refinement.start()
+            logger.info(f"✓ Двухфазные решения: срок предварительного {settings.PROVISIONAL_DEADLINE_MS} мс")
+
+        # Прием транзакций через Unix-сокет
+        if settings.UDS_PATH:
+            scoring_server = ScoringServer(
+                settings.UDS_PATH,
+                _score_unix_socket,
+                max_in_flight=settings.UDS_MAX_IN_FLIGHT,
+                max_frame_bytes=settings.UDS_MAX_FRAME_BYTES
+            )
+            await scoring_server.start()
+            logger.info(f"✓ Unix-сокет {settings.UDS_PATH} принимает транзакции")
+
         logger.info("🚀 FraudGuard AI успешно запущен!")
 
     except Exception as e:
@@ -70,9 +234,42 @@ async def lifespan(app: FastAPI):
 
     # Очистка при завершении
     logger.info("Завершение работы FraudGuard AI...")
+    if scoring_server is not None:
+        await scoring_server.close()
+        scoring_server = None
+    if refinement is not None:
+        await refinement.stop(settings.SIDE_EFFECT_DRAIN_TIMEOUT)
+    if side_effects is not None:
+        await side_effects.stop(settings.SIDE_EFFECT_DRAIN_TIMEOUT)
+    if webhook_sender is not None:
+        await webhook_sender.close()
+    await rate_limiter.close()
+    await stop_broadcasting()
+    reload_task.cancel()
+    graph_task.cancel()
+    loop_lag_task.cancel()
+    live_stats_task.cancel()
+    if live_stats is not None:
+        live_stats.close()
+    evidence_task.cancel()
+    snapshot_task.cancel()
+    if evidence_collector is not None:
+        evidence_collector.close()
+    if risk_analyzer is not None and risk_analyzer.balance_tracker is not None:
+        risk_analyzer.balance_tracker.save_snapshot()
+    if entity_index is not None:
+        entity_index.save_snapshot()
     fraud_detector = None
     risk_analyzer = None
     evidence_collector = None
+    blocklist_manager = None
+    fraud_labels = None
+    entity_index = None
+    side_effects = None
+    refiner = None
+    refinement = None
+    webhook_sender = None
+    live_stats = None
 
 
 # Создание FastAPI приложения
@@ -83,6 +280,61 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Контроль допуска к оценке транзакций (внутри CORS, чтобы отказы несли заголовки CORS)
+admission_limiter = AdaptiveConcurrencyLimiter(
+    initial_limit=settings.ADMISSION_INITIAL_LIMIT,
+    min_limit=settings.ADMISSION_MIN_LIMIT,
+    max_limit=settings.ADMISSION_MAX_LIMIT,
+    target_latency_ms=settings.ADMISSION_TARGET_LATENCY_MS,
+    backoff=settings.ADMISSION_BACKOFF,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    queue_timeout_ms=settings.ADMISSION_QUEUE_TIMEOUT_MS,
+    max_loop_lag_ms=settings.ADMISSION_MAX_LOOP_LAG_MS
+)
+batch_admission_limiter = AdaptiveConcurrencyLimiter(
+    initial_limit=settings.ADMISSION_BATCH_INITIAL_LIMIT,
+    min_limit=settings.ADMISSION_BATCH_MIN_LIMIT,
+    max_limit=settings.ADMISSION_BATCH_MAX_LIMIT,
+    target_latency_ms=settings.ADMISSION_BATCH_TARGET_LATENCY_MS,
+    backoff=settings.ADMISSION_BACKOFF,
+    queue_size=settings.ADMISSION_BATCH_QUEUE_SIZE,
+    queue_timeout_ms=settings.ADMISSION_BATCH_QUEUE_TIMEOUT_MS,
+    max_loop_lag_ms=settings.ADMISSION_MAX_LOOP_LAG_MS
+)
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        limiter=admission_limiter,
+        paths=settings.ADMISSION_PATHS,
+        retry_after=settings.ADMISSION_RETRY_AFTER,
+        batch_limiter=batch_admission_limiter,
+        batch_paths=settings.ADMISSION_BATCH_PATHS
+    )
+
+# Ограничение частоты по клиентам (до контроля допуска: отклоненные клиенты не занимают его места)
+rate_limiter = RateLimiter(
+    settings.RATE_LIMIT_TIERS,
+    api_keys=settings.RATE_LIMIT_API_KEYS,
+    max_clients=settings.RATE_LIMIT_MAX_CLIENTS,
+    backend_url=settings.RATE_LIMIT_BACKEND_URL
+)
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        paths=settings.RATE_LIMIT_PATHS,
+        trust_forwarded=settings.RATE_LIMIT_TRUST_FORWARDED
+    )
+
+# Время запросов и заголовок Server-Timing (снаружи ограничений: ожидание допуска входит в total)
+if settings.METRICS_ENABLED:
+    app.add_middleware(
+        MetricsMiddleware,
+        metrics=metrics,
+        paths=settings.METRICS_PATHS,
+        server_timing=settings.SERVER_TIMING_ENABLED
+    )
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -119,10 +371,17 @@ async def health_check():
     )
 
 
-@app.post("/api/v1/analyze", response_model=TransactionResponse)
+# Прием транзакций: тело разбирается без построения модели (app/fastpath.py)
+analyze_router = APIRouter(route_class=FastDecodeRoute)
+
+
+@analyze_router.post("/api/v1/analyze", response_model=TransactionResponse)
 async def analyze_transaction(
     transaction: TransactionRequest,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    x_deadline_ms: Annotated[Optional[float], Header(
+        gt=0, description="Срок ответа в миллисекундах от приема запроса"
+    )] = None
 ):
     """
     Анализ транзакции в реальном времени
@@ -132,6 +391,16 @@ async def analyze_transaction(
     2. Предсказание вероятности мошенничества (ML модель)
     3. Расчет уровня риска
     4. Рекомендации по обработке транзакции
+
+    В двухфазном режиме (TWO_PHASE_ENABLED) возвращается предварительное
+    решение (decision_stage=provisional) без проверок с накоплением
+    состояния; окончательное публикуется в webhook и WebSocket.
+    В скользящие окна /api/v1/stats попадает возвращенное решение.
+
+    Срок ответа - заголовок X-Deadline-Ms или REQUEST_DEADLINE_MS
+    (PROVISIONAL_DEADLINE_MS в двухфазном режиме). Если модель не
+    успевает или выключатель разомкнут, вероятность берется из кэша
+    предсказаний или эвристики (scoring_path в ответе).
     """
     try:
         if fraud_detector is None:
@@ -141,61 +410,55 @@ async def analyze_transaction(
             )
 
         logger.info(f"Анализ транзакции: amount={transaction.amount}, type={transaction.type}")
+        two_phase = refinement is not None
+        deadline = Deadline(x_deadline_ms or (
+            settings.PROVISIONAL_DEADLINE_MS if two_phase else settings.REQUEST_DEADLINE_MS
+        ))
 
-        # 1. Предсказание вероятности мошенничества
-        fraud_probability = await fraud_detector.predict(transaction)
+        # 1. Предсказание вероятности мошенничества (в пределах срока)
+        prediction = await fraud_detector.score(transaction, deadline, settings.DEADLINE_RESERVE_MS)
+        fraud_probability = prediction.probability
 
         # 2. Анализ рисков
-        risk_assessment = await risk_analyzer.assess_risk(
-            transaction,
-            fraud_probability
-        )
+        with metrics.stage("risk"):
+            risk_assessment = await risk_analyzer.assess_risk(
+                transaction,
+                fraud_probability,
+                stateful_checks=not two_phase
+            )
 
         # 3. Формирование рекомендаций
-        recommendations = _generate_recommendations(
-            risk_assessment,
-            transaction
-        )
+        with metrics.stage("recommendations"):
+            recommendations = _generate_recommendations(
+                risk_assessment,
+                transaction
+            )
 
-        # 4. Логирование в фоновом режиме
-        background_tasks.add_task(
-            _log_transaction,
-            transaction,
-            fraud_probability,
-            risk_assessment
-        )
+            response = _build_response(
+                transaction, fraud_probability, risk_assessment, recommendations,
+                scoring_path=prediction.path,
+                decision_stage="provisional" if two_phase else "final"
+            )
 
-        # Формирование ответа
-        response = TransactionResponse(
-            transaction_id=transaction.transaction_id or f"TXN_{datetime.now(timezone.utc).timestamp()}",
-            is_fraud=fraud_probability > settings.FRAUD_THRESHOLD,
-            fraud_probability=round(fraud_probability, 4),
-            risk_level=risk_assessment.risk_level,
-            risk_score=risk_assessment.risk_score,
-            confidence=risk_assessment.confidence,
-            recommendations=recommendations,
-            requires_3d_secure=risk_assessment.requires_3d_secure,
-            should_block=risk_assessment.should_block,
-            risk_factors=risk_assessment.risk_factors,
-            timestamp=datetime.now(timezone.utc)
-        )
+        if live_stats is not None:
+            live_stats.record(response, deadline.elapsed_ms())
 
-        # 5. Broadcast результатов через WebSocket (для демо)
-        background_tasks.add_task(
-            broadcast_analysis,
-            response.transaction_id,
-            response.risk_score,
-            response.fraud_probability,
-            response.is_fraud,
-            response.timestamp
-        )
-        
-        # 6. Сохранение транзакции в файл
-        background_tasks.add_task(_save_transaction_to_file, transaction, response)
+        # 4. Побочные эффекты: логирование, broadcast через WebSocket, сохранение в файл
+        # (в двухфазном режиме - после уточнения решения)
+        with metrics.stage("dispatch"):
+            if two_phase:
+                refiner.record_provisional(deadline.elapsed_ms())
+                await refinement.submit(
+                    DecisionEvent(transaction, fraud_probability, risk_assessment, response)
+                )
+            else:
+                await _dispatch_side_effects(
+                    transaction, fraud_probability, risk_assessment, response, background_tasks
+                )
 
         logger.info(
             f"Анализ завершен: fraud_prob={fraud_probability:.4f}, "
-            f"risk_level={risk_assessment.risk_level}"
+            f"risk_level={risk_assessment.risk_level}, path={prediction.path}"
         )
 
         return response
@@ -208,9 +471,13 @@ async def analyze_transaction(
         )
 
 
+app.include_router(analyze_router)
+
+
 @app.post("/api/v1/batch-analyze", response_model=List[TransactionResponse])
-async def batch_analyze_transactions(transactions: List[TransactionRequest]):
+async def batch_analyze_transactions(transactions: List[TransactionRequest], request: Request):
     """Пакетный анализ нескольких транзакций"""
+    await charge_rows(request, len(transactions))
     try:
         results = []
         for transaction in transactions:
@@ -226,14 +493,64 @@ async def batch_analyze_transactions(transactions: List[TransactionRequest]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post(
+    "/api/v1/batch-analyze/arrow",
+    response_class=Response,
+    responses={200: {"content": {ARROW_STREAM_MEDIA_TYPE: {}}}},
+    openapi_extra={"requestBody": {"required": True, "content": {ARROW_STREAM_MEDIA_TYPE: {}}}}
+)
+async def batch_analyze_arrow(request: Request):
+    """
+    Пакетный анализ в формате Arrow IPC (stream)
+
+    Столбцы запроса - поля TransactionRequest. Вероятности считаются
+    для всего пакета одной матрицей признаков; ответ - столбцы
+    transaction_id, fraud_probability, risk_score, risk_level
+    (1 - LOW ... 4 - CRITICAL) и flags (1 - is_fraud, 2 - 3D-Secure,
+    4 - блокировка).
+    """
+    if arrow_batch.pa is None:
+        raise HTTPException(status_code=501, detail="pyarrow не установлен")
+    if fraud_detector is None:
+        raise HTTPException(status_code=503, detail="Модель обнаружения мошенничества не загружена")
+
+    try:
+        batch = arrow_batch.read_batch(await request.body(), settings.ARROW_BATCH_MAX_ROWS)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    await charge_rows(request, len(batch.transactions))
+
+    background_tasks = BackgroundTasks()
+    responses = await score_transactions(
+        batch.transactions, background_tasks, columns=batch.columns, types=batch.types
+    )
+    return Response(
+        arrow_batch.write_results(responses),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+        background=background_tasks
+    )
+
+
 @app.get("/api/v1/stats", response_model=dict)
 async def get_statistics():
-    """Получение статистики работы системы"""
+    """
+    Получение статистики работы системы
+
+    Счетчики с запуска воркера, задержки этапов (latency) и скользящие
+    окна 1m/5m/1h/24h по всем воркерам (windows): TPS, доли
+    мошенничества, блокировок и 3D-Secure, квантили вероятности и задержки.
+    """
     try:
         if fraud_detector is None:
             return {"error": "Модель не загружена"}
 
         stats = await fraud_detector.get_statistics()
+        stats["request_decoding"] = transaction_decoder.get_statistics()
+        stats["latency"] = metrics.get_statistics()
+        if live_stats is not None:
+            stats["windows"] = live_stats.get_statistics()
+        if scoring_server is not None:
+            stats["unix_socket"] = scoring_server.get_statistics()
         return stats
 
     except Exception as e:
@@ -241,17 +558,199 @@ async def get_statistics():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Метрики воркера в текстовом формате Prometheus
+
+    Гистограммы задержек по этапам, запросам и приемникам побочных
+    эффектов (app/metrics.py), счетчики путей оценки и отказов.
+    """
+    parts = [metrics.render_prometheus()]
+    if fraud_detector is not None:
+        parts.append(format_metric(
+            "fraudguard_predictions_total", "counter", "Оценки по пути получения вероятности",
+            (({"path": path}, count) for path, count in fraud_detector.paths.items())
+        ))
+        parts.append(format_metric(
+            "fraudguard_model_fallbacks_total", "counter", "Запасной путь вместо модели по причинам",
+            (({"reason": reason}, count) for reason, count in sorted(fraud_detector.fallbacks.items()))
+        ))
+    admission = {"single": admission_limiter.get_statistics(), "batch": batch_admission_limiter.get_statistics()}
+    parts.append(format_metric(
+        "fraudguard_admission_shed_total", "counter", "Запросы, отклоненные контролем допуска",
+        (
+            ({"reason": reason, "class": name}, stats[f"shed_{reason}"])
+            for name, stats in admission.items()
+            for reason in ("queue_full", "timeout", "loop_lag")
+        )
+    ))
+    parts.append(format_metric(
+        "fraudguard_admission_limit", "gauge", "Текущий лимит одновременных запросов",
+        (({"class": name}, stats["limit"]) for name, stats in admission.items())
+    ))
+    parts.append(format_metric(
+        "fraudguard_rate_limited_total", "counter", "Запросы, отклоненные ограничением частоты",
+        [(None, rate_limiter.limited)]
+    ))
+    if side_effects is not None:
+        parts.append(format_metric(
+            "fraudguard_sink_queue_depth", "gauge", "События в очереди приемника",
+            (({"sink": name}, sink["depth"]) for name, sink in side_effects.get_statistics().items())
+        ))
+    return PlainTextResponse("".join(parts), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/v1/blocklists", response_model=dict)
+async def get_blocklists():
+    """Размеры списков блокировки, память на миллион записей и задержка проверки"""
+    if blocklist_manager is None:
+        raise HTTPException(status_code=503, detail="Списки блокировки не загружены")
+    return blocklist_manager.get_statistics()
+
+
+@app.post("/api/v1/blocklists/{kind}", response_model=dict)
+async def update_blocklist(kind: str, update: BlocklistUpdate):
+    """Массовое добавление и удаление записей списка блокировки"""
+    if blocklist_manager is None:
+        raise HTTPException(status_code=503, detail="Списки блокировки не загружены")
+    if kind not in BLOCKLIST_KINDS:
+        raise HTTPException(status_code=404, detail=f"Неизвестный тип списка: {kind}")
+
+    entries = await asyncio.to_thread(
+        blocklist_manager.bulk_update, kind, update.add, update.remove
+    )
+    return {"kind": kind, "entries": entries}
+
+
+@app.post("/api/v1/fraud-labels", response_model=dict)
+async def add_fraud_labels(labels: FraudLabels):
+    """Подтвержденные мошеннические счета: сразу в граф этого воркера, остальным - через общий файл"""
+    if fraud_labels is None:
+        raise HTTPException(status_code=503, detail="Граф переводов не инициализирован")
+
+    marked = fraud_labels.append(labels.accounts)
+    return {"accounts": marked, "fraud_accounts": fraud_labels.graph.get_statistics()["fraud_accounts"]}
+
+
+@app.post("/api/v1/evidence/export")
+async def export_evidence(request: EvidenceExportRequest):
+    """
+    Массовый экспорт доказательств для chargeback
+
+    Пакет отдается потоком: JSONL (строка на транзакцию + манифест)
+    или ZIP (<transaction_id>.json + manifest.json).
+    """
+    if evidence_collector is None:
+        raise HTTPException(status_code=503, detail="Сборщик доказательств не инициализирован")
+
+    media_type = "application/zip" if request.format == "zip" else "application/x-ndjson"
+    filename = f"chargeback_evidence.{request.format}"
+    return StreamingResponse(
+        stream_export(evidence_collector, request.transaction_ids, request.format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/api/v1/evidence/stats", response_model=dict)
+async def get_evidence_statistics():
+    """Размер хранилища доказательств и экономия от дедупликации"""
+    if evidence_collector is None:
+        raise HTTPException(status_code=503, detail="Сборщик доказательств не инициализирован")
+    return await evidence_collector.get_statistics()
+
+
+@app.get("/api/v1/pipeline", response_model=dict)
+async def get_pipeline_statistics():
+    """Глубина очередей, отставание и потери приемников побочных эффектов"""
+    if side_effects is None:
+        raise HTTPException(status_code=503, detail="Конвейер побочных эффектов не запущен")
+    return side_effects.get_statistics()
+
+
+@app.get("/api/v1/refinement", response_model=dict)
+async def get_refinement_statistics():
+    """Двухфазные решения: превышения срока, очередь уточнения, доля измененных решений, webhook"""
+    if refiner is None:
+        raise HTTPException(status_code=404, detail="Двухфазный режим выключен")
+    return {
+        **refiner.get_statistics(),
+        "queue": refinement.get_statistics()["refinement"],
+        "webhook": webhook_sender.get_statistics() if webhook_sender is not None else None,
+    }
+
+
+@app.get("/api/v1/admission", response_model=dict)
+async def get_admission_statistics():
+    """Лимит одновременных запросов к оценке, запросы в обработке и в очереди, отказы"""
+    return {
+        "enabled": settings.ADMISSION_ENABLED,
+        **admission_limiter.get_statistics(),
+        "batch": batch_admission_limiter.get_statistics()
+    }
+
+
+@app.get("/api/v1/rate-limit", response_model=dict)
+async def get_rate_limit_statistics():
+    """Разрешенные и отклоненные запросы клиентов, корзины в памяти"""
+    return {"enabled": settings.RATE_LIMIT_ENABLED, **rate_limiter.get_statistics()}
+
+
+@app.get("/api/v1/ws/stats", response_model=dict)
+async def get_ws_statistics():
+    """Подключения WebSocket этого воркера и задержка публикации через pub/sub"""
+    return {
+        "connections": manager.get_statistics(),
+        "publisher": ws.publisher.get_statistics() if ws.publisher is not None else None,
+    }
+
+
+@app.get("/api/v1/linked/{transaction_id}", response_model=dict)
+async def get_linked_transactions(
+    transaction_id: str,
+    hops: int = 2,
+    limit: int = Query(1000, ge=1, le=settings.LINKED_MAX_LIMIT)
+):
+    """
+    Транзакции, связанные с данной общими IP, устройством, картой, email
+    или получателем, на расстоянии до hops шагов
+    """
+    if entity_index is None:
+        raise HTTPException(status_code=503, detail="Индекс сущностей не инициализирован")
+    if not 1 <= hops <= settings.LINKED_MAX_HOPS:
+        raise HTTPException(status_code=400, detail=f"hops должен быть от 1 до {settings.LINKED_MAX_HOPS}")
+
+    result = entity_index.linked(transaction_id, max_hops=hops, limit=limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Транзакция {transaction_id} не найдена в индексе")
+    return result
+
+
 @app.websocket("/ws/stream")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint для real-time стриминга результатов анализа"""
-    await manager.connect(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    since: Optional[int] = None,
+    stream: Optional[str] = None
+):
+    """
+    WebSocket endpoint для real-time стриминга результатов анализа
+
+    Переподключение: ?since=<seq>&stream=<id> из последнего полученного
+    кадра (оба параметра обязательны) - досылаются только пропущенные
+    события или кадр resync. Номера общие для воркеров.
+    Подпротокол fraudguard.bin.v1 - пакетные бинарные кадры (app/ws_codec.py).
+    """
+    await manager.connect(websocket, since, stream)
     try:
         while True:
-            # Ожидание сообщений от клиента (keep-alive)
+            # Ожидание сообщений от клиента: keep-alive или подписка
             data = await websocket.receive_text()
             # Echo для проверки соединения
             if data == "ping":
-                await websocket.send_text("pong")
+                await manager.send_personal_message("pong", websocket)
+                continue
+            await _handle_ws_command(websocket, data)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
         logger.info("WebSocket client disconnected")
@@ -259,87 +758,266 @@ async def websocket_endpoint(websocket: WebSocket):
 
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
 
+async def score_transactions(
+    transactions: List[TransactionRequest],
+    background_tasks: BackgroundTasks,
+    columns: Optional[dict] = None,
+    types: Optional[List[str]] = None,
+    deferred: Optional[List[DecisionEvent]] = None
+) -> List[TransactionResponse]:
+    """
+    Оценка пакета транзакций
+
+    Вероятности считаются одной матрицей признаков (FraudDetector.predict_columns),
+    анализ рисков и побочные эффекты - по транзакциям, как в /api/v1/analyze.
+    Готовые столбцы columns/types (Arrow) используются без повторной сборки.
+    Если передан deferred, побочные эффекты не выполняются: решения
+    добавляются в список для dispatch_decisions (после фиксации вызывающим).
+    """
+    started = time.perf_counter()
+    if columns is None:
+        with metrics.stage("preprocess"):
+            columns, types = fraud_detector.preprocessor.columns_from_transactions(transactions)
+    probabilities, scoring_path = await fraud_detector.score_columns(columns, types)
+
+    responses = []
+    for transaction, fraud_probability in zip(transactions, probabilities.tolist()):
+        with metrics.stage("risk"):
+            risk_assessment = await risk_analyzer.assess_risk(transaction, fraud_probability)
+        with metrics.stage("recommendations"):
+            recommendations = _generate_recommendations(risk_assessment, transaction)
+            response = _build_response(
+                transaction, fraud_probability, risk_assessment, recommendations, scoring_path=scoring_path
+            )
+        if live_stats is not None:
+            live_stats.record(response, (time.perf_counter() - started) * 1000)
+        if deferred is not None:
+            deferred.append(DecisionEvent(transaction, fraud_probability, risk_assessment, response))
+        else:
+            with metrics.stage("dispatch"):
+                await _dispatch_side_effects(
+                    transaction, fraud_probability, risk_assessment, response, background_tasks
+                )
+        responses.append(response)
+    return responses
+
+
+async def dispatch_decisions(events: List[DecisionEvent], background_tasks: BackgroundTasks):
+    """Побочные эффекты решений, отложенных score_transactions(deferred=...)"""
+    for event in events:
+        await _dispatch_side_effects(*event, background_tasks)
+
+
+async def _score_unix_socket(transaction: TransactionRequest) -> TransactionResponse:
+    """Оценка транзакции, принятой через Unix-сокет, тем же путем, что и /api/v1/analyze"""
+    background_tasks = BackgroundTasks()
+    response = await analyze_transaction(transaction, background_tasks)
+    # Задачи появляются только без конвейера побочных эффектов
+    await background_tasks()
+    return response
+
+
+def _build_response(
+    transaction: TransactionRequest,
+    fraud_probability: float,
+    risk_assessment: RiskAssessment,
+    recommendations: List[str],
+    transaction_id: Optional[str] = None,
+    scoring_path: str = "model",
+    decision_stage: str = "final"
+) -> TransactionResponse:
+    """Ответ с результатами анализа транзакции"""
+    return TransactionResponse(
+        transaction_id=(
+            transaction_id or transaction.transaction_id or f"TXN_{datetime.now(timezone.utc).timestamp()}"
+        ),
+        is_fraud=fraud_probability > settings.FRAUD_THRESHOLD,
+        fraud_probability=round(fraud_probability, 4),
+        risk_level=risk_assessment.risk_level,
+        risk_score=risk_assessment.risk_score,
+        confidence=risk_assessment.confidence,
+        recommendations=recommendations,
+        requires_3d_secure=risk_assessment.requires_3d_secure,
+        should_block=risk_assessment.should_block,
+        risk_factors=risk_assessment.risk_factors,
+        scoring_path=scoring_path,
+        decision_stage=decision_stage,
+        timestamp=datetime.now(timezone.utc)
+    )
+
+
+def _finalize_decision(
+    transaction: TransactionRequest,
+    fraud_probability: float,
+    risk_assessment: RiskAssessment,
+    provisional: TransactionResponse
+) -> TransactionResponse:
+    """Окончательный ответ по полной оценке рисков (тот же transaction_id, что и у предварительного)"""
+    recommendations = _generate_recommendations(risk_assessment, transaction)
+    return _build_response(
+        transaction, fraud_probability, risk_assessment, recommendations,
+        transaction_id=provisional.transaction_id,
+        scoring_path=provisional.scoring_path
+    )
+
+
+async def _publish_final_decision(event: DecisionEvent):
+    """Окончательное решение - в конвейер побочных эффектов (webhook, WebSocket, доказательства)"""
+    background_tasks = BackgroundTasks()
+    await _dispatch_side_effects(*event, background_tasks)
+    await background_tasks()
+
+
+async def _dispatch_side_effects(
+    transaction: TransactionRequest,
+    fraud_probability: float,
+    risk_assessment: RiskAssessment,
+    response: TransactionResponse,
+    background_tasks: BackgroundTasks
+):
+    """Логирование, broadcast через WebSocket и сохранение в файл после решения"""
+    if side_effects is not None:
+        await side_effects.submit(
+            DecisionEvent(transaction, fraud_probability, risk_assessment, response)
+        )
+        return
+
+    background_tasks.add_task(
+        _log_transaction,
+        transaction,
+        fraud_probability,
+        risk_assessment,
+        response.transaction_id
+    )
+    background_tasks.add_task(
+        broadcast_analysis,
+        response.transaction_id,
+        response.risk_score,
+        response.fraud_probability,
+        response.is_fraud,
+        response.timestamp,
+        transaction_type=transaction.type.value,
+        merchant=transaction.nameDest,
+        risk_level=response.risk_level.value
+    )
+    background_tasks.add_task(_save_transaction_to_file, transaction, response)
+
+
+async def _handle_ws_command(websocket: WebSocket, data: str):
+    """Подписка с фильтрами и частотой кадров, отмена подписки"""
+    try:
+        command = json.loads(data)
+        action = command.get("action")
+        if action == "subscribe":
+            subscription = SubscriptionFilter.from_message(command)
+            manager.subscribe(websocket, subscription)
+            reply = {"type": "subscribed", **subscription._asdict()}
+        elif action == "unsubscribe":
+            manager.subscribe(websocket, None)
+            reply = {"type": "unsubscribed"}
+        else:
+            raise ValueError(f"Неизвестная команда: {action}")
+    except (ValueError, AttributeError) as e:
+        reply = {"type": "error", "detail": str(e)}
+    await manager.send_personal_message(json.dumps(reply, default=list), websocket)
+
+
 def _save_transaction_to_file(transaction: TransactionRequest, response: TransactionResponse):
     """Сохранить транзакцию в JSON файл для отображения на фронтенде"""
+    _save_transactions_to_file([(transaction, response)])
+
+
+def _save_decisions_to_file(events: List[DecisionEvent]):
+    """Приемник конвейера: сохранение пакета решений в файл фронтенда"""
+    _save_transactions_to_file([(event.transaction, event.response) for event in events])
+
+
+def _frontend_transaction_data(transaction: TransactionRequest, response: TransactionResponse) -> dict:
+    """Объект транзакции для фронтенда"""
+    return {
+        "transaction_id": response.transaction_id,
+        "timestamp": response.timestamp.isoformat(),
+        "product_id": getattr(transaction, 'product_id', '') or "PRODUCT-001",
+        "product_name": getattr(transaction, 'product_name', '') or "Товар",
+        "category": getattr(transaction, 'category', '') or "Электроника",
+        "sku": f"SKU-{response.transaction_id[-6:]}",
+        "amount": transaction.amount,
+        "currency": getattr(transaction, 'currency', '') or "RUB",
+        "payment_method": getattr(transaction, 'payment_method', '') or "card",
+        "is_high_risk_item": response.risk_score >= 70,
+        
+        # Информация о клиенте
+        "customer_id": getattr(transaction, 'customer_id', '') or getattr(transaction, 'nameOrig', '') or "CUSTOMER-001",
+        "email": getattr(transaction, 'email', '') or f"customer@example.com",
+        "email_domain": getattr(transaction, 'email', '').split('@')[1] if getattr(transaction, 'email', '') and '@' in getattr(transaction, 'email', '') else "example.com",
+        "phone": "+7**********",
+        "phone_verified": True,
+        "previous_orders": 0,
+        "previous_chargebacks": 0,
+        
+        # IP и геолокация
+        "ip": transaction.ip_address or "0.0.0.0",
+        "ip_country": getattr(transaction, 'ip_country', '') or "RU",
+        "ip_region": getattr(transaction, 'ip_region', '') or transaction.location or "Москва",
+        "proxy": False,
+        "vpn": False,
+        "tor": False,
+        
+        # Устройство
+        "device_id": transaction.device_id or "device_unknown",
+        "device_os": getattr(transaction, 'device_os', '') or "Windows",
+        "browser": getattr(transaction, 'browser', '') or "Chrome 120",
+        "is_emulator": False,
+        
+        # 3DS
+        "is_3ds_passed": getattr(transaction, 'is_3ds_passed', False),
+        "attempt_count": 1,
+        
+        #Результаты анализа
+        "is_fraud": response.is_fraud,
+        "fraud_probability": response.fraud_probability,
+        "risk_level": response.risk_level,
+        "risk_score": response.risk_score,  # Используем risk_score из response!
+        "risk_factors": response.risk_factors,  # Сохраняем факторы риска!
+        "fraud_type": "Финансовое мошенничество" if response.is_fraud else "",
+        "chargeback_code": "" if not response.is_fraud else "FRAUD",
+        "chargeback_date": "",
+        
+        # Дополнительно
+        "payment_gateway": "API",
+        "delivery_type": "courier",
+        "session_length_sec": 120,
+        "pages_viewed": 5,
+    }
+
+
+def _save_transactions_to_file(decisions: List[tuple]):
+    """Сохранить пакет транзакций в JSON файл одной перезаписью"""
     try:
         transactions_file = "data/api_transactions.json"
-        
+
         # Загрузить существующие транзакции
         if os.path.exists(transactions_file):
             with open(transactions_file, 'r', encoding='utf-8') as f:
                 transactions = json.load(f)
         else:
             transactions = []
-        
-        # Создать объект транзакции для фронтенда
-        transaction_data = {
-            "transaction_id": response.transaction_id,
-            "timestamp": response.timestamp.isoformat(),
-            "product_id": getattr(transaction, 'product_id', '') or "PRODUCT-001",
-            "product_name": getattr(transaction, 'product_name', '') or "Товар",
-            "category": getattr(transaction, 'category', '') or "Электроника",
-            "sku": f"SKU-{response.transaction_id[-6:]}",
-            "amount": transaction.amount,
-            "currency": getattr(transaction, 'currency', '') or "RUB",
-            "payment_method": getattr(transaction, 'payment_method', '') or "card",
-            "is_high_risk_item": response.risk_score >= 70,
-            
-            # Информация о клиенте
-            "customer_id": getattr(transaction, 'customer_id', '') or getattr(transaction, 'nameOrig', '') or "CUSTOMER-001",
-            "email": getattr(transaction, 'email', '') or f"customer@example.com",
-            "email_domain": getattr(transaction, 'email', '').split('@')[1] if getattr(transaction, 'email', '') and '@' in getattr(transaction, 'email', '') else "example.com",
-            "phone": "+7**********",
-            "phone_verified": True,
-            "previous_orders": 0,
-            "previous_chargebacks": 0,
-            
-            # IP и геолокация
-            "ip": transaction.ip_address or "0.0.0.0",
-            "ip_country": getattr(transaction, 'ip_country', '') or "RU",
-            "ip_region": getattr(transaction, 'ip_region', '') or transaction.location or "Москва",
-            "proxy": False,
-            "vpn": False,
-            "tor": False,
-            
-            # Устройство
-            "device_id": transaction.device_id or "device_unknown",
-            "device_os": getattr(transaction, 'device_os', '') or "Windows",
-            "browser": getattr(transaction, 'browser', '') or "Chrome 120",
-            "is_emulator": False,
-            
-            # 3DS
-            "is_3ds_passed": getattr(transaction, 'is_3ds_passed', False),
-            "attempt_count": 1,
-            
-            #Результаты анализа
-            "is_fraud": response.is_fraud,
-            "fraud_probability": response.fraud_probability,
-            "risk_level": response.risk_level,
-            "risk_score": response.risk_score,  # Используем risk_score из response!
-            "risk_factors": response.risk_factors,  # Сохраняем факторы риска!
-            "fraud_type": "Финансовое мошенничество" if response.is_fraud else "",
-            "chargeback_code": "" if not response.is_fraud else "FRAUD",
-            "chargeback_date": "",
-            
-            # Дополнительно
-            "payment_gateway": "API",
-            "delivery_type": "courier",
-            "session_length_sec": 120,
-            "pages_viewed": 5,
-        }
-        
+
         # Добавить в начало списка (свежие сначала)
-        transactions.insert(0, transaction_data)
-        
+        transactions[:0] = [
+            _frontend_transaction_data(transaction, response)
+            for transaction, response in reversed(decisions)
+        ]
+
         # Ограничить до 1000 транзакций
         transactions = transactions[:1000]
-        
+
         # Сохранить
         os.makedirs("data", exist_ok=True)
         with open(transactions_file, 'w', encoding='utf-8') as f:
             json.dump(transactions, f, ensure_ascii=False, indent=2, default=str)
-            
-        logger.info(f"Транзакция {response.transaction_id} сохранена в {transactions_file}")
+
+        logger.info(f"Сохранено транзакций в {transactions_file}: {len(decisions)}")
     except Exception as e:
         logger.error(f"Ошибка сохранения транзакции: {str(e)}")
 
@@ -380,12 +1058,111 @@ def _generate_recommendations(
     return recommendations
 
 
+async def _reload_data_files_periodically(
+    enrichment: EnrichmentService,
+    blocklists: BlocklistManager
+):
+    """Периодическая проверка новых файлов индексов обогащения и списков блокировки"""
+    while True:
+        await asyncio.sleep(settings.DATA_FILES_RELOAD_INTERVAL)
+        try:
+            await asyncio.to_thread(enrichment.reload)
+            await asyncio.to_thread(blocklists.reload)
+        except Exception as e:
+            logger.error(f"Ошибка перезагрузки файлов данных: {str(e)}")
+
+
+async def _maintain_transfer_graph_periodically(graph: TransferGraph, labels: FraudLabelFeed):
+    """Метки мошенничества других воркеров и удаление ребер старше срока хранения"""
+    last_prune = asyncio.get_running_loop().time()
+    while True:
+        await asyncio.sleep(settings.FRAUD_LABELS_POLL_INTERVAL)
+        try:
+            labels.poll()
+            now = asyncio.get_running_loop().time()
+            if now - last_prune >= settings.TRANSFER_GRAPH_PRUNE_INTERVAL:
+                await asyncio.to_thread(graph.prune)
+                last_prune = now
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания графа переводов: {str(e)}")
+
+
+async def _flush_live_stats_periodically(stats: LiveStatistics):
+    """Перенос решений текущей секунды в окна, видимые остальным воркерам"""
+    while True:
+        await asyncio.sleep(1.0)
+        stats.flush()
+
+
+async def _maintain_evidence_periodically(collector: EvidenceCollector):
+    """Запись буфера доказательств и удаление записей старше срока хранения"""
+    last_purge = asyncio.get_running_loop().time()
+    while True:
+        await asyncio.sleep(settings.EVIDENCE_FLUSH_INTERVAL)
+        try:
+            await collector.flush()
+            now = asyncio.get_running_loop().time()
+            if now - last_purge >= settings.EVIDENCE_PURGE_INTERVAL:
+                await collector.purge_expired()
+                last_purge = now
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания хранилища доказательств: {str(e)}")
+
+
+async def _save_snapshots_periodically(index: EntityIndex, balances: BalanceTracker):
+    """Снимки состояния воркера: после сбоя теряется не больше интервала"""
+    while True:
+        await asyncio.sleep(settings.SNAPSHOT_INTERVAL)
+        try:
+            # Копия балансов - в цикле событий, где они меняются
+            await asyncio.to_thread(balances.save_snapshot, None, balances.snapshot_items())
+            await asyncio.to_thread(index.save_snapshot)
+        except Exception as e:
+            logger.error(f"Ошибка записи снимков: {str(e)}")
+
+
+def _side_effect_sink(name: str, handler, overflow: str, batch_size: Optional[int] = None) -> Sink:
+    return Sink(
+        name,
+        handler,
+        capacity=settings.SIDE_EFFECT_QUEUE_SIZE,
+        batch_size=batch_size or settings.SIDE_EFFECT_BATCH_SIZE,
+        overflow=overflow,
+        spill_dir=settings.SIDE_EFFECT_SPILL_DIR
+    )
+
+
+async def _log_transactions(events: List[DecisionEvent]):
+    """Приемник конвейера: логирование пакета решений"""
+    for event in events:
+        await _log_transaction(
+            event.transaction, event.fraud_probability, event.risk_assessment, event.response.transaction_id
+        )
+
+
+async def _broadcast_analyses(events: List[DecisionEvent]):
+    """Приемник конвейера: broadcast пакета решений через WebSocket"""
+    for event in events:
+        response = event.response
+        await broadcast_analysis(
+            response.transaction_id,
+            response.risk_score,
+            response.fraud_probability,
+            response.is_fraud,
+            response.timestamp,
+            transaction_type=event.transaction.type.value,
+            merchant=event.transaction.nameDest,
+            risk_level=response.risk_level.value
+        )
+
+
 async def _log_transaction(
     transaction: TransactionRequest,
     fraud_probability: float,
-    risk_assessment: RiskAssessment
+    risk_assessment: RiskAssessment,
+    transaction_id: Optional[str] = None
 ):
-    """Логирование транзакции (выполняется в фоновом режиме)"""
+    """Логирование транзакции под ID ответа (выполняется в фоновом режиме)"""
     try:
         # Здесь можно добавить сохранение в базу данных
         logger.info(
@@ -400,7 +1177,8 @@ async def _log_transaction(
             await evidence_collector.log_transaction(
                 transaction,
                 fraud_probability,
-                risk_assessment
+                risk_assessment,
+                transaction_id
             )
     except Exception as e:
         logger.error(f"Ошибка логирования транзакции: {str(e)}")
@@ -0,0 +1,288 @@
+"""
+Метрики задержки по этапам обработки
+Таймеры на монотонных часах, гистограммы в стиле HDR на воркер,
+экспорт в текстовом формате Prometheus и заголовок Server-Timing
+"""
+import time
+from array import array
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+# Границы le гистограмм в /metrics, секунды
+PROMETHEUS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Семейство -> (имя метрики, имя метки, описание)
+FAMILIES = {
+    "stage": ("fraudguard_stage_duration_seconds", "stage", "Длительность этапа обработки транзакции"),
+    "request": ("fraudguard_request_duration_seconds", "path", "Время от приема запроса до начала ответа"),
+    "sink": ("fraudguard_sink_batch_duration_seconds", "sink", "Обработка пакета приемником побочных эффектов"),
+}
+
+# Этапы текущего запроса: этап -> суммарные наносекунды (для Server-Timing)
+_request_stages: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_stages", default=None)
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек в стиле HDR (микросекунды)
+
+    - Значения меньше 2^precision_bits хранятся точно, дальше на каждую
+      степень двойки приходится 2^(precision_bits-1) ячеек: относительная
+      погрешность не больше 2^-(precision_bits-1) (~1.6% при 7 битах)
+    - Номер ячейки - сдвиг и сложение, без поиска по границам
+    - Значения больше 2^max_bits мкс попадают в последнюю ячейку
+    - Счетчики - array('Q') без блокировок: запись только из потока
+      цикла событий своего воркера
+    """
+
+    def __init__(self, precision_bits: int = 7, max_bits: int = 36):
+        self._bits = precision_bits
+        self._half = 1 << (precision_bits - 1)
+        self._sub_count = 1 << precision_bits
+        self._max_shift = max_bits - precision_bits
+        self._last = self.bucket_index((1 << max_bits) - 1)
+        self.counts = array('Q', bytes(8 * (self._last + 1)))
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def bucket_index(self, value: int) -> int:
+        """Номер ячейки значения в микросекундах"""
+        if value < self._sub_count:
+            return value
+        shift = value.bit_length() - self._bits
+        if shift > self._max_shift:
+            return self._last
+        return shift * self._half + (value >> shift)
+
+    def bucket_upper(self, index: int) -> int:
+        """Верхняя граница ячейки (не включительно)"""
+        if index < self._sub_count:
+            return index + 1
+        shift = index // self._half - 1
+        return (index - shift * self._half + 1) << shift
+
+    def record(self, value_us: int):
+        if value_us < self._sub_count:
+            index = value_us
+        else:
+            shift = value_us.bit_length() - self._bits
+            index = shift * self._half + (value_us >> shift) if shift <= self._max_shift else self._last
+        self.counts[index] += 1
+        self.count += 1
+        self.total_us += value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def quantile(self, q: float) -> float:
+        """Значение квантиля q (0-1) в микросекундах - верхняя граница ячейки"""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return float(min(self.bucket_upper(index), self.max_us))
+        return float(self.max_us)
+
+    def cumulative(self, bounds_us: Sequence[float]) -> List[int]:
+        """Число значений не больше каждой границы (границы по возрастанию)"""
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds_us:
+            stop = self.bucket_index(int(bound))
+            while index <= stop:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class _StageTimer:
+    __slots__ = ("histogram", "name", "stages", "started")
+
+    def __init__(self, histogram: LatencyHistogram, name: str, stages: Optional[Dict[str, int]]):
+        self.histogram = histogram
+        self.name = name
+        self.stages = stages
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.started
+        self.histogram.record(elapsed // 1000)
+        stages = self.stages
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0) + elapsed
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Гистограммы задержек воркера по семействам FAMILIES
+
+    Этапы (stage) также суммируются в этапы текущего запроса, если
+    запрос идет через MetricsMiddleware. Данные - только этого
+    процесса: при нескольких воркерах каждый отдает свои.
+    """
+
+    def __init__(self, enabled: bool = True, precision_bits: int = 7):
+        self.enabled = enabled
+        self.precision_bits = precision_bits
+        self._histograms: Dict[str, Dict[str, LatencyHistogram]] = {family: {} for family in FAMILIES}
+        self._stages = self._histograms["stage"]
+
+    def stage(self, name: str):
+        """Таймер этапа: with metrics.stage("model"): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self._stages.get(name) or self._create("stage", name), name, _request_stages.get())
+
+    def observe_ns(self, family: str, name: str, elapsed_ns: int):
+        """Запись длительности в наносекундах"""
+        if not self.enabled:
+            return
+        histogram = self._histograms[family].get(name) or self._create(family, name)
+        histogram.record(elapsed_ns // 1000)
+
+        if family == "stage":
+            stages = _request_stages.get()
+            if stages is not None:
+                stages[name] = stages.get(name, 0) + elapsed_ns
+
+    def _create(self, family: str, name: str) -> LatencyHistogram:
+        histogram = self._histograms[family][name] = LatencyHistogram(self.precision_bits)
+        return histogram
+
+    def histogram(self, family: str, name: str) -> Optional[LatencyHistogram]:
+        return self._histograms[family].get(name)
+
+    def reset(self):
+        for histograms in self._histograms.values():
+            histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """Гистограммы в текстовом формате Prometheus (0.0.4)"""
+        bounds_us = [bound * 1e6 for bound in PROMETHEUS_BUCKETS]
+        lines = []
+        for family, (metric, label, description) in FAMILIES.items():
+            histograms = self._histograms[family]
+            if not histograms:
+                continue
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in sorted(histograms.items()):
+                value = _escape(name)
+                for bound, count in zip(PROMETHEUS_BUCKETS, histogram.cumulative(bounds_us)):
+                    lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label}="{value}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{{label}="{value}"}} {histogram.total_us / 1e6}')
+                lines.append(f'{metric}_count{{{label}="{value}"}} {histogram.count}')
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def get_statistics(self) -> Dict:
+        """Число измерений, среднее и квантили по этапам, мс"""
+        result = {}
+        for family, histograms in self._histograms.items():
+            result[family] = {
+                name: {
+                    "count": histogram.count,
+                    "mean_ms": round(histogram.total_us / histogram.count / 1000, 3) if histogram.count else 0.0,
+                    "p50_ms": round(histogram.quantile(0.5) / 1000, 3),
+                    "p90_ms": round(histogram.quantile(0.9) / 1000, 3),
+                    "p99_ms": round(histogram.quantile(0.99) / 1000, 3),
+                    "max_ms": round(histogram.max_us / 1000, 3),
+                }
+                for name, histogram in sorted(histograms.items())
+            }
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_metric(
+    name: str,
+    kind: str,
+    description: str,
+    samples: Iterable[Tuple[Optional[Dict[str, str]], float]]
+) -> str:
+    """Счетчик или gauge в текстовом формате Prometheus: samples - пары (метки, значение)"""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if labels:
+            rendered = ",".join(f'{key}="{_escape(str(item))}"' for key, item in labels.items())
+            lines.append(f"{name}{{{rendered}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(stages: Dict[str, int], total_ns: int) -> bytes:
+    """Значение заголовка Server-Timing: этапы и total, мс"""
+    parts = [f"{name};dur={elapsed / 1e6:.3f}" for name, elapsed in stages.items()]
+    parts.append(f"total;dur={total_ns / 1e6:.3f}")
+    return ", ".join(parts).encode('latin-1')
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: для путей paths (точное совпадение) - время до начала
+    ответа в семействе request и, при server_timing, заголовок
+    Server-Timing с этапами запроса. Этапы после начала ответа (фоновые
+    задачи, приемники) в заголовок не попадают.
+    """
+
+    def __init__(self, app, metrics: Metrics, paths: Sequence[str], server_timing: bool = True):
+        self.app = app
+        self.metrics = metrics
+        self.paths = frozenset(paths)
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter_ns()
+        stages: Dict[str, int] = {}
+        token = _request_stages.set(stages)
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter_ns() - started
+                self.metrics.observe_ns("request", scope["path"], elapsed)
+                if self.server_timing:
+                    message = dict(message)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", server_timing(stages, elapsed))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _request_stages.reset(token)
+
+
+metrics = Metrics(enabled=settings.METRICS_ENABLED)
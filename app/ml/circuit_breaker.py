@@ -0,0 +1,134 @@
+"""
+Автоматический выключатель по задержке модели
+Медленные вызовы размыкают цепь, запросы идут в запасной путь
+"""
+import time
+from collections import deque
+from typing import Deque, Dict
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class LatencyCircuitBreaker:
+    """
+    Выключатель вокруг вызова модели
+
+    - closed: вызовы разрешены; если среди последних window вызовов
+      (не меньше min_calls) доля медленных (дольше slow_call_ms или
+      с ошибкой) достигает slow_call_rate, цепь размыкается
+    - open: вызовы запрещены open_seconds секунд
+    - half_open: разрешено half_open_calls пробных вызовов; все быстрые -
+      цепь замыкается, первый медленный - снова размыкается
+
+    expected_ms() - сглаженная задержка успешных вызовов, по ней
+    проверяется, укладывается ли вызов в остаток срока запроса. Оценка
+    обновляется только вызовами, поэтому запросы, пропускающие модель
+    из-за нее, раз в open_seconds пропускают один пробный вызов
+    (probe_due) - иначе одна медленная пауза отключила бы модель навсегда.
+    """
+
+    def __init__(
+        self,
+        slow_call_ms: float = 50.0,
+        slow_call_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        open_seconds: float = 5.0,
+        half_open_calls: int = 3,
+        smoothing: float = 0.2
+    ):
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min(min_calls, window)
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.smoothing = smoothing
+
+        self.state = STATE_CLOSED
+        self._window: Deque[bool] = deque(maxlen=window)
+        self._slow_in_window = 0
+        self._opened_at = 0.0
+        self._probes_left = 0
+        self._probes_passed = 0
+        self._expected_ms = 0.0
+        self._last_call = time.monotonic()
+
+        self.trips = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def allow(self) -> bool:
+        """Разрешен ли вызов модели сейчас"""
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = STATE_HALF_OPEN
+            self._probes_left = self.half_open_calls
+            self._probes_passed = 0
+
+        if self.state == STATE_HALF_OPEN:
+            if self._probes_left == 0:
+                self.rejected += 1
+                return False
+            self._probes_left -= 1
+        return True
+
+    def record(self, elapsed_ms: float, failed: bool = False):
+        """Учет завершенного вызова"""
+        self._last_call = time.monotonic()
+        if not failed:
+            if self._expected_ms:
+                self._expected_ms += self.smoothing * (elapsed_ms - self._expected_ms)
+            else:
+                self._expected_ms = elapsed_ms
+        slow = failed or elapsed_ms > self.slow_call_ms
+
+        if self.state == STATE_HALF_OPEN:
+            if slow:
+                self._open()
+                return
+            self._probes_passed += 1
+            if self._probes_passed >= self.half_open_calls:
+                self.state = STATE_CLOSED
+                self._window.clear()
+                self._slow_in_window = 0
+            return
+
+        if len(self._window) == self._window.maxlen:
+            self._slow_in_window -= self._window[0]
+        self._window.append(slow)
+        self._slow_in_window += slow
+        if len(self._window) >= self.min_calls and self._slow_in_window >= self.slow_call_rate * len(self._window):
+            self._open()
+
+    def _open(self):
+        self.state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+
+    def probe_due(self) -> bool:
+        """Пора ли вызвать модель вопреки оценке задержки (не чаще раза в open_seconds)"""
+        now = time.monotonic()
+        if now - self._last_call < self.open_seconds:
+            return False
+        self._last_call = now
+        self.probes += 1
+        return True
+
+    def expected_ms(self) -> float:
+        """Ожидаемая длительность вызова"""
+        return self._expected_ms
+
+    def get_statistics(self) -> Dict:
+        """Состояние, доля медленных вызовов и число срабатываний"""
+        return {
+            "state": self.state,
+            "slow_call_rate": round(self._slow_in_window / len(self._window), 4) if self._window else 0.0,
+            "expected_ms": round(self._expected_ms, 3),
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "probes": self.probes,
+        }
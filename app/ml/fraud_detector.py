@@ -3,20 +3,37 @@
 Основан на модели из предоставленного notebook
 """
 import os
+import time
 import numpy as np
 import pandas as pd
 import xgboost as xgb
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
 import logging
 from datetime import datetime, timezone
 import joblib
 from pathlib import Path
 
+from app.config import settings
+from app.deadline import Deadline
+from app.metrics import metrics
 from app.models import TransactionRequest
+from app.ml.circuit_breaker import LatencyCircuitBreaker
 from app.ml.preprocessor import TransactionPreprocessor
 
 logger = logging.getLogger(__name__)
 
+# Путь, которым получена вероятность
+PATH_MODEL = "model"
+PATH_CACHE = "cache"  # Предсказание модели для тех же признаков
+PATH_HEURISTIC = "heuristic"
+
+
+class Prediction(NamedTuple):
+    """Вероятность мошенничества и путь, которым она получена"""
+    probability: float
+    path: str
+
 
 class FraudDetector:
     """
@@ -27,17 +44,36 @@ class FraudDetector:
     - Precision: ~83.1%
     """
 
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        breaker: Optional[LatencyCircuitBreaker] = None,
+        cache_size: Optional[int] = None
+    ):
         self.model: Optional[xgb.Booster] = None
         self.preprocessor = TransactionPreprocessor()
         self.model_path = model_path or "data/models/fraud_model.json"
 
+        # Деградация: выключатель по задержке модели и кэш ее предсказаний
+        self.breaker = breaker or LatencyCircuitBreaker(
+            slow_call_ms=settings.MODEL_BREAKER_SLOW_MS,
+            slow_call_rate=settings.MODEL_BREAKER_SLOW_RATE,
+            window=settings.MODEL_BREAKER_WINDOW,
+            open_seconds=settings.MODEL_BREAKER_OPEN_SECONDS,
+            half_open_calls=settings.MODEL_BREAKER_HALF_OPEN_CALLS
+        )
+        self.cache_size = settings.MODEL_CACHE_SIZE if cache_size is None else cache_size
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+
         # Статистика для мониторинга
         self.stats = {
             "total_predictions": 0,
             "fraud_detected": 0,
             "last_prediction_time": None
         }
+        self.paths = {PATH_MODEL: 0, PATH_CACHE: 0, PATH_HEURISTIC: 0}
+        # Причины запасного пути: no_model, deadline, circuit_open, error
+        self.fallbacks: Dict[str, int] = {}
 
     async def load_model(self):
         """Загрузка обученной модели"""
@@ -83,32 +119,135 @@ class FraudDetector:
         Returns:
             float: Вероятность мошенничества (0-1)
         """
-        try:
-            # Предобработка данных
-            features = self.preprocessor.preprocess(transaction)
+        return (await self.score(transaction)).probability
 
-            # Создание DMatrix для XGBoost
-            dmatrix = xgb.DMatrix(features)
+    async def score(
+        self,
+        transaction: TransactionRequest,
+        deadline: Optional[Deadline] = None,
+        reserve_ms: float = 0.0
+    ) -> Prediction:
+        """
+        Предсказание с учетом срока запроса
 
-            # Предсказание
-            if self.model is not None:
-                prediction = self.model.predict(dmatrix)[0]
-            else:
-                # Fallback: эвристический анализ если модель не загружена
-                prediction = self._heuristic_prediction(transaction)
+        Модель не вызывается, если она не загружена, выключатель разомкнут
+        или остаток срока за вычетом reserve_ms (время следующих этапов)
+        меньше ожидаемой длительности вызова (кроме пробного вызова раз
+        в open_seconds выключателя, обновляющего оценку). Тогда возвращается прежнее
+        предсказание модели для тех же признаков, а без него - эвристика.
 
-            # Обновление статистики
-            self.stats["total_predictions"] += 1
-            if prediction > 0.5:
-                self.stats["fraud_detected"] += 1
-            self.stats["last_prediction_time"] = datetime.now(timezone.utc).isoformat()
+        Args:
+            transaction: Данные транзакции
+            deadline: Срок запроса (None - без ограничения)
+            reserve_ms: Часть срока, оставляемая следующим этапам
 
-            return float(prediction)
+        Returns:
+            Prediction: Вероятность и путь (model, cache, heuristic)
+        """
+        if self.model is None:
+            return self._fallback(transaction, None, "no_model")
+        if deadline is not None and deadline.remaining_ms() <= reserve_ms:
+            return self._fallback(transaction, None, "deadline")
 
+        started = time.perf_counter()
+        try:
+            # Предобработка данных
+            with metrics.stage("preprocess"):
+                features = self.preprocessor.preprocess(transaction)
+                key = tuple(features.to_numpy()[0].tolist())
         except Exception as e:
+            logger.error(f"Ошибка предобработки: {str(e)}")
+            return self._fallback(transaction, None, "error")
+
+        remaining = deadline.remaining_ms() - reserve_ms if deadline is not None else None
+        if remaining is not None and remaining < self.breaker.expected_ms() and not self.breaker.probe_due():
+            return self._fallback(transaction, key, "deadline")
+        if not self.breaker.allow():
+            return self._fallback(transaction, key, "circuit_open")
+
+        try:
+            with metrics.stage("model"):
+                prediction = float(self.model.predict(xgb.DMatrix(features))[0])
+        except Exception as e:
+            self.breaker.record((time.perf_counter() - started) * 1000, failed=True)
             logger.error(f"Ошибка предсказания: {str(e)}")
             # В случае ошибки используем консервативный подход
-            return self._heuristic_prediction(transaction)
+            return self._fallback(transaction, key, "error")
+        self.breaker.record((time.perf_counter() - started) * 1000)
+
+        if self.cache_size:
+            self._cache[key] = prediction
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return self._count(Prediction(prediction, PATH_MODEL))
+
+    def _fallback(self, transaction: TransactionRequest, key: Optional[tuple], reason: str) -> Prediction:
+        """Прежнее предсказание модели для тех же признаков или эвристика"""
+        self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+        cached = self._cache.get(key) if key is not None else None
+        if cached is not None:
+            return self._count(Prediction(cached, PATH_CACHE))
+        return self._count(Prediction(self._heuristic_prediction(transaction), PATH_HEURISTIC))
+
+    def _count(self, prediction: Prediction) -> Prediction:
+        self.paths[prediction.path] += 1
+        self.stats["total_predictions"] += 1
+        if prediction.probability > settings.FRAUD_THRESHOLD:
+            self.stats["fraud_detected"] += 1
+        self.stats["last_prediction_time"] = datetime.now(timezone.utc).isoformat()
+        return prediction
+
+    async def predict_columns(self, columns: Dict[str, np.ndarray], types: Sequence[str]) -> np.ndarray:
+        """
+        Предсказание для пакета транзакций, заданного столбцами
+
+        Args:
+            columns: Числовые столбцы (amount и балансы)
+            types: Типы транзакций
+
+        Returns:
+            np.ndarray: Вероятности мошенничества (0-1) по строкам
+        """
+        return (await self.score_columns(columns, types))[0]
+
+    async def score_columns(
+        self,
+        columns: Dict[str, np.ndarray],
+        types: Sequence[str]
+    ) -> Tuple[np.ndarray, str]:
+        """Предсказание для пакета и путь, которым получены вероятности (model или heuristic)"""
+        with metrics.stage("preprocess"):
+            features = self.preprocessor.preprocess_columns(columns, types)
+        path = PATH_MODEL
+        try:
+            if self.model is None:
+                raise ValueError("Модель не загружена")
+            with metrics.stage("model"):
+                dmatrix = xgb.DMatrix(features, feature_names=TransactionPreprocessor.FEATURE_ORDER)
+                predictions = self.model.predict(dmatrix).astype(np.float64)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного предсказания: {str(e)}")
+            predictions = self._heuristic_prediction_columns(features)
+            path = PATH_HEURISTIC
+
+        self.paths[path] += len(predictions)
+        self.stats["total_predictions"] += len(predictions)
+        self.stats["fraud_detected"] += int((predictions > settings.FRAUD_THRESHOLD).sum())
+        self.stats["last_prediction_time"] = datetime.now(timezone.utc).isoformat()
+        return predictions, path
+
+    @staticmethod
+    def _heuristic_prediction_columns(features: np.ndarray) -> np.ndarray:
+        """Эвристика _heuristic_prediction по матрице признаков"""
+        amount, old_org, new_org, old_dest, new_dest = (features[:, i] for i in range(5))
+        risky_type = (features[:, 5] > 0) | (features[:, 6] > 0)
+
+        risk_score = np.full(len(features), 0.3)
+        risk_score += np.where(amount > 200000, 0.2, np.where(amount < 500, 0.15, 0.0))
+        risk_score += np.where((old_org > 0) & (new_org == 0), 0.25, 0.0)
+        risk_score += np.where(np.abs(new_dest - old_dest - amount) > amount * 0.1, 0.25, 0.0)
+        return np.where(risky_type, np.minimum(risk_score, 1.0), 0.01)
 
     def _heuristic_prediction(self, transaction: TransactionRequest) -> float:
         """
@@ -152,7 +291,11 @@ class FraudDetector:
             "fraud_detected": self.stats["fraud_detected"],
             "fraud_rate": round(fraud_rate, 4),
             "last_prediction_time": self.stats["last_prediction_time"],
-            "is_model_loaded": self.model is not None
+            "is_model_loaded": self.model is not None,
+            "scoring_paths": dict(self.paths),
+            "fallbacks": dict(self.fallbacks),
+            "circuit_breaker": self.breaker.get_statistics(),
+            "cache_entries": len(self._cache)
         }
 
     def save_model(self, path: Optional[str] = None):
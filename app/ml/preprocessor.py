@@ -4,7 +4,7 @@
 """
 import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, List, Sequence, Tuple
 import logging
 
 from app.models import TransactionRequest
@@ -23,6 +23,22 @@ class TransactionPreprocessor:
     4. Расчет доли мошенничества по бакетам
     """
 
+    # Порядок признаков должен соответствовать обучению модели
+    FEATURE_ORDER = [
+        'amount',
+        'oldbalanceOrg',
+        'newbalanceOrig',
+        'oldbalanceDest',
+        'newbalanceDest',
+        'type_CASH_OUT',
+        'type_TRANSFER',
+        'balanceChange_Dest',
+        'fraud_share'
+    ]
+
+    # Числовые признаки, которые берутся из входных данных как есть
+    BALANCE_COLUMNS = ['amount', 'oldbalanceOrg', 'newbalanceOrig', 'oldbalanceDest', 'newbalanceDest']
+
     def __init__(self):
         # Границы бакетов для сумм транзакций (из notebook)
         self.num_buckets = 25
@@ -88,43 +104,80 @@ class TransactionPreprocessor:
         # 5. Удаление признака bucket (используется только для расчета fraud_share)
         df = df.drop(['bucket'], axis=1)
 
-        # Порядок признаков должен соответствовать обучению модели
-        feature_order = [
-            'amount',
-            'oldbalanceOrg',
-            'newbalanceOrig',
-            'oldbalanceDest',
-            'newbalanceDest',
-            'type_CASH_OUT',
-            'type_TRANSFER',
-            'balanceChange_Dest',
-            'fraud_share'
-        ]
-
-        df = df[feature_order]
+        df = df[self.FEATURE_ORDER]
 
         logger.debug(f"Подготовлены признаки: {df.columns.tolist()}")
 
         return df
 
-    def _calculate_bucket(self, amount: float) -> float:
+    def preprocess_columns(self, columns: Dict[str, np.ndarray], types: Sequence[str]) -> np.ndarray:
         """
-        Логарифмическое биннирование суммы транзакции
-        Реализация из notebook
+        Предобработка пакета транзакций по столбцам
+
+        Те же признаки, что и preprocess, без DataFrame на каждую транзакцию.
+
+        Args:
+            columns: Числовые столбцы BALANCE_COLUMNS (отсутствующие - нули)
+            types: Типы транзакций
+
+        Returns:
+            Матрица признаков (строк x FEATURE_ORDER)
         """
-        if amount <= 0:
-            return 0.0
+        amount = np.asarray(columns['amount'], dtype=np.float64)
+        rows = len(amount)
+        features = np.zeros((rows, len(self.FEATURE_ORDER)), dtype=np.float64)
+        for position, name in enumerate(self.BALANCE_COLUMNS):
+            if name in columns:
+                features[:, position] = columns[name]
+
+        types = np.asarray(types, dtype=object)
+        features[:, 5] = types == "CASH_OUT"
+        features[:, 6] = types == "TRANSFER"
+        features[:, 7] = features[:, 4] - features[:, 3]
+
+        bins = self._bucket_bins()
+        buckets = bins[np.clip(np.digitize(amount, bins), 0, len(bins) - 1)]
+        buckets[amount <= 0] = 0.0
+        bucket_keys = np.fromiter(self.fraud_share_by_bucket.keys(), dtype=np.float64)
+        shares = np.fromiter(self.fraud_share_by_bucket.values(), dtype=np.float64)
+        closest = np.abs(buckets[:, None] - bucket_keys[None, :]).argmin(axis=1)
+        features[:, 8] = shares[closest] + 1  # +1 как в notebook
+
+        return features
+
+    def columns_from_transactions(self, transactions: Sequence[TransactionRequest]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """Числовые столбцы и типы для preprocess_columns из списка транзакций"""
+        columns = {
+            name: np.fromiter(
+                (getattr(transaction, name) for transaction in transactions),
+                dtype=np.float64, count=len(transactions)
+            )
+            for name in self.BALANCE_COLUMNS
+        }
+        types = [getattr(transaction.type, 'value', transaction.type) for transaction in transactions]
+        return columns, types
 
-        # Логарифмические границы бакетов
+    def _bucket_bins(self) -> np.ndarray:
+        """Логарифмические границы бакетов"""
         min_amount = 0.01
         max_amount = 10000000.0
 
-        bins = np.logspace(
+        return np.logspace(
             np.log10(min_amount),
             np.log10(max_amount),
             self.num_buckets
         )
 
+    def _calculate_bucket(self, amount: float) -> float:
+        """
+        Логарифмическое биннирование суммы транзакции
+        Реализация из notebook
+        """
+        if amount <= 0:
+            return 0.0
+
+        bins = self._bucket_bins()
+
         # Определение бакета
         bucket_idx = np.digitize(amount, bins)
 
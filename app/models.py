@@ -2,7 +2,7 @@
 Pydantic модели для валидации данных API
 """
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Literal
 from datetime import datetime, timezone
 from enum import Enum
 
@@ -158,6 +158,14 @@ class TransactionResponse(BaseModel):
     requires_3d_secure: bool = Field(False, description="Требуется ли 3D-Secure")
     should_block: bool = Field(False, description="Следует ли заблокировать транзакцию")
     risk_factors: List[str] = Field(default_factory=list, description="Факторы риска")
+    scoring_path: Literal["model", "cache", "heuristic"] = Field(
+        "model",
+        description="Источник вероятности: модель, прежнее предсказание модели или эвристика (деградация)"
+    )
+    decision_stage: Literal["provisional", "final"] = Field(
+        "final",
+        description="provisional - предварительное решение, окончательное придет в webhook и WebSocket"
+    )
 
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -176,6 +184,8 @@ class TransactionResponse(BaseModel):
                 ],
                 "requires_3d_secure": True,
                 "should_block": True,
+                "scoring_path": "model",
+                "decision_stage": "final",
                 "timestamp": "2025-11-07T14:30:00"
             }
         }
@@ -194,6 +204,23 @@ class EvidenceRecord(BaseModel):
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class BlocklistUpdate(BaseModel):
+    """Массовое обновление списка блокировки"""
+    add: List[str] = Field(default_factory=list, description="Добавляемые записи")
+    remove: List[str] = Field(default_factory=list, description="Удаляемые записи")
+
+
+class FraudLabels(BaseModel):
+    """Подтвержденные мошеннические счета для графа переводов"""
+    accounts: List[str] = Field(..., min_length=1, description="Счета (nameOrig/nameDest)")
+
+
+class EvidenceExportRequest(BaseModel):
+    """Запрос массового экспорта доказательств"""
+    transaction_ids: List[str] = Field(..., min_length=1, description="ID транзакций")
+    format: Literal["jsonl", "zip"] = Field("zip", description="Формат пакета")
+
+
 class HealthCheck(BaseModel):
     """Статус здоровья сервиса"""
     status: str
@@ -0,0 +1,254 @@
+"""
+Pub/sub бэкенды для рассылки между воркерами
+Бэкенд broadcaster на redis.asyncio и локальный сервер с протоколом Redis (RESP)
+"""
+import asyncio
+import logging
+import typing
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from broadcaster import Broadcast
+from broadcaster._backends.base import BroadcastBackend
+from broadcaster._base import Event
+
+logger = logging.getLogger(__name__)
+
+
+class RedisPubSubBackend(BroadcastBackend):
+    """
+    Бэкенд broadcaster поверх redis.asyncio
+
+    Встроенный redis-бэкенд broadcaster 0.2 требует asyncio_redis;
+    этот использует клиент redis из requirements.txt.
+    """
+
+    def __init__(self, url: str):
+        self._url = url
+        self._redis = None
+        self._pubsub = None
+
+    async def connect(self) -> None:
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(self._url)
+        self._pubsub = self._redis.pubsub()
+
+    async def disconnect(self) -> None:
+        try:
+            await self._pubsub.aclose()
+        finally:
+            await self._redis.aclose()
+
+    async def subscribe(self, channel: str) -> None:
+        await self._pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str) -> None:
+        await self._pubsub.unsubscribe(channel)
+
+    async def publish(self, channel: str, message: typing.Any) -> None:
+        await self._redis.publish(channel, message)
+
+    async def allocate(self, name: str, count: int) -> Tuple[str, int]:
+        """
+        Общая последовательность: id потока и последний из count номеров
+
+        Id потока создается вместе со счетчиком (SET NX), поэтому после
+        перезапуска Redis у новых номеров и потока другой id
+        """
+        pipeline = self._redis.pipeline(transaction=False)
+        pipeline.set(f"{name}:stream", uuid.uuid4().hex[:12], nx=True)
+        pipeline.get(f"{name}:stream")
+        pipeline.incrby(f"{name}:seq", count)
+        _, stream, last = await pipeline.execute()
+        return stream.decode('utf-8'), int(last)
+
+    async def next_published(self) -> Event:
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(0.05)
+                continue
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is not None:
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode('utf-8')
+                return Event(channel=channel, message=message["data"])
+
+
+class Broadcaster(Broadcast):
+    """
+    Broadcast с бэкендом redis.asyncio для redis:// и rediss://
+
+    allocate() - номера последовательности, общие для всех издателей
+    канала: в Redis, для остальных бэкендов - в памяти процесса.
+    wait_listener() и reconnect() - для восстановления подписки после
+    обрыва соединения с бэкендом
+    """
+
+    def __init__(self, url: str):
+        if urlparse(url).scheme in ("redis", "rediss"):
+            self._subscribers = {}
+            self._backend = RedisPubSubBackend(url)
+        else:
+            super().__init__(url)
+        self._sequences: Dict[str, int] = {}
+        self._stream = uuid.uuid4().hex[:12]
+
+    async def allocate(self, name: str, count: int) -> Tuple[str, int]:
+        """Id потока и последний из count выделенных номеров"""
+        if isinstance(self._backend, RedisPubSubBackend):
+            return await self._backend.allocate(name, count)
+        last = self._sequences[name] = self._sequences.get(name, 0) + count
+        return self._stream, last
+
+    async def wait_listener(self) -> None:
+        """Ожидание остановки приема сообщений; ошибка приема (обрыв соединения) передается вызывающему"""
+        await asyncio.shield(self._listener_task)
+
+    async def reconnect(self) -> None:
+        """Новое соединение с бэкендом; подписки, оставшиеся от оборванного, сбрасываются"""
+        listener = getattr(self, "_listener_task", None)
+        if listener is not None and not listener.done():
+            listener.cancel()
+        try:
+            await self._backend.disconnect()
+        except Exception as e:
+            logger.debug(f"Ошибка закрытия соединения pub/sub: {str(e)}")
+        self._subscribers = {}
+        await self.connect()
+
+
+# === ЛОКАЛЬНЫЙ СЕРВЕР PUB/SUB (RESP) ===
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        size = int(header[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+class PubSubServer:
+    """
+    Минимальный сервер с протоколом Redis: PUBLISH, SUBSCRIBE, UNSUBSCRIBE, PING
+    и GET, SET [NX], INCRBY для общей последовательности издателей
+
+    Замена Redis для нескольких воркеров на одной машине:
+    BROADCAST_URL=redis://127.0.0.1:6380
+    """
+
+    # Подписчик с переполненным буфером отправки пропускает сообщения
+    MAX_WRITE_BUFFER = 8 * 1024 * 1024
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6380):
+        self.host = host
+        self.port = port
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.values: Dict[bytes, bytes] = {}
+        self.published = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Pub/sub сервер запущен на {self.host}:{self.port}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriptions: Set[bytes] = set()
+        try:
+            while True:
+                command = await _read_command(reader)
+                if command is None:
+                    break
+                if not command:
+                    continue
+                name = command[0].upper()
+
+                if name == b"PUBLISH":
+                    writer.write(_encode(self._publish(command[1], command[2])))
+                elif name == b"SUBSCRIBE":
+                    for channel in command[1:]:
+                        subscriptions.add(channel)
+                        self.channels.setdefault(channel, set()).add(writer)
+                        writer.write(_encode([b"subscribe", channel, len(subscriptions)]))
+                elif name == b"UNSUBSCRIBE":
+                    for channel in command[1:] or list(subscriptions):
+                        subscriptions.discard(channel)
+                        self.channels.get(channel, set()).discard(writer)
+                        writer.write(_encode([b"unsubscribe", channel, len(subscriptions)]))
+                elif name == b"GET":
+                    writer.write(_encode(self.values.get(command[1])))
+                elif name == b"SET":
+                    if b"NX" in (arg.upper() for arg in command[3:]) and command[1] in self.values:
+                        writer.write(_encode(None))
+                    else:
+                        self.values[command[1]] = command[2]
+                        writer.write(b"+OK\r\n")
+                elif name == b"INCRBY":
+                    value = int(self.values.get(command[1], b"0")) + int(command[2])
+                    self.values[command[1]] = b"%d" % value
+                    writer.write(_encode(value))
+                elif name == b"PING":
+                    writer.write(_encode([b"pong", b""]) if subscriptions else b"+PONG\r\n")
+                else:
+                    # CLIENT SETINFO, SELECT и прочие служебные команды клиента
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscriptions:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    def _publish(self, channel: bytes, message: bytes) -> int:
+        frame = _encode([b"message", channel, message])
+        delivered = 0
+        for subscriber in list(self.channels.get(channel, ())):
+            if subscriber.transport.get_write_buffer_size() > self.MAX_WRITE_BUFFER:
+                continue
+            subscriber.write(frame)
+            delivered += 1
+        self.published += 1
+        return delivered
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальный pub/sub сервер с протоколом Redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def _serve():
+        server = PubSubServer(args.host, args.port)
+        await server.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(_serve())
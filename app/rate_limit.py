@@ -0,0 +1,340 @@
+"""
+Ограничение частоты запросов по клиентам
+Корзины токенов по API-ключу и IP источника, ленивое пополнение,
+вытеснение давно не активных клиентов, общий бэкенд Redis для воркеров
+"""
+import hashlib
+import json
+import logging
+import math
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from urllib.parse import urlparse
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+
+class Bucket(NamedTuple):
+    """Корзина клиента: пополнение rate токенов в секунду до burst"""
+    key: str
+    rate: float
+    burst: float
+
+
+class TokenBucketTable:
+    """
+    Таблица корзин в памяти процесса
+
+    - Токены и время последнего пополнения лежат в двух массивах double,
+      словарь хранит только ключ -> номер строки
+    - Пополнение ленивое: при обращении добавляется rate * прошедшее время
+      (никаких таймеров на ключ)
+    - При max_entries клиентах строка дольше всех не обращавшегося
+      клиента отдается новому; вытесненный клиент при возвращении
+      начинает с полной корзины, как и после долгого простоя
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._rows: "OrderedDict[str, int]" = OrderedDict()
+        self._tokens = array('d')
+        self._updated = array('d')
+        self.evicted = 0
+
+    def take(self, buckets: Sequence[Bucket], cost: float, now: float) -> float:
+        """
+        Списание cost токенов из всех корзин сразу
+
+        Returns:
+            0.0 - списано; иначе секунды до появления токенов
+            (math.inf - cost больше burst одной из корзин)
+        """
+        rows = [self._row(bucket, now) for bucket in buckets]
+        wait = 0.0
+        for row, bucket in zip(rows, buckets):
+            tokens = min(bucket.burst, self._tokens[row] + (now - self._updated[row]) * bucket.rate)
+            self._tokens[row] = tokens
+            self._updated[row] = now
+            if tokens < cost:
+                wait = max(wait, math.inf if cost > bucket.burst else (cost - tokens) / bucket.rate)
+        if wait:
+            return wait
+        for row in rows:
+            self._tokens[row] -= cost
+        return 0.0
+
+    def _row(self, bucket: Bucket, now: float) -> int:
+        row = self._rows.get(bucket.key)
+        if row is not None:
+            self._rows.move_to_end(bucket.key)
+            return row
+
+        if len(self._rows) >= self.max_entries:
+            _, row = self._rows.popitem(last=False)
+            self.evicted += 1
+            self._tokens[row] = bucket.burst
+            self._updated[row] = now
+        else:
+            row = len(self._tokens)
+            self._tokens.append(bucket.burst)
+            self._updated.append(now)
+        self._rows[bucket.key] = row
+        return row
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+# KEYS - корзины, ARGV - cost, затем пары rate, burst. Время - часы Redis,
+# общие для всех воркеров. Ответ: {1, "0"} или {0, "<секунды ожидания>"}
+_REDIS_TAKE = """
+local cost = tonumber(ARGV[1])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 't', 'u')
+    local available = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    available = math.min(burst, available + math.max(0, now - updated) * rate)
+    tokens[i] = available
+    if available < cost then
+        if cost > burst then
+            wait = -1
+        elseif wait >= 0 then
+            wait = math.max(wait, (cost - available) / rate)
+        end
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local left = tokens[i]
+    if wait == 0 then
+        left = left - cost
+    end
+    redis.call('HSET', key, 't', tostring(left), 'u', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+if wait == 0 then
+    return {1, "0"}
+end
+return {0, tostring(wait)}
+"""
+
+
+class RedisTokenBuckets:
+    """
+    Корзины в Redis для нескольких воркеров и хостов
+
+    Проверка и списание - один Lua-скрипт (атомарно для всех корзин
+    запроса). Ключи истекают, когда корзина заведомо полна, поэтому
+    простаивающие клиенты не занимают память. API-ключи хранятся хэшем.
+    """
+
+    def __init__(self, url: str, prefix: str = "fraudguard:rl:"):
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._script = None
+
+    async def take(self, buckets: Sequence[Bucket], cost: float) -> float:
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.url)
+            self._script = self._redis.register_script(_REDIS_TAKE)
+
+        keys = [self.prefix + hashlib.blake2b(bucket.key.encode(), digest_size=12).hexdigest() for bucket in buckets]
+        args = [cost]
+        for bucket in buckets:
+            args.extend((bucket.rate, bucket.burst))
+        allowed, wait = await self._script(keys=keys, args=args)
+        if allowed:
+            return 0.0
+        wait = float(wait)
+        return math.inf if wait < 0 else wait
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+class RateLimiter:
+    """
+    Корзины токенов по клиентам
+
+    - Запрос с X-API-Key списывает токены из корзины ключа (уровень по
+      api_keys, неизвестный ключ - default_tier) и из корзины IP
+      источника (ip_tier); без ключа - только из корзины IP
+    - Уровни: {"имя": {"rate": токенов в секунду, "burst": емкость}}
+    - backend_url memory:// - таблица в памяти процесса (лимит на
+      воркер), redis://host:port - общие корзины всех воркеров; при
+      ошибке Redis таблица в памяти используется backend_retry_seconds
+    """
+
+    def __init__(
+        self,
+        tiers: Dict[str, Dict[str, float]],
+        api_keys: Optional[Dict[str, str]] = None,
+        default_tier: str = "default",
+        ip_tier: str = "ip",
+        max_clients: int = 100_000,
+        backend_url: str = "memory://",
+        backend_retry_seconds: float = 5.0
+    ):
+        for name in (default_tier, ip_tier, *(api_keys or {}).values()):
+            if name not in tiers:
+                raise ValueError(f"Неизвестный уровень ограничения: {name}")
+        self.tiers = tiers
+        self.api_keys = api_keys or {}
+        self.default_tier = default_tier
+        self.ip_tier = ip_tier
+        self.table = TokenBucketTable(max_clients)
+        self.backend = (
+            RedisTokenBuckets(backend_url) if urlparse(backend_url).scheme in ("redis", "rediss") else None
+        )
+
+        self.backend_retry_seconds = backend_retry_seconds
+        self._backend_retry_at = 0.0
+
+        self.allowed = 0
+        self.limited = 0
+        self.backend_errors = 0
+
+    def buckets(self, api_key: Optional[str], ip: Optional[str]) -> List[Bucket]:
+        """Корзины, из которых списывается запрос клиента"""
+        buckets = []
+        if api_key:
+            tier = self.tiers[self.api_keys.get(api_key, self.default_tier)]
+            buckets.append(Bucket(f"key:{api_key}", tier["rate"], tier["burst"]))
+        tier = self.tiers[self.ip_tier]
+        buckets.append(Bucket(f"ip:{ip or 'unknown'}", tier["rate"], tier["burst"]))
+        return buckets
+
+    async def take(self, buckets: Sequence[Bucket], cost: float = 1.0) -> float:
+        """Списание cost токенов; 0.0 - разрешено, иначе секунды до повтора"""
+        wait = None
+        now = time.monotonic()
+        if self.backend is not None and now >= self._backend_retry_at:
+            try:
+                wait = await self.backend.take(buckets, cost)
+            except Exception as e:
+                self.backend_errors += 1
+                self._backend_retry_at = now + self.backend_retry_seconds
+                logger.warning(f"Бэкенд ограничения частоты недоступен: {str(e)}")
+        if wait is None:
+            wait = self.table.take(buckets, cost, now)
+
+        if wait:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def get_statistics(self) -> Dict:
+        """Разрешенные и отклоненные запросы, клиенты в таблице"""
+        return {
+            "backend": "redis" if self.backend is not None else "memory",
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "clients": len(self.table),
+            "max_clients": self.table.max_entries,
+            "evicted": self.table.evicted,
+            "backend_errors": self.backend_errors,
+        }
+
+
+def _too_many_requests(wait: float) -> HTTPException:
+    if math.isinf(wait):
+        return HTTPException(status_code=429, detail="Запрос больше емкости корзины клиента (burst)")
+    return HTTPException(
+        status_code=429,
+        detail="Превышен лимит запросов клиента",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))}
+    )
+
+
+async def charge_rows(request: Request, rows: int):
+    """
+    Дополнительное списание за строки пакета
+
+    Middleware списывает 1 токен при приеме запроса; пакет из rows
+    строк после разбора списывает остальные rows - 1.
+
+    Raises:
+        HTTPException: 413, если пакет больше емкости корзины клиента
+            (такой пакет не пройдет никогда - повтор бессмыслен);
+            429, если токенов не хватает
+    """
+    state = request.scope.get("state") or {}
+    limiter, buckets = state.get("rate_limiter"), state.get("rate_limit_buckets")
+    if limiter is None or rows <= 1:
+        return
+    capacity = int(min(bucket.burst for bucket in buckets))
+    if rows > capacity:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Пакет из {rows} строк больше емкости корзины клиента: не больше {capacity} строк в пакете"
+        )
+    wait = await limiter.take(buckets, rows - 1)
+    if wait:
+        raise _too_many_requests(wait)
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware: запросы к путям paths (по префиксу) списывают 1 токен
+    из корзин клиента, при нехватке - 429 с Retry-After. Корзины
+    запроса сохраняются в request.state для charge_rows.
+    IP - адрес соединения или, при trust_forwarded, первый адрес
+    X-Forwarded-For (только за доверенным прокси).
+    """
+
+    def __init__(self, app, limiter: RateLimiter, paths: Sequence[str], trust_forwarded: bool = False):
+        self.app = app
+        self.limiter = limiter
+        self.paths = tuple(paths)
+        self.trust_forwarded = trust_forwarded
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        api_key = forwarded = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                api_key = value.decode('latin-1')
+            elif name == b"x-forwarded-for" and self.trust_forwarded:
+                forwarded = value.decode('latin-1').split(",", 1)[0].strip()
+        client = scope.get("client")
+        ip = forwarded or (client[0] if client else None)
+
+        buckets = self.limiter.buckets(api_key, ip)
+        wait = await self.limiter.take(buckets)
+        if wait:
+            error = _too_many_requests(wait)
+            body = json.dumps({"detail": error.detail}, ensure_ascii=False).encode('utf-8')
+            headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            headers.extend((name.lower().encode(), value.encode()) for name, value in (error.headers or {}).items())
+            await send({"type": "http.response.start", "status": 429, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        state = scope.setdefault("state", {})
+        state["rate_limiter"] = self.limiter
+        state["rate_limit_buckets"] = buckets
+        await self.app(scope, receive, send)
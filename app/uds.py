@@ -0,0 +1,193 @@
+"""
+Прием транзакций через Unix-сокет для шлюзов на том же хосте
+Бинарные кадры с длиной вместо HTTP, тот же путь оценки, что и /api/v1/analyze
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import orjson
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.fastpath import encode_response, transaction_decoder
+from app.models import TransactionRequest, TransactionResponse
+from app.uds_client import REQUEST_HEADER, RESPONSE_HEADER
+
+logger = logging.getLogger(__name__)
+
+ScoreHandler = Callable[[TransactionRequest], Awaitable[TransactionResponse]]
+
+
+class ScoringServer:
+    """
+    Сервер оценки транзакций на Unix-сокете (протокол - app/uds_client.py)
+
+    - Каждый запрос обрабатывается в своей задаче, поэтому в одном
+      соединении может быть до max_in_flight запросов одновременно;
+      при достижении лимита чтение соединения приостанавливается
+    - Тело разбирается TransactionDecoder с откатом на модель,
+      ошибки валидации возвращаются со статусом 422
+    - Кадр длиннее max_frame_bytes закрывает соединение
+    - Lifespan выполняют все воркеры uvicorn и consume.py, а сокет
+      обслуживает один процесс: владелец блокировки <path>.lock (flock).
+      Остальные раз в takeover_interval секунд пытаются взять блокировку
+      и заменяют владельца, если он завершился. Файл сокета удаляется
+      только владельцем блокировки
+    """
+
+    def __init__(
+        self,
+        path: str,
+        score: ScoreHandler,
+        max_in_flight: int = 256,
+        max_frame_bytes: int = 1024 * 1024,
+        takeover_interval: float = 1.0
+    ):
+        self.path = path
+        self.score = score
+        self.max_in_flight = max_in_flight
+        self.max_frame_bytes = max_frame_bytes
+        self.takeover_interval = takeover_interval
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock_fd: Optional[int] = None
+        self._standby: Optional[asyncio.Task] = None
+
+        self.connections = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    async def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._acquire_lock():
+            await self._bind()
+        else:
+            logger.info(f"Unix-сокет {self.path} обслуживает другой процесс")
+            self._standby = asyncio.create_task(self._take_over())
+
+    def _acquire_lock(self) -> bool:
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o660)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _bind(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # сокет завершившегося владельца
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o660)
+        logger.info(f"Прием транзакций через Unix-сокет {self.path}")
+
+    async def _take_over(self):
+        while not self._acquire_lock():
+            await asyncio.sleep(self.takeover_interval)
+        await self._bind()
+
+    @property
+    def serving(self) -> bool:
+        return self._server is not None
+
+    async def close(self):
+        if self._standby is not None:
+            self._standby.cancel()
+            await asyncio.gather(self._standby, return_exceptions=True)
+            self._standby = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks: Set[asyncio.Task] = set()
+        try:
+            while True:
+                length, request_id = REQUEST_HEADER.unpack(await reader.readexactly(REQUEST_HEADER.size))
+                if length > self.max_frame_bytes:
+                    logger.warning(f"Кадр {length} байт превышает лимит, соединение закрыто")
+                    break
+                body = await reader.readexactly(length)
+
+                await slots.acquire()
+                task = asyncio.create_task(self._process(request_id, body, writer, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self.connections -= 1
+            writer.close()
+
+    async def _process(
+        self,
+        request_id: int,
+        body: bytes,
+        writer: asyncio.StreamWriter,
+        slots: asyncio.Semaphore
+    ):
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            try:
+                status, payload = await self._score(body)
+            except Exception as e:
+                # Ответ на каждый кадр: иначе клиент ждет его бесконечно
+                logger.error(f"Ошибка обработки кадра Unix-сокета: {str(e)}")
+                status, payload = 500, orjson.dumps({"detail": str(e)})
+            if status != 200:
+                self.errors += 1
+            writer.write(RESPONSE_HEADER.pack(len(payload), request_id, status) + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.in_flight -= 1
+            self.requests += 1
+            self.total_ms += (time.perf_counter() - started) * 1000
+            slots.release()
+
+    async def _score(self, body: bytes) -> Tuple[int, bytes]:
+        transaction = transaction_decoder.decode(body)
+        if transaction is None:
+            try:
+                transaction = TransactionRequest.model_validate_json(body)
+            except ValidationError as e:
+                return 422, orjson.dumps({"detail": e.errors(include_url=False)}, default=str)
+
+        try:
+            response = await self.score(transaction)
+        except HTTPException as e:
+            return e.status_code, orjson.dumps({"detail": e.detail})
+        except Exception as e:
+            logger.error(f"Ошибка оценки через Unix-сокет: {str(e)}")
+            return 500, orjson.dumps({"detail": str(e)})
+        return 200, encode_response(response)
+
+    def get_statistics(self) -> Dict:
+        """Соединения, запросы в обработке и средняя задержка"""
+        return {
+            "path": self.path,
+            "serving": self.serving,
+            "connections": self.connections,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 3) if self.requests else 0.0,
+        }
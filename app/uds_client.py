@@ -0,0 +1,111 @@
+"""
+Клиент оценки транзакций через Unix-сокет (для шлюза на том же хосте)
+
+Протокол (little-endian):
+    запрос   uint32 длина тела, uint32 request_id, тело - JSON TransactionRequest
+    ответ    uint32 длина тела, uint32 request_id, uint16 статус (как в HTTP),
+             тело - JSON TransactionResponse или {"detail": ...}
+
+В одном соединении может быть много запросов одновременно; ответы
+приходят по мере готовности и сопоставляются по request_id.
+
+Пример:
+    async with ScoringClient("/run/fraudguard/scoring.sock") as client:
+        result = await client.analyze({"type": "TRANSFER", "amount": 1500.0})
+"""
+import asyncio
+import json
+import struct
+from typing import Any, Dict, Optional
+
+REQUEST_HEADER = struct.Struct("<II")
+RESPONSE_HEADER = struct.Struct("<IIH")
+
+
+class ScoringError(Exception):
+    """Ответ сервера со статусом, отличным от 200"""
+
+    def __init__(self, status: int, detail: Any):
+        super().__init__(f"{status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+
+class ScoringClient:
+    """Асинхронный клиент с конвейерной отправкой запросов"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
+
+    async def __aenter__(self) -> "ScoringClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def analyze(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Оценка транзакции
+
+        Raises:
+            ScoringError: ошибка валидации (422) или обработки
+            ConnectionError: соединение закрыто
+        """
+        return await self.analyze_raw(json.dumps(transaction).encode('utf-8'))
+
+    async def analyze_raw(self, body: bytes) -> Dict[str, Any]:
+        """Оценка транзакции, уже закодированной в JSON"""
+        if self._writer is None:
+            raise ConnectionError("Клиент не подключен")
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        self._writer.write(REQUEST_HEADER.pack(len(body), request_id) + body)
+        await self._writer.drain()
+
+        status, payload = await future
+        result = json.loads(payload)
+        if status != 200:
+            raise ScoringError(status, result.get("detail"))
+        return result
+
+    async def _read_loop(self):
+        error: Exception = ConnectionError("Соединение закрыто сервером")
+        try:
+            while True:
+                header = await self._reader.readexactly(RESPONSE_HEADER.size)
+                length, request_id, status = RESPONSE_HEADER.unpack(header)
+                payload = await self._reader.readexactly(length)
+                future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((status, payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            if not isinstance(e, asyncio.IncompleteReadError):
+                error = e
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
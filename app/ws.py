@@ -3,61 +3,699 @@ WebSocket Manager for FraudShield.AI
 Handles real-time broadcasting of fraud analysis results to connected clients
 """
 from fastapi import WebSocket, WebSocketDisconnect
-from broadcaster import Broadcast
-from typing import List, Dict, Any
+from app.config import settings
+from app.pubsub import Broadcaster
+from app.ws_codec import BINARY_SUBPROTOCOL, encode_batch, encode_event, encode_summary
+from collections import deque
+from typing import Any, Deque, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple, Union
+import asyncio
 import json
 import logging
+import os
+import time
+import uuid
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
-# Broadcaster instance (memory-based for simplicity)
-broadcast = Broadcast("memory://")
+ANALYSIS_CHANNEL = "fraudguard:analysis"
+
+
+# Slow client policies: disconnect the client, or drop its oldest queued messages
+SLOW_CLIENT_DISCONNECT = "disconnect"
+SLOW_CLIENT_DROP_OLDEST = "drop_oldest"
+
+
+class SubscriptionFilter(NamedTuple):
+    """Server-side filter and frame rate of a subscription (hashable: equal filters share a group)"""
+    min_risk_score: float = 0.0
+    fraud_only: bool = False
+    types: FrozenSet[str] = frozenset()
+    merchants: FrozenSet[str] = frozenset()
+    interval_ms: int = 1000
+
+    @classmethod
+    def from_message(cls, payload: Dict[str, Any]) -> "SubscriptionFilter":
+        """
+        Parse a subscribe request:
+        {"action": "subscribe", "min_risk_score": 70, "fraud_only": true,
+         "types": ["TRANSFER"], "merchants": ["M123"], "max_fps": 5}
+        """
+        try:
+            max_fps = float(payload.get("max_fps") or 1.0)
+            if max_fps <= 0:
+                raise ValueError("max_fps must be positive")
+            interval_ms = max(settings.WS_MIN_FRAME_INTERVAL_MS, int(1000 / max_fps))
+            return cls(
+                min_risk_score=float(payload.get("min_risk_score") or 0.0),
+                fraud_only=bool(payload.get("fraud_only", False)),
+                types=frozenset(str(value).upper() for value in payload.get("types") or ()),
+                merchants=frozenset(str(value) for value in payload.get("merchants") or ()),
+                interval_ms=interval_ms
+            )
+        except (TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid subscription: {e}") from e
+
+    def matches(self, message: Dict[str, Any]) -> bool:
+        if message["risk_score"] < self.min_risk_score:
+            return False
+        if self.fraud_only and not message["is_fraud"]:
+            return False
+        if self.types and message.get("transaction_type") not in self.types:
+            return False
+        if self.merchants and message.get("merchant") not in self.merchants:
+            return False
+        return True
+
+
+class SubscriptionGroup:
+    """
+    Clients with the same filter
+
+    The filter is evaluated once per event for the whole group; matching
+    events are packed into one frame every interval_ms (JSON or, for
+    binary clients, the compact binary format). Events beyond
+    max_events per frame are dropped and reported in a summary frame.
+    """
+
+    def __init__(self, subscription: SubscriptionFilter, max_events: int, binary: bool = False):
+        self.subscription = subscription
+        self.max_events = max_events
+        self.binary = binary
+        self.members: Set["ClientConnection"] = set()
+        self.pending: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self.dropped_fraud = 0
+        self.dropped_max_risk_score = 0.0
+        self.flusher: Optional[asyncio.Task] = None
+
+    def add(self, message: Dict[str, Any]):
+        if len(self.pending) < self.max_events:
+            self.pending.append(message)
+            return
+        self.dropped += 1
+        self.dropped_fraud += message["is_fraud"]
+        self.dropped_max_risk_score = max(self.dropped_max_risk_score, message["risk_score"])
+
+    def take_frames(self) -> List[Union[str, bytes]]:
+        """Batch frame and, if events were dropped, a summary frame (serialized once)"""
+        frames = []
+        if self.pending:
+            if self.binary:
+                frames.append(encode_batch(encode_event(message) for message in self.pending))
+            else:
+                frames.append(json.dumps({"type": "batch", "events": self.pending}, default=str))
+            self.pending = []
+        if self.dropped and self.binary:
+            frames.append(encode_summary(self.dropped, self.dropped_fraud, self.dropped_max_risk_score))
+        elif self.dropped:
+            frames.append(json.dumps({
+                "type": "summary",
+                "dropped": self.dropped,
+                "dropped_fraud": self.dropped_fraud,
+                "dropped_max_risk_score": self.dropped_max_risk_score,
+            }))
+        self.dropped = self.dropped_fraud = 0
+        self.dropped_max_risk_score = 0.0
+        return frames
+
+
+class ReplayBuffer:
+    """
+    Fixed-size ring buffer of recent events with monotonic sequence numbers
+
+    Each event is stored with its serialized frame, so a reconnecting
+    client gets the missed frames without re-serialization. Sequence
+    numbers and the stream id come from the publisher (shared by all
+    workers, see AnalysisPublisher); events broadcast without a publisher
+    are numbered locally. Sequence numbers of another stream are not
+    comparable.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.reset(uuid.uuid4().hex[:12], 0)
+
+    def reset(self, stream_id: str, last_seq: int):
+        """Start a new stream: events up to last_seq are not in the buffer"""
+        self.stream_id = stream_id
+        self.last_seq = last_seq
+        self._first_seq = last_seq + 1
+        self._frames: List[Optional[Tuple[int, str]]] = [None] * self.capacity
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(self._first_seq, self.last_seq - self.capacity + 1)
+
+    def append(self, message: Dict[str, Any]) -> str:
+        """Store the serialized frame; a message without seq gets the next local number"""
+        seq = message.get("seq")
+        if seq is None:
+            seq = message["seq"] = self.last_seq + 1
+        frame = json.dumps(message, default=str)
+        # Batches of different publishers may arrive out of order
+        if seq > self.last_seq - self.capacity:
+            self._frames[seq % self.capacity] = (seq, frame)
+        self.last_seq = max(self.last_seq, seq)
+        return frame
+
+    def since(self, seq: int) -> Optional[List[str]]:
+        """
+        Frames after seq
+
+        Returns:
+            None if the gap is no longer in the buffer
+        """
+        if seq >= self.last_seq:
+            return []
+        if seq < self.oldest_seq - 1:
+            return None
+        frames = []
+        for s in range(seq + 1, self.last_seq + 1):
+            entry = self._frames[s % self.capacity]
+            if entry is not None and entry[0] == s:
+                frames.append(entry[1])
+        return frames
+
+
+class ClientConnection:
+    """A connected client with a bounded outbound queue and its own sender task"""
+
+    __slots__ = ("websocket", "queue", "max_queue", "sender", "sent", "dropped", "wakeup", "group", "binary")
+
+    def __init__(self, websocket: WebSocket, max_queue: int, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary
+        self.queue: Deque[Union[str, bytes]] = deque()
+        self.max_queue = max_queue
+        self.sender: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.wakeup = asyncio.Event()
+        self.group: Optional[SubscriptionGroup] = None
+
+    def offer(self, message: Union[str, bytes], policy: str) -> bool:
+        """
+        Queue a message without waiting
+
+        Returns:
+            False if the client is too slow and must be disconnected
+        """
+        if len(self.queue) >= self.max_queue:
+            if policy == SLOW_CLIENT_DISCONNECT:
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(message)
+        self.wakeup.set()
+        return True
 
 
 class ConnectionManager:
-    """Manages WebSocket connections and broadcasting"""
-    
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        """Accept a new WebSocket connection"""
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"WebSocket client connected. Total connections: {len(self.active_connections)}")
-    
+    """
+    Manages WebSocket connections and broadcasting
+
+    The payload is serialized once per message and appended to each
+    client's bounded queue; a per-client sender task writes it to the
+    socket, so a slow client never delays the broadcast for the others.
+
+    Clients without a subscription get one frame per event; subscribed
+    clients get coalesced frames from their subscription group.
+
+    Every event gets a sequence number and is kept in a replay buffer;
+    a client reconnecting with `since` receives only the missed events.
+
+    Clients negotiating the binary subprotocol always belong to a group
+    (unfiltered by default) and receive batched binary frames.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 100,
+        slow_client_policy: str = SLOW_CLIENT_DROP_OLDEST,
+        replay_size: int = 10_000
+    ):
+        self.max_queue = max_queue
+        self.slow_client_policy = slow_client_policy
+        self.replay = ReplayBuffer(replay_size)
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.groups: Dict[Tuple[SubscriptionFilter, bool], SubscriptionGroup] = {}
+        self.slow_disconnects = 0
+
+    @property
+    def active_connections(self) -> Set[WebSocket]:
+        return set(self.clients)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        since: Optional[int] = None,
+        stream: Optional[str] = None
+    ):
+        """Accept a new WebSocket connection and replay the events it missed"""
+        binary = BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        await websocket.accept(subprotocol=BINARY_SUBPROTOCOL if binary else None)
+        client = self.register(websocket, binary)
+        self.resume(client, since, stream)
+        logger.info(f"WebSocket client connected. Total connections: {len(self.clients)}")
+
+    def register(self, websocket: WebSocket, binary: bool = False) -> ClientConnection:
+        """Start the sender task for an accepted connection"""
+        client = ClientConnection(websocket, self.max_queue, binary)
+        client.sender = asyncio.create_task(self._send_loop(client))
+        self.clients[websocket] = client
+        if binary:
+            self.subscribe(websocket, None)
+        return client
+
+    def resume(self, client: ClientConnection, since: Optional[int], stream: Optional[str] = None):
+        """
+        Queue the hello frame and, for a reconnect, the missed frames
+        or a resync signal when the gap is no longer in the buffer
+        """
+        replay = self.replay
+        frames = [json.dumps({"type": "hello", "stream": replay.stream_id, "seq": replay.last_seq})]
+        if since is not None:
+            missed, reason = None, None
+            if stream is None:
+                reason = "stream required"
+            elif stream != replay.stream_id:
+                reason = "stream changed"
+            elif since > replay.last_seq:
+                reason = "ahead of stream"
+            else:
+                missed = replay.since(since)
+                if missed is None:
+                    reason = "gap too large"
+            if reason is not None:
+                frames.append(json.dumps({
+                    "type": "resync",
+                    "reason": reason,
+                    "stream": replay.stream_id,
+                    "oldest_seq": replay.oldest_seq,
+                    "latest_seq": replay.last_seq,
+                }))
+            elif client.binary:
+                step = settings.WS_MAX_EVENTS_PER_FRAME
+                frames.extend(
+                    encode_batch(encode_event(json.loads(frame)) for frame in missed[start:start + step])
+                    for start in range(0, len(missed), step)
+                )
+            else:
+                frames.extend(missed)
+        # The replay is bounded by the buffer size and bypasses the queue limit
+        client.queue.extend(frames)
+        client.wakeup.set()
+
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        self.active_connections.remove(websocket)
-        logger.info(f"WebSocket client disconnected. Total connections: {len(self.active_connections)}")
-    
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        self._leave_group(client)
+        if client.sender is not None and client.sender is not asyncio.current_task():
+            client.sender.cancel()
+        logger.info(f"WebSocket client disconnected. Total connections: {len(self.clients)}")
+
+    def subscribe(self, websocket: WebSocket, subscription: Optional[SubscriptionFilter]):
+        """
+        Move a client to the group of its filter
+
+        None - back to per-event frames (binary clients: the unfiltered group)
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        self._leave_group(client)
+        if subscription is None:
+            if not client.binary:
+                return
+            subscription = SubscriptionFilter(interval_ms=settings.WS_BINARY_FRAME_INTERVAL_MS)
+
+        key = (subscription, client.binary)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = SubscriptionGroup(
+                subscription, settings.WS_MAX_EVENTS_PER_FRAME, client.binary
+            )
+            group.flusher = asyncio.create_task(self._flush_loop(group))
+        group.members.add(client)
+        client.group = group
+
+    def _leave_group(self, client: ClientConnection):
+        group = client.group
+        if group is None:
+            return
+        client.group = None
+        group.members.discard(client)
+        if not group.members:
+            del self.groups[(group.subscription, group.binary)]
+            if group.flusher is not None:
+                group.flusher.cancel()
+
+    async def _flush_loop(self, group: SubscriptionGroup):
+        interval = group.subscription.interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            frames = group.take_frames()
+            if frames:
+                self._deliver(frames, group.members)
+
+    def _deliver(self, frames: List[Union[str, bytes]], clients):
+        policy = self.slow_client_policy
+        slow = [
+            client.websocket for client in clients
+            if not all(client.offer(frame, policy) for frame in frames)
+        ]
+        for websocket in slow:
+            self.slow_disconnects += 1
+            self.disconnect(websocket)
+            asyncio.create_task(self._close_slow(websocket))
+
+    async def _send_loop(self, client: ClientConnection):
+        queue = client.queue
+        try:
+            while True:
+                while not queue:
+                    client.wakeup.clear()
+                    await client.wakeup.wait()
+                frame = queue.popleft()
+                if isinstance(frame, bytes):
+                    await client.websocket.send_bytes(frame)
+                else:
+                    await client.websocket.send_text(frame)
+                client.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to client: {e}")
+            self.disconnect(client.websocket)
+
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Send a message to a specific client"""
-        await websocket.send_text(message)
-    
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.offer(message, SLOW_CLIENT_DROP_OLDEST)
+
     async def broadcast_message(self, message: Dict[Any, Any]):
         """Broadcast a message to all connected clients"""
-        message_str = json.dumps(message, default=str)
-        
-        # Remove disconnected clients
-        disconnected = []
-        for connection in self.active_connections:
+        frame = self.replay.append(message)
+
+        for group in self.groups.values():
+            if group.subscription.matches(message):
+                group.add(message)
+
+        unsubscribed = [client for client in self.clients.values() if client.group is None]
+        if unsubscribed:
+            self._deliver([frame], unsubscribed)
+
+        logger.debug(f"Broadcasted message to {len(self.clients)} clients")
+
+    @staticmethod
+    async def _close_slow(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Connection count, queue depth and drops"""
+        clients = self.clients.values()
+        return {
+            "connections": len(self.clients),
+            "max_queue_depth": max((len(client.queue) for client in clients), default=0),
+            "dropped_messages": sum(client.dropped for client in clients),
+            "slow_disconnects": self.slow_disconnects,
+            "subscription_groups": len(self.groups),
+            "stream": self.replay.stream_id,
+            "last_seq": self.replay.last_seq,
+        }
+
+
+# Global connection manager instance
+manager = ConnectionManager(
+    max_queue=settings.WS_CLIENT_QUEUE_SIZE,
+    slow_client_policy=settings.WS_SLOW_CLIENT_POLICY,
+    replay_size=settings.WS_REPLAY_BUFFER_SIZE
+)
+
+
+def _latency_summary(samples: Deque[float]) -> Dict[str, float]:
+    if not samples:
+        return {"avg_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+    return {
+        "avg_ms": round(sum(ordered) / len(ordered), 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+class AnalysisPublisher:
+    """
+    Publishes analysis messages through the broadcaster backend
+
+    Messages are buffered and published as one batch every interval_ms
+    (or once batch_size messages are buffered). Every worker subscribes
+    to the channel and fans the received batches out to its own sockets,
+    so a dashboard sees transactions scored by any worker.
+
+    Sequence numbers are allocated from the backend's shared sequence
+    when a batch is published, so every worker replays the same events
+    under the same numbers and a client may resume on any worker.
+
+    The subscription is supervised: when the backend connection drops,
+    the broadcaster reconnects with exponential backoff (up to
+    max_reconnect_delay seconds). start() fails if the first subscription
+    is not ready within subscribe_timeout seconds. A batch that fails
+    to publish is buffered again (up to max_buffered messages) and
+    retried after a backoff; beyond that, and while this worker is not
+    subscribed, batches are delivered to this worker's sockets directly.
+    """
+
+    def __init__(
+        self,
+        broadcast: Broadcaster,
+        connections: ConnectionManager,
+        channel: str = ANALYSIS_CHANNEL,
+        interval_ms: int = 20,
+        batch_size: int = 500,
+        max_buffered: int = 50_000,
+        subscribe_timeout: float = 5.0,
+        reconnect_delay: float = 0.1,
+        max_reconnect_delay: float = 5.0
+    ):
+        self.broadcast = broadcast
+        self.connections = connections
+        self.channel = channel
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self.subscribe_timeout = subscribe_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.origin = os.getpid()
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+        self.publishes = 0
+        self.published_messages = 0
+        self.received_batches = 0
+        self.publish_errors = 0
+        self.reconnects = 0
+        self.local_deliveries = 0
+        self.last_error: Optional[str] = None
+        self._publish_latency: Deque[float] = deque(maxlen=1000)
+        self._delivery_latency: Deque[float] = deque(maxlen=1000)
+
+    async def start(self):
+        try:
+            await asyncio.wait_for(self._subscribe(), self.subscribe_timeout)
+        except Exception as e:
+            await self._shutdown()
+            reason = self.last_error or f"{type(e).__name__}: {e}"
+            raise ConnectionError(f"Subscription to {self.channel} failed: {reason}") from e
+
+    async def _subscribe(self):
+        await self.broadcast.connect()
+        stream, last_seq = await self.broadcast.allocate(self.channel, 0)
+        self.connections.replay.reset(stream, last_seq)
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._flush_loop())]
+        # Subscribe before the first publish, otherwise early batches are lost
+        await self._ready.wait()
+
+    async def stop(self):
+        if self._buffer:
+            await self._publish_batch()
+        await self._shutdown()
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.broadcast.disconnect()
+        except Exception as e:
+            logger.warning(f"Error closing broadcast backend: {e}")
+
+    def publish(self, message: Dict[str, Any]):
+        """Buffer a message for the next batch"""
+        self._buffer.append(message)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._buffer:
+                if await self._publish_batch():
+                    delay = self.reconnect_delay
+                else:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _publish_batch(self) -> bool:
+        """Publish the buffered messages; False if the backend failed"""
+        batch, self._buffer = self._buffer[:self.max_buffered], self._buffer[self.max_buffered:]
+        started = time.perf_counter()
+        try:
+            stream, last_seq = await self.broadcast.allocate(self.channel, len(batch))
+            for seq, message in enumerate(batch, last_seq - len(batch) + 1):
+                message["seq"] = seq
+            payload = json.dumps(
+                {"origin": self.origin, "published_at": time.time(), "stream": stream, "events": batch},
+                default=str
+            )
+            await self.broadcast.publish(self.channel, payload)
+        except Exception as e:
+            self.publish_errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Error publishing analysis batch: {e}")
+            if len(batch) + len(self._buffer) <= self.max_buffered:
+                self._buffer[:0] = batch
+            else:
+                # Other workers miss these messages, this worker's sockets still get them
+                await self._deliver_locally(batch)
+            return False
+        self._publish_latency.append((time.perf_counter() - started) * 1000)
+        self.publishes += 1
+        self.published_messages += len(batch)
+        if not self._ready.is_set():
+            # Not subscribed: the published batch does not come back to this worker
+            await self._deliver_locally(batch)
+        return True
+
+    async def _deliver_locally(self, batch: List[Dict[str, Any]]):
+        self.local_deliveries += len(batch)
+        for message in batch:
+            await self.connections.broadcast_message(message)
+
+    async def _listen(self):
+        """Keep the subscription alive, reconnecting with backoff"""
+        delay = self.reconnect_delay
+        while True:
             try:
-                await connection.send_text(message_str)
+                await self._receive()
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"Error sending to client: {e}")
-                disconnected.append(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
-        
-        logger.info(f"Broadcasted message to {len(self.active_connections)} clients")
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Analysis subscription lost: {e}; reconnecting in {delay:.1f}s")
+            if self._ready.is_set():
+                delay = self.reconnect_delay  # the subscription worked: start the backoff over
+            self._ready.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+            try:
+                await self.broadcast.reconnect()
+                self.reconnects += 1
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Broadcast backend reconnect failed: {e}")
+
+    async def _receive(self):
+        """Fan received batches out until the subscription or the backend listener stops"""
+        async with self.broadcast.subscribe(self.channel) as subscriber:
+            self._ready.set()
+            consume = asyncio.create_task(self._consume(subscriber))
+            listener = asyncio.create_task(self.broadcast.wait_listener())
+            try:
+                done, _ = await asyncio.wait({consume, listener}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                consume.cancel()
+                listener.cancel()
+            for task in done:
+                task.result()
+            raise ConnectionError("subscription closed")
 
+    async def _consume(self, subscriber):
+        async for event in subscriber:
+            try:
+                batch = json.loads(event.message)
+            except ValueError:
+                logger.error("Invalid analysis batch received")
+                continue
+            self._delivery_latency.append((time.time() - batch["published_at"]) * 1000)
+            self.received_batches += 1
+            replay = self.connections.replay
+            if batch["stream"] != replay.stream_id:
+                # The shared sequence was reset (backend restart)
+                replay.reset(batch["stream"], min(message["seq"] for message in batch["events"]) - 1)
+            for message in batch["events"]:
+                await self.connections.broadcast_message(message)
 
-# Global connection manager instance
-manager = ConnectionManager()
+    def get_statistics(self) -> Dict[str, Any]:
+        """Publish counters and publish / delivery latency"""
+        return {
+            "backend": settings.BROADCAST_URL.split("://", 1)[0],
+            "buffered": len(self._buffer),
+            "publishes": self.publishes,
+            "published_messages": self.published_messages,
+            "publish_errors": self.publish_errors,
+            "subscribed": self._ready.is_set(),
+            "reconnects": self.reconnects,
+            "local_deliveries": self.local_deliveries,
+            "last_error": self.last_error,
+            "received_batches": self.received_batches,
+            "publish_latency": _latency_summary(self._publish_latency),
+            "delivery_latency": _latency_summary(self._delivery_latency),
+        }
+
+
+# Cross-worker publisher (started in the application lifespan)
+publisher: Optional[AnalysisPublisher] = None
+
+
+async def start_broadcasting(url: Optional[str] = None) -> AnalysisPublisher:
+    """Connect to the pub/sub backend and start publishing analysis results"""
+    global publisher
+    publisher = AnalysisPublisher(
+        Broadcaster(url or settings.BROADCAST_URL),
+        manager,
+        interval_ms=settings.WS_PUBLISH_INTERVAL_MS,
+        batch_size=settings.WS_PUBLISH_BATCH_SIZE,
+        max_buffered=settings.WS_PUBLISH_MAX_BUFFERED,
+        subscribe_timeout=settings.WS_SUBSCRIBE_TIMEOUT
+    )
+    await publisher.start()
+    return publisher
+
+
+async def stop_broadcasting():
+    """Publish buffered messages and disconnect from the backend"""
+    global publisher
+    if publisher is not None:
+        await publisher.stop()
+        publisher = None
 
 
 async def broadcast_analysis(
@@ -65,7 +703,10 @@ async def broadcast_analysis(
     risk_score: float,
     probability: float,
     is_fraud: bool,
-    timestamp: datetime = None
+    timestamp: datetime = None,
+    transaction_type: Optional[str] = None,
+    merchant: Optional[str] = None,
+    risk_level: Optional[str] = None
 ):
     """
     Broadcast fraud analysis result to all connected WebSocket clients
@@ -76,6 +717,9 @@ async def broadcast_analysis(
         probability: Fraud probability (0-1)
         is_fraud: Whether transaction is classified as fraud
         timestamp: Analysis timestamp
+        transaction_type: Transaction type (for subscription filters)
+        merchant: Merchant / destination account (for subscription filters)
+        risk_level: Risk level (LOW / MEDIUM / HIGH / CRITICAL)
     """
     if timestamp is None:
         timestamp = datetime.now(timezone.utc)
@@ -85,8 +729,14 @@ async def broadcast_analysis(
         "risk_score": round(risk_score, 2),
         "probability": round(probability, 4),
         "is_fraud": is_fraud,
-        "timestamp": timestamp.isoformat()
+        "timestamp": timestamp.isoformat(),
+        "transaction_type": transaction_type,
+        "merchant": merchant,
+        "risk_level": risk_level
     }
     
-    await manager.broadcast_message(message)
+    if publisher is not None:
+        publisher.publish(message)
+    else:
+        await manager.broadcast_message(message)
     logger.info(f"Broadcasted analysis for {transaction_id}: is_fraud={is_fraud}, risk={risk_score}")
@@ -0,0 +1,113 @@
+"""
+Compact binary WebSocket frame format (subprotocol fraudguard.bin.v1)
+
+Frame (little-endian):
+    header   magic 0xFB, frame type (1 - batch, 2 - summary), uint16 count
+    batch    count events:
+             uint32 seq, int64 timestamp (epoch ms), uint16 risk_score * 100,
+             uint16 probability * 10000, uint8 flags (bit 0 - is_fraud),
+             uint8 risk level code, uint8 transaction type code,
+             uint8 id length + utf-8 id, uint8 merchant length + utf-8 merchant
+    summary  uint32 dropped, uint32 dropped_fraud, uint16 dropped_max_risk_score * 100
+"""
+import struct
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+BINARY_SUBPROTOCOL = "fraudguard.bin.v1"
+
+FRAME_MAGIC = 0xFB
+FRAME_BATCH = 1
+FRAME_SUMMARY = 2
+
+# Enum codes (0 - unknown)
+RISK_LEVEL_CODES = {"LOW": 1, "MEDIUM": 2, "HIGH": 3, "CRITICAL": 4}
+TRANSACTION_TYPE_CODES = {"PAYMENT": 1, "TRANSFER": 2, "CASH_OUT": 3, "CASH_IN": 4, "DEBIT": 5}
+_RISK_LEVELS = {code: name for name, code in RISK_LEVEL_CODES.items()}
+_TRANSACTION_TYPES = {code: name for name, code in TRANSACTION_TYPE_CODES.items()}
+
+_HEADER = struct.Struct("<BBH")
+_EVENT = struct.Struct("<IqHHBBB")
+_SUMMARY = struct.Struct("<IIH")
+
+
+def _short_string(value: Optional[str]) -> bytes:
+    """Length-prefixed UTF-8, trimmed to 255 bytes on a character boundary"""
+    data = (value or "").encode('utf-8')
+    if len(data) > 255:
+        data = data[:255].decode('utf-8', 'ignore').encode('utf-8')
+    return bytes((len(data),)) + data
+
+
+def _timestamp_ms(value: Any) -> int:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value or 0)
+
+
+def encode_event(message: Dict[str, Any]) -> bytes:
+    """Binary record of one analysis message"""
+    return _EVENT.pack(
+        message.get("seq", 0),
+        _timestamp_ms(message.get("timestamp")),
+        min(0xFFFF, int(round(message["risk_score"] * 100))),
+        min(0xFFFF, int(round(message["probability"] * 10000))),
+        1 if message["is_fraud"] else 0,
+        RISK_LEVEL_CODES.get(message.get("risk_level"), 0),
+        TRANSACTION_TYPE_CODES.get(message.get("transaction_type"), 0),
+    ) + _short_string(message["transaction_id"]) + _short_string(message.get("merchant"))
+
+
+def encode_batch(events: Iterable[bytes]) -> bytes:
+    """Batch frame from encoded events"""
+    events = list(events)
+    return _HEADER.pack(FRAME_MAGIC, FRAME_BATCH, len(events)) + b"".join(events)
+
+
+def encode_summary(dropped: int, dropped_fraud: int, dropped_max_risk_score: float) -> bytes:
+    """Summary frame for events dropped from a batch"""
+    return _HEADER.pack(FRAME_MAGIC, FRAME_SUMMARY, 0) + _SUMMARY.pack(
+        dropped, dropped_fraud, min(0xFFFF, int(round(dropped_max_risk_score * 100)))
+    )
+
+
+def decode_frame(frame: bytes) -> Dict[str, Any]:
+    """Decode a frame (reference implementation for clients and tests)"""
+    magic, frame_type, count = _HEADER.unpack_from(frame, 0)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Invalid frame")
+    offset = _HEADER.size
+
+    if frame_type == FRAME_SUMMARY:
+        dropped, dropped_fraud, max_risk = _SUMMARY.unpack_from(frame, offset)
+        return {
+            "type": "summary",
+            "dropped": dropped,
+            "dropped_fraud": dropped_fraud,
+            "dropped_max_risk_score": max_risk / 100,
+        }
+
+    events: List[Dict[str, Any]] = []
+    for _ in range(count):
+        seq, timestamp_ms, risk_score, probability, flags, risk_level, transaction_type = \
+            _EVENT.unpack_from(frame, offset)
+        offset += _EVENT.size
+        strings = []
+        for _ in range(2):
+            size = frame[offset]
+            strings.append(frame[offset + 1:offset + 1 + size].decode('utf-8'))
+            offset += 1 + size
+        events.append({
+            "seq": seq,
+            "timestamp_ms": timestamp_ms,
+            "risk_score": risk_score / 100,
+            "probability": probability / 10000,
+            "is_fraud": bool(flags & 1),
+            "risk_level": _RISK_LEVELS.get(risk_level),
+            "transaction_type": _TRANSACTION_TYPES.get(transaction_type),
+            "transaction_id": strings[0],
+            "merchant": strings[1] or None,
+        })
+    return {"type": "batch", "events": events}
@@ -0,0 +1,109 @@
+"""
+Пакетный анализ: Arrow IPC против JSON (/api/v1/batch-analyze)
+
+FraudDetector с небольшой моделью XGBoost, обученной на синтетических
+признаках, RiskAnalyzer без подключаемых индексов, побочные эффекты отключены.
+
+Запуск: python -m benchmarks.arrow_batch [--rows 10000] [--repeat 3]
+"""
+import argparse
+import json
+import logging
+import random
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+import xgboost as xgb
+from fastapi.testclient import TestClient
+
+import app.main
+from app.ml.fraud_detector import FraudDetector
+from app.ml.preprocessor import TransactionPreprocessor
+from services.risk_analyzer import RiskAnalyzer
+from services.side_effects import SideEffectPipeline
+
+
+def _rows(count: int):
+    rng = random.Random(3)
+    rows = []
+    for i in range(count):
+        amount = round(10 ** rng.uniform(1, 6), 2)
+        old_balance = round(amount * rng.uniform(0.5, 3), 2)
+        rows.append({
+            "transaction_id": f"TX{i}",
+            "type": rng.choice(["PAYMENT", "TRANSFER", "CASH_OUT", "CASH_IN", "DEBIT"]),
+            "amount": amount,
+            "nameOrig": f"C{rng.randrange(10**9)}",
+            "oldbalanceOrg": old_balance,
+            "newbalanceOrig": round(max(old_balance - amount, 0.0), 2),
+            "nameDest": f"M{rng.randrange(10**9)}",
+            "oldbalanceDest": 0.0,
+            "newbalanceDest": amount,
+            "ip_address": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+            "vpn": rng.random() < 0.05,
+            "previous_orders": rng.randrange(10),
+        })
+    return rows
+
+
+def _train_model(rows) -> xgb.Booster:
+    preprocessor = TransactionPreprocessor()
+    columns = {name: np.array([row[name] for row in rows]) for name in preprocessor.BALANCE_COLUMNS}
+    features = preprocessor.preprocess_columns(columns, [row["type"] for row in rows])
+    labels = (features[:, 5] + features[:, 6] > 0) & (features[:, 0] > 50_000)
+    dtrain = xgb.DMatrix(features, label=labels, feature_names=TransactionPreprocessor.FEATURE_ORDER)
+    return xgb.train({"objective": "binary:logistic", "max_depth": 4, "verbosity": 0}, dtrain, 20)
+
+
+def _arrow_body(rows) -> bytes:
+    table = pa.Table.from_pylist(rows)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _measure(send, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = send()
+        best = min(best, time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return best, len(response.content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    rows = _rows(args.rows)
+    detector = FraudDetector(model_path="missing")
+    detector.model = _train_model(rows)
+    app.main.fraud_detector = detector
+    app.main.risk_analyzer = RiskAnalyzer()
+    app.main.side_effects = SideEffectPipeline([])
+
+    json_body = json.dumps(rows).encode()
+    arrow_body = _arrow_body(rows)
+    client = TestClient(app.main.app)
+
+    json_seconds, json_response = _measure(lambda: client.post(
+        "/api/v1/batch-analyze", content=json_body, headers={"content-type": "application/json"}
+    ), args.repeat)
+    arrow_seconds, arrow_response = _measure(lambda: client.post(
+        "/api/v1/batch-analyze/arrow", content=arrow_body,
+        headers={"content-type": "application/vnd.apache.arrow.stream"}
+    ), args.repeat)
+
+    print(f"{args.rows} строк, лучшее из {args.repeat}")
+    print(f"  JSON:  {json_seconds * 1000:8.1f} мс, запрос {len(json_body) / 1024:7.0f} КБ, "
+          f"ответ {json_response / 1024:7.0f} КБ")
+    print(f"  Arrow: {arrow_seconds * 1000:8.1f} мс, запрос {len(arrow_body) / 1024:7.0f} КБ, "
+          f"ответ {arrow_response / 1024:7.0f} КБ")
+    print(f"  ускорение x{json_seconds / arrow_seconds:.2f}")
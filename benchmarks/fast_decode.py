@@ -0,0 +1,38 @@
+"""
+Разбор тела /api/v1/analyze: Pydantic модель против быстрого пути (app/fastpath.py)
+
+Тело - пример из схемы TransactionRequest; время - лучшее из серий.
+
+Запуск: python -m benchmarks.fast_decode [--rounds 50000] [--repeats 5]
+"""
+import argparse
+import json
+import time
+
+from app.fastpath import transaction_decoder
+from app.models import TransactionRequest
+
+
+def _best_us(decode, body: bytes, rounds: int, repeats: int) -> float:
+    """Лучшее среднее время разбора в серии, мкс"""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            decode(body)
+        best = min(best, (time.perf_counter() - started) / rounds * 1e6)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    body = json.dumps(TransactionRequest.model_config["json_schema_extra"]["example"]).encode()
+    assert transaction_decoder.decode(body) is not None, "пример не проходит быстрый путь"
+    pydantic_us = _best_us(TransactionRequest.model_validate_json, body, args.rounds, args.repeats)
+    fast_us = _best_us(transaction_decoder.decode, body, args.rounds, args.repeats)
+    print(f"Pydantic: {pydantic_us:.2f} мкс/запрос, быстрый путь: {fast_us:.2f} мкс/запрос "
+          f"({pydantic_us / fast_us:.1f}x)")
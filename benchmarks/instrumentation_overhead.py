@@ -0,0 +1,115 @@
+"""
+Накладные расходы метрик задержки (app/metrics.py) на /api/v1/analyze
+
+1. Время запроса: приложение в том же процессе через httpx.ASGITransport
+   (без сети) с загруженной моделью; побочные эффекты отключены, лимиты
+   частоты сняты. Серии с метриками и без чередуются.
+2. Стоимость метрик на запрос: MetricsMiddleware вокруг пустого
+   обработчика с теми же этапами, что у настоящего запроса (по его
+   Server-Timing), с метриками и без - в плотном цикле.
+
+Доля накладных расходов - (2) к лучшему времени запроса без метрик.
+Сравнение серий (1) приведено для справки: на общей машине разброс
+между сериями обычно больше процента.
+
+Запуск: python -m benchmarks.instrumentation_overhead [--rounds 10] [--requests 500]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import statistics
+import time
+from typing import List
+
+import httpx
+
+import app.main
+from app.metrics import MetricsMiddleware, metrics
+from app.ml.fraud_detector import FraudDetector
+from app.models import TransactionRequest
+from services.risk_analyzer import RiskAnalyzer
+from services.side_effects import SideEffectPipeline
+
+BODY = json.dumps(TransactionRequest.model_config["json_schema_extra"]["example"]).encode()
+PATH = "/api/v1/analyze"
+
+
+async def _series(client: httpx.AsyncClient, requests: int) -> float:
+    """Среднее время запроса в серии, мкс"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = await client.post(PATH, content=BODY, headers={"content-type": "application/json"})
+        response.raise_for_status()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def _instrumentation_cost_us(stages: List[str], repeats: int = 7, calls: int = 20_000) -> float:
+    """Добавка метрик к запросу с этапами stages, мкс (лучшее из repeats)"""
+    async def endpoint(scope, receive, send):
+        for name in stages:
+            with metrics.stage(name):
+                pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(endpoint, metrics, [PATH])
+    scope = {"type": "http", "path": PATH}
+    best = {True: math.inf, False: math.inf}
+    for _ in range(repeats):
+        for enabled in (True, False):
+            metrics.enabled = enabled
+            started = time.perf_counter_ns()
+            for _ in range(calls):
+                await middleware(scope, None, send)
+            best[enabled] = min(best[enabled], (time.perf_counter_ns() - started) / calls / 1000)
+    metrics.enabled = True
+    return best[True] - best[False]
+
+
+async def _run(rounds: int, requests: int):
+    app.main.fraud_detector = FraudDetector()
+    await app.main.fraud_detector.load_model()
+    app.main.risk_analyzer = RiskAnalyzer()
+    app.main.side_effects = SideEffectPipeline([])
+    app.main.rate_limiter.tiers = {
+        name: {"rate": math.inf, "burst": math.inf} for name in app.main.rate_limiter.tiers
+    }
+
+    transport = httpx.ASGITransport(app=app.main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post(PATH, content=BODY, headers={"content-type": "application/json"})
+        header = response.headers["server-timing"]
+        stages = [part.split(";", 1)[0] for part in header.split(", ")[:-1]]
+        print(f"Server-Timing: {header}")
+        await _series(client, requests)  # прогрев
+
+        timings = {True: [], False: []}
+        for index in range(rounds):
+            # порядок серий чередуется, чтобы дрейф машины не попадал в разницу
+            for enabled in ((True, False) if index % 2 else (False, True)):
+                metrics.enabled = enabled
+                timings[enabled].append(await _series(client, requests))
+    metrics.enabled = True
+
+    cost = await _instrumentation_cost_us(stages)
+    best = min(timings[False])
+    print(f"{rounds} серий по {requests} запросов, мкс/запрос (медиана, лучшая серия)")
+    for enabled, name in ((False, "без метрик"), (True, "с метриками")):
+        print(f"  {name:<12} {statistics.median(timings[enabled]):8.1f} {min(timings[enabled]):8.1f}")
+    print(f"Метрики на запрос ({len(stages)} этапов, middleware, Server-Timing): "
+          f"{cost:.1f} мкс - {cost / best * 100:.2f}% запроса")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    asyncio.run(_run(args.rounds, args.requests))
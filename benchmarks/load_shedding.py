@@ -0,0 +1,131 @@
+"""
+Сброс нагрузки: полезная пропускная способность при перегрузке
+с контролем допуска (app/admission.py) и без него
+
+Сервер uvicorn в отдельном процессе; обработчик занимает цикл событий
+на --service-ms (как оценка модели). Клиенты присылают запросы вдвое
+чаще, чем он успевает, и ждут ответа не дольше --timeout-ms.
+Считаются ответы 200, полученные в срок.
+
+Запуск: python -m benchmarks.load_shedding [--seconds 5] [--service-ms 5] [--timeout-ms 200]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from app.admission import AdaptiveConcurrencyLimiter, AdmissionControlMiddleware
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port: int, service_ms: float, timeout_ms: float, admission: bool):
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=16, min_limit=2, target_latency_ms=timeout_ms / 4,
+        queue_size=8, queue_timeout_ms=timeout_ms / 4, max_loop_lag_ms=timeout_ms / 4
+    )
+
+    @asynccontextmanager
+    async def lifespan(app):
+        monitor = asyncio.create_task(limiter.monitor_loop_lag())
+        yield
+        monitor.cancel()
+
+    app = FastAPI(lifespan=lifespan if admission else None)
+    if admission:
+        app.add_middleware(AdmissionControlMiddleware, limiter=limiter, paths=["/api/v1/analyze"])
+
+        @app.get("/admission")
+        async def admission_statistics():
+            return limiter.get_statistics()
+
+    @app.post("/api/v1/analyze")
+    async def analyze():
+        time.sleep(service_ms / 1000)
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="error", access_log=False)
+
+
+async def _run(port: int, seconds: float, rate: float, timeout_ms: float):
+    counts = {"ok": 0, "late": 0, "shed": 0, "timeout": 0}
+    limits = httpx.Limits(max_connections=2000, max_keepalive_connections=2000)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+        while True:
+            try:
+                await client.get("/health")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.05)
+
+        async def one():
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/v1/analyze", timeout=timeout_ms / 1000)
+            except httpx.TimeoutException:
+                counts["timeout"] += 1
+                return
+            if response.status_code != 200:
+                counts["shed"] += 1
+            elif (time.perf_counter() - started) * 1000 > timeout_ms:
+                counts["late"] += 1
+            else:
+                counts["ok"] += 1
+
+        tasks = []
+        started = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - started < seconds:
+            due = int((time.perf_counter() - started) * rate)
+            while sent < due:
+                tasks.append(asyncio.create_task(one()))
+                sent += 1
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks)
+
+        limit = None
+        response = await client.get("/admission")
+        if response.status_code == 200:
+            limit = response.json()["limit"]
+    return sent, counts, limit
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--service-ms", type=float, default=5.0)
+    parser.add_argument("--timeout-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    capacity = 1000 / args.service_ms
+    rate = capacity * 2
+    print(f"Емкость ~{capacity:.0f} запросов/с, нагрузка {rate:.0f} запросов/с, срок {args.timeout_ms:.0f} мс")
+    for name, admission in [("без контроля", False), ("с контролем", True)]:
+        port = _free_port()
+        server = multiprocessing.Process(
+            target=_serve, args=(port, args.service_ms, args.timeout_ms, admission), daemon=True
+        )
+        server.start()
+        try:
+            sent, counts, limit = asyncio.run(_run(port, args.seconds, rate, args.timeout_ms))
+        finally:
+            server.terminate()
+            server.join()
+        print(f"  {name:<13} отправлено {sent}, в срок {counts['ok']} "
+              f"({counts['ok'] / args.seconds:.0f}/с), отклонено {counts['shed']}, "
+              f"таймаут {counts['timeout'] + counts['late']}"
+              + (f", итоговый лимит {limit}" if limit is not None else ""))
@@ -0,0 +1,122 @@
+"""
+Задержка оценки: Unix-сокет (app/uds_client.py) против HTTP /api/v1/analyze
+
+Оба транспорта в одном процессе ведут к одному пути оценки
+(FraudDetector без модели - эвристика, RiskAnalyzer без индексов,
+побочные эффекты отключены). HTTP - uvicorn и httpx с keep-alive.
+
+Запуск: python -m benchmarks.uds_latency [--requests 2000] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+import app.main
+from app.ml.fraud_detector import FraudDetector
+from app.models import TransactionRequest
+from app.uds import ScoringServer
+from app.uds_client import ScoringClient
+from services.risk_analyzer import RiskAnalyzer
+from services.side_effects import SideEffectPipeline
+
+BODY = json.dumps(TransactionRequest.model_config["json_schema_extra"]["example"]).encode()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _report(name: str, latencies, elapsed: float, requests: int):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"  {name:<6} p50 {statistics.median(latencies) * 1000:6.3f} мс, "
+          f"p99 {p99 * 1000:6.3f} мс, {requests / elapsed:7.0f} запросов/с")
+
+
+async def _measure(send, requests: int, concurrency: int):
+    for _ in range(50):
+        await send()  # прогрев
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        await send()
+        latencies.append(time.perf_counter() - request_started)
+    sequential = time.perf_counter() - started
+
+    async def worker(count: int):
+        for _ in range(count):
+            await send()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    concurrent = time.perf_counter() - started
+    return latencies, sequential, concurrent
+
+
+async def _run(requests: int, concurrency: int):
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        app.main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning", access_log=False
+    ))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    path = os.path.join(tempfile.mkdtemp(), "scoring.sock")
+    scoring_server = ScoringServer(path, app.main._score_unix_socket, max_in_flight=concurrency)
+    await scoring_server.start()
+
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as http:
+            async def send_http():
+                response = await http.post(
+                    "/api/v1/analyze", content=BODY, headers={"content-type": "application/json"}
+                )
+                response.raise_for_status()
+
+            http_result = await _measure(send_http, requests, concurrency)
+
+        async with ScoringClient(path) as client:
+            async def send_uds():
+                await client.analyze_raw(BODY)
+
+            uds_result = await _measure(send_uds, requests, concurrency)
+    finally:
+        await scoring_server.close()
+        server.should_exit = True
+        await server_task
+
+    print(f"{requests} запросов последовательно")
+    _report("HTTP", http_result[0], http_result[1], requests)
+    _report("UDS", uds_result[0], uds_result[1], requests)
+    print(f"{concurrency} одновременных запросов (UDS - одно соединение)")
+    print(f"  HTTP   {requests / http_result[2]:7.0f} запросов/с")
+    print(f"  UDS    {requests / uds_result[2]:7.0f} запросов/с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    app.main.fraud_detector = FraudDetector(model_path="missing")
+    app.main.risk_analyzer = RiskAnalyzer()
+    app.main.side_effects = SideEffectPipeline([])
+
+    asyncio.run(_run(args.requests, args.concurrency))
@@ -0,0 +1,60 @@
+"""
+Нагрузочный тест рассылки WebSocket: 1000 имитированных клиентов
+
+Стоимость broadcast_message не должна зависеть от самого медленного клиента.
+
+Запуск: python -m benchmarks.ws_fanout [--clients 1000] [--messages 200]
+"""
+import argparse
+import asyncio
+import time
+
+from app.ws import SLOW_CLIENT_DROP_OLDEST, ConnectionManager
+
+
+class SimulatedClient:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def _run(clients: int, messages: int, slow_delay: float) -> float:
+    manager = ConnectionManager(max_queue=100, slow_client_policy=SLOW_CLIENT_DROP_OLDEST)
+    sockets = [SimulatedClient(0.0) for _ in range(clients - 1)] + [SimulatedClient(slow_delay)]
+    for socket in sockets:
+        manager.register(socket)
+
+    elapsed = 0.0
+    for i in range(messages):
+        started = time.perf_counter()
+        await manager.broadcast_message({"transaction_id": f"TX{i}", "risk_score": 42.0})
+        elapsed += time.perf_counter() - started
+        await asyncio.sleep(0)
+
+    await asyncio.sleep(0.1)
+    stats = manager.get_statistics()
+    for socket in sockets:
+        manager.disconnect(socket)
+    print(
+        f"  медленный клиент {slow_delay * 1000:.0f} мс: "
+        f"broadcast {elapsed / messages * 1000:.3f} мс, потеряно у медленного {stats['dropped_messages']}"
+    )
+    return elapsed / messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.clients} клиентов, {args.messages} сообщений")
+    for slow_delay in (0.0, 0.1, 1.0):
+        asyncio.run(_run(args.clients, args.messages, slow_delay))
@@ -0,0 +1,63 @@
+"""
+Размер и стоимость кодирования кадров WebSocket: JSON против бинарного подпротокола
+
+JSON - кадр на событие (json.dumps), бинарный - пакет событий в одном кадре.
+
+Запуск: python -m benchmarks.ws_frame_format [--events 20000] [--batch 200]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.ws_codec import encode_batch, encode_event
+
+
+def _events(count: int):
+    rng = random.Random(1)
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "transaction_id": f"TXN_{1704067200 + i}.{rng.randrange(10**6):06d}",
+            "risk_score": round(rng.uniform(0, 100), 2),
+            "probability": round(rng.random(), 4),
+            "is_fraud": rng.random() < 0.05,
+            "timestamp": (started + timedelta(milliseconds=i * 7)).isoformat(),
+            "transaction_type": rng.choice(["PAYMENT", "TRANSFER", "CASH_OUT"]),
+            "merchant": f"M{rng.randrange(10**9)}",
+            "risk_level": rng.choice(["LOW", "MEDIUM", "HIGH", "CRITICAL"]),
+            "seq": i + 1,
+        }
+        for i in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+
+    events = _events(args.events)
+
+    started = time.perf_counter()
+    json_frames = [json.dumps(event, default=str) for event in events]
+    json_seconds = time.perf_counter() - started
+    json_bytes = sum(len(frame.encode('utf-8')) for frame in json_frames)
+
+    started = time.perf_counter()
+    binary_frames = [
+        encode_batch(encode_event(event) for event in events[i:i + args.batch])
+        for i in range(0, len(events), args.batch)
+    ]
+    binary_seconds = time.perf_counter() - started
+    binary_bytes = sum(len(frame) for frame in binary_frames)
+
+    print(f"{args.events} событий, пакет {args.batch}")
+    print(f"  JSON:     {json_bytes / len(events):6.1f} байт/событие, "
+          f"{json_seconds / len(events) * 1e6:5.2f} мкс/событие, {len(json_frames)} кадров")
+    print(f"  бинарный: {binary_bytes / len(events):6.1f} байт/событие, "
+          f"{binary_seconds / len(events) * 1e6:5.2f} мкс/событие, {len(binary_frames)} кадров")
+    print(f"  экономия трафика: {1 - binary_bytes / json_bytes:.0%}, "
+          f"кодирование x{json_seconds / binary_seconds:.2f}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Скрипт для запуска FraudGuard AI в режиме потребителя журнала
+
+Читает NDJSON-сегменты транзакций из каталога журнала, оценивает их
+пакетами тем же конвейером, что и API, и пишет решения в журнал решений
+с контрольными точками (services/log_consumer.py). Побочные эффекты
+решений (лог, доказательства, WebSocket) выполняются после контрольной
+точки пакета.
+
+Запуск: python consume.py [--log-dir data/stream/in] [--output-dir data/stream/out]
+                          [--batch-size 500] [--parallelism 4] [--partitions p0,p1] [--once]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+# Добавляем текущую директорию в PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import BackgroundTasks
+
+import app.main
+from app.config import settings
+from services.log_consumer import LogConsumer
+
+logger = logging.getLogger("consume")
+
+# Решения, ожидающие фиксации пакета: id(response) -> (response, event)
+_pending_effects = {}
+
+
+async def _score_batch(transactions):
+    events = []
+    responses = await app.main.score_transactions(transactions, BackgroundTasks(), deferred=events)
+    for event in events:
+        _pending_effects[id(event.response)] = (event.response, event)
+    return responses
+
+
+async def _dispatch_committed(responses):
+    events = []
+    for response in responses:
+        pending = _pending_effects.pop(id(response), None)
+        if pending is not None and pending[0] is response:
+            events.append(pending[1])
+    background_tasks = BackgroundTasks()
+    await app.main.dispatch_decisions(events, background_tasks)
+    # Задачи появляются только без конвейера побочных эффектов
+    await background_tasks()
+
+
+async def _consume(args):
+    async with app.main.lifespan(app.main.app):
+        consumer = LogConsumer(
+            args.log_dir,
+            args.output_dir,
+            _score_batch,
+            batch_size=args.batch_size,
+            parallelism=args.parallelism,
+            poll_interval=args.poll_interval,
+            partitions=args.partitions.split(",") if args.partitions else None,
+            on_commit=_dispatch_committed
+        )
+        if args.once:
+            processed = await consumer.run_once()
+            logger.info(f"Обработано записей: {processed}")
+            return
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, consumer.stop)
+        await consumer.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FraudGuard AI: потребитель журнала транзакций")
+    parser.add_argument("--log-dir", default=settings.CONSUMER_LOG_DIR)
+    parser.add_argument("--output-dir", default=settings.CONSUMER_OUTPUT_DIR)
+    parser.add_argument("--batch-size", type=int, default=settings.CONSUMER_BATCH_SIZE)
+    parser.add_argument("--parallelism", type=int, default=settings.CONSUMER_PARALLELISM)
+    parser.add_argument("--poll-interval", type=float, default=settings.CONSUMER_POLL_INTERVAL)
+    parser.add_argument("--partitions", help="Разделы через запятую (по умолчанию - все)")
+    parser.add_argument("--once", action="store_true", help="Обработать записанное и завершиться")
+    asyncio.run(_consume(parser.parse_args()))
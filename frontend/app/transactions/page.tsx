@@ -22,6 +22,9 @@ export default function TransactionsPage() {
     const [isWsConnected, setIsWsConnected] = useState(false);
     const [newTransactionIds, setNewTransactionIds] = useState<Set<string>>(new Set());
     const wsRef = useRef<WebSocket | null>(null);
+    // Last received sequence number and stream id, used to resume after a reconnect
+    const lastSeqRef = useRef<number | null>(null);
+    const streamRef = useRef<string | null>(null);
 
     useEffect(() => {
         loadTransactions().then((data) => {
@@ -33,7 +36,10 @@ export default function TransactionsPage() {
         // WebSocket connection for real-time updates
         const connectWebSocket = () => {
             try {
-                const ws = new WebSocket('ws://localhost:8000/ws/stream');
+                const resume = lastSeqRef.current !== null && streamRef.current !== null
+                    ? `?since=${lastSeqRef.current}&stream=${streamRef.current}`
+                    : '';
+                const ws = new WebSocket(`ws://localhost:8000/ws/stream${resume}`);
 
                 ws.onopen = () => {
                     console.log('WebSocket connected');
@@ -58,6 +64,23 @@ export default function TransactionsPage() {
 
                         const data = JSON.parse(event.data);
 
+                        if (data.type === 'hello') {
+                            streamRef.current = data.stream;
+                            if (lastSeqRef.current === null) lastSeqRef.current = data.seq;
+                            return;
+                        }
+                        if (data.type === 'resync') {
+                            // Missed events are no longer buffered on the server: full reload
+                            streamRef.current = data.stream;
+                            lastSeqRef.current = data.latest_seq;
+                            loadTransactions().then((data) => {
+                                setTransactions(data);
+                            });
+                            return;
+                        }
+                        if (data.type) return;
+                        if (typeof data.seq === 'number') lastSeqRef.current = data.seq;
+
                         // Mark transaction as new for animation
                         setNewTransactionIds(prev => new Set(prev).add(data.transaction_id));
 
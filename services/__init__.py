@@ -3,5 +3,13 @@
 """
 from .risk_analyzer import RiskAnalyzer
 from .evidence_collector import EvidenceCollector
+from .transfer_graph import TransferGraph
+from .balance_tracker import BalanceTracker
+from .enrichment import EnrichmentService
+from .blocklist import BlocklistManager
+from .device_similarity import DeviceSimilarityIndex
+from .evidence_store import EvidenceStore
+from .entity_index import EntityIndex
 
-__all__ = ['RiskAnalyzer', 'EvidenceCollector']
+__all__ = ['RiskAnalyzer', 'EvidenceCollector', 'TransferGraph', 'BalanceTracker', 'EnrichmentService',
+           'BlocklistManager', 'DeviceSimilarityIndex', 'EvidenceStore', 'EntityIndex']
@@ -0,0 +1,151 @@
+"""
+Трекер непрерывности балансов счетов
+Сравнивает баланс "до" с балансом "после" предыдущей транзакции того же счета
+"""
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from services.process_files import claim_process_files, process_path
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceTracker:
+    """
+    Индекс последних известных балансов счетов
+
+    - Поиск и обновление за O(1)
+    - Ограниченный объем памяти: при превышении max_accounts
+      вытесняются давно не встречавшиеся счета (LRU)
+    - Снимок в JSON файл для восстановления после перезапуска: у каждого
+      процесса свой файл (services/process_files.py), при загрузке
+      к своему снимку добавляются снимки завершенных процессов
+    """
+
+    def __init__(self, max_accounts: int = 1_000_000, snapshot_path: Optional[str] = None):
+        self.max_accounts = max_accounts
+        self.snapshot_path = snapshot_path
+        self._balances: "OrderedDict[str, float]" = OrderedDict()
+        self.evicted = 0
+        # Забранные снимки завершенных процессов: удаляются после записи своего
+        self._claimed: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._balances)
+
+    def get(self, account: str) -> Optional[float]:
+        """Последний известный баланс счета"""
+        return self._balances.get(account)
+
+    def update(self, account: str, balance: float):
+        """Сохранение баланса после транзакции"""
+        balances = self._balances
+        if account in balances:
+            balances.move_to_end(account)
+        balances[account] = balance
+
+        if len(balances) > self.max_accounts:
+            balances.popitem(last=False)
+            self.evicted += 1
+
+    def discontinuity(self, account: Optional[str], observed_balance: float) -> Optional[float]:
+        """
+        Расхождение между балансом "до" и последним известным балансом
+
+        Returns:
+            Абсолютное расхождение или None, если счет еще не встречался
+        """
+        if not account:
+            return None
+        previous = self._balances.get(account)
+        if previous is None:
+            return None
+        return abs(observed_balance - previous)
+
+    def observe(
+        self,
+        name_orig: Optional[str],
+        old_balance_orig: float,
+        new_balance_orig: float,
+        name_dest: Optional[str],
+        old_balance_dest: float,
+        new_balance_dest: float
+    ) -> Dict[str, Optional[float]]:
+        """
+        Расчет признаков разрыва балансов и обновление индекса
+
+        Returns:
+            Расхождения для отправителя и получателя
+        """
+        features = {
+            "orig_discontinuity": self.discontinuity(name_orig, old_balance_orig),
+            "dest_discontinuity": self.discontinuity(name_dest, old_balance_dest),
+        }
+
+        if name_orig:
+            self.update(name_orig, new_balance_orig)
+        if name_dest:
+            self.update(name_dest, new_balance_dest)
+
+        return features
+
+    def snapshot_items(self) -> List[Tuple[str, float]]:
+        """Копия балансов для снимка: от давно не встречавшихся к свежим"""
+        return list(self._balances.items())
+
+    def save_snapshot(self, path: Optional[str] = None, items: Optional[List[Tuple[str, float]]] = None):
+        """
+        Атомарное сохранение снимка балансов (по умолчанию - в файл этого процесса)
+
+        items - копия из snapshot_items(), если запись идет в другом потоке
+        """
+        path = path or (process_path(self.snapshot_path) if self.snapshot_path else None)
+        if not path:
+            return
+        items = self.snapshot_items() if items is None else items
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(items, f)
+        os.replace(tmp_path, path)
+
+        claimed, self._claimed = self._claimed, []
+        for claimed_path in claimed:
+            try:
+                os.remove(claimed_path)
+            except FileNotFoundError:
+                pass
+
+        logger.info(f"Снимок балансов сохранен в {path}: {len(items)} счетов")
+
+    def load_snapshot(self, path: Optional[str] = None) -> int:
+        """
+        Загрузка снимка path или, по умолчанию, своего снимка
+        и снимков завершенных процессов
+
+        Returns:
+            Количество загруженных счетов
+        """
+        if path:
+            paths = [path]
+        elif self.snapshot_path:
+            self._claimed = claim_process_files(self.snapshot_path)
+            paths = [process_path(self.snapshot_path), *self._claimed]
+        else:
+            paths = []
+
+        self._balances = OrderedDict()
+        for snapshot in paths:
+            if not os.path.exists(snapshot):
+                continue
+            with open(snapshot, 'r', encoding='utf-8') as f:
+                for account, balance in json.load(f):
+                    self.update(account, balance)
+        logger.info(f"Снимок балансов загружен: {len(self._balances)} счетов")
+        return len(self._balances)
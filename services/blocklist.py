@@ -0,0 +1,351 @@
+"""
+Списки блокировки (denylist) для IP, устройств, email, карт и счетов
+Фильтр Блума в памяти + точное отсортированное множество на диске
+"""
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BLOOM_MAGIC = b"FGBF"
+
+# Типы списков и соответствующие поля транзакции
+BLOCKLIST_KINDS = ("ip", "device", "email_domain", "card", "account")
+
+
+def normalize_entry(value: str) -> str:
+    """Нормализация значения перед хешированием"""
+    return value.strip().lower()
+
+
+def entry_key(value: str) -> int:
+    """64-битный ключ записи (blake2b)"""
+    digest = hashlib.blake2b(normalize_entry(value).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _entry_keys(values: Iterable[str]) -> np.ndarray:
+    keys = np.fromiter((entry_key(value) for value in values if value.strip()), dtype=np.uint64)
+    return np.unique(keys)
+
+
+def _write_atomic(path: str, *chunks: bytes):
+    """Запись через временный файл с уникальным именем в том же каталоге и os.replace"""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class BloomFilter:
+    """
+    Фильтр Блума с двойным хешированием (Kirsch-Mitzenmacher)
+
+    Позиции битов вычисляются из 64-битного ключа записи:
+    h1 - младшие 32 бита, h2 - старшие 32 бита.
+    """
+
+    def __init__(self, bits: bytes, num_bits: int, num_hashes: int):
+        self.bits = bits
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+
+    @staticmethod
+    def optimal_params(capacity: int, fp_rate: float) -> Tuple[int, int]:
+        """Количество бит и хеш-функций для заданной вероятности ложных срабатываний"""
+        capacity = max(capacity, 1)
+        num_bits = max(64, int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return num_bits, num_hashes
+
+    @classmethod
+    def build(cls, keys: np.ndarray, fp_rate: float) -> "BloomFilter":
+        """Построение фильтра по массиву ключей (векторизовано)"""
+        num_bits, num_hashes = cls.optimal_params(len(keys), fp_rate)
+        bits = np.zeros((num_bits + 7) // 8, dtype=np.uint8)
+
+        h1 = keys & np.uint64(0xFFFFFFFF)
+        h2 = keys >> np.uint64(32)
+        for i in range(num_hashes):
+            positions = (h1 + np.uint64(i) * h2) % np.uint64(num_bits)
+            np.bitwise_or.at(
+                bits,
+                (positions >> np.uint64(3)).astype(np.int64),
+                (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8))
+            )
+
+        return cls(bits.tobytes(), num_bits, num_hashes)
+
+    def __contains__(self, key: int) -> bool:
+        h1 = key & 0xFFFFFFFF
+        h2 = key >> 32
+        bits = self.bits
+        num_bits = self.num_bits
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % num_bits
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def to_bytes(self) -> bytes:
+        return struct.pack("<4sQI", BLOOM_MAGIC, self.num_bits, self.num_hashes) + bytes(self.bits)
+
+    @classmethod
+    def from_buffer(cls, buffer) -> "BloomFilter":
+        magic, num_bits, num_hashes = struct.unpack_from("<4sQI", buffer, 0)
+        if magic != BLOOM_MAGIC:
+            raise ValueError("Неверный формат фильтра Блума")
+        header = struct.calcsize("<4sQI")
+        return cls(memoryview(buffer)[header:], num_bits, num_hashes)
+
+
+class Blocklist:
+    """
+    Один список блокировки
+
+    Файлы в каталоге списков:
+    - <kind>.set   - отсортированные 64-битные ключи (точная проверка)
+    - <kind>.bloom - фильтр Блума
+    Оба файла отображаются в память (mmap).
+    """
+
+    def __init__(self, kind: str, set_path: str, bloom_path: str):
+        self.kind = kind
+        self.set_path = set_path
+        self.bloom_path = bloom_path
+
+        self._set_mmap = self._map(set_path)
+        self._bloom_mmap = self._map(bloom_path)
+
+        self.keys = memoryview(self._set_mmap).cast("Q") if self._set_mmap else memoryview(b"").cast("Q")
+        self.bloom = BloomFilter.from_buffer(self._bloom_mmap)
+
+    @staticmethod
+    def _map(path: str) -> Optional[mmap.mmap]:
+        if os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def contains_key(self, key: int) -> bool:
+        """Проверка ключа: фильтр Блума, затем подтверждение по множеству"""
+        if key not in self.bloom:
+            return False
+        keys = self.keys
+        position = bisect_left(keys, key)
+        return position < len(keys) and keys[position] == key
+
+    def __contains__(self, value: str) -> bool:
+        return self.contains_key(entry_key(value))
+
+    def key_array(self) -> np.ndarray:
+        """Копия ключей списка"""
+        return np.frombuffer(self._set_mmap, dtype=np.uint64).copy() if self._set_mmap else np.empty(0, dtype=np.uint64)
+
+    @property
+    def nbytes(self) -> int:
+        """Размер на диске/в памяти: множество и фильтр"""
+        return os.path.getsize(self.set_path) + os.path.getsize(self.bloom_path)
+
+    @property
+    def bloom_nbytes(self) -> int:
+        return os.path.getsize(self.bloom_path)
+
+    @classmethod
+    def write(cls, kind: str, directory: str, keys: np.ndarray, fp_rate: float) -> "Blocklist":
+        """Атомарная запись файлов списка и открытие новой версии"""
+        keys = np.unique(keys.astype(np.uint64))
+        set_path = os.path.join(directory, f"{kind}.set")
+        bloom_path = os.path.join(directory, f"{kind}.bloom")
+
+        # Фильтр пишется первым: старое множество с новым фильтром дает
+        # только лишние проверки, но не пропуски
+        _write_atomic(bloom_path, BloomFilter.build(keys, fp_rate).to_bytes())
+        _write_atomic(set_path, keys.astype('<u8').tobytes())
+        return cls(kind, set_path, bloom_path)
+
+
+class BlocklistManager:
+    """
+    Набор списков блокировки
+
+    Исходный файл `<kind>.txt` (одна запись на строку) импортируется,
+    если он новее скомпилированного списка: список компилируется во
+    временные файлы и атомарно подменяется. Массовое добавление/удаление
+    (bulk_update) изменяет скомпилированный список, не трогая исходный файл.
+
+    Запись списка идет под блокировкой файла `<kind>.lock` (flock), общей
+    для воркеров: bulk_update перечитывает множество с диска под ней,
+    поэтому изменения другого воркера, еще не загруженные этим, не теряются.
+    """
+
+    def __init__(self, directory: str, fp_rate: float = 0.001):
+        self.directory = directory
+        self.fp_rate = fp_rate
+        self.lists: Dict[str, Blocklist] = {}
+        self._loaded_mtimes: Dict[str, float] = {}
+        self._lookup_ns: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self, kind: str):
+        """Монопольная блокировка записи списка между процессами"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{kind}.lock"), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def reload(self) -> List[str]:
+        """
+        Загрузка/перезагрузка списков из каталога
+
+        Returns:
+            Типы обновленных списков
+        """
+        if not os.path.isdir(self.directory):
+            return []
+
+        updated = []
+        with self._lock:
+            for kind in BLOCKLIST_KINDS:
+                source_path = os.path.join(self.directory, f"{kind}.txt")
+                set_path = os.path.join(self.directory, f"{kind}.set")
+                bloom_path = os.path.join(self.directory, f"{kind}.bloom")
+                compiled = os.path.exists(set_path) and os.path.exists(bloom_path)
+
+                # Новый исходный файл (новее скомпилированного) заменяет список
+                if os.path.exists(source_path) and (
+                    not compiled or os.path.getmtime(source_path) > os.path.getmtime(set_path)
+                ):
+                    with self._file_lock(kind):
+                        # Другой воркер мог скомпилировать файл, пока ждали блокировку
+                        if os.path.exists(set_path) and os.path.getmtime(source_path) <= os.path.getmtime(set_path):
+                            blocklist = Blocklist(kind, set_path, bloom_path)
+                        else:
+                            with open(source_path, 'r', encoding='utf-8') as f:
+                                keys = _entry_keys(f)
+                            blocklist = Blocklist.write(kind, self.directory, keys, self.fp_rate)
+                    self._swap(kind, blocklist)
+                    updated.append(kind)
+                elif compiled and self._loaded_mtimes.get(kind) != os.path.getmtime(set_path):
+                    self._swap(kind, Blocklist(kind, set_path, bloom_path))
+                    updated.append(kind)
+
+        return updated
+
+    def bulk_update(
+        self,
+        kind: str,
+        add: Optional[Iterable[str]] = None,
+        remove: Optional[Iterable[str]] = None
+    ) -> int:
+        """
+        Массовое добавление и удаление записей
+
+        Фильтр Блума не поддерживает удаление, поэтому он
+        перестраивается вместе с новой версией множества.
+
+        Returns:
+            Размер списка после обновления
+        """
+        if kind not in BLOCKLIST_KINDS:
+            raise ValueError(f"Неизвестный тип списка: {kind}")
+
+        set_path = os.path.join(self.directory, f"{kind}.set")
+        with self._lock, self._file_lock(kind):
+            # Текущая версия - на диске, а не в памяти этого воркера
+            if os.path.exists(set_path):
+                keys = np.fromfile(set_path, dtype='<u8').astype(np.uint64)
+            else:
+                keys = np.empty(0, dtype=np.uint64)
+            if add:
+                keys = np.union1d(keys, _entry_keys(add))
+            if remove:
+                keys = np.setdiff1d(keys, _entry_keys(remove), assume_unique=True)
+
+            blocklist = Blocklist.write(kind, self.directory, keys, self.fp_rate)
+            self._swap(kind, blocklist)
+
+        logger.info(f"Список блокировки {kind} обновлен: {len(blocklist)} записей")
+        return len(blocklist)
+
+    def _swap(self, kind: str, blocklist: Blocklist):
+        self.lists[kind] = blocklist
+        self._loaded_mtimes[kind] = os.path.getmtime(blocklist.set_path)
+        self._lookup_ns[kind] = self._measure_lookup(blocklist)
+
+    @staticmethod
+    def _measure_lookup(blocklist: Blocklist, samples: int = 2000) -> float:
+        """Средняя задержка проверки (промахи и попадания), наносекунды"""
+        step = max(1, len(blocklist) // (samples // 2))
+        hits = [blocklist.keys[i] for i in range(0, len(blocklist), step)][:samples // 2]
+        misses = [entry_key(f"probe-{i}") for i in range(samples - len(hits))]
+        keys = hits + misses
+        started = time.perf_counter_ns()
+        for key in keys:
+            blocklist.contains_key(key)
+        return (time.perf_counter_ns() - started) / len(keys)
+
+    def check(self, kind: str, value: Optional[str]) -> bool:
+        """Есть ли значение в списке"""
+        if not value:
+            return False
+        blocklist = self.lists.get(kind)
+        return blocklist is not None and value in blocklist
+
+    def get_statistics(self) -> Dict:
+        """Размеры списков, память на миллион записей и задержка проверки"""
+        stats = {}
+        for kind, blocklist in self.lists.items():
+            entries = len(blocklist)
+            stats[kind] = {
+                "entries": entries,
+                "bytes": blocklist.nbytes,
+                "bloom_bytes": blocklist.bloom_nbytes,
+                "bytes_per_million": round(blocklist.nbytes / entries * 1_000_000) if entries else 0,
+                "lookup_ns": round(self._lookup_ns.get(kind, 0.0)),
+            }
+        return stats
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+
+    manager = BlocklistManager(sys.argv[1] if len(sys.argv) > 1 else "data/blocklists")
+    manager.reload()
+    for kind, kind_stats in manager.get_statistics().items():
+        print(
+            f"{kind}: {kind_stats['entries']} записей, "
+            f"{kind_stats['bytes_per_million'] / 1024 / 1024:.1f} МБ на миллион, "
+            f"проверка {kind_stats['lookup_ns']} нс"
+        )
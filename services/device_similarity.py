@@ -0,0 +1,299 @@
+"""
+Индекс похожих устройств (MinHash/LSH по отпечатку устройства)
+Связывает клиентов, использующих почти одинаковые устройства
+"""
+import hashlib
+import ipaddress
+import logging
+import re
+import time
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Простое число Мерсенна для универсального хеширования
+_MERSENNE_PRIME = (1 << 31) - 1
+
+_UA_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9_.\-]*(?:/[0-9][0-9.]*)?")
+
+# Вес различающих полей (ID устройства, подсеть IP) - число их копий в
+# множестве токенов: общие токены стокового браузера без них не дают
+# похожести выше порога
+DISCRIMINATIVE_WEIGHT = 8
+
+
+def _subnet(ip_address: Optional[str]) -> Optional[str]:
+    """Подсеть адреса: /24 для IPv4, /48 для IPv6"""
+    try:
+        address = ipaddress.ip_address((ip_address or "").strip())
+    except ValueError:
+        return None
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+def fingerprint_tokens(transaction) -> Set[str]:
+    """
+    Токены отпечатка устройства
+
+    - компоненты User-Agent (продукт/версия) и их пары
+    - ОС, браузер и его версия
+    - параметры экрана, если есть
+    - ID устройства и подсеть IP с весом DISCRIMINATIVE_WEIGHT
+    """
+    tokens = set()
+
+    for name, value in (
+        ("device", getattr(transaction, 'device_id', None)),
+        ("subnet", _subnet(getattr(transaction, 'ip_address', None))),
+    ):
+        if value:
+            tokens.update(f"{name}:{str(value).lower()}#{copy}" for copy in range(DISCRIMINATIVE_WEIGHT))
+
+    user_agent = getattr(transaction, 'user_agent', None) or ""
+    ua_tokens = [token.lower() for token in _UA_TOKEN_RE.findall(user_agent)]
+    tokens.update(f"ua:{token}" for token in ua_tokens)
+    tokens.update(f"ua2:{a}|{b}" for a, b in zip(ua_tokens, ua_tokens[1:]))
+
+    device_os = getattr(transaction, 'device_os', None)
+    if device_os:
+        tokens.add(f"os:{device_os.lower()}")
+
+    browser = getattr(transaction, 'browser', None)
+    if browser:
+        browser = browser.lower()
+        tokens.add(f"browser:{browser}")
+        tokens.add(f"browser_family:{browser.split()[0]}")
+
+    for field in ('screen_resolution', 'screen_color_depth', 'timezone', 'language'):
+        value = getattr(transaction, field, None)
+        if value:
+            tokens.add(f"{field}:{str(value).lower()}")
+
+    return tokens
+
+
+class DeviceSimilarityIndex:
+    """
+    MinHash/LSH индекс отпечатков устройств
+
+    - Сигнатура MinHash из num_perm значений, разбитая на bands полос
+    - Полоса хешируется в корзину; кандидаты - записи из общих корзин,
+      похожесть проверяется по доле совпавших значений сигнатуры
+    - Фиксированный бюджет памяти: кольцевой буфер на capacity записей,
+      корзины ограничены по длине
+    - Ссылки на записи удаляются из корзин постепенно: при вытеснении
+      записи из буфера и при истечении окна - каждое добавление
+      проверяет до expire_batch самых старых записей, так что запрос
+      не ждет полной перестройки
+    - observe() не связывает клиентов, если похожих больше
+      max_cluster_share записей окна: такой отпечаток - массовая
+      конфигурация (стоковый браузер), а не ферма устройств
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 32,
+        bands: int = 8,
+        capacity: int = 200_000,
+        window_seconds: float = 24 * 3600.0,
+        similarity_threshold: float = 0.8,
+        max_bucket_size: int = 256,
+        expire_batch: int = 2,
+        max_cluster_share: float = 0.01,
+        seed: int = 42
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm должен делиться на bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_bucket_size = max_bucket_size
+        self.expire_batch = expire_batch
+        self.max_cluster_share = max_cluster_share
+        self.common_suppressed = 0
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        # Кольцевой буфер записей
+        self._signatures = np.zeros((capacity, num_perm), dtype=np.uint32)
+        self._timestamps = array('d', [0.0]) * capacity
+        self._customers: List[Optional[str]] = [None] * capacity
+        self._next_slot = 0
+        self._size = 0
+
+        self._buckets: Dict[tuple, deque] = {}
+
+    # === СИГНАТУРЫ ===
+
+    def signature(self, tokens: Set[str]) -> Optional[np.ndarray]:
+        """MinHash сигнатура множества токенов"""
+        if not tokens:
+            return None
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+                % _MERSENNE_PRIME
+                for token in tokens
+            ),
+            dtype=np.uint64,
+            count=len(tokens)
+        )
+        # (a * h + b) mod p < 2^62 - без переполнения uint64
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        rows = self.rows
+        return [
+            (band, signature[band * rows:(band + 1) * rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    # === ОБНОВЛЕНИЕ ===
+
+    def add(self, customer_id: str, signature: np.ndarray, timestamp: Optional[float] = None):
+        """Добавление отпечатка устройства клиента"""
+        timestamp = time.time() if timestamp is None else timestamp
+        self._expire(timestamp - self.window_seconds)
+
+        slot = self._next_slot
+        if self._customers[slot] is not None:
+            self._unlink(slot)  # вытесняемая запись
+        self._signatures[slot] = signature
+        self._timestamps[slot] = timestamp
+        self._customers[slot] = customer_id
+        self._next_slot = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = deque(maxlen=self.max_bucket_size)
+            bucket.append(slot)
+
+    def _unlink(self, slot: int):
+        """Удаление ссылок на запись из ее корзин"""
+        for key in self._band_keys(self._signatures[slot]):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(slot)
+            except ValueError:
+                pass  # уже вытеснена из корзины ограничением длины
+            if not bucket:
+                del self._buckets[key]
+
+    def _expire(self, cutoff: float):
+        """Удаление до expire_batch самых старых записей старше cutoff"""
+        for _ in range(self.expire_batch):
+            if not self._size:
+                return
+            slot = (self._next_slot - self._size) % self.capacity
+            if self._timestamps[slot] >= cutoff:
+                return
+            self._unlink(slot)
+            self._customers[slot] = None
+            self._size -= 1
+
+    def rebuild(self, now: Optional[float] = None):
+        """Полная перестройка корзин по актуальным записям окна (O(capacity * bands))"""
+        now = time.time() if now is None else now
+        cutoff = now - self.window_seconds
+        buckets: Dict[tuple, deque] = {}
+
+        # Обход от старых записей к новым, чтобы ограничение корзин вытесняло старые
+        for offset in range(self._size):
+            slot = (self._next_slot - self._size + offset) % self.capacity
+            if self._timestamps[slot] < cutoff:
+                continue
+            for key in self._band_keys(self._signatures[slot]):
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = deque(maxlen=self.max_bucket_size)
+                bucket.append(slot)
+
+        self._buckets = buckets
+        logger.debug(f"Индекс устройств перестроен: {len(buckets)} корзин")
+
+    # === ЗАПРОСЫ ===
+
+    def count_similar_customers(
+        self,
+        signature: np.ndarray,
+        exclude_customer: Optional[str] = None,
+        now: Optional[float] = None
+    ) -> int:
+        """
+        Количество разных клиентов с почти одинаковым устройством за окно
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.window_seconds
+
+        candidates = set()
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket:
+                candidates.update(bucket)
+        if not candidates:
+            return 0
+
+        slots = np.fromiter(
+            (slot for slot in candidates if self._timestamps[slot] >= cutoff),
+            dtype=np.int64
+        )
+        if not len(slots):
+            return 0
+
+        similarity = (self._signatures[slots] == signature).mean(axis=1)
+        customers = {
+            self._customers[slot]
+            for slot in slots[similarity >= self.similarity_threshold]
+        }
+        customers.discard(exclude_customer)
+        return len(customers)
+
+    def observe(self, transaction, customer_id: Optional[str]) -> int:
+        """
+        Запрос похожих устройств и добавление текущего отпечатка
+
+        Returns:
+            Количество других клиентов с почти одинаковым устройством
+            (0 для массовых отпечатков, см. max_cluster_share)
+        """
+        if not customer_id:
+            return 0
+        signature = self.signature(fingerprint_tokens(transaction))
+        if signature is None:
+            return 0
+
+        timestamp = getattr(transaction, 'timestamp', None)
+        now = timestamp.timestamp() if timestamp is not None else time.time()
+
+        count = self.count_similar_customers(signature, customer_id, now)
+        if count and count > self.max_cluster_share * self._size:
+            self.common_suppressed += 1
+            count = 0
+        self.add(customer_id, signature, now)
+        return count
+
+    def get_statistics(self) -> Dict:
+        """Статистика индекса"""
+        return {
+            "entries": self._size,
+            "capacity": self.capacity,
+            "buckets": len(self._buckets),
+            "common_suppressed": self.common_suppressed,
+            "signature_bytes": self._signatures.nbytes,
+        }
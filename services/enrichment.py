@@ -0,0 +1,422 @@
+"""
+Локальные индексы обогащения: диапазоны IP и BIN карт
+Страна/регион/ASN по IP-адресу и страна эмитента/тип карты по BIN
+"""
+import csv
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"FGRI"
+INDEX_VERSION = 1
+
+# Размер каталога первого уровня: 2**20 блоков (4 МБ)
+DIRECTORY_BITS = 20
+
+# Длина ключа BIN: 6-значные BIN дополняются до 8 знаков
+BIN_KEY_DIGITS = 8
+
+
+class IpInfo(NamedTuple):
+    """Данные о диапазоне IP-адресов"""
+    country: str
+    region: str
+    asn: int
+    is_hosting: bool
+
+
+class BinInfo(NamedTuple):
+    """Данные о диапазоне BIN карт"""
+    issuer_country: str
+    card_type: str
+
+
+_unpack_ipv4 = struct.Struct("!I").unpack
+
+
+def ip_to_int(ip_address: Optional[str]) -> Optional[int]:
+    """IPv4 адрес в число (None для IPv6 и некорректных адресов)"""
+    if not ip_address:
+        return None
+    try:
+        return _unpack_ipv4(socket.inet_aton(ip_address))[0]
+    except OSError:
+        return None
+
+
+def bin_to_key(card_bin: Optional[str], fill: str = "0") -> Optional[int]:
+    """BIN карты в ключ фиксированной длины"""
+    if not card_bin:
+        return None
+    digits = card_bin.strip()[:BIN_KEY_DIGITS]
+    if not digits.isdigit():
+        return None
+    return int(digits.ljust(BIN_KEY_DIGITS, fill))
+
+
+def _align(offset: int, size: int = 8) -> int:
+    return (offset + size - 1) // size * size
+
+
+class RangeIndex:
+    """
+    Индекс непересекающихся диапазонов [start, end] с атрибутами
+
+    Скомпилированный файл:
+    - заголовок: magic, длина метаданных, метаданные в JSON
+      (количество записей, колонки, таблица строк)
+    - отсортированные массивы starts/ends (uint32)
+    - каталог первого уровня по старшим битам ключа (uint32)
+    - массив на каждую колонку (индекс строки или число)
+
+    Файл отображается в память (mmap), массивы читаются через memoryview
+    без копирования, поиск - бинарный (bisect).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, meta_len = struct.unpack_from("<4sI", self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Неверный формат индекса: {path}")
+
+        meta = json.loads(self._mmap[8:8 + meta_len])
+        if meta["version"] != INDEX_VERSION:
+            raise ValueError(f"Неподдерживаемая версия индекса: {meta['version']}")
+
+        self.count = meta["count"]
+        self.strings: List[str] = meta["strings"]
+        self.columns: List[Tuple[str, str]] = [tuple(column) for column in meta["columns"]]
+
+        buffer = memoryview(self._mmap)
+        offset = _align(8 + meta_len)
+
+        def take(typecode: str, count: int = self.count) -> memoryview:
+            nonlocal offset
+            size = struct.calcsize(typecode) * count
+            view = buffer[offset:offset + size].cast(typecode)
+            offset = _align(offset + size)
+            return view
+
+        self.starts = take("I")
+        self.ends = take("I")
+        self._shift = meta["shift"]
+        self._directory = take("I", meta["directory_size"])
+        self._columns = [
+            (take(typecode), name.startswith("$"))
+            for name, typecode in self.columns
+        ]
+
+    def find(self, key: int) -> int:
+        """
+        Поиск диапазона, содержащего ключ
+
+        Каталог первого уровня по старшим битам ключа сужает бинарный поиск
+        до записей одного блока: несколько сравнений вместо log2(count).
+
+        Returns:
+            Номер диапазона или -1
+        """
+        block = key >> self._shift
+        directory = self._directory
+        if block + 1 >= len(directory):
+            return -1
+        idx = bisect_right(self.starts, key, directory[block], directory[block + 1] + 1) - 1
+        if idx < 0 or key > self.ends[idx]:
+            return -1
+        return idx
+
+    def lookup(self, key: int) -> Optional[list]:
+        """
+        Значения колонок для диапазона, содержащего ключ
+
+        Returns:
+            Значения колонок или None
+        """
+        idx = self.find(key)
+        if idx < 0:
+            return None
+        strings = self.strings
+        return [
+            strings[values[idx]] if is_string else values[idx]
+            for values, is_string in self._columns
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        """Размер индекса в байтах"""
+        return len(self._mmap)
+
+    @staticmethod
+    def compile(
+        rows: Iterable[Sequence],
+        path: str,
+        columns: Sequence[Tuple[str, str]]
+    ) -> int:
+        """
+        Компиляция диапазонов в бинарный файл (атомарно, через os.replace)
+
+        Args:
+            rows: Кортежи (start, end, значения колонок...)
+            path: Путь к скомпилированному файлу
+            columns: Пары (имя, typecode); имена строковых колонок начинаются с '$'
+
+        Returns:
+            Количество диапазонов
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+
+        strings: List[str] = []
+        string_ids: Dict[str, int] = {}
+        encoded_columns = [[] for _ in columns]
+        starts, ends = [], []
+        previous_end = -1
+
+        for row in rows:
+            start, end = int(row[0]), int(row[1])
+            if start <= previous_end:
+                raise ValueError(f"Пересекающиеся диапазоны: {start} <= {previous_end}")
+            previous_end = end
+            starts.append(start)
+            ends.append(end)
+
+            for i, (name, _) in enumerate(columns):
+                value = row[2 + i]
+                if name.startswith("$"):
+                    value = value or ""
+                    if value not in string_ids:
+                        string_ids[value] = len(strings)
+                        strings.append(value)
+                    value = string_ids[value]
+                encoded_columns[i].append(int(value))
+
+        # Каталог первого уровня: для каждого блока старших битов ключа -
+        # номер последнего диапазона, начинающегося не позже начала блока
+        max_key = ends[-1] if ends else 0
+        shift = max(0, max_key.bit_length() - DIRECTORY_BITS)
+        directory = array("I")
+        position = 0
+        for block in range((max_key >> shift) + 2):
+            block_start = block << shift
+            while position < len(starts) and starts[position] <= block_start:
+                position += 1
+            directory.append(max(0, position - 1))
+
+        # Строковые колонки хранят индексы: uint16 или uint32 по размеру таблицы
+        string_typecode = "H" if len(strings) <= 0xFFFF else "I"
+        columns = [
+            (name, string_typecode if name.startswith("$") else typecode)
+            for name, typecode in columns
+        ]
+
+        meta = json.dumps({
+            "version": INDEX_VERSION,
+            "count": len(starts),
+            "shift": shift,
+            "directory_size": len(directory),
+            "columns": columns,
+            "strings": strings,
+        }, ensure_ascii=False).encode('utf-8')
+
+        # Временный файл с уникальным именем: воркеры компилируют индекс независимо
+        directory_path = os.path.dirname(path) or "."
+        os.makedirs(directory_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory_path, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack("<4sI", INDEX_MAGIC, len(meta)))
+                f.write(meta)
+                arrays = [("I", starts), ("I", ends), ("I", directory)] + [
+                    (typecode, values) for (_, typecode), values in zip(columns, encoded_columns)
+                ]
+                for typecode, values in arrays:
+                    f.write(b"\0" * (_align(f.tell()) - f.tell()))
+                    f.write(array(typecode, values).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        return len(starts)
+
+
+IP_COLUMNS = [("$country", "H"), ("$region", "H"), ("asn", "I"), ("is_hosting", "B")]
+BIN_COLUMNS = [("$issuer_country", "H"), ("$card_type", "H")]
+
+
+def _ipv4_bound(value: str) -> int:
+    """Граница диапазона: IPv4 адрес или число; ValueError для IPv6 и некорректных значений"""
+    value = value.strip()
+    if value.isdigit():
+        value = int(value)
+    address = ipaddress.ip_address(value)
+    if address.version != 4:
+        raise ValueError(f"{value}: индекс хранит только IPv4")
+    return int(address)
+
+
+def _parse_rows(path: str, parse: Callable[[Dict[str, str]], tuple]) -> Iterable[tuple]:
+    """Строки CSV через parse; строки с ошибками и start > end пропускаются с предупреждением"""
+    skipped = 0
+    with open(path, newline='', encoding='utf-8') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                parsed = parse(row)
+                if parsed[0] > parsed[1]:
+                    raise ValueError("начало диапазона больше конца")
+            except (KeyError, TypeError, ValueError) as e:
+                skipped += 1
+                if skipped == 1:
+                    logger.warning(f"{path}:{line}: строка пропущена: {str(e)}")
+                continue
+            yield parsed
+    if skipped:
+        logger.warning(f"{path}: пропущено строк: {skipped}")
+
+
+def _parse_ip_range(row: Dict[str, str]) -> tuple:
+    return (
+        _ipv4_bound(row["ip_start"] or ""),
+        _ipv4_bound(row["ip_end"] or ""),
+        row.get("country", ""),
+        row.get("region", ""),
+        int(row.get("asn") or 0),
+        1 if str(row.get("is_hosting", "")).lower() in ("1", "true", "yes") else 0,
+    )
+
+
+def _bin_bound(value: Optional[str], fill: str) -> int:
+    key = bin_to_key(value, fill)
+    if key is None:
+        raise ValueError(f"{value!r}: BIN должен состоять из цифр")
+    return key
+
+
+def _parse_bin_range(row: Dict[str, str]) -> tuple:
+    return (
+        _bin_bound(row["bin_start"], "0"),
+        _bin_bound(row["bin_end"] or row["bin_start"], "9"),
+        row.get("issuer_country", ""),
+        row.get("card_type", ""),
+    )
+
+
+def _read_ip_ranges(path: str) -> Iterable[tuple]:
+    """CSV: ip_start,ip_end,country,region,asn,is_hosting; строки с IPv6 и ошибками пропускаются"""
+    return _parse_rows(path, _parse_ip_range)
+
+
+def _read_bin_ranges(path: str) -> Iterable[tuple]:
+    """CSV: bin_start,bin_end,issuer_country,card_type (6-8 цифр); строки с ошибками пропускаются"""
+    return _parse_rows(path, _parse_bin_range)
+
+
+class EnrichmentService:
+    """
+    Обогащение транзакций по локальным файлам данных
+
+    Исходные CSV компилируются в бинарные индексы рядом с ними (*.idx).
+    При появлении нового CSV (изменилось время модификации) индекс
+    перекомпилируется во временный файл и атомарно подменяется:
+    текущие запросы дочитывают старую версию. Некорректные строки
+    пропускаются; если файл не компилируется (например, пересекающиеся
+    диапазоны), остается прежний индекс.
+    """
+
+    def __init__(self, ip_ranges_path: Optional[str] = None, bin_ranges_path: Optional[str] = None):
+        self.ip_ranges_path = ip_ranges_path
+        self.bin_ranges_path = bin_ranges_path
+        self.ip_index: Optional[RangeIndex] = None
+        self.bin_index: Optional[RangeIndex] = None
+        self._source_mtimes: Dict[str, float] = {}
+        self._reload_lock = threading.Lock()
+
+    def reload(self) -> bool:
+        """
+        Перезагрузка индексов, если исходные файлы изменились
+
+        Returns:
+            True, если хотя бы один индекс обновлен
+        """
+        with self._reload_lock:
+            updated = False
+            ip_index = self._load(self.ip_ranges_path, _read_ip_ranges, IP_COLUMNS)
+            if ip_index is not None:
+                self.ip_index = ip_index
+                updated = True
+            bin_index = self._load(self.bin_ranges_path, _read_bin_ranges, BIN_COLUMNS)
+            if bin_index is not None:
+                self.bin_index = bin_index
+                updated = True
+            return updated
+
+    def _load(self, source_path: Optional[str], reader, columns) -> Optional[RangeIndex]:
+        if not source_path or not os.path.exists(source_path):
+            return None
+
+        source_mtime = os.path.getmtime(source_path)
+        if self._source_mtimes.get(source_path) == source_mtime:
+            return None
+
+        index_path = f"{os.path.splitext(source_path)[0]}.idx"
+        try:
+            if not os.path.exists(index_path) or os.path.getmtime(index_path) < source_mtime:
+                count = RangeIndex.compile(reader(source_path), index_path, columns)
+                logger.info(f"Индекс {index_path} скомпилирован: {count} диапазонов")
+            index = RangeIndex(index_path)
+        except Exception as e:
+            # Файл не перечитывается до следующего изменения; прежний индекс остается
+            self._source_mtimes[source_path] = source_mtime
+            logger.error(f"Индекс обогащения {source_path} не обновлен: {str(e)}")
+            return None
+        self._source_mtimes[source_path] = source_mtime
+        logger.info(f"Индекс обогащения загружен: {index_path} ({index.nbytes / 1024 / 1024:.1f} МБ)")
+        return index
+
+    def lookup_ip(self, ip_address: Optional[str]) -> Optional[IpInfo]:
+        """Данные по IP-адресу"""
+        index = self.ip_index
+        key = ip_to_int(ip_address)
+        if index is None or key is None:
+            return None
+        values = index.lookup(key)
+        if values is None:
+            return None
+        country, region, asn, is_hosting = values
+        return IpInfo(country, region, asn, bool(is_hosting))
+
+    def lookup_bin(self, card_bin: Optional[str]) -> Optional[BinInfo]:
+        """Данные по BIN карты"""
+        index = self.bin_index
+        key = bin_to_key(card_bin)
+        if index is None or key is None:
+            return None
+        values = index.lookup(key)
+        if values is None:
+            return None
+        return BinInfo(*values)
+
+    def get_statistics(self) -> Dict:
+        """Статистика индексов"""
+        return {
+            "ip_ranges": self.ip_index.count if self.ip_index else 0,
+            "ip_index_bytes": self.ip_index.nbytes if self.ip_index else 0,
+            "bin_ranges": self.bin_index.count if self.bin_index else 0,
+            "bin_index_bytes": self.bin_index.nbytes if self.bin_index else 0,
+        }
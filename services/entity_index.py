@@ -0,0 +1,489 @@
+"""
+Инвертированный индекс сущностей для расследований
+IP, устройство, карта, email и получатель -> транзакции с тем же значением
+"""
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from services.process_files import claim_process_files, process_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"FGE2"
+SNAPSHOT_VERSION = 2
+# Формат снимка -> число секций (b"FGEI" - версия 1, без времени транзакций)
+_SNAPSHOT_SECTIONS = {b"FGEI": 7, SNAPSHOT_MAGIC: 8}
+
+
+def entity_keys(transaction) -> List[str]:
+    """
+    Ключи сущностей транзакции: "<тип>:<нормализованное значение>"
+
+    Карта задается парой BIN + последние 4 цифры.
+    """
+    keys = []
+    for kind, field in (("ip", "ip_address"), ("device", "device_id"), ("email", "email"), ("dest", "nameDest")):
+        value = getattr(transaction, field, None)
+        if value and value.strip():
+            keys.append(f"{kind}:{value.strip().lower()}")
+
+    card_bin = getattr(transaction, 'card_bin', None)
+    card_last4 = getattr(transaction, 'card_last4', None)
+    if card_bin and card_last4:
+        keys.append(f"card:{card_bin.strip()}:{card_last4.strip()}")
+    return keys
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class PostingList:
+    """
+    Сжатый отсортированный список номеров транзакций
+
+    Номера хранятся разностями от предыдущего в varint (1-2 байта
+    на запись вместо 4-8), дописываются только в конец.
+    """
+
+    __slots__ = ("data", "last", "count")
+
+    def __init__(self, data: Optional[bytearray] = None, last: int = -1, count: int = 0):
+        self.data = data if data is not None else bytearray()
+        self.last = last
+        self.count = count
+
+    def append(self, doc: int) -> bool:
+        """Добавление номера больше последнего"""
+        if doc <= self.last:
+            return False
+        _encode_varint(doc - self.last - 1 if self.last >= 0 else doc, self.data)
+        self.last = doc
+        self.count += 1
+        return True
+
+    def decode(self) -> array:
+        """Номера транзакций по возрастанию"""
+        docs = array('I')
+        doc = -1
+        value = shift = 0
+        for byte in self.data:
+            value |= (byte & 0x7F) << shift
+            if byte & 0x80:
+                shift += 7
+                continue
+            doc = value if doc < 0 else doc + value + 1
+            docs.append(doc)
+            value = shift = 0
+        return docs
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class EntityIndex:
+    """
+    Инвертированный индекс: сущность -> сжатый список транзакций
+
+    - Транзакции нумеруются по порядку поступления, поэтому списки
+      остаются отсортированными при дописывании в конец
+    - Прямой индекс (транзакция -> сущности) хранится плоскими
+      массивами для обхода связей на несколько шагов
+    - Сущности с числом транзакций больше max_fanout (общий NAT,
+      популярный получатель) при обходе не раскрываются
+    - Время индексации транзакций хранится для удаления по сроку
+      хранения (purge_expired)
+    - Двоичный снимок для восстановления после перезапуска: у каждого
+      процесса свой файл <snapshot_path без расширения>.<pid><расширение>;
+      при загрузке снимки завершенных процессов забираются
+      переименованием (каждый - одним воркером) и объединяются
+    - Обновления (add, purge_expired) выполняются из одного потока,
+      запросы и снимок - из любого
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Optional[str] = None,
+        max_fanout: int = 10_000
+    ):
+        self.snapshot_path = snapshot_path
+        self.max_fanout = max_fanout
+
+        self._transaction_ids: List[str] = []
+        self._doc_ids: Dict[str, int] = {}
+
+        self._entity_keys: List[str] = []
+        self._entity_ids: Dict[str, int] = {}
+        self._postings: List[PostingList] = []
+
+        # Прямой индекс: сущности транзакции doc - _doc_entities[_doc_offsets[doc]:_doc_offsets[doc + 1]]
+        self._doc_offsets = array('I', [0])
+        self._doc_entities = array('I')
+        self._doc_times = array('d')
+
+        self._lock = threading.RLock()
+        # Забранные снимки завершенных процессов: удаляются после записи своего
+        self._claimed: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._transaction_ids)
+
+    # === ОБНОВЛЕНИЕ ===
+
+    def add(self, transaction_id: str, keys: List[str], timestamp: Optional[float] = None) -> bool:
+        """
+        Индексация транзакции
+
+        Returns:
+            False, если транзакция уже проиндексирована
+        """
+        with self._lock:
+            if transaction_id in self._doc_ids:
+                return False
+
+            doc = len(self._transaction_ids)
+            self._transaction_ids.append(transaction_id)
+            self._doc_ids[transaction_id] = doc
+            self._doc_times.append(time.time() if timestamp is None else timestamp)
+
+            for key in dict.fromkeys(keys):
+                entity = self._entity_ids.get(key)
+                if entity is None:
+                    entity = self._entity_ids[key] = len(self._entity_keys)
+                    self._entity_keys.append(key)
+                    self._postings.append(PostingList())
+                self._postings[entity].append(doc)
+                self._doc_entities.append(entity)
+            self._doc_offsets.append(len(self._doc_entities))
+            return True
+
+    def add_transaction(self, transaction_id: str, transaction) -> bool:
+        """Индексация транзакции по ее полям"""
+        return self.add(transaction_id, entity_keys(transaction))
+
+    # === ЗАПРОСЫ ===
+
+    def entities(self, transaction_id: str) -> List[str]:
+        """Сущности транзакции"""
+        with self._lock:
+            doc = self._doc_ids.get(transaction_id)
+            if doc is None:
+                return []
+            return [self._entity_keys[entity] for entity in self._entities_of(doc)]
+
+    def _entities_of(self, doc: int) -> array:
+        return self._doc_entities[self._doc_offsets[doc]:self._doc_offsets[doc + 1]]
+
+    def transactions(self, key: str) -> List[str]:
+        """Транзакции с данным значением сущности"""
+        with self._lock:
+            entity = self._entity_ids.get(key)
+            if entity is None:
+                return []
+            transaction_ids = self._transaction_ids
+            return [transaction_ids[doc] for doc in self._postings[entity].decode()]
+
+    def linked(
+        self,
+        transaction_id: str,
+        max_hops: int = 2,
+        limit: int = 1000
+    ) -> Optional[Dict]:
+        """
+        Связанные транзакции на расстоянии до max_hops шагов
+
+        Шаг - общая сущность (IP, устройство, карта, email, получатель).
+        Обход в ширину, каждая сущность раскрывается один раз.
+
+        Returns:
+            Связанные транзакции с расстоянием и сущностью, через которую
+            найдена связь, или None, если транзакция не проиндексирована
+        """
+        with self._lock:
+            return self._linked(transaction_id, max_hops, limit)
+
+    def _linked(self, transaction_id: str, max_hops: int, limit: int) -> Optional[Dict]:
+        started = time.perf_counter()
+        start_doc = self._doc_ids.get(transaction_id)
+        if start_doc is None:
+            return None
+
+        visited_docs = {start_doc}
+        visited_entities = set()
+        skipped_entities: List[str] = []
+        linked: List[Dict] = []
+        truncated = False
+        frontier = [start_doc]
+
+        for hop in range(1, max_hops + 1):
+            next_frontier = []
+            for doc in frontier:
+                for entity in self._entities_of(doc):
+                    if entity in visited_entities:
+                        continue
+                    visited_entities.add(entity)
+
+                    posting = self._postings[entity]
+                    if posting.count > self.max_fanout:
+                        skipped_entities.append(self._entity_keys[entity])
+                        continue
+
+                    for linked_doc in posting.decode():
+                        if linked_doc in visited_docs:
+                            continue
+                        if len(linked) >= limit:
+                            truncated = True
+                            break
+                        visited_docs.add(linked_doc)
+                        next_frontier.append(linked_doc)
+                        linked.append({
+                            "transaction_id": self._transaction_ids[linked_doc],
+                            "hops": hop,
+                            "via": self._entity_keys[entity],
+                        })
+                    if truncated:
+                        break
+                if truncated:
+                    break
+            if truncated or not next_frontier:
+                break
+            frontier = next_frontier
+
+        return {
+            "transaction_id": transaction_id,
+            "entities": self.entities(transaction_id),
+            "linked": linked,
+            "truncated": truncated,
+            "skipped_entities": skipped_entities,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    # === ОБСЛУЖИВАНИЕ ===
+
+    def purge_expired(self, cutoff: float) -> int:
+        """
+        Удаление транзакций, проиндексированных раньше cutoff
+
+        Оставшиеся транзакции и сущности перенумеровываются; новые
+        структуры строятся без блокировки (обновления идут из этого же
+        потока), запросы ждут только их подмены.
+
+        Returns:
+            Количество удаленных транзакций
+        """
+        keep = [doc for doc, timestamp in enumerate(self._doc_times) if timestamp >= cutoff]
+        removed = len(self._transaction_ids) - len(keep)
+        if not removed:
+            return 0
+
+        doc_remap = array('l', [-1]) * len(self._transaction_ids)
+        for new_doc, doc in enumerate(keep):
+            doc_remap[doc] = new_doc
+
+        entity_keys: List[str] = []
+        postings: List[PostingList] = []
+        entity_remap = array('l', [-1]) * len(self._entity_keys)
+        for entity, posting in enumerate(self._postings):
+            kept = PostingList()
+            for doc in posting.decode():
+                if doc_remap[doc] >= 0:
+                    kept.append(doc_remap[doc])
+            if kept.count:
+                entity_remap[entity] = len(entity_keys)
+                entity_keys.append(self._entity_keys[entity])
+                postings.append(kept)
+
+        doc_offsets, doc_entities = array('I', [0]), array('I')
+        for doc in keep:
+            doc_entities.extend(entity_remap[entity] for entity in self._entities_of(doc))
+            doc_offsets.append(len(doc_entities))
+
+        transaction_ids = [self._transaction_ids[doc] for doc in keep]
+        self._replace(
+            transaction_ids, entity_keys, postings, doc_offsets, doc_entities,
+            array('d', (self._doc_times[doc] for doc in keep))
+        )
+        logger.info(f"Индекс сущностей: удалено {removed} транзакций старше срока хранения")
+        return removed
+
+    def _replace(self, transaction_ids, entity_keys, postings, doc_offsets, doc_entities, doc_times):
+        doc_ids = {transaction_id: doc for doc, transaction_id in enumerate(transaction_ids)}
+        entity_ids = {key: entity for entity, key in enumerate(entity_keys)}
+        with self._lock:
+            self._transaction_ids = transaction_ids
+            self._doc_ids = doc_ids
+            self._entity_keys = entity_keys
+            self._entity_ids = entity_ids
+            self._postings = postings
+            self._doc_offsets = doc_offsets
+            self._doc_entities = doc_entities
+            self._doc_times = doc_times
+
+    def get_statistics(self) -> Dict:
+        """Размер индекса"""
+        posting_bytes = sum(len(posting.data) for posting in self._postings)
+        postings = sum(posting.count for posting in self._postings)
+        return {
+            "transactions": len(self._transaction_ids),
+            "entities": len(self._entity_keys),
+            "postings": postings,
+            "posting_bytes": posting_bytes,
+            "bytes_per_posting": round(posting_bytes / postings, 2) if postings else 0.0,
+        }
+
+    # === СНИМОК ===
+
+    def process_snapshot_path(self, pid: Optional[int] = None) -> Optional[str]:
+        """Файл снимка процесса pid (по умолчанию - этого)"""
+        return process_path(self.snapshot_path, pid) if self.snapshot_path else None
+
+    def save_snapshot(self, path: Optional[str] = None) -> bool:
+        """Атомарная запись снимка индекса (по умолчанию - в файл этого процесса)"""
+        path = path or self.process_snapshot_path()
+        if not path:
+            return False
+
+        # Под блокировкой - только копирование, сериализация - без нее
+        with self._lock:
+            transaction_ids = list(self._transaction_ids)
+            entity_keys = list(self._entity_keys)
+            lasts = array('q', (posting.last for posting in self._postings))
+            counts = array('I', (posting.count for posting in self._postings))
+            sizes = array('I', (len(posting.data) for posting in self._postings))
+            data = b"".join(posting.data for posting in self._postings)
+            offsets = self._doc_offsets.tobytes()
+            entities = self._doc_entities.tobytes()
+            times = self._doc_times.tobytes()
+            claimed, self._claimed = self._claimed, []
+
+        meta = json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "transaction_ids": transaction_ids,
+            "entity_keys": entity_keys,
+        }, ensure_ascii=False).encode('utf-8')
+        sections = [meta, offsets, entities, lasts.tobytes(), counts.tobytes(), sizes.tobytes(), data, times]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path) or "."
+        )
+        with os.fdopen(fd, 'wb') as f:
+            f.write(struct.pack(f"<4s{len(sections)}Q", SNAPSHOT_MAGIC, *(len(s) for s in sections)))
+            for section in sections:
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        # Содержимое забранных снимков теперь в своем
+        for claimed_path in claimed:
+            if claimed_path != path:
+                try:
+                    os.remove(claimed_path)
+                except FileNotFoundError:
+                    pass
+
+        logger.info(f"Снимок индекса сущностей сохранен: {len(transaction_ids)} транзакций")
+        return True
+
+    def load_snapshot(self, path: Optional[str] = None) -> bool:
+        """
+        Загрузка снимка path или, по умолчанию, своего снимка
+        и снимков завершенных процессов
+        """
+        if path:
+            paths = [path]
+        elif self.snapshot_path:
+            paths = [self.process_snapshot_path(), *claim_process_files(self.snapshot_path)]
+        else:
+            paths = []
+        paths = [item for item in paths if os.path.exists(item)]
+        if not paths:
+            return False
+
+        self._replace(*_read_snapshot(paths[0]))
+        for other in paths[1:]:
+            transaction_ids, entity_keys, _, doc_offsets, doc_entities, doc_times = _read_snapshot(other)
+            for doc, transaction_id in enumerate(transaction_ids):
+                keys = [entity_keys[entity] for entity in doc_entities[doc_offsets[doc]:doc_offsets[doc + 1]]]
+                self.add(transaction_id, keys, doc_times[doc])
+        if not path:
+            self._claimed = [item for item in paths if item != self.process_snapshot_path()]
+
+        logger.info(
+            f"Снимок индекса сущностей загружен: {len(self._transaction_ids)} транзакций, файлов - {len(paths)}"
+        )
+        return True
+
+
+def _read_snapshot(path: str) -> Tuple:
+    """Разбор файла снимка: структуры индекса для EntityIndex._replace"""
+    with open(path, 'rb') as f:
+        buffer = f.read()
+
+    magic = buffer[:4]
+    if magic not in _SNAPSHOT_SECTIONS:
+        raise ValueError(f"Неверный формат снимка индекса: {path}")
+    header = struct.Struct(f"<4s{_SNAPSHOT_SECTIONS[magic]}Q")
+    _, *lengths = header.unpack_from(buffer, 0)
+
+    sections = []
+    offset = header.size
+    for length in lengths:
+        sections.append(buffer[offset:offset + length])
+        offset += length
+    meta_bytes, offsets, entities, lasts, counts, sizes, data, *times = sections
+
+    meta = json.loads(meta_bytes)
+    if meta["version"] not in (1, SNAPSHOT_VERSION):
+        raise ValueError(f"Неподдерживаемая версия снимка индекса: {meta['version']}")
+
+    lasts, counts, sizes = array('q', lasts), array('I', counts), array('I', sizes)
+    postings = []
+    position = 0
+    for last, count, size in zip(lasts, counts, sizes):
+        postings.append(PostingList(bytearray(data[position:position + size]), last, count))
+        position += size
+
+    transaction_ids = meta["transaction_ids"]
+    # В снимке версии 1 времени нет: срок хранения отсчитывается от загрузки
+    doc_times = array('d', times[0]) if times else array('d', [time.time()]) * len(transaction_ids)
+    return (
+        transaction_ids, meta["entity_keys"], postings,
+        array('I', offsets), array('I', entities), doc_times
+    )
+
+
+if __name__ == "__main__":
+    import random
+
+    logging.basicConfig(level=logging.INFO)
+
+    index = EntityIndex(max_fanout=10_000)
+    rng = random.Random(7)
+    total = 1_000_000
+    started = time.perf_counter()
+    for i in range(total):
+        index.add(f"TX{i}", [
+            f"ip:10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(64)}",
+            f"device:{rng.randrange(total // 4)}",
+            f"dest:C{rng.randrange(total // 2)}",
+        ])
+    print(f"Индексация: {total / (time.perf_counter() - started):.0f} транзакций/с")
+    print(index.get_statistics())
+
+    queries = [f"TX{rng.randrange(total)}" for _ in range(1000)]
+    started = time.perf_counter()
+    for transaction_id in queries:
+        index.linked(transaction_id, max_hops=3)
+    print(f"Связанные транзакции (3 шага): {(time.perf_counter() - started) / len(queries) * 1000:.3f} мс на запрос")
@@ -2,12 +2,23 @@
 Сборщик доказательств для защиты от chargeback
 Собирает и сохраняет все данные о транзакции для последующего оспаривания
 """
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 import json
 
 from app.models import TransactionRequest, RiskAssessment, EvidenceRecord
+from app.config import settings
+from services.entity_index import EntityIndex
+from services.evidence_store import (
+    EvidenceStore,
+    EVENT_COMMUNICATION,
+    EVENT_DELIVERY,
+    EVENT_SCREENSHOT
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,16 +35,41 @@ class EvidenceCollector:
     - Трек-номера доставки
     - Переписку с клиентом
     - Скриншоты и другие артефакты
+
+    Доказательства хранятся в EvidenceStore (SQLite + горячий LRU-кэш),
+    дополнения записываются как события без чтения всей записи.
+    Все обращения к хранилищу выполняются в отдельном потоке (одном:
+    соединение SQLite не используется параллельно), цикл событий
+    не ждет записи, удаления и подсчета.
+    Если задан индекс сущностей, транзакция индексируется при логировании
+    (в том же потоке) и удаляется из него вместе с доказательствами.
     """
 
-    def __init__(self):
-        self.evidence_storage: Dict[str, EvidenceRecord] = {}
+    def __init__(
+        self,
+        store: Optional[EvidenceStore] = None,
+        entity_index: Optional[EntityIndex] = None
+    ):
+        self.store = store or EvidenceStore(
+            settings.EVIDENCE_DB_PATH,
+            cache_size=settings.EVIDENCE_CACHE_SIZE,
+            retention_days=settings.EVIDENCE_RETENTION_DAYS,
+            batch_size=settings.EVIDENCE_BATCH_SIZE,
+            flush_interval=settings.EVIDENCE_FLUSH_INTERVAL
+        )
+        self.entity_index = entity_index
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="evidence")
+
+    async def _run(self, function, *args):
+        """Вызов хранилища в потоке хранилища"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
 
     async def log_transaction(
         self,
         transaction: TransactionRequest,
         fraud_probability: float,
-        risk_assessment: RiskAssessment
+        risk_assessment: RiskAssessment,
+        transaction_id: Optional[str] = None
     ):
         """
         Логирование транзакции с сохранением всех данных
@@ -42,8 +78,11 @@ class EvidenceCollector:
             transaction: Данные транзакции
             fraud_probability: Вероятность мошенничества
             risk_assessment: Оценка рисков
+            transaction_id: ID из ответа API (по нему ищут доказательства и связи)
         """
-        transaction_id = transaction.transaction_id or f"TXN_{datetime.now(timezone.utc).timestamp()}"
+        transaction_id = (
+            transaction_id or transaction.transaction_id or f"TXN_{datetime.now(timezone.utc).timestamp()}"
+        )
 
         # Сбор IP логов
         ip_logs = []
@@ -63,11 +102,16 @@ class EvidenceCollector:
             timestamp=datetime.now(timezone.utc)
         )
 
-        # Сохранение в хранилище
-        self.evidence_storage[transaction_id] = evidence
+        # Сохранение в хранилище и индексация
+        await self._run(self._save, evidence, transaction)
 
         logger.info(f"Доказательства собраны для транзакции {transaction_id}")
 
+    def _save(self, evidence: EvidenceRecord, transaction: TransactionRequest):
+        self.store.add_record(evidence)
+        if self.entity_index is not None:
+            self.entity_index.add_transaction(evidence.transaction_id, transaction)
+
     async def add_delivery_info(
         self,
         transaction_id: str,
@@ -82,11 +126,10 @@ class EvidenceCollector:
             tracking_number: Трек-номер доставки
             signature: Подпись получателя (если есть)
         """
-        if transaction_id in self.evidence_storage:
-            evidence = self.evidence_storage[transaction_id]
-            evidence.tracking_number = tracking_number
-            evidence.delivery_signature = signature
-
+        if await self._run(self.store.append_event, transaction_id, EVENT_DELIVERY, {
+            "tracking_number": tracking_number,
+            "signature": signature
+        }):
             logger.info(
                 f"Добавлена информация о доставке для {transaction_id}: "
                 f"track={tracking_number}"
@@ -110,17 +153,13 @@ class EvidenceCollector:
             content: Содержание сообщения
             timestamp: Время сообщения
         """
-        if transaction_id in self.evidence_storage:
-            evidence = self.evidence_storage[transaction_id]
-
-            communication_record = {
-                "type": message_type,
-                "content": content,
-                "timestamp": (timestamp or datetime.now(timezone.utc)).isoformat()
-            }
-
-            evidence.customer_communication.append(communication_record)
+        communication_record = {
+            "type": message_type,
+            "content": content,
+            "timestamp": (timestamp or datetime.now(timezone.utc)).isoformat()
+        }
 
+        if await self._run(self.store.append_event, transaction_id, EVENT_COMMUNICATION, communication_record):
             logger.info(
                 f"Добавлена запись переписки для {transaction_id}: "
                 f"type={message_type}"
@@ -136,10 +175,7 @@ class EvidenceCollector:
             transaction_id: ID транзакции
             screenshot_url: URL или путь к скриншоту
         """
-        if transaction_id in self.evidence_storage:
-            evidence = self.evidence_storage[transaction_id]
-            evidence.screenshots.append(screenshot_url)
-
+        if await self._run(self.store.append_event, transaction_id, EVENT_SCREENSHOT, screenshot_url):
             logger.info(f"Добавлен скриншот для {transaction_id}")
         else:
             logger.warning(f"Транзакция {transaction_id} не найдена в хранилище")
@@ -154,7 +190,30 @@ class EvidenceCollector:
         Returns:
             EvidenceRecord или None
         """
-        return self.evidence_storage.get(transaction_id)
+        return await self._run(self.store.get, transaction_id)
+
+    async def purge_expired(self) -> int:
+        """Удаление доказательств и транзакций индекса сущностей старше срока хранения"""
+        return await self._run(self._purge_expired)
+
+    def _purge_expired(self) -> int:
+        removed = self.store.purge_expired()
+        if self.entity_index is not None:
+            self.entity_index.purge_expired(time.time() - self.store.retention_days * 86400)
+        return removed
+
+    async def flush(self):
+        """Запись накопленных изменений в хранилище"""
+        await self._run(self.store.flush)
+
+    async def get_statistics(self) -> Dict:
+        """Количество записей и экономия от дедупликации содержимого"""
+        return {"records": await self._run(self.store.count), **await self._run(self.store.storage_stats)}
+
+    def close(self):
+        """Завершение обращений к хранилищу и его закрытие"""
+        self._executor.shutdown(wait=True)
+        self.store.close()
 
     async def export_for_chargeback(self, transaction_id: str) -> Dict:
         """
@@ -166,13 +225,57 @@ class EvidenceCollector:
         Returns:
             Словарь с форматированными доказательствами
         """
-        evidence = self.evidence_storage.get(transaction_id)
+        evidence = await self._run(self.store.get, transaction_id)
 
         if not evidence:
             return {"error": "Доказательства не найдены"}
 
-        # Форматирование для банка/платежной системы
-        chargeback_package = {
+        chargeback_package = self._format_chargeback_package(transaction_id, evidence)
+
+        logger.info(f"Экспортированы доказательства для chargeback: {transaction_id}")
+
+        return chargeback_package
+
+    async def iter_chargeback_packages(
+        self,
+        transaction_ids: Iterable[str],
+        batch_size: int = 500
+    ) -> AsyncIterator[Tuple[str, Optional[Dict]]]:
+        """
+        Пакетный экспорт доказательств
+
+        Записи читаются пакетами по batch_size ключей мимо горячего кэша,
+        пакеты отдаются по одному, без сборки всего экспорта в памяти.
+
+        Yields:
+            (transaction_id, пакет доказательств или None)
+        """
+        batch: List[str] = []
+        for transaction_id in transaction_ids:
+            batch.append(transaction_id)
+            if len(batch) >= batch_size:
+                for item in await self._run(self._export_batch, batch):
+                    yield item
+                batch = []
+        if batch:
+            for item in await self._run(self._export_batch, batch):
+                yield item
+
+    def _export_batch(self, transaction_ids: List[str]) -> List[Tuple[str, Optional[Dict]]]:
+        records = self.store.get_many(transaction_ids, use_cache=False)
+        return [
+            (
+                transaction_id,
+                self._format_chargeback_package(transaction_id, records[transaction_id])
+                if transaction_id in records else None
+            )
+            for transaction_id in transaction_ids
+        ]
+
+    @staticmethod
+    def _format_chargeback_package(transaction_id: str, evidence: EvidenceRecord) -> Dict:
+        """Форматирование доказательств для банка/платежной системы"""
+        return {
             "transaction_id": transaction_id,
             "evidence_collected_at": evidence.timestamp.isoformat(),
             "delivery_proof": {
@@ -188,7 +291,3 @@ class EvidenceCollector:
                 "screenshots": evidence.screenshots
             }
         }
-
-        logger.info(f"Экспортированы доказательства для chargeback: {transaction_id}")
-
-        return chargeback_package
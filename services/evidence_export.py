@@ -0,0 +1,188 @@
+"""
+Массовый потоковый экспорт доказательств для chargeback
+JSONL или ZIP (документ на транзакцию + манифест)
+"""
+import io
+import json
+import logging
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from services.evidence_collector import EvidenceCollector
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("jsonl", "zip")
+
+
+class ExportStats:
+    """Счетчики экспорта и пропускная способность"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.exported = 0
+        self.missing: List[str] = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def packages_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return self.exported / elapsed if elapsed > 0 else 0.0
+
+    def manifest(self, entries: List[Dict]) -> Dict:
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "exported": self.exported,
+            "missing": self.missing,
+            "elapsed_sec": round(self.elapsed, 3),
+            "packages_per_sec": round(self.packages_per_sec, 1),
+            "documents": entries,
+        }
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Файловый объект без seek: накапливает байты до следующей выдачи"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _dumps(document: Dict) -> bytes:
+    return json.dumps(document, ensure_ascii=False, default=str).encode('utf-8')
+
+
+async def stream_jsonl(
+    collector: EvidenceCollector,
+    transaction_ids: Iterable[str],
+    stats: Optional[ExportStats] = None
+) -> AsyncIterator[bytes]:
+    """
+    Экспорт в JSONL: строка на транзакцию, последняя строка - манифест
+    """
+    stats = stats or ExportStats()
+    entries = []
+
+    async for transaction_id, package in collector.iter_chargeback_packages(transaction_ids):
+        if package is None:
+            stats.missing.append(transaction_id)
+            continue
+        stats.exported += 1
+        entries.append({"transaction_id": transaction_id, "line": stats.exported})
+        yield _dumps(package) + b"\n"
+
+    yield _dumps({"manifest": stats.manifest(entries)}) + b"\n"
+    _log_stats(stats)
+
+
+async def stream_zip(
+    collector: EvidenceCollector,
+    transaction_ids: Iterable[str],
+    stats: Optional[ExportStats] = None
+) -> AsyncIterator[bytes]:
+    """
+    Экспорт в ZIP: <transaction_id>.json на транзакцию и manifest.json
+
+    Архив пишется в поток без seek (дескрипторы данных после файлов),
+    каждый документ отдается сразу после сжатия.
+    """
+    stats = stats or ExportStats()
+    entries = []
+    writer = _ChunkWriter()
+
+    with zipfile.ZipFile(writer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        async for transaction_id, package in collector.iter_chargeback_packages(transaction_ids):
+            if package is None:
+                stats.missing.append(transaction_id)
+                continue
+            stats.exported += 1
+            filename = f"{_safe_filename(transaction_id)}.json"
+            entries.append({"transaction_id": transaction_id, "file": filename})
+            archive.writestr(filename, _dumps(package))
+            yield writer.drain()
+
+        archive.writestr("manifest.json", _dumps(stats.manifest(entries)))
+
+    yield writer.drain()
+    _log_stats(stats)
+
+
+def _safe_filename(transaction_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in transaction_id)
+
+
+def _log_stats(stats: ExportStats):
+    logger.info(
+        f"Экспорт доказательств: {stats.exported} пакетов, "
+        f"{len(stats.missing)} не найдено, {stats.packages_per_sec:.0f} пакетов/с"
+    )
+
+
+def stream_export(
+    collector: EvidenceCollector,
+    transaction_ids: Iterable[str],
+    export_format: str,
+    stats: Optional[ExportStats] = None
+) -> AsyncIterator[bytes]:
+    """Поток экспорта в выбранном формате"""
+    if export_format == "zip":
+        return stream_zip(collector, transaction_ids, stats)
+    if export_format == "jsonl":
+        return stream_jsonl(collector, transaction_ids, stats)
+    raise ValueError(f"Неизвестный формат экспорта: {export_format}")
+
+
+def read_transaction_ids(path: str) -> Iterable[str]:
+    """ID транзакций из файла (по одному на строку)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            transaction_id = line.strip()
+            if transaction_id:
+                yield transaction_id
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Массовый экспорт доказательств для chargeback")
+    parser.add_argument("ids_file", help="Файл с ID транзакций (по одному на строку)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="zip")
+    parser.add_argument("--output", required=True, help="Путь к выходному файлу")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def _run():
+        collector = EvidenceCollector()
+        stats = ExportStats()
+        try:
+            with open(args.output, 'wb') as output:
+                async for chunk in stream_export(
+                    collector, read_transaction_ids(args.ids_file), args.format, stats
+                ):
+                    output.write(chunk)
+        finally:
+            collector.close()
+        print(
+            f"Экспортировано {stats.exported} пакетов ({len(stats.missing)} не найдено) "
+            f"за {stats.elapsed:.2f} с: {stats.packages_per_sec:.0f} пакетов/с"
+        )
+
+    asyncio.run(_run())
@@ -0,0 +1,425 @@
+"""
+Постоянное хранилище доказательств (SQLite)
+Горячий LRU-кэш, пакетная запись и удаление по сроку хранения
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.models import EvidenceRecord
+
+logger = logging.getLogger(__name__)
+
+# Типы событий, из которых собирается запись доказательств
+EVENT_IP_LOG = "ip_log"
+EVENT_COMMUNICATION = "communication"
+EVENT_SCREENSHOT = "screenshot"
+EVENT_DELIVERY = "delivery"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evidence (
+    transaction_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    device_fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_evidence_created_at ON evidence (created_at);
+
+CREATE TABLE IF NOT EXISTS evidence_blobs (
+    hash TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS evidence_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    blob TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_evidence_events_tx ON evidence_events (transaction_id, id);
+"""
+
+
+def payload_hash(payload: str) -> str:
+    """Адрес содержимого события (blake2b, 128 бит)"""
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _apply_event(record: EvidenceRecord, kind: str, payload):
+    """Применение события к записи доказательств"""
+    if kind == EVENT_IP_LOG:
+        record.ip_logs.append(payload)
+    elif kind == EVENT_COMMUNICATION:
+        record.customer_communication.append(payload)
+    elif kind == EVENT_SCREENSHOT:
+        record.screenshots.append(payload)
+    elif kind == EVENT_DELIVERY:
+        record.tracking_number = payload["tracking_number"]
+        record.delivery_signature = payload["signature"]
+
+
+class EvidenceStore:
+    """
+    Хранилище доказательств
+
+    - Запись транзакции - строка `evidence`, все дополнения
+      (IP-логи, переписка, скриншоты, доставка) - события в
+      `evidence_events`, которые только добавляются
+    - Содержимое событий хранится по адресу (хеш -> `evidence_blobs`)
+      со счетчиком ссылок: повторяющиеся URL скриншотов, шаблоны писем
+      и строки логов хранятся один раз
+    - Запись собирается из событий при чтении и кэшируется в LRU
+    - Изменения копятся в буфере и пишутся одной транзакцией SQLite
+      при достижении batch_size или по истечении flush_interval
+    - Записи старше retention_days удаляются (purge_expired)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_size: int = 10_000,
+        retention_days: float = 180.0,
+        batch_size: int = 200,
+        flush_interval: float = 1.0
+    ):
+        self.path = path
+        self.cache_size = cache_size
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_inline_payloads()
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+
+        self._cache: "OrderedDict[str, EvidenceRecord]" = OrderedDict()
+
+        # Буфер записи: новые записи и события
+        self._pending_records: Dict[str, Tuple[float, str, Optional[str]]] = {}
+        self._pending_events: List[Tuple[str, str, str]] = []
+        self._last_flush = time.monotonic()
+
+    def _migrate_inline_payloads(self):
+        """Перенос содержимого событий из evidence_events в evidence_blobs (старый формат)"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(evidence_events)")}
+        if "payload" not in columns:
+            return
+
+        self._conn.create_function("payload_hash", 1, payload_hash, deterministic=True)
+        with self._conn:
+            self._conn.execute("DROP INDEX IF EXISTS idx_evidence_events_tx")
+            self._conn.execute("ALTER TABLE evidence_events RENAME TO evidence_events_inline")
+        self._conn.executescript(_SCHEMA)
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO evidence_blobs (hash, payload, size, refcount) "
+                "SELECT payload_hash(payload), payload, LENGTH(CAST(payload AS BLOB)), COUNT(*) "
+                "FROM evidence_events_inline GROUP BY payload_hash(payload)"
+            )
+            self._conn.execute(
+                "INSERT INTO evidence_events (id, transaction_id, kind, blob) "
+                "SELECT id, transaction_id, kind, payload_hash(payload) FROM evidence_events_inline"
+            )
+            self._conn.execute("DROP TABLE evidence_events_inline")
+        logger.info("Содержимое событий доказательств перенесено в evidence_blobs")
+
+    # === ЗАПИСЬ ===
+
+    def add_record(self, record: EvidenceRecord):
+        """Сохранение записи доказательств (повторная запись заменяет прежнюю)"""
+        with self._lock:
+            if any(event[0] == record.transaction_id for event in self._pending_events):
+                self._pending_events = [
+                    event for event in self._pending_events if event[0] != record.transaction_id
+                ]
+            self._pending_records[record.transaction_id] = (
+                record.timestamp.timestamp(),
+                record.timestamp.isoformat(),
+                record.device_fingerprint
+            )
+            for ip_log in record.ip_logs:
+                self._queue_event(record.transaction_id, EVENT_IP_LOG, ip_log)
+            for communication in record.customer_communication:
+                self._queue_event(record.transaction_id, EVENT_COMMUNICATION, communication)
+            for screenshot in record.screenshots:
+                self._queue_event(record.transaction_id, EVENT_SCREENSHOT, screenshot)
+            if record.tracking_number is not None or record.delivery_signature is not None:
+                self._queue_event(record.transaction_id, EVENT_DELIVERY, {
+                    "tracking_number": record.tracking_number,
+                    "signature": record.delivery_signature
+                })
+
+            self._cache_put(record.transaction_id, record.model_copy(deep=True))
+            self._maybe_flush()
+
+    def append_event(self, transaction_id: str, kind: str, payload) -> bool:
+        """
+        Добавление события к существующей записи (без чтения записи)
+
+        Returns:
+            False, если запись не найдена
+        """
+        with self._lock:
+            if not self.exists(transaction_id):
+                return False
+
+            self._queue_event(transaction_id, kind, payload)
+
+            cached = self._cache.get(transaction_id)
+            if cached is not None:
+                _apply_event(cached, kind, payload)
+
+            self._maybe_flush()
+            return True
+
+    def _queue_event(self, transaction_id: str, kind: str, payload):
+        self._pending_events.append(
+            (transaction_id, kind, json.dumps(payload, ensure_ascii=False))
+        )
+
+    def _maybe_flush(self):
+        pending = len(self._pending_records) + len(self._pending_events)
+        if pending >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Запись буфера одной транзакцией
+
+        Returns:
+            Количество записанных строк
+        """
+        with self._lock:
+            if not self._pending_records and not self._pending_events:
+                self._last_flush = time.monotonic()
+                return 0
+
+            records = [
+                (transaction_id, created_at, timestamp, device_fingerprint)
+                for transaction_id, (created_at, timestamp, device_fingerprint)
+                in self._pending_records.items()
+            ]
+            events = self._pending_events
+
+            hashed_events = []
+            blobs: Dict[str, str] = {}
+            references: Counter = Counter()
+            for transaction_id, kind, payload in events:
+                blob = payload_hash(payload)
+                blobs[blob] = payload
+                references[blob] += 1
+                hashed_events.append((transaction_id, kind, blob))
+
+            with self._conn:
+                # События заменяемых записей удаляются до вставки новых
+                self._delete_events([record[0] for record in records])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO evidence "
+                    "(transaction_id, created_at, timestamp, device_fingerprint) VALUES (?, ?, ?, ?)",
+                    records
+                )
+                self._conn.executemany(
+                    "INSERT INTO evidence_blobs (hash, payload, size, refcount) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (hash) DO UPDATE SET refcount = refcount + excluded.refcount",
+                    [
+                        (blob, payload, len(payload.encode('utf-8')), references[blob])
+                        for blob, payload in blobs.items()
+                    ]
+                )
+                self._conn.executemany(
+                    "INSERT INTO evidence_events (transaction_id, kind, blob) VALUES (?, ?, ?)",
+                    hashed_events
+                )
+
+            written = len(records) + len(events)
+            self._pending_records = {}
+            self._pending_events = []
+            self._last_flush = time.monotonic()
+            return written
+
+    # === ЧТЕНИЕ ===
+
+    def exists(self, transaction_id: str) -> bool:
+        """Есть ли запись доказательств"""
+        with self._lock:
+            if transaction_id in self._cache or transaction_id in self._pending_records:
+                return True
+            row = self._conn.execute(
+                "SELECT 1 FROM evidence WHERE transaction_id = ?", (transaction_id,)
+            ).fetchone()
+            return row is not None
+
+    def get(self, transaction_id: str) -> Optional[EvidenceRecord]:
+        """Запись доказательств (из кэша или собранная из событий)"""
+        return self.get_many([transaction_id]).get(transaction_id)
+
+    def get_many(
+        self,
+        transaction_ids: Iterable[str],
+        chunk_size: int = 500,
+        use_cache: bool = True
+    ) -> Dict[str, EvidenceRecord]:
+        """
+        Пакетное чтение записей
+
+        Промахи кэша читаются запросами `IN (...)` по chunk_size ключей.
+        При use_cache=False прочитанные записи не вытесняют горячие
+        (массовый экспорт).
+        """
+        with self._lock:
+            found: Dict[str, EvidenceRecord] = {}
+            missing = []
+            for transaction_id in transaction_ids:
+                cached = self._cache.get(transaction_id)
+                if cached is not None:
+                    if use_cache:
+                        self._cache.move_to_end(transaction_id)
+                    found[transaction_id] = cached
+                else:
+                    missing.append(transaction_id)
+
+            if not missing:
+                return found
+
+            if self._pending_records or self._pending_events:
+                self.flush()
+
+            for start in range(0, len(missing), chunk_size):
+                chunk = missing[start:start + chunk_size]
+                for record in self._load(chunk):
+                    if use_cache:
+                        self._cache_put(record.transaction_id, record)
+                    found[record.transaction_id] = record
+
+            return found
+
+    def _load(self, transaction_ids: List[str]) -> List[EvidenceRecord]:
+        placeholders = ",".join("?" * len(transaction_ids))
+        records = {
+            transaction_id: EvidenceRecord(
+                transaction_id=transaction_id,
+                device_fingerprint=device_fingerprint,
+                timestamp=datetime.fromisoformat(timestamp)
+            )
+            for transaction_id, timestamp, device_fingerprint in self._conn.execute(
+                "SELECT transaction_id, timestamp, device_fingerprint FROM evidence "
+                f"WHERE transaction_id IN ({placeholders})",
+                transaction_ids
+            )
+        }
+        for transaction_id, kind, payload in self._conn.execute(
+            "SELECT e.transaction_id, e.kind, b.payload FROM evidence_events e "
+            "JOIN evidence_blobs b ON b.hash = e.blob "
+            f"WHERE e.transaction_id IN ({placeholders}) ORDER BY e.id",
+            transaction_ids
+        ):
+            _apply_event(records[transaction_id], kind, json.loads(payload))
+        return list(records.values())
+
+    def _delete_events(self, transaction_ids: List[str], chunk_size: int = 500):
+        """Удаление событий записей с уменьшением счетчиков ссылок (внутри транзакции)"""
+        released: Counter = Counter()
+        for start in range(0, len(transaction_ids), chunk_size):
+            chunk = transaction_ids[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            released.update(dict(self._conn.execute(
+                "SELECT blob, COUNT(*) FROM evidence_events "
+                f"WHERE transaction_id IN ({placeholders}) GROUP BY blob",
+                chunk
+            ).fetchall()))
+            self._conn.execute(f"DELETE FROM evidence_events WHERE transaction_id IN ({placeholders})", chunk)
+
+        if released:
+            self._conn.executemany(
+                "UPDATE evidence_blobs SET refcount = refcount - ? WHERE hash = ?",
+                [(count, blob) for blob, count in released.items()]
+            )
+            self._conn.executemany(
+                "DELETE FROM evidence_blobs WHERE hash = ? AND refcount <= 0",
+                [(blob,) for blob in released]
+            )
+
+    def _cache_put(self, transaction_id: str, record: EvidenceRecord):
+        self._cache[transaction_id] = record
+        self._cache.move_to_end(transaction_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # === ОБСЛУЖИВАНИЕ ===
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """
+        Удаление записей старше retention_days
+
+        Returns:
+            Количество удаленных записей
+        """
+        cutoff = (time.time() if now is None else now) - self.retention_days * 86400
+        with self._lock:
+            self.flush()
+            with self._conn:
+                expired = [
+                    row[0] for row in self._conn.execute(
+                        "SELECT transaction_id FROM evidence WHERE created_at < ?", (cutoff,)
+                    )
+                ]
+                for start in range(0, len(expired), 500):
+                    chunk = expired[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    self._delete_events(chunk)
+                    self._conn.execute(
+                        f"DELETE FROM evidence WHERE transaction_id IN ({placeholders})", chunk
+                    )
+            for transaction_id in expired:
+                self._cache.pop(transaction_id, None)
+
+        if expired:
+            logger.info(f"Удалено {len(expired)} записей доказательств старше {self.retention_days} дней")
+        return len(expired)
+
+    def storage_stats(self) -> Dict:
+        """
+        Экономия от дедупликации содержимого событий
+
+        logical_bytes - объем без дедупликации, stored_bytes - фактический
+        """
+        with self._lock:
+            self.flush()
+            blobs, references, stored, logical = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(refcount), 0), COALESCE(SUM(size), 0), "
+                "COALESCE(SUM(size * refcount), 0) FROM evidence_blobs"
+            ).fetchone()
+        return {
+            "blobs": blobs,
+            "references": references,
+            "logical_bytes": logical,
+            "stored_bytes": stored,
+            "saved_bytes": logical - stored,
+            "dedup_ratio": round(logical / stored, 2) if stored else 1.0,
+        }
+
+    def count(self) -> int:
+        """Количество записей в хранилище"""
+        with self._lock:
+            self.flush()
+            return self._conn.execute("SELECT COUNT(*) FROM evidence").fetchone()[0]
+
+    def close(self):
+        """Запись буфера и закрытие соединения"""
+        with self._lock:
+            self.flush()
+            self._conn.close()
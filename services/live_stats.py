@@ -0,0 +1,235 @@
+"""
+Оперативная статистика решений в скользящих окнах
+Кольцевые буферы посекундных и поминутных ячеек, общие для всех воркеров
+через файлы в отображаемой памяти
+"""
+import logging
+import os
+import time
+from array import array
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.metrics import LatencyHistogram
+from app.models import TransactionResponse
+from services.process_files import process_alive
+
+logger = logging.getLogger(__name__)
+
+# Окно -> секунды
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600, "24h": 86400}
+
+SECOND_SLOTS = 3600  # Посекундные ячейки - окна до часа
+MINUTE_SLOTS = 1440  # Поминутные ячейки - окна до суток
+
+# Счетчики в начале строки ячейки
+COUNTERS = ("decisions", "fraud", "blocked", "three_ds")
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LiveStatistics:
+    """
+    Скользящие окна 1m, 5m, 1h, 24h по решениям
+
+    - Ячейка - строка int64: метка (номер секунды или минуты), счетчики
+      COUNTERS, гистограмма вероятностей (score_bins ячеек равной ширины
+      на [0, 1]) и гистограмма задержки в стиле HDR (app/metrics.py)
+    - Обе гистограммы складываются по ячейкам и воркерам, поэтому
+      квантили окна считаются по сумме без хранения значений; погрешность
+      квантиля вероятности - половина ширины ячейки, задержки - точность
+      ячеек HDR
+    - Окна до часа - из SECOND_SLOTS посекундных ячеек, 24h - из
+      MINUTE_SLOTS поминутных; чтение окна - сумма ячеек с метками
+      внутри окна, O(число ячеек)
+    - Решения копятся в строке текущей секунды в памяти и переносятся
+      в кольца при смене секунды и в flush() (раз в секунду из фоновой
+      задачи), так что запись решения - несколько инкрементов массива
+    - directory - кольца воркера в файле <pid>-<мс запуска>.stats,
+      чтение суммирует файлы всех воркеров (в том числе завершенных:
+      их решения остаются в окнах); файлы завершенных воркеров без данных
+      за сутки удаляются. None - только этот процесс
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        score_bins: int = 100,
+        latency_precision_bits: int = 4,
+        latency_max_bits: int = 24,
+        clock: Callable[[], float] = time.time
+    ):
+        self.directory = directory
+        self.score_bins = score_bins
+        self._latency = LatencyHistogram(latency_precision_bits, latency_max_bits)
+        self._score_offset = len(COUNTERS)
+        self._latency_offset = self._score_offset + score_bins
+        self.width = self._latency_offset + len(self._latency.counts)
+        self._clock = clock
+
+        self._row = array('q', bytes(8 * self.width))
+        self._row_second: Optional[int] = None
+        self._pending = False
+
+        self._size = (SECOND_SLOTS + MINUTE_SLOTS) * (self.width + 1)
+        self._others: Dict[str, np.ndarray] = {}
+        self.path: Optional[str] = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._remove_expired()
+            self.path = os.path.join(directory, f"{os.getpid()}-{int(time.time() * 1000)}.stats")
+            self._storage = np.memmap(self.path, dtype=np.int64, mode="w+", shape=(self._size,))
+        else:
+            self._storage = np.zeros(self._size, dtype=np.int64)
+        self._seconds, self._minutes = self._rings(self._storage)
+        self._seconds[:, 0] = -1
+        self._minutes[:, 0] = -1
+
+    def _rings(self, storage: np.ndarray):
+        """Посекундное и поминутное кольца; столбец 0 - метка ячейки (-1 - пустая)"""
+        split = SECOND_SLOTS * (self.width + 1)
+        return (
+            storage[:split].reshape(SECOND_SLOTS, self.width + 1),
+            storage[split:].reshape(MINUTE_SLOTS, self.width + 1)
+        )
+
+    def record(self, response: TransactionResponse, latency_ms: float):
+        """Учет решения и задержки его получения"""
+        second = int(self._clock())
+        if second != self._row_second:
+            self.flush()
+            self._row_second = second
+
+        row = self._row
+        row[0] += 1
+        if response.is_fraud:
+            row[1] += 1
+        if response.should_block:
+            row[2] += 1
+        if response.requires_3d_secure:
+            row[3] += 1
+        score = min(int(response.fraud_probability * self.score_bins), self.score_bins - 1)
+        row[self._score_offset + max(score, 0)] += 1
+        row[self._latency_offset + self._latency.bucket_index(max(int(latency_ms * 1000), 0))] += 1
+        self._pending = True
+
+    def flush(self):
+        """Перенос строки текущей секунды в кольца"""
+        if not self._pending:
+            return
+        row = np.frombuffer(self._row, dtype=np.int64)
+        self._add(self._seconds, self._row_second, row)
+        self._add(self._minutes, self._row_second // 60, row)
+        self._row = array('q', bytes(8 * self.width))
+        self._pending = False
+
+    @staticmethod
+    def _add(ring: np.ndarray, stamp: int, row: np.ndarray):
+        cell = ring[stamp % len(ring)]
+        if cell[0] == stamp:
+            cell[1:] += row
+        else:
+            # Метка - после данных: читатели не складывают наполовину записанную ячейку
+            cell[0] = -1
+            cell[1:] = row
+            cell[0] = stamp
+
+    def _remove_expired(self):
+        """Удаление файлов воркеров, в которых нет данных за последние сутки"""
+        oldest = int(self._clock()) // 60 - MINUTE_SLOTS
+        for name in os.listdir(self.directory):
+            if not name.endswith(".stats"):
+                continue
+            path = os.path.join(self.directory, name)
+            if process_alive(name.split("-", 1)[0]):
+                continue
+            try:
+                storage = np.fromfile(path, dtype=np.int64)
+                if len(storage) == self._size and self._rings(storage)[1][:, 0].max() > oldest:
+                    continue
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Файл статистики {path} не удален: {str(e)}")
+
+    def _sources(self) -> List[np.ndarray]:
+        """Хранилища этого и остальных воркеров"""
+        sources = [self._storage]
+        if not self.directory:
+            return sources
+        names = {name for name in os.listdir(self.directory) if name.endswith(".stats")}
+        for name in list(self._others):
+            if name not in names:
+                del self._others[name]
+        for name in sorted(names):
+            path = os.path.join(self.directory, name)
+            if path == self.path:
+                continue
+            storage = self._others.get(name)
+            if storage is None:
+                try:
+                    if os.path.getsize(path) != self._size * 8:
+                        continue
+                    storage = self._others[name] = np.memmap(path, dtype=np.int64, mode="r", shape=(self._size,))
+                except (OSError, ValueError):
+                    continue
+            sources.append(storage)
+        return sources
+
+    def window_totals(self, seconds: int) -> np.ndarray:
+        """Сумма ячеек окна по всем воркерам (без столбца меток)"""
+        self.flush()
+        now = int(self._clock())
+        if seconds <= SECOND_SLOTS:
+            index, stamp, span = 0, now, seconds
+        else:
+            index, stamp, span = 1, now // 60, min(seconds // 60, MINUTE_SLOTS)
+
+        total = np.zeros(self.width, dtype=np.int64)
+        for storage in self._sources():
+            ring = self._rings(storage)[index]
+            stamps = ring[:, 0]
+            cells = ring[(stamps > stamp - span) & (stamps <= stamp)]
+            if len(cells):
+                total += cells[:, 1:].sum(axis=0)
+        return total
+
+    def _quantiles(self, counts: np.ndarray, value: Callable[[int], float]) -> Dict[str, Optional[float]]:
+        total = int(counts.sum())
+        if not total:
+            return {f"p{round(q * 100)}": None for q in QUANTILES}
+        cumulative = np.cumsum(counts)
+        return {
+            f"p{round(q * 100)}": value(int(np.searchsorted(cumulative, max(1, round(q * total)))))
+            for q in QUANTILES
+        }
+
+    def get_statistics(self) -> Dict:
+        """TPS, доли мошенничества, блокировок и 3D-Secure, квантили вероятности и задержки по окнам"""
+        result = {}
+        for name, seconds in WINDOWS.items():
+            totals = self.window_totals(seconds)
+            decisions, fraud, blocked, three_ds = (int(value) for value in totals[:len(COUNTERS)])
+            scores = totals[self._score_offset:self._latency_offset]
+            latency = totals[self._latency_offset:]
+            result[name] = {
+                "decisions": decisions,
+                "tps": round(decisions / seconds, 3),
+                "fraud_rate": round(fraud / decisions, 4) if decisions else 0.0,
+                "block_rate": round(blocked / decisions, 4) if decisions else 0.0,
+                "three_ds_rate": round(three_ds / decisions, 4) if decisions else 0.0,
+                "fraud_probability": self._quantiles(
+                    scores, lambda index: round((index + 0.5) / self.score_bins, 4)
+                ),
+                "latency_ms": self._quantiles(
+                    latency, lambda index: round(self._latency.bucket_upper(index) / 1000, 3)
+                ),
+            }
+        result["worker_files"] = len(self._sources())
+        return result
+
+    def close(self):
+        self.flush()
+        if isinstance(self._storage, np.memmap):
+            self._storage.flush()
+
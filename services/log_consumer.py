@@ -0,0 +1,370 @@
+"""
+Потребитель локального журнала транзакций (замена Kafka без брокера)
+Чтение NDJSON-сегментов, пакетная оценка, журнал решений и контрольные точки
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.fastpath import transaction_decoder
+from app.models import TransactionRequest, TransactionResponse
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIXES = (".ndjson", ".jsonl")
+
+ScoreBatch = Callable[[List[TransactionRequest]], Awaitable[List[TransactionResponse]]]
+OnCommit = Callable[[List[TransactionResponse]], Awaitable[None]]
+
+
+def list_segments(path: str) -> List[str]:
+    """Сегменты раздела по возрастанию имени (имя задает порядок записи)"""
+    return sorted(name for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIXES))
+
+
+def _write_json_atomic(path: str, document: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PartitionConsumer:
+    """
+    Чтение одного раздела журнала
+
+    Раздел - каталог с сегментами <имя>.ndjson, в которые производитель
+    только дописывает строки. Позиция - (сегмент, смещение в байтах).
+    Неполная последняя строка сегмента ждет дозаписи; к следующему
+    сегменту потребитель переходит, когда текущий прочитан до конца.
+
+    Ровно один раз: решения пакета дописываются в журнал решений
+    (fsync), затем атомарно записывается контрольная точка с позицией
+    во входном журнале и размером журнала решений. При запуске журнал
+    решений обрезается до размера из контрольной точки - решения,
+    записанные после нее, будут получены повторно при повторной
+    обработке тех же записей.
+    """
+
+    def __init__(self, name: str, path: str, output_dir: str):
+        self.name = name
+        self.path = path
+        safe_name = name.replace(os.sep, "_") or "default"
+        self.output_path = os.path.join(output_dir, f"{safe_name}.decisions.ndjson")
+        self.checkpoint_path = os.path.join(output_dir, f"{safe_name}.checkpoint.json")
+
+        self.segment: Optional[str] = None
+        self.offset = 0
+        self.output_size = 0
+        self.records = 0
+        self.errors = 0
+        self.last_commit_at: Optional[float] = None
+
+    def restore(self):
+        """Загрузка контрольной точки и отбрасывание незафиксированных решений"""
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            self.segment = checkpoint["segment"]
+            self.offset = checkpoint["offset"]
+            self.output_size = checkpoint["output_size"]
+            self.records = checkpoint["records"]
+            self.errors = checkpoint["errors"]
+
+        if os.path.exists(self.output_path):
+            size = os.path.getsize(self.output_path)
+            if size < self.output_size:
+                raise RuntimeError(
+                    f"Журнал решений {self.output_path} короче контрольной точки ({size} < {self.output_size})"
+                )
+            if size > self.output_size:
+                with open(self.output_path, 'r+b') as f:
+                    f.truncate(self.output_size)
+                logger.info(f"Раздел {self.name}: отброшено {size - self.output_size} байт незафиксированных решений")
+        elif self.output_size:
+            raise RuntimeError(f"Журнал решений {self.output_path} не найден")
+
+    def read_batch(self, limit: int) -> Tuple[List[Tuple[str, int, bytes]], Optional[str], int]:
+        """
+        Следующие записи раздела
+
+        Returns:
+            Записи (сегмент, смещение, строка) и позиция после них
+        """
+        segments = list_segments(self.path)
+        if not segments:
+            return [], self.segment, self.offset
+
+        segment, offset = self.segment, self.offset
+        if segment is None or segment not in segments:
+            # Первый запуск или сегмент удален после обработки
+            newer = [name for name in segments if segment is None or name > segment]
+            if not newer:
+                return [], self.segment, self.offset
+            segment, offset = newer[0], 0
+
+        records = []
+        while len(records) < limit:
+            has_newer = segments[-1] != segment
+            with open(os.path.join(self.path, segment), 'rb') as f:
+                f.seek(offset)
+                while len(records) < limit:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if not line.endswith(b"\n") and not has_newer:
+                        break  # строка еще дописывается
+                    if line.strip():
+                        records.append((segment, offset, line))
+                    offset += len(line)
+                at_end = not f.read(1)
+
+            if len(records) >= limit or not (at_end and has_newer):
+                break
+            segment, offset = segments[segments.index(segment) + 1], 0
+
+        return records, segment, offset
+
+    def commit(self, lines: List[bytes], segment: Optional[str], offset: int, errors: int):
+        """Запись решений пакета и контрольной точки"""
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        with open(self.output_path, 'ab') as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            self.output_size = f.tell()
+
+        self.segment, self.offset = segment, offset
+        self.records += len(lines)
+        self.errors += errors
+        self.last_commit_at = time.time()
+        _write_json_atomic(self.checkpoint_path, {
+            "segment": self.segment,
+            "offset": self.offset,
+            "output_size": self.output_size,
+            "records": self.records,
+            "errors": self.errors,
+        })
+
+    def lag_bytes(self) -> int:
+        """Непрочитанный объем раздела"""
+        lag = 0
+        for name in list_segments(self.path):
+            if self.segment is None or name > self.segment:
+                lag += os.path.getsize(os.path.join(self.path, name))
+            elif name == self.segment:
+                lag += max(0, os.path.getsize(os.path.join(self.path, name)) - self.offset)
+        return lag
+
+    def get_statistics(self) -> Dict:
+        return {
+            "segment": self.segment,
+            "offset": self.offset,
+            "records": self.records,
+            "errors": self.errors,
+            "lag_bytes": self.lag_bytes(),
+        }
+
+
+class LogConsumer:
+    """
+    Потребитель каталога журнала
+
+    - Разделы: подкаталоги log_dir с сегментами; если сегменты лежат
+      прямо в log_dir, это один раздел
+    - Каждый раздел читается пакетами до batch_size записей; одновременно
+      обрабатывается до parallelism разделов (в одном цикле событий -
+      для загрузки нескольких ядер запускаются процессы с разными partitions)
+    - Запись, не прошедшая валидацию или оценку, попадает в журнал
+      решений с полем error и не обрабатывается повторно
+    - Отставание (байты непрочитанных сегментов) пишется в stats.json
+      каталога решений и в лог
+
+    Гарантии при сбое между оценкой пакета и контрольной точкой:
+    - Журнал решений - ровно один раз (см. PartitionConsumer)
+    - Состояние оценки (скорости, граф переводов, остатки, похожие
+      устройства) обновляется внутри score_batch и не откатывается:
+      незафиксированный пакет оценивается повторно, и его транзакции
+      учитываются в этих признаках дважды - не менее одного раза
+    - Побочные эффекты решений (лог, доказательства, WebSocket, файл)
+      выполняет on_commit после контрольной точки - не более одного раза:
+      при сбое между ними эффекты пакета теряются, но не дублируются
+    """
+
+    def __init__(
+        self,
+        log_dir: str,
+        output_dir: str,
+        score_batch: ScoreBatch,
+        batch_size: int = 500,
+        parallelism: int = 4,
+        poll_interval: float = 0.5,
+        partitions: Optional[List[str]] = None,
+        on_commit: Optional[OnCommit] = None
+    ):
+        self.log_dir = log_dir
+        self.output_dir = output_dir
+        self.score_batch = score_batch
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.partition_filter = set(partitions) if partitions else None
+        self._slots = asyncio.Semaphore(parallelism)
+        self._stopping = asyncio.Event()
+        self.partitions: Dict[str, PartitionConsumer] = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def discover(self):
+        """Поиск новых разделов"""
+        if not os.path.isdir(self.log_dir):
+            return
+        names = [name for name in sorted(os.listdir(self.log_dir))
+                 if os.path.isdir(os.path.join(self.log_dir, name))]
+        if not names and list_segments(self.log_dir):
+            names = [""]
+        for name in names:
+            if name in self.partitions:
+                continue
+            if self.partition_filter is not None and name not in self.partition_filter:
+                continue
+            partition = PartitionConsumer(name, os.path.join(self.log_dir, name), self.output_dir)
+            partition.restore()
+            self.partitions[name] = partition
+            logger.info(f"Раздел {name or '.'}: позиция {partition.segment}:{partition.offset}")
+
+    def stop(self):
+        """Остановка после фиксации текущих пакетов"""
+        self._stopping.set()
+
+    async def run(self):
+        """Цикл чтения до stop()"""
+        last_report = 0.0
+        while not self._stopping.is_set():
+            self.discover()
+            processed = await asyncio.gather(*(
+                self._process_partition(partition) for partition in self.partitions.values()
+            ))
+
+            if time.monotonic() - last_report >= 10:
+                last_report = time.monotonic()
+                self._report()
+            if not any(processed):
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        self._report()
+
+    async def run_once(self) -> int:
+        """Обработка всего, что уже записано (без ожидания новых записей)"""
+        total = 0
+        self.discover()
+        while True:
+            processed = sum(await asyncio.gather(*(
+                self._process_partition(partition) for partition in self.partitions.values()
+            )))
+            if not processed:
+                break
+            total += processed
+        self._report()
+        return total
+
+    async def _process_partition(self, partition: PartitionConsumer) -> int:
+        async with self._slots:
+            records, segment, offset = partition.read_batch(self.batch_size)
+            if not records:
+                if (segment, offset) != (partition.segment, partition.offset):
+                    partition.commit([], segment, offset, 0)
+                return 0
+
+            transactions, positions, lines = [], [], [None] * len(records)
+            errors = 0
+            for i, (record_segment, record_offset, line) in enumerate(records):
+                source = {"partition": partition.name, "segment": record_segment, "offset": record_offset}
+                try:
+                    transaction = transaction_decoder.decode(line)
+                    if transaction is None:
+                        transaction = TransactionRequest.model_validate_json(line)
+                except ValidationError as e:
+                    lines[i] = self._decision_line(source, error=str(e.errors(include_url=False)[0]))
+                    errors += 1
+                    continue
+                except Exception as e:
+                    lines[i] = self._decision_line(source, error=f"decode failed: {str(e)}")
+                    errors += 1
+                    continue
+                transactions.append(transaction)
+                positions.append((i, source))
+
+            decided = []
+            if transactions:
+                for (i, source), result in zip(positions, await self._score(transactions)):
+                    if isinstance(result, Exception):
+                        lines[i] = self._decision_line(source, error=f"scoring failed: {str(result)}")
+                        errors += 1
+                    else:
+                        lines[i] = self._decision_line(source, decision=result.model_dump(mode="json"))
+                        decided.append(result)
+
+            partition.commit(lines, segment, offset, errors)
+            if self.on_commit is not None and decided:
+                try:
+                    await self.on_commit(decided)
+                except Exception as e:
+                    logger.error(f"Раздел {partition.name}: ошибка побочных эффектов решений: {str(e)}")
+            return len(records)
+
+    async def _score(self, transactions: List[TransactionRequest]) -> List:
+        """
+        Оценка пакета: ответ или исключение на каждую транзакцию
+
+        Если пакет целиком завершился ошибкой, транзакции оцениваются
+        по одной: запись, на которой оценка падает, получает строку
+        с error, остальные - решения, и позиция раздела продвигается
+        """
+        try:
+            return list(await self.score_batch(transactions))
+        except Exception as e:
+            logger.error(f"Ошибка оценки пакета из {len(transactions)} записей: {str(e)}")
+        results = []
+        for transaction in transactions:
+            try:
+                results.extend(await self.score_batch([transaction]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @staticmethod
+    def _decision_line(source: Dict, decision: Optional[Dict] = None, error: Optional[str] = None) -> bytes:
+        document = {**source, "decided_at": datetime.now(timezone.utc).isoformat()}
+        if decision is not None:
+            document["decision"] = decision
+        else:
+            document["error"] = error
+        return (json.dumps(document, ensure_ascii=False) + "\n").encode('utf-8')
+
+    def get_statistics(self) -> Dict:
+        """Позиции, счетчики и отставание по разделам"""
+        partitions = {name or ".": partition.get_statistics() for name, partition in self.partitions.items()}
+        return {
+            "lag_bytes": sum(stats["lag_bytes"] for stats in partitions.values()),
+            "records": sum(stats["records"] for stats in partitions.values()),
+            "errors": sum(stats["errors"] for stats in partitions.values()),
+            "partitions": partitions,
+        }
+
+    def _report(self):
+        stats = self.get_statistics()
+        _write_json_atomic(os.path.join(self.output_dir, "stats.json"), stats)
+        logger.info(
+            f"Потребитель: {stats['records']} записей, {stats['errors']} ошибок, "
+            f"отставание {stats['lag_bytes']} байт"
+        )
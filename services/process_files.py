@@ -0,0 +1,78 @@
+"""
+Файлы состояния по процессам
+Каждый воркер пишет свой файл <база>.<pid><расширение>, файлы
+завершенных процессов забирает один из воркеров
+"""
+import logging
+import os
+import uuid
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def process_alive(pid: str) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_path(path: str, pid: Optional[int] = None) -> str:
+    """Файл процесса pid (по умолчанию - этого) для общего пути path"""
+    base, extension = os.path.splitext(path)
+    return f"{base}.{os.getpid() if pid is None else pid}{extension}"
+
+
+def claim_process_files(path: str) -> List[str]:
+    """
+    Файлы завершенных процессов для общего пути path
+
+    - <база>.<pid>*<расширение> завершенного процесса и path (файл
+      прежнего формата, общий для всех) переименовываются в
+      <база>.<pid этого процесса>.<случайный суффикс><расширение>;
+      переименование атомарно, поэтому каждый файл забирает один воркер
+    - Забранные раньше файлы этого pid (процесс с тем же pid не успел
+      их обработать) возвращаются как есть
+    - Свой файл process_path(path) в результат не входит
+
+    Returns:
+        Пути забранных файлов по имени исходного файла
+    """
+    directory = os.path.dirname(path) or "."
+    if not os.path.isdir(directory):
+        return []
+    base, extension = os.path.splitext(os.path.basename(path))
+    pid = str(os.getpid())
+    own = process_path(path)
+
+    claimed = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(extension):
+            continue
+        if name == base + extension:
+            owner = None
+        elif name.startswith(base + "."):
+            owner = name[len(base) + 1:len(name) - len(extension)].split(".", 1)[0]
+        else:
+            continue
+        file_path = os.path.join(directory, name)
+        if file_path == own:
+            continue
+        if owner != pid:
+            if owner is not None and process_alive(owner):
+                continue
+            target = f"{os.path.splitext(own)[0]}.{uuid.uuid4().hex[:8]}{extension}"
+            try:
+                os.rename(file_path, target)
+            except FileNotFoundError:
+                continue  # забрал другой воркер
+            file_path = target
+        claimed.append(file_path)
+
+    if claimed:
+        logger.info(f"Забраны файлы завершенных процессов для {path}: {len(claimed)}")
+    return claimed
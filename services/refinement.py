@@ -0,0 +1,115 @@
+"""
+Уточнение предварительных решений (двухфазный режим /api/v1/analyze)
+Полная оценка рисков в фоне, публикация окончательного решения и доля изменений
+"""
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+from app.models import RiskAssessment, TransactionRequest, TransactionResponse
+from services.side_effects import DecisionEvent
+
+logger = logging.getLogger(__name__)
+
+RISK_LEVEL_ORDER = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "CRITICAL": 3}
+
+# (транзакция, вероятность, полная оценка, предварительный ответ) -> окончательный ответ
+Finalize = Callable[[TransactionRequest, float, RiskAssessment, TransactionResponse], TransactionResponse]
+Publish = Callable[[DecisionEvent], Awaitable[None]]
+
+
+class DecisionRefiner:
+    """
+    Вторая фаза решения
+
+    Предварительное решение строится по модели и проверкам без
+    накопления состояния. Уточнение повторяет оценку рисков со всеми
+    проверками (граф переводов, непрерывность балансов, похожие
+    устройства), строит окончательный ответ с тем же transaction_id
+    и передает его в publish (webhook, WebSocket, доказательства).
+
+    Вероятность модели не пересчитывается - окончательное решение
+    может отличаться только уровнем риска, блокировкой и 3D-Secure.
+    """
+
+    def __init__(self, risk_analyzer, finalize: Finalize, publish: Publish, deadline_ms: float = 50.0):
+        self.risk_analyzer = risk_analyzer
+        self.finalize = finalize
+        self.publish = publish
+        self.deadline_ms = deadline_ms
+
+        self.provisional = 0
+        self.deadline_exceeded = 0
+        self.provisional_total_ms = 0.0
+        self.refined = 0
+        self.changed = 0
+        self.changed_risk_level = 0
+        self.changed_block = 0
+        self.changed_3ds = 0
+        self.escalated = 0
+        self.deescalated = 0
+        self.refinement_lag_ms = 0.0
+
+    def record_provisional(self, elapsed_ms: float):
+        """Учет времени предварительного решения относительно срока"""
+        self.provisional += 1
+        self.provisional_total_ms += elapsed_ms
+        if elapsed_ms > self.deadline_ms:
+            self.deadline_exceeded += 1
+
+    async def refine_batch(self, events: List[DecisionEvent]):
+        """Обработчик приемника: уточнение пакета предварительных решений"""
+        for event in events:
+            try:
+                assessment = await self.risk_analyzer.assess_risk(
+                    event.transaction, event.fraud_probability, stateful_checks=True
+                )
+                final = self.finalize(event.transaction, event.fraud_probability, assessment, event.response)
+            except Exception as e:
+                logger.error(f"Ошибка уточнения решения {event.response.transaction_id}: {str(e)}")
+                continue
+
+            self._compare(event.response, final)
+            await self.publish(DecisionEvent(event.transaction, event.fraud_probability, assessment, final))
+
+    def _compare(self, provisional: TransactionResponse, final: TransactionResponse):
+        self.refined += 1
+        lag = final.timestamp - provisional.timestamp
+        self.refinement_lag_ms = lag.total_seconds() * 1000
+
+        level_delta = RISK_LEVEL_ORDER[final.risk_level.value] - RISK_LEVEL_ORDER[provisional.risk_level.value]
+        block_changed = final.should_block != provisional.should_block
+        secure_changed = final.requires_3d_secure != provisional.requires_3d_secure
+        if not (level_delta or block_changed or secure_changed):
+            return
+
+        self.changed += 1
+        self.changed_risk_level += level_delta != 0
+        self.changed_block += block_changed
+        self.changed_3ds += secure_changed
+        if (level_delta, final.should_block, final.requires_3d_secure) > (0, provisional.should_block, provisional.requires_3d_secure):
+            self.escalated += 1
+        else:
+            self.deescalated += 1
+        logger.info(
+            f"Решение {final.transaction_id} уточнено: {provisional.risk_level.value} -> {final.risk_level.value}, "
+            f"блокировка {provisional.should_block} -> {final.should_block}"
+        )
+
+    def get_statistics(self) -> Dict:
+        """Сроки предварительных решений и доля изменившихся после уточнения"""
+        return {
+            "deadline_ms": self.deadline_ms,
+            "provisional": self.provisional,
+            "provisional_avg_ms": round(self.provisional_total_ms / self.provisional, 3) if self.provisional else 0.0,
+            "deadline_exceeded": self.deadline_exceeded,
+            "refined": self.refined,
+            "pending": max(0, self.provisional - self.refined),
+            "changed": self.changed,
+            "change_rate": round(self.changed / self.refined, 4) if self.refined else 0.0,
+            "changed_risk_level": self.changed_risk_level,
+            "changed_block": self.changed_block,
+            "changed_3ds": self.changed_3ds,
+            "escalated": self.escalated,
+            "deescalated": self.deescalated,
+            "last_refinement_lag_ms": round(self.refinement_lag_ms, 3),
+        }
@@ -3,8 +3,13 @@
 Реализует многоуровневую оценку рисков и рекомендации
 """
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from app.models import TransactionRequest, RiskAssessment, RiskLevel
+from services.transfer_graph import TransferGraph, transaction_timestamp
+from services.balance_tracker import BalanceTracker
+from services.enrichment import EnrichmentService
+from services.blocklist import BlocklistManager
+from services.device_similarity import DeviceSimilarityIndex
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +24,17 @@ class RiskAnalyzer:
     - Сумму транзакции
     - Паттерны балансов
     - Дополнительные факторы (IP, устройство и т.д.)
+    - Связи между счетами (граф переводов)
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        transfer_graph: Optional[TransferGraph] = None,
+        balance_tracker: Optional[BalanceTracker] = None,
+        enrichment: Optional[EnrichmentService] = None,
+        blocklists: Optional[BlocklistManager] = None,
+        device_index: Optional[DeviceSimilarityIndex] = None
+    ):
         # Пороги для определения уровней риска
         self.risk_thresholds = {
             'CRITICAL': 0.85,
@@ -36,10 +49,26 @@ class RiskAnalyzer:
         # Пороги для блокировки
         self.block_threshold = 0.80
 
+        # Граф переводов nameOrig → nameDest (опционально)
+        self.transfer_graph = transfer_graph
+
+        # Последние известные балансы счетов (опционально)
+        self.balance_tracker = balance_tracker
+
+        # Локальные индексы IP и BIN (опционально)
+        self.enrichment = enrichment
+
+        # Списки блокировки (опционально)
+        self.blocklists = blocklists
+
+        # Индекс похожих устройств (опционально)
+        self.device_index = device_index
+
     async def assess_risk(
         self,
         transaction: TransactionRequest,
-        fraud_probability: float
+        fraud_probability: float,
+        stateful_checks: bool = True
     ) -> RiskAssessment:
         """
         Комплексная оценка рисков транзакции
@@ -47,6 +76,10 @@ class RiskAnalyzer:
         Args:
             transaction: Данные транзакции
             fraud_probability: Вероятность мошенничества от ML модели
+            stateful_checks: Проверки с накоплением состояния (похожие
+                устройства, непрерывность балансов, граф переводов).
+                Без них оценка дешевле и ничего не запоминает - для
+                предварительного решения, которое потом уточняется
 
         Returns:
             RiskAssessment: Детальная оценка рисков
@@ -77,6 +110,22 @@ class RiskAnalyzer:
             additional_risk += 35
             risk_factors.append("Обнаружен эмулятор устройства")
         
+        # Совпадения со списками блокировки
+        if self.blocklists is not None:
+            blocklist_risk, blocklist_factors = self._analyze_blocklists(transaction)
+            additional_risk += blocklist_risk
+            risk_factors.extend(blocklist_factors)
+        
+        # Почти одинаковое устройство у разных клиентов (ферма устройств)
+        if self.device_index is not None and stateful_checks:
+            customer_id = getattr(transaction, 'customer_id', None) or transaction.nameOrig
+            similar_customers = self.device_index.observe(transaction, customer_id)
+            if similar_customers >= 2:
+                additional_risk += min(similar_customers * 5, 30)  # Max +30
+                risk_factors.append(
+                    f"Похожее устройство использовали {similar_customers} других клиентов за 24ч"
+                )
+        
         # ВАЖНЫЕ ФАКТОРЫ
         
         # Адреса не совпадают
@@ -92,12 +141,16 @@ class RiskAnalyzer:
             risk_factors.append(f"{chargebacks} предыдущих чарджбеков")
         
         # Иностранная карта (несоответствие стран)
-        issuer_country = getattr(transaction, 'issuer_country', '')
-        ip_country = getattr(transaction, 'ip_country', '')
+        issuer_country, ip_country, is_hosting = self._resolve_geo(transaction)
         if issuer_country and ip_country and issuer_country != ip_country:
             additional_risk += 15
             risk_factors.append(f"Карта из {issuer_country}, IP из {ip_country}")
         
+        # IP из сети хостинг-провайдера (сервер, а не клиентское устройство)
+        if is_hosting:
+            additional_risk += 15
+            risk_factors.append("IP-адрес принадлежит хостинг-провайдеру")
+        
         # 3DS не пройдена
         if not getattr(transaction, 'is_3ds_passed', False):
             additional_risk += 25
@@ -179,6 +232,11 @@ class RiskAnalyzer:
         if balance_risk > 10:
             risk_factors.append("Подозрительное изменение балансов")
 
+        if self.balance_tracker is not None and stateful_checks:
+            continuity_risk, continuity_factors = self._analyze_balance_continuity(transaction)
+            risk_score += continuity_risk
+            risk_factors.extend(continuity_factors)
+
         # 5. Анализ дополнительных факторов
         old_additional = self._analyze_additional_factors(transaction)
         risk_score += old_additional
@@ -186,6 +244,12 @@ class RiskAnalyzer:
         # 6. Добавить факторы риска из признаков
         risk_score += additional_risk
 
+        # 7. Связи между счетами
+        if self.transfer_graph is not None and stateful_checks:
+            graph_risk, graph_factors = self._analyze_transfer_graph(transaction)
+            risk_score += graph_risk
+            risk_factors.extend(graph_factors)
+
         # Ограничение риска в диапазоне 0-100
         risk_score = max(0, min(100, risk_score))
 
@@ -210,6 +274,76 @@ class RiskAnalyzer:
             risk_factors=risk_factors
         )
 
+    def _analyze_blocklists(self, transaction: TransactionRequest) -> Tuple[float, List[str]]:
+        """
+        Проверка полей транзакции по спискам блокировки
+
+        Returns:
+            Дополнительные баллы риска и факторы риска
+        """
+        risk = 0.0
+        factors = []
+        blocklists = self.blocklists
+
+        if blocklists.check("card", self._card_key(transaction)):
+            risk += 50
+            factors.append("Карта в списке скомпрометированных")
+
+        for account in (transaction.nameDest, transaction.nameOrig):
+            if blocklists.check("account", account):
+                risk += 45
+                factors.append(f"Счет {account} в списке блокировки")
+
+        if blocklists.check("device", transaction.device_id):
+            risk += 40
+            factors.append("Устройство в списке блокировки")
+
+        if blocklists.check("ip", transaction.ip_address):
+            risk += 35
+            factors.append(f"IP-адрес {transaction.ip_address} в списке блокировки")
+
+        email_domain = getattr(transaction, 'email_domain', None)
+        email = getattr(transaction, 'email', None)
+        if not email_domain and email and '@' in email:
+            email_domain = email.rsplit('@', 1)[1]
+        if blocklists.check("email_domain", email_domain):
+            risk += 20
+            factors.append(f"Одноразовый email-домен: {email_domain}")
+
+        return risk, factors
+
+    @staticmethod
+    def _card_key(transaction: TransactionRequest) -> Optional[str]:
+        """Ключ карты для списков: BIN и последние 4 цифры"""
+        card_bin = getattr(transaction, 'card_bin', None)
+        card_last4 = getattr(transaction, 'card_last4', None)
+        if not card_bin or not card_last4:
+            return None
+        return f"{card_bin}:{card_last4}"
+
+    def _resolve_geo(self, transaction: TransactionRequest) -> Tuple[str, str, bool]:
+        """
+        Страна эмитента карты, страна IP и признак хостинга
+
+        Значения из локальных индексов имеют приоритет над данными запроса,
+        данные запроса используются, только если индекс ничего не нашел.
+        """
+        issuer_country = getattr(transaction, 'issuer_country', '')
+        ip_country = getattr(transaction, 'ip_country', '')
+        is_hosting = False
+
+        if self.enrichment is not None:
+            ip_info = self.enrichment.lookup_ip(transaction.ip_address)
+            if ip_info is not None:
+                ip_country = ip_info.country or ip_country
+                is_hosting = ip_info.is_hosting
+
+            bin_info = self.enrichment.lookup_bin(getattr(transaction, 'card_bin', None))
+            if bin_info is not None:
+                issuer_country = bin_info.issuer_country or issuer_country
+
+        return issuer_country, ip_country, is_hosting
+
     def _get_type_risk_multiplier(self, transaction_type: str) -> float:
         """Множитель риска по типу транзакции"""
         risk_multipliers = {
@@ -288,6 +422,40 @@ class RiskAnalyzer:
 
         return risk
 
+    def _analyze_balance_continuity(self, transaction: TransactionRequest) -> Tuple[float, List[str]]:
+        """
+        Сравнение балансов "до" с балансами после предыдущих транзакций счетов
+
+        Returns:
+            Дополнительные баллы риска (0-25) и факторы риска
+        """
+        risk = 0.0
+        factors = []
+
+        features = self.balance_tracker.observe(
+            transaction.nameOrig,
+            transaction.oldbalanceOrg,
+            transaction.newbalanceOrig,
+            transaction.nameDest,
+            transaction.oldbalanceDest,
+            transaction.newbalanceDest
+        )
+
+        # Допуск на округление: 1 рубль или 1% от суммы
+        tolerance = max(1.0, transaction.amount * 0.01)
+
+        orig_gap = features["orig_discontinuity"]
+        if orig_gap is not None and orig_gap > tolerance:
+            risk += 15
+            factors.append(f"Баланс отправителя расходится с предыдущей транзакцией на {orig_gap:,.2f}")
+
+        dest_gap = features["dest_discontinuity"]
+        if dest_gap is not None and dest_gap > tolerance:
+            risk += 10
+            factors.append(f"Баланс получателя расходится с предыдущей транзакцией на {dest_gap:,.2f}")
+
+        return risk, factors
+
     def _analyze_additional_factors(self, transaction: TransactionRequest) -> float:
         """
         Анализ дополнительных факторов риска
@@ -311,6 +479,55 @@ class RiskAnalyzer:
 
         return risk
 
+    def _analyze_transfer_graph(self, transaction: TransactionRequest) -> Tuple[float, List[str]]:
+        """
+        Анализ связей между счетами по графу переводов
+
+        Returns:
+            Дополнительные баллы риска (0-60) и факторы риска
+        """
+        risk = 0.0
+        factors = []
+
+        name_orig = transaction.nameOrig
+        name_dest = transaction.nameDest
+        if not name_orig and not name_dest:
+            return risk, factors
+
+        now = transaction_timestamp(transaction.timestamp)
+        if name_orig and name_dest:
+            self.transfer_graph.add_transfer(name_orig, name_dest, now, transaction.type)
+
+        features = self.transfer_graph.get_features(name_orig, name_dest, now)
+
+        # Много входящих переводов на один счет (сбор средств на дроп)
+        dest_in_degree = features["dest_in_degree_window"]
+        if dest_in_degree > 3:
+            risk += min((dest_in_degree - 3) * 5, 20)
+            factors.append(f"{dest_in_degree} входящих переводов на счет получателя за час")
+
+        # Вывод средств сразу после входящего перевода (TRANSFER → CASH_OUT)
+        if transaction.type == "CASH_OUT" and features["orig_received_transfer_window"]:
+            risk += 15
+            factors.append("Вывод средств сразу после входящего перевода (счет-посредник)")
+
+        # Близость к известным мошенническим счетам
+        distances = [
+            d for d in (features["dest_distance_to_fraud"], features["orig_distance_to_fraud"])
+            if d >= 0
+        ]
+        if distances:
+            distance = min(distances)
+            risk += {0: 25, 1: 20, 2: 10}.get(distance, 5)
+            factors.append(f"Связь с мошенническим счетом через {distance} шаг(а)")
+
+        # Крупная сеть связанных счетов
+        if features["component_size"] >= 50:
+            risk += 5
+            factors.append(f"Счет входит в сеть из {features['component_size']} связанных счетов")
+
+        return risk, factors
+
     def _determine_risk_level(self, normalized_risk: float) -> RiskLevel:
         """Определение уровня риска"""
         if normalized_risk >= self.risk_thresholds['CRITICAL']:
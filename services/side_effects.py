@@ -0,0 +1,380 @@
+"""
+Конвейер побочных эффектов после решения по транзакции
+Ограниченные очереди на приемник, пакетная обработка и политика переполнения
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import IO, Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from app.metrics import metrics
+from app.models import RiskAssessment, TransactionRequest, TransactionResponse
+from services.process_files import claim_process_files, process_path
+
+logger = logging.getLogger(__name__)
+
+# Политики переполнения очереди приемника
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_SPILL = "spill"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL)
+
+
+class DecisionEvent(NamedTuple):
+    """Решение по транзакции для приемников побочных эффектов"""
+    transaction: TransactionRequest
+    fraud_probability: float
+    risk_assessment: RiskAssessment
+    response: TransactionResponse
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "transaction": self.transaction.model_dump(mode="json"),
+            "fraud_probability": self.fraud_probability,
+            "risk_assessment": self.risk_assessment.model_dump(mode="json"),
+            "response": self.response.model_dump(mode="json"),
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "DecisionEvent":
+        document = json.loads(data)
+        return cls(
+            TransactionRequest.model_validate(document["transaction"]),
+            document["fraud_probability"],
+            RiskAssessment.model_validate(document["risk_assessment"]),
+            TransactionResponse.model_validate(document["response"]),
+        )
+
+
+BatchHandler = Callable[[List[Any]], Optional[Awaitable[None]]]
+
+
+class Sink:
+    """
+    Приемник побочных эффектов
+
+    - Очередь ограничена capacity событиями
+    - Обработчик получает пакеты до batch_size событий; синхронный
+      обработчик выполняется в пуле потоков
+    - При переполнении: block - отправитель ждет освобождения места,
+      drop_oldest - вытесняется самое старое событие, spill - события
+      дописываются в файл и обрабатываются после очереди в памяти
+      (файл переживает перезапуск)
+    - Файл у каждого процесса свой: <name>.<pid>.jsonl. При запуске
+      файлы завершенных процессов переименовываются в файлы этого
+      процесса и обрабатываются первыми; переименование атомарно,
+      поэтому каждый файл забирает один воркер
+    - Файл дописывается через один открытый буферизованный дескриптор;
+      буфер сбрасывается перед чтением и при остановке. Строки, которые
+      не удалось разобрать (например, оборванная при сбое последняя
+      строка), пропускаются и учитываются в corrupt
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: BatchHandler,
+        capacity: int = 10_000,
+        batch_size: int = 100,
+        overflow: str = OVERFLOW_DROP_OLDEST,
+        spill_dir: Optional[str] = None,
+        encode: Callable[[Any], str] = DecisionEvent.to_json,
+        decode: Callable[[str], Any] = DecisionEvent.from_json
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+        if overflow == OVERFLOW_SPILL and not spill_dir:
+            raise ValueError("Для политики spill нужен spill_dir")
+
+        self.name = name
+        self.handler = handler
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.encode = encode
+        self.decode = decode
+        self._is_async = asyncio.iscoroutinefunction(handler)
+
+        # (время постановки в очередь, событие)
+        self._queue: Deque[Tuple[float, Any]] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.spill_path = (
+            process_path(os.path.join(spill_dir, f"{name}.jsonl")) if overflow == OVERFLOW_SPILL else None
+        )
+        # Забранные файлы завершенных процессов - читаются до своего
+        self._claimed: List[str] = []
+        self._spill_offset = 0
+        self._spilled_pending = 0
+        self._spill_file: Optional[IO[str]] = None
+        if self.spill_path:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._claimed = claim_process_files(os.path.join(spill_dir, f"{name}.jsonl"))
+            self._spilled_pending = self._count_spilled()
+            if self._spilled_pending:
+                self._not_empty.set()
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self.corrupt = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+        self._idle = asyncio.Event()
+        if not self._spilled_pending:
+            self._idle.set()
+
+    # === ПОСТАНОВКА В ОЧЕРЕДЬ ===
+
+    async def put(self, event: Any):
+        """Постановка события с учетом политики переполнения"""
+        # Пока в файле есть события, новые тоже идут в файл (порядок FIFO)
+        if self._spilled_pending:
+            self._spill(event)
+            return
+
+        if len(self._queue) >= self.capacity:
+            if self.overflow == OVERFLOW_BLOCK:
+                while len(self._queue) >= self.capacity:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+            elif self.overflow == OVERFLOW_DROP_OLDEST:
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self._spill(event)
+                return
+
+        self._queue.append((time.monotonic(), event))
+        self.enqueued += 1
+        self._idle.clear()
+        self._not_empty.set()
+
+    def _spill(self, event: Any):
+        if self._spill_file is None:
+            self._spill_file = open(self.spill_path, 'a', encoding='utf-8', buffering=1 << 16)
+        self._spill_file.write(self.encode(event) + "\n")
+        self._spilled_pending += 1
+        self.spilled += 1
+        self.enqueued += 1
+        self._idle.clear()
+        self._not_empty.set()
+
+    def _count_spilled(self) -> int:
+        """Строки в забранных файлах и в своем файле"""
+        count = 0
+        for path in (*self._claimed, self.spill_path):
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    count += sum(1 for _ in f)
+        return count
+
+    def _close_spill_file(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def _read_spilled(self, limit: int) -> List[Tuple[float, Any]]:
+        """
+        Следующие события из файлов: сначала забранные (прочитанный
+        удаляется), затем свой (прочитанный до конца очищается)
+        """
+        path = self._claimed[0] if self._claimed else self.spill_path
+        if path == self.spill_path and self._spill_file is not None:
+            self._spill_file.flush()
+        events = []
+        lines = 0
+        with open(path, 'rb') as f:
+            f.seek(self._spill_offset)
+            for _ in range(limit):
+                line = f.readline()
+                if not line:
+                    break
+                lines += 1
+                try:
+                    events.append((time.monotonic(), self.decode(line.decode('utf-8'))))
+                except Exception as e:
+                    self.corrupt += 1
+                    logger.warning(f"Приемник {self.name}: строка {path} пропущена: {str(e)}")
+            self._spill_offset = f.tell()
+            at_end = not f.readline()
+
+        self._spilled_pending = max(0, self._spilled_pending - lines)
+        if at_end:
+            self._spill_offset = 0
+            if self._claimed:
+                os.remove(self._claimed.pop(0))
+            else:
+                open(path, 'w').close()
+                self._spilled_pending = 0
+        return events
+
+    # === ОБРАБОТКА ===
+
+    def _next_batch(self) -> List[Tuple[float, Any]]:
+        queue = self._queue
+        batch = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+        # Пакет из одних поврежденных строк пуст - чтение продолжается
+        while not batch and self._spilled_pending:
+            batch = self._read_spilled(self.batch_size)
+        if len(queue) < self.capacity:
+            self._not_full.set()
+        return batch
+
+    def _skip_spill_file(self):
+        """Отказ от файла, который не удается прочитать: иначе put() писал бы в файл без читателя"""
+        self._spill_offset = 0
+        if self._claimed:
+            path = self._claimed.pop(0)
+            logger.error(f"Приемник {self.name}: файл {path} пропущен")
+            try:
+                if self._spill_file is not None:
+                    self._spill_file.flush()
+                self._spilled_pending = self._count_spilled()
+                return
+            except OSError:
+                pass
+        self._close_spill_file()
+        self._spilled_pending = 0
+        try:
+            open(self.spill_path, 'w').close()
+        except OSError as e:
+            logger.error(f"Приемник {self.name}: файл {self.spill_path} не очищен: {str(e)}")
+
+    async def run(self):
+        """Цикл обработки пакетов"""
+        while True:
+            await self._not_empty.wait()
+            try:
+                batch = self._next_batch()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка чтения файла приемника {self.name}: {str(e)}")
+                self._skip_spill_file()
+                continue
+            if not batch:
+                self._not_empty.clear()
+                self._idle.set()
+                continue
+
+            events = [event for _, event in batch]
+            started = time.perf_counter_ns()
+            try:
+                if self._is_async:
+                    await self.handler(events)
+                else:
+                    await asyncio.to_thread(self.handler, events)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка приемника {self.name}: {str(e)}")
+            elapsed = time.perf_counter_ns() - started
+            metrics.observe_ns("sink", self.name, elapsed)
+            self.last_batch_ms = elapsed / 1e6
+            self.processed += len(events)
+            self.batches += 1
+
+    async def join(self):
+        """Ожидание обработки всех событий"""
+        await self._idle.wait()
+
+    def spill_remaining(self) -> int:
+        """
+        Запись необработанных событий очереди в файл (при остановке)
+
+        События очереди старше событий в файле и записываются перед ними.
+        """
+        self._close_spill_file()
+        if not self.spill_path or not self._queue:
+            return 0
+        count = len(self._queue)
+
+        remainder = b""
+        if os.path.exists(self.spill_path):
+            with open(self.spill_path, 'rb') as f:
+                f.seek(0 if self._claimed else self._spill_offset)
+                remainder = f.read()
+
+        tmp_path = f"{self.spill_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for _, event in self._queue:
+                f.write((self.encode(event) + "\n").encode('utf-8'))
+            f.write(remainder)
+        os.replace(tmp_path, self.spill_path)
+
+        self._spill_offset = 0
+        self._spilled_pending += count
+        self._queue.clear()
+        return count
+
+    def get_statistics(self) -> Dict:
+        """Глубина очереди, отставание и счетчики"""
+        lag = time.monotonic() - self._queue[0][0] if self._queue else 0.0
+        return {
+            "overflow": self.overflow,
+            "depth": len(self._queue),
+            "capacity": self.capacity,
+            "spilled_pending": self._spilled_pending,
+            "lag_seconds": round(lag, 3),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "errors": self.errors,
+            "corrupt": self.corrupt,
+            "batches": self.batches,
+            "last_batch_ms": round(self.last_batch_ms, 3),
+        }
+
+
+class SideEffectPipeline:
+    """
+    Набор приемников: событие ставится в очередь один раз и
+    раздается всем приемникам, каждый обрабатывает его в своей задаче
+    """
+
+    def __init__(self, sinks: List[Sink]):
+        self.sinks = {sink.name: sink for sink in sinks}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Запуск задач приемников"""
+        self._tasks = [asyncio.create_task(sink.run()) for sink in self.sinks.values()]
+
+    async def submit(self, event: Any):
+        """Постановка события во все приемники"""
+        for sink in self.sinks.values():
+            await sink.put(event)
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Остановка: обработка очередей в пределах timeout,
+        остаток очередей spill-приемников сохраняется в файл
+        """
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(sink.join() for sink in self.sinks.values())),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Очереди побочных эффектов не обработаны до остановки")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for sink in self.sinks.values():
+            spilled = sink.spill_remaining()
+            if spilled:
+                logger.info(f"Приемник {sink.name}: {spilled} событий сохранено в {sink.spill_path}")
+
+    def get_statistics(self) -> Dict:
+        """Статистика приемников"""
+        return {name: sink.get_statistics() for name, sink in self.sinks.items()}
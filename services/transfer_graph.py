@@ -0,0 +1,561 @@
+"""
+Граф переводов между счетами (nameOrig → nameDest)
+Инкрементальный индекс для обнаружения дропов (mule) и колец
+"""
+import csv
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Расстояние до мошеннического счета, если он недостижим
+UNREACHABLE = -1
+
+# Узлов за один захват блокировки при очистке и пересчете компонент
+CHUNK_NODES = 4096
+
+
+def _find(parent: array, node: int) -> int:
+    """Корень узла в union-find со сжатием путей"""
+    root = node
+    while parent[root] != root:
+        root = parent[root]
+    while parent[node] != root:
+        parent[node], node = root, parent[node]
+    return root
+
+
+def _link(parent: array, size: array, a: int, b: int) -> Optional[Tuple[int, int]]:
+    """Объединение множеств; возвращает (новый корень, присоединенный корень) или None"""
+    root_a = _find(parent, a)
+    root_b = _find(parent, b)
+    if root_a == root_b:
+        return None
+    if size[root_a] < size[root_b]:
+        root_a, root_b = root_b, root_a
+    parent[root_b] = root_a
+    size[root_a] += size[root_b]
+    return root_a, root_b
+
+
+class TransferGraph:
+    """
+    Инкрементальный граф переводов
+
+    Хранение:
+    - Счета отображаются в целочисленные ID
+    - Списки смежности и времена ребер - компактные массивы `array`
+      (отсортированы по времени, окно считается бинарным поиском)
+    - Компоненты связности - union-find на массивах parent/size
+    - Слоты счетов, у которых не осталось ребер, освобождаются при
+      очистке и занимаются новыми счетами - память ограничена числом
+      счетов за срок хранения
+
+    Очистка (prune) рассчитана на запуск в отдельном потоке: она
+    захватывает блокировку порциями по CHUNK_NODES узлов, компоненты
+    строятся в новых массивах, а объединения, сделанные за это время,
+    доигрываются при подмене. add_transfer, mark_fraud и get_features
+    ждут не дольше одной порции.
+
+    Признаки (запрос за микросекунды):
+    - Количество входящих/исходящих переводов за окно
+    - Размер компоненты связности
+    - Расстояние (в шагах) до известного мошеннического счета
+    - Паттерн TRANSFER → CASH_OUT через счет-посредник
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 3600.0,
+        retention_seconds: float = 7 * 24 * 3600.0,
+        max_hops: int = 3,
+        max_visited: int = 5000
+    ):
+        self.window_seconds = window_seconds
+        self.retention_seconds = retention_seconds
+        self.max_hops = max_hops
+        self.max_visited = max_visited
+
+        self._ids: Dict[str, int] = {}
+        self._names: List[Optional[str]] = []
+        self._free: List[int] = []
+
+        # Смежность: соседи и времена ребер для каждого узла
+        self._out: List[array] = []
+        self._out_ts: List[array] = []
+        self._in: List[array] = []
+        self._in_ts: List[array] = []
+
+        # Время последнего входящего TRANSFER (0 - не было)
+        self._last_transfer_in = array('d')
+
+        # Union-find
+        self._parent = array('l')
+        self._size = array('l')
+        self._fraud_in_component = array('l')
+
+        # Известные мошеннические счета
+        self._fraud = bytearray()
+        self._fraud_nodes: List[int] = []
+
+        self.edge_count = 0
+
+        self._lock = threading.Lock()
+        # Ребра старше границы последней очистки не добавляются
+        self._cutoff = 0.0
+        # Объединения за время пересчета компонент (None - пересчета нет)
+        self._pending_unions: Optional[List[Tuple[int, int]]] = None
+
+    # === ОБНОВЛЕНИЕ ===
+
+    def _node(self, name: str) -> int:
+        """ID узла для счета (создается при первом появлении)"""
+        node = self._ids.get(name)
+        if node is not None:
+            return node
+
+        if self._free:
+            # Слот освобожден при очистке: ребер нет, узел - одиночная компонента
+            node = self._free.pop()
+            self._ids[name] = node
+            self._names[node] = name
+            return node
+
+        node = len(self._names)
+        self._ids[name] = node
+        self._names.append(name)
+        self._out.append(array('l'))
+        self._out_ts.append(array('d'))
+        self._in.append(array('l'))
+        self._in_ts.append(array('d'))
+        self._last_transfer_in.append(0.0)
+        self._parent.append(node)
+        self._size.append(1)
+        self._fraud_in_component.append(0)
+        self._fraud.append(0)
+        return node
+
+    @staticmethod
+    def _insert_edge(neighbours: array, times: array, node: int, ts: float):
+        """Вставка ребра с сохранением сортировки по времени"""
+        if not times or times[-1] <= ts:
+            neighbours.append(node)
+            times.append(ts)
+        else:
+            pos = bisect_right(times, ts)
+            neighbours.insert(pos, node)
+            times.insert(pos, ts)
+
+    def add_transfer(
+        self,
+        name_orig: str,
+        name_dest: str,
+        timestamp: Optional[float] = None,
+        transaction_type: Optional[str] = None
+    ):
+        """
+        Добавление перевода в граф
+
+        Args:
+            name_orig: Счет отправителя
+            name_dest: Счет получателя
+            timestamp: Время перевода (epoch seconds)
+            transaction_type: Тип транзакции
+        """
+        ts = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if ts < self._cutoff:
+                return
+            orig = self._node(name_orig)
+            dest = self._node(name_dest)
+
+            self._insert_edge(self._out[orig], self._out_ts[orig], dest, ts)
+            self._insert_edge(self._in[dest], self._in_ts[dest], orig, ts)
+            self.edge_count += 1
+
+            if transaction_type == "TRANSFER" and ts > self._last_transfer_in[dest]:
+                self._last_transfer_in[dest] = ts
+
+            self._union(orig, dest)
+            if self._pending_unions is not None:
+                self._pending_unions.append((orig, dest))
+
+    def mark_fraud(self, name: str):
+        """Пометка счета как мошеннического"""
+        with self._lock:
+            node = self._node(name)
+            if not self._fraud[node]:
+                self._fraud[node] = 1
+                self._fraud_nodes.append(node)
+                self._fraud_in_component[self._find(node)] += 1
+
+    def _chunks(self) -> Iterable[range]:
+        """Диапазоны узлов по CHUNK_NODES (узлы, добавленные по ходу, тоже попадают)"""
+        start = 0
+        while start < len(self._names):
+            yield range(start, min(start + CHUNK_NODES, len(self._names)))
+            start += CHUNK_NODES
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        Удаление ребер старше retention_seconds
+
+        Union-find не поддерживает удаление, поэтому после очистки
+        компоненты пересчитываются целиком (rebuild_components), а слоты
+        счетов без ребер освобождаются. Блокировка захватывается порциями -
+        вызывается через asyncio.to_thread, не блокируя обработку запросов.
+
+        Returns:
+            Количество удаленных ребер
+        """
+        cutoff = (time.time() if now is None else now) - self.retention_seconds
+        with self._lock:
+            self._cutoff = max(self._cutoff, cutoff)
+        removed = 0
+
+        for nodes in self._chunks():
+            with self._lock:
+                for adjacency, times in ((self._out, self._out_ts), (self._in, self._in_ts)):
+                    for node in nodes:
+                        node_times = times[node]
+                        if not node_times or node_times[0] >= cutoff:
+                            continue
+                        pos = bisect_left(node_times, cutoff)
+                        del node_times[:pos]
+                        del adjacency[node][:pos]
+                        removed += pos
+
+        # Каждое ребро хранится дважды (out и in)
+        removed //= 2
+        with self._lock:
+            self.edge_count -= removed
+
+        if removed:
+            self.rebuild_components()
+            released = self._release_expired(cutoff)
+            logger.info(f"Граф переводов: удалено {removed} устаревших ребер, освобождено {released} счетов")
+
+        return removed
+
+    def _release_expired(self, cutoff: float) -> int:
+        """Освобождение слотов счетов без ребер (после rebuild_components они - одиночные компоненты)"""
+        released = 0
+        for nodes in self._chunks():
+            with self._lock:
+                for node in nodes:
+                    name = self._names[node]
+                    if (
+                        name is None
+                        or self._out[node] or self._in[node]
+                        or self._fraud[node]
+                        or self._last_transfer_in[node] >= cutoff
+                        or self._parent[node] != node or self._size[node] != 1
+                    ):
+                        continue
+                    del self._ids[name]
+                    self._names[node] = None
+                    self._last_transfer_in[node] = 0.0
+                    self._free.append(node)
+                    released += 1
+        return released
+
+    # === UNION-FIND ===
+
+    def _find(self, node: int) -> int:
+        return _find(self._parent, node)
+
+    def _union(self, a: int, b: int):
+        merged = _link(self._parent, self._size, a, b)
+        if merged is not None:
+            root, child = merged
+            self._fraud_in_component[root] += self._fraud_in_component[child]
+
+    def rebuild_components(self):
+        """
+        Полный пересчет компонент связности по текущим ребрам
+
+        Компоненты строятся в новых массивах порциями; объединения,
+        сделанные add_transfer за это время, доигрываются при подмене.
+        """
+        with self._lock:
+            n = len(self._names)
+            self._pending_unions = []
+        parent = array('l', range(n))
+        size = array('l', [1]) * n
+
+        for nodes in self._chunks():
+            with self._lock:
+                for orig in nodes:
+                    if orig >= n:
+                        break
+                    for dest in self._out[orig]:
+                        if dest < n:
+                            _link(parent, size, orig, dest)
+
+        with self._lock:
+            total = len(self._names)
+            parent.extend(range(n, total))
+            size.extend(array('l', [1]) * (total - n))
+            for orig, dest in self._pending_unions:
+                _link(parent, size, orig, dest)
+            self._pending_unions = None
+
+            fraud_in_component = array('l', [0]) * total
+            for node in self._fraud_nodes:
+                fraud_in_component[_find(parent, node)] += 1
+            self._parent, self._size, self._fraud_in_component = parent, size, fraud_in_component
+
+    # === ПРИЗНАКИ ===
+
+    @staticmethod
+    def _count_since(times: array, since: float) -> int:
+        return len(times) - bisect_left(times, since)
+
+    def in_degree(self, name: str, now: Optional[float] = None, window: Optional[float] = None) -> int:
+        """Количество входящих переводов за окно"""
+        node = self._ids.get(name)
+        if node is None:
+            return 0
+        now = time.time() if now is None else now
+        return self._count_since(self._in_ts[node], now - (window or self.window_seconds))
+
+    def out_degree(self, name: str, now: Optional[float] = None, window: Optional[float] = None) -> int:
+        """Количество исходящих переводов за окно"""
+        node = self._ids.get(name)
+        if node is None:
+            return 0
+        now = time.time() if now is None else now
+        return self._count_since(self._out_ts[node], now - (window or self.window_seconds))
+
+    def component_size(self, name: str) -> int:
+        """Размер компоненты связности счета"""
+        node = self._ids.get(name)
+        if node is None:
+            return 0
+        return self._size[self._find(node)]
+
+    def distance_to_fraud(self, name: str) -> int:
+        """
+        Минимальное число шагов до известного мошеннического счета
+
+        Граф обходится как неориентированный, глубина ограничена max_hops.
+        Если в компоненте нет мошеннических счетов, обход не выполняется.
+
+        Returns:
+            Количество шагов или UNREACHABLE
+        """
+        node = self._ids.get(name)
+        if node is None:
+            return UNREACHABLE
+        if self._fraud[node]:
+            return 0
+        if not self._fraud_in_component[self._find(node)]:
+            return UNREACHABLE
+
+        visited = {node}
+        queue = deque([(node, 0)])
+        while queue:
+            current, depth = queue.popleft()
+            if depth >= self.max_hops:
+                continue
+            for adjacency in (self._out[current], self._in[current]):
+                for neighbour in adjacency:
+                    if neighbour in visited:
+                        continue
+                    if self._fraud[neighbour]:
+                        return depth + 1
+                    if len(visited) >= self.max_visited:
+                        return UNREACHABLE
+                    visited.add(neighbour)
+                    queue.append((neighbour, depth + 1))
+
+        return UNREACHABLE
+
+    def get_features(
+        self,
+        name_orig: Optional[str],
+        name_dest: Optional[str],
+        now: Optional[float] = None
+    ) -> Dict[str, float]:
+        """
+        Графовые признаки для пары счетов
+
+        Returns:
+            Словарь признаков
+        """
+        with self._lock:
+            return self._get_features(name_orig, name_dest, time.time() if now is None else now)
+
+    def _get_features(self, name_orig: Optional[str], name_dest: Optional[str], now: float) -> Dict[str, float]:
+        features = {
+            "dest_in_degree_window": 0,
+            "orig_out_degree_window": 0,
+            "component_size": 0,
+            "dest_distance_to_fraud": UNREACHABLE,
+            "orig_distance_to_fraud": UNREACHABLE,
+            "orig_received_transfer_window": False,
+        }
+
+        if name_dest:
+            features["dest_in_degree_window"] = self.in_degree(name_dest, now)
+            features["component_size"] = self.component_size(name_dest)
+            features["dest_distance_to_fraud"] = self.distance_to_fraud(name_dest)
+
+        if name_orig:
+            features["orig_out_degree_window"] = self.out_degree(name_orig, now)
+            features["component_size"] = max(
+                features["component_size"],
+                self.component_size(name_orig)
+            )
+            features["orig_distance_to_fraud"] = self.distance_to_fraud(name_orig)
+
+            node = self._ids.get(name_orig)
+            if node is not None:
+                last_transfer = self._last_transfer_in[node]
+                features["orig_received_transfer_window"] = (
+                    last_transfer > 0 and now - last_transfer <= self.window_seconds
+                )
+
+        return features
+
+    def get_statistics(self) -> Dict:
+        """Статистика графа"""
+        with self._lock:
+            roots = {self._find(node) for node in self._ids.values()}
+            memory_bytes = sum(
+                adjacency.buffer_info()[1] * adjacency.itemsize
+                for adjacency in (*self._out, *self._out_ts, *self._in, *self._in_ts)
+            )
+            return {
+                "accounts": len(self._ids),
+                "free_slots": len(self._free),
+                "edges": self.edge_count,
+                "components": len(roots),
+                "largest_component": max((self._size[root] for root in roots), default=0),
+                "fraud_accounts": sum(self._fraud),
+                "adjacency_bytes": memory_bytes,
+            }
+
+    # === ПАКЕТНЫЙ ПЕРЕСЧЕТ ===
+
+    def load_archive(self, rows: Iterable[Dict], step_seconds: float = 3600.0) -> int:
+        """
+        Загрузка архива транзакций в формате PaySim
+
+        Колонка `step` (час симуляции) переводится во время,
+        счета из транзакций с isFraud=1 помечаются как мошеннические.
+
+        Returns:
+            Количество загруженных транзакций
+        """
+        loaded = 0
+        for row in rows:
+            name_orig = row.get("nameOrig")
+            name_dest = row.get("nameDest")
+            if not name_orig or not name_dest:
+                continue
+
+            ts = float(row.get("step") or 0) * step_seconds
+            self.add_transfer(name_orig, name_dest, ts, row.get("type"))
+
+            if str(row.get("isFraud", "0")) in ("1", "True", "true"):
+                self.mark_fraud(name_orig)
+                self.mark_fraud(name_dest)
+            loaded += 1
+
+        self.rebuild_components()
+        return loaded
+
+    @classmethod
+    def from_archive(cls, path: str, **kwargs) -> "TransferGraph":
+        """Построение графа по CSV архиву транзакций"""
+        graph = cls(**kwargs)
+        with open(path, newline='', encoding='utf-8') as f:
+            loaded = graph.load_archive(csv.DictReader(f))
+        logger.info(f"Граф переводов построен по {path}: {loaded} транзакций")
+        return graph
+
+
+class FraudLabelFeed:
+    """
+    Подтвержденные мошеннические счета для графа переводов
+
+    - Файл path общий для воркеров: по счету в строке
+    - append() помечает счета в графе этого воркера и дописывает их
+      в файл одной записью с O_APPEND - строки разных воркеров
+      не перемешиваются
+    - poll() помечает счета из строк, дописанных после прошлого вызова;
+      первый вызов применяет весь файл. Недописанная последняя строка
+      читается в следующий раз
+    - path=None - только граф этого воркера
+    """
+
+    def __init__(self, graph: TransferGraph, path: Optional[str] = None):
+        self.graph = graph
+        self.path = path
+        self.offset = 0
+        self.labels = 0
+
+    def append(self, accounts: Iterable[str]) -> int:
+        """Пометка счетов и запись в общий файл; возвращает число счетов"""
+        names = [name.strip() for name in accounts if name.strip()]
+        for name in names:
+            self.graph.mark_fraud(name)
+        self.labels += len(names)
+        if self.path and names:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, "".join(f"{name}\n" for name in names).encode('utf-8'))
+            finally:
+                os.close(fd)
+        return len(names)
+
+    def poll(self) -> int:
+        """Пометка счетов, дописанных в файл другими воркерами"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < self.offset:
+                self.offset = 0  # файл заменен
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+
+        marked = 0
+        for line in data[:end].split(b"\n"):
+            name = line.decode('utf-8', 'replace').strip()
+            if name:
+                self.graph.mark_fraud(name)
+                marked += 1
+        self.labels += marked
+        return marked
+
+
+def transaction_timestamp(timestamp: Optional[datetime]) -> float:
+    """Время транзакции в epoch seconds"""
+    return timestamp.timestamp() if timestamp is not None else time.time()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+
+    archive_path = sys.argv[1] if len(sys.argv) > 1 else "data/raw/PS_20174392719_1491204439457_log.csv"
+
+    started = time.perf_counter()
+    graph = TransferGraph.from_archive(archive_path)
+    elapsed = time.perf_counter() - started
+
+    print(f"Пересчет компонент выполнен за {elapsed:.2f} с")
+    for key, value in graph.get_statistics().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,112 @@
+"""
+Доставка окончательных решений во внешний webhook
+Пакеты решений, повтор с экспоненциальной задержкой при временных ошибках
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from services.side_effects import DecisionEvent
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых запрос повторяется
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class WebhookSender:
+    """
+    Отправитель решений в webhook (обработчик приемника конвейера)
+
+    - Пакет решений отправляется одним POST {"decisions": [...]}
+    - Ошибки соединения, таймауты и статусы RETRY_STATUSES повторяются
+      до max_retries раз с задержкой retry_backoff * 2^попытка
+      (Retry-After ответа, если он больше, но не больше max_retry_delay -
+      по умолчанию retry_backoff * 2^max_retries, последний шаг повторов)
+    - Остальные 4xx и исчерпанные повторы - пакет считается
+      недоставленным, приемник переходит к следующему
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 5.0,
+        max_retries: int = 5,
+        retry_backoff: float = 0.5,
+        headers: Optional[Dict[str, str]] = None,
+        max_retry_delay: Optional[float] = None
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_delay = retry_backoff * 2 ** max_retries if max_retry_delay is None else max_retry_delay
+        self.headers = headers or {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.batches = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.last_error: Optional[str] = None
+        self.last_delivery_ms = 0.0
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send(self, events: List[DecisionEvent]):
+        """Отправка пакета решений с повторами"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, headers=self.headers)
+        body = {"decisions": [event.response.model_dump(mode="json") for event in events]}
+
+        self.batches += 1
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            delay = self.retry_backoff * 2 ** attempt
+            try:
+                response = await self._client.post(self.url, json=body)
+            except httpx.HTTPError as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            else:
+                if response.is_success:
+                    self.delivered += len(events)
+                    self.last_delivery_ms = (time.perf_counter() - started) * 1000
+                    return
+                self.last_error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                delay = max(delay, min(_retry_after(response), self.max_retry_delay))
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+        self.failed += len(events)
+        logger.error(f"Webhook {self.url}: {len(events)} решений не доставлено ({self.last_error})")
+
+    def get_statistics(self) -> Dict:
+        """Доставленные и недоставленные решения, повторы"""
+        return {
+            "url": self.url,
+            "batches": self.batches,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "last_error": self.last_error,
+            "last_delivery_ms": round(self.last_delivery_ms, 3),
+        }
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        seconds = float(response.headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0  # дата HTTP вместо секунд
+    return seconds if math.isfinite(seconds) and seconds > 0 else 0.0
@@ -0,0 +1,126 @@
+"""
+Тесты контроля допуска и сброса нагрузки
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.admission import AdaptiveConcurrencyLimiter, AdmissionControlMiddleware
+
+
+def _app(limiter: AdaptiveConcurrencyLimiter, delay: float) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AdmissionControlMiddleware, limiter=limiter, paths=["/api/v1/analyze"], retry_after=2)
+
+    @app.post("/api/v1/analyze")
+    async def analyze():
+        await asyncio.sleep(delay)
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_overload_is_shed_fast_and_health_is_exempt():
+    """Тест: сверх лимита и очереди - сразу 503 с Retry-After, /health отвечает"""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=2, min_limit=2, max_limit=2, target_latency_ms=1000, queue_size=2, queue_timeout_ms=500
+    )
+    transport = httpx.ASGITransport(app=_app(limiter, delay=0.1))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        requests = [asyncio.create_task(client.post("/api/v1/analyze")) for _ in range(8)]
+        await asyncio.sleep(0.02)
+        stats = limiter.get_statistics()
+        health = await client.get("/health")
+        responses = await asyncio.gather(*requests)
+
+    assert (stats["in_flight"], stats["queued"]) == (2, 2)
+    assert health.status_code == 200
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200] * 4 + [503] * 4
+    rejected = [response for response in responses if response.status_code == 503]
+    assert all(response.headers["retry-after"] == "2" for response in rejected)
+
+    stats = limiter.get_statistics()
+    assert stats["shed_queue_full"] == 4
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_is_bounded():
+    """Тест: запрос, не дождавшийся места за queue_timeout_ms, отклоняется"""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=1, min_limit=1, max_limit=1, target_latency_ms=1000, queue_size=4, queue_timeout_ms=20
+    )
+    assert await limiter.acquire()
+    assert not await limiter.acquire()
+    assert limiter.get_statistics()["shed_timeout"] == 1
+    assert limiter.get_statistics()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_adapts_to_latency():
+    """Тест: медленные ответы уменьшают лимит, быстрые при загрузке - увеличивают"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=2, target_latency_ms=50, backoff=0.5)
+    for _ in range(5):
+        await limiter.acquire()
+    limiter.release(200.0)
+    limiter.release(200.0)  # в пределах одного окна - одно уменьшение
+    assert limiter.get_statistics()["limit"] == 5
+
+    for _ in range(2):
+        assert await limiter.acquire()
+    for _ in range(5):
+        limiter.release(5.0)
+    assert limiter.limit > 5
+    assert limiter.get_statistics()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_blocked_event_loop_sheds_new_requests():
+    """Тест: синхронная работа задерживает цикл событий - новые запросы отклоняются до ее окончания"""
+    limiter = AdaptiveConcurrencyLimiter(max_loop_lag_ms=20)
+    monitor = asyncio.create_task(limiter.monitor_loop_lag(interval=0.005))
+    await asyncio.sleep(0.02)
+    assert await limiter.acquire()
+
+    time.sleep(0.05)  # обработчик занял цикл событий
+    await asyncio.sleep(0.001)
+    assert not await limiter.acquire()
+    assert limiter.get_statistics()["shed_loop_lag"] == 1
+
+    await asyncio.sleep(0.03)
+    assert await limiter.acquire()
+    monitor.cancel()
+
+
+@pytest.mark.asyncio
+async def test_batches_have_their_own_limiter():
+    """Тест: медленные пакеты уменьшают лимит пакетов, а не одиночных запросов"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, target_latency_ms=20, backoff=0.5)
+    batch_limiter = AdaptiveConcurrencyLimiter(initial_limit=8, min_limit=1, target_latency_ms=20, backoff=0.5)
+    app = FastAPI()
+    app.add_middleware(
+        AdmissionControlMiddleware, limiter=limiter, paths=["/api/v1/analyze"],
+        batch_limiter=batch_limiter, batch_paths=["/api/v1/batch-analyze"]
+    )
+
+    @app.post("/api/v1/batch-analyze/arrow")
+    async def batch_analyze():
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.post("/api/v1/batch-analyze/arrow")).status_code == 200
+
+    assert batch_limiter.get_statistics()["limit"] == 4
+    assert limiter.get_statistics()["limit"] == 8
+    assert limiter.get_statistics()["admitted"] == 0
@@ -5,7 +5,7 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock, MagicMock, patch
 from app.main import app
-from app.ml.fraud_detector import FraudDetector
+from app.ml.fraud_detector import FraudDetector, Prediction
 from services.risk_analyzer import RiskAnalyzer
 from services.evidence_collector import EvidenceCollector
 from app.models import RiskAssessment, RiskLevel
@@ -17,7 +17,7 @@ def setup_services(monkeypatch):
     # Создаем моки
     mock_fraud_detector = MagicMock(spec=FraudDetector)
     mock_fraud_detector.model = MagicMock()  # Модель существует
-    mock_fraud_detector.predict = AsyncMock(return_value=0.3)
+    mock_fraud_detector.score = AsyncMock(return_value=Prediction(0.3, "model"))
     mock_fraud_detector.get_statistics = AsyncMock(return_value={
         "total_predictions": 0,
         "fraud_detected": 0,
@@ -89,6 +89,10 @@ def test_analyze_transaction():
     assert 0 <= data["fraud_probability"] <= 1
     assert data["risk_level"] in ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
 
+    # Доказательства и связи - под тем же ID, что вернул API
+    import app.main
+    assert app.main.evidence_collector.log_transaction.await_args.args[3] == data["transaction_id"]
+
 
 def test_analyze_low_risk_transaction(monkeypatch):
     """Тест транзакции с низким риском"""
@@ -96,7 +100,7 @@ def test_analyze_low_risk_transaction(monkeypatch):
     import app.main
     mock_fraud_detector = MagicMock(spec=FraudDetector)
     mock_fraud_detector.model = MagicMock()
-    mock_fraud_detector.predict = AsyncMock(return_value=0.1)  # Низкая вероятность мошенничества
+    mock_fraud_detector.score = AsyncMock(return_value=Prediction(0.1, "model"))  # Низкая вероятность мошенничества
 
     mock_risk_analyzer = MagicMock(spec=RiskAnalyzer)
     mock_risk_analyzer.assess_risk = AsyncMock(return_value=RiskAssessment(
@@ -134,7 +138,7 @@ def test_analyze_high_risk_transaction(monkeypatch):
     import app.main
     mock_fraud_detector = MagicMock(spec=FraudDetector)
     mock_fraud_detector.model = MagicMock()
-    mock_fraud_detector.predict = AsyncMock(return_value=0.85)  # Высокая вероятность мошенничества
+    mock_fraud_detector.score = AsyncMock(return_value=Prediction(0.85, "model"))  # Высокая вероятность мошенничества
 
     mock_risk_analyzer = MagicMock(spec=RiskAnalyzer)
     mock_risk_analyzer.assess_risk = AsyncMock(return_value=RiskAssessment(
@@ -207,5 +211,180 @@ def test_invalid_transaction():
     assert response.status_code == 422  # Validation error
 
 
+def test_fast_decode_matches_model():
+    """Тест: быстрый путь принимает те же значения, что и модель, остальное проверяет модель"""
+    from app.fastpath import TransactionRecord, transaction_decoder
+    from app.models import TransactionRequest
+
+    body = b'{"type": "CASH_OUT", "amount": 1500, "nameDest": "M1", "vpn": true, ' \
+           b'"timestamp": "2024-01-01T10:00:00Z", "unknown": 1}'
+    record = transaction_decoder.decode(body)
+    model = TransactionRequest.model_validate_json(body)
+    assert isinstance(record, TransactionRecord)
+    assert record.model_dump() == model.model_dump()
+    assert TransactionRequest.model_validate(record.model_dump(mode="json")) == model
+
+    # Нестандартные или недопустимые значения - обычный путь FastAPI
+    assert transaction_decoder.decode(b'{"type": "PAYMENT", "amount": "1500"}') is None
+    assert transaction_decoder.decode(b'{"type": "PAYMENT", "amount": 20000000}') is None
+    assert transaction_decoder.decode(b'{"type": "PAYMENT", "amount": 1, "oldbalanceOrg": -1}') is None
+    assert transaction_decoder.decode(b'{"amount": 1}') is None
+    for timestamp in ("2024-13-01T00:00:00", "2024-02-30T00:00:00Z", "2024-01-01T00:00:00+25:00"):
+        body = b'{"type": "PAYMENT", "amount": 1, "timestamp": "%s"}' % timestamp.encode()
+        assert transaction_decoder.decode(body) is None
+        response = client.post("/api/v1/analyze", content=body, headers={"content-type": "application/json"})
+        assert response.status_code == 422
+
+    fast = transaction_decoder.fast
+    response = client.post("/api/v1/analyze", json={"type": "PAYMENT", "amount": 100.0})
+    assert response.status_code == 200
+    assert transaction_decoder.fast == fast + 1
+    assert response.json()["timestamp"].endswith("Z")
+
+    fallback = transaction_decoder.fallback
+    response = client.post("/api/v1/analyze", json={"type": "PAYMENT", "amount": "100.5"})
+    assert response.status_code == 200
+    response = client.post("/api/v1/analyze", json={"type": "PAYMENT", "amount": 0})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "amount"]
+    assert transaction_decoder.fallback == fallback + 2
+
+
+def test_linked_limit_is_bounded(monkeypatch):
+    """Тест: limit в /api/v1/linked ограничен"""
+    import app.main
+    from app.config import settings
+    from services.entity_index import EntityIndex
+
+    index = EntityIndex()
+    index.add("TX1", ["ip:1"])
+    index.add("TX2", ["ip:1"])
+    monkeypatch.setattr(app.main, "entity_index", index)
+
+    assert client.get("/api/v1/linked/TX1?limit=0").status_code == 422
+    assert client.get(f"/api/v1/linked/TX1?limit={settings.LINKED_MAX_LIMIT + 1}").status_code == 422
+    response = client.get("/api/v1/linked/TX1?limit=1")
+    assert [item["transaction_id"] for item in response.json()["linked"]] == ["TX2"]
+
+
+def test_batch_analyze_arrow(monkeypatch):
+    """Тест пакетного анализа в формате Arrow IPC"""
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import app.main
+    from app.ml.fraud_detector import FraudDetector as RealFraudDetector
+
+    monkeypatch.setattr(
+        app.main.fraud_detector, "score_columns", RealFraudDetector(model_path="missing").score_columns
+    )
+    table = pa.table({
+        "transaction_id": ["A1", "A2"],
+        "type": ["TRANSFER", "PAYMENT"],
+        "amount": [250000.0, 100.0],
+        "oldbalanceOrg": [250000.0, 1000.0],
+        "newbalanceOrig": [0.0, 900.0],
+        "vpn": [True, None],
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    response = client.post(
+        "/api/v1/batch-analyze/arrow",
+        content=sink.getvalue().to_pybytes(),
+        headers={"content-type": "application/vnd.apache.arrow.stream"}
+    )
+    assert response.status_code == 200
+    result = pa.ipc.open_stream(response.content).read_all().to_pydict()
+    assert result["transaction_id"] == ["A1", "A2"]
+    # Эвристика: TRANSFER с обнулением баланса отправителя, PAYMENT - минимальный риск
+    assert result["fraud_probability"] == [1.0, 0.01]
+    assert result["risk_level"] == [2, 2]  # MEDIUM из мока анализатора рисков
+    assert result["flags"] == [1, 0]
+
+    bad = pa.table({"type": ["PAYMENT"], "amount": [-1.0]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, bad.schema) as writer:
+        writer.write_table(bad)
+    response = client.post("/api/v1/batch-analyze/arrow", content=sink.getvalue().to_pybytes())
+    assert response.status_code == 422
+    assert "Строка 0" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_column_path_matches_per_transaction_path():
+    """Тест: признаки и вероятности пакета по столбцам совпадают с расчетом по одной транзакции"""
+    import numpy as np
+    import xgboost as xgb
+    from app.ml.preprocessor import TransactionPreprocessor
+    from app.models import TransactionRequest
+
+    preprocessor = TransactionPreprocessor()
+    bins = preprocessor._bucket_bins()
+    keys = sorted(preprocessor.fraud_share_by_bucket)
+    # Границы бакетов, соседние с ними значения и середины между ключами долей
+    amounts = [float(edge) for edge in bins] + [1e-9, 0.005, 250.0, 3000.0]
+    amounts += [float(np.nextafter(edge, 0)) for edge in bins] + [float(np.nextafter(edge, np.inf)) for edge in bins]
+    amounts += [(low + high) / 2 for low, high in zip(keys, keys[1:])]
+    amounts = [amount for amount in amounts if 0 < amount <= 10_000_000]
+    types = ["PAYMENT", "TRANSFER", "CASH_OUT", "CASH_IN", "DEBIT"]
+    rng = np.random.default_rng(7)
+    transactions = [
+        TransactionRequest(
+            type=types[i % len(types)],
+            amount=amount,
+            oldbalanceOrg=float(rng.uniform(0, 1e6)),
+            newbalanceOrig=0.0 if i % 3 == 0 else float(rng.uniform(0, 1e6)),
+            oldbalanceDest=float(rng.uniform(0, 1e6)),
+            newbalanceDest=float(rng.uniform(0, 1e6))
+        )
+        for i, amount in enumerate(amounts)
+    ]
+
+    columns, row_types = preprocessor.columns_from_transactions(transactions)
+    features = preprocessor.preprocess_columns(columns, row_types)
+    expected = np.vstack([preprocessor.preprocess(transaction).to_numpy() for transaction in transactions])
+    np.testing.assert_array_equal(features, expected)
+
+    training = xgb.DMatrix(
+        features, label=rng.integers(0, 2, len(features)), feature_names=TransactionPreprocessor.FEATURE_ORDER
+    )
+    detector = FraudDetector(model_path="missing", cache_size=0)
+    detector.model = xgb.train({"objective": "binary:logistic", "max_depth": 3}, training, num_boost_round=5)
+    batch = await detector.predict_columns(columns, row_types)
+    single = [await detector.predict(transaction) for transaction in transactions]
+    assert len(set(np.round(batch, 6))) > 1
+    np.testing.assert_allclose(batch, single, rtol=1e-6)
+
+
+def test_server_timing_and_metrics():
+    """Тест: этапы запроса в Server-Timing и гистограммы в /metrics"""
+    import app.main
+    app.main.fraud_detector.paths = {"model": 1, "cache": 0, "heuristic": 0}
+    app.main.fraud_detector.fallbacks = {}
+
+    response = client.post("/api/v1/analyze", json={
+        "type": "PAYMENT",
+        "amount": 100.0,
+        "oldbalanceOrg": 1000.0,
+        "newbalanceOrig": 900.0,
+        "oldbalanceDest": 0.0,
+        "newbalanceDest": 0.0
+    })
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    stages = [part.split(";")[0] for part in timing.split(", ")]
+    assert {"decode", "risk", "recommendations", "dispatch", "serialize"} <= set(stages)
+    assert stages[-1] == "total"
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE fraudguard_stage_duration_seconds histogram" in metrics.text
+    assert 'fraudguard_stage_duration_seconds_bucket{stage="risk",le="+Inf"}' in metrics.text
+    assert 'fraudguard_request_duration_seconds_count{path="/api/v1/analyze"}' in metrics.text
+    assert 'fraudguard_predictions_total{path="model"} 1' in metrics.text
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,235 @@
+"""
+Тесты для хранилища доказательств
+"""
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import zipfile
+from datetime import datetime, timezone
+
+import pytest
+
+from app.models import EvidenceRecord, RiskAssessment, RiskLevel, TransactionRequest
+from services.entity_index import EntityIndex
+from services.evidence_collector import EvidenceCollector
+from services.evidence_export import stream_jsonl, stream_zip
+from services.evidence_store import EvidenceStore
+
+
+def _assessment():
+    return RiskAssessment(risk_level=RiskLevel.LOW, risk_score=10.0, confidence=0.7)
+
+
+@pytest.fixture
+def collector(tmp_path):
+    store = EvidenceStore(str(tmp_path / "evidence.db"), cache_size=2, batch_size=3)
+    collector = EvidenceCollector(store=store)
+    yield collector
+    collector.close()
+
+
+@pytest.mark.asyncio
+async def test_evidence_survives_restart_and_cache_eviction(tmp_path, collector):
+    """Тест: доказательства читаются из SQLite после вытеснения из кэша и перезапуска"""
+    for i in range(5):
+        await collector.log_transaction(
+            TransactionRequest(transaction_id=f"TX{i}", type="PAYMENT", amount=100.0, ip_address="5.1.2.3"),
+            0.1,
+            _assessment()
+        )
+
+    await collector.add_delivery_info("TX0", "TRACK-1", "Иванов")
+    await collector.add_communication("TX0", "email", "Заказ отправлен")
+    await collector.add_screenshot("TX0", "https://example.com/s1.png")
+    await collector.add_screenshot("missing", "https://example.com/s2.png")
+    expected = await collector.export_for_chargeback("TX0")
+    collector.close()
+
+    restarted = EvidenceCollector(store=EvidenceStore(str(tmp_path / "evidence.db")))
+    exported = await restarted.export_for_chargeback("TX0")
+    assert exported == expected
+    assert exported["delivery_proof"] == {"tracking_number": "TRACK-1", "signature": "Иванов"}
+    assert exported["visual_proof"]["screenshots"] == ["https://example.com/s1.png"]
+    assert len(exported["technical_data"]["ip_logs"]) == 1
+    assert await restarted.get_evidence("missing") is None
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_store_calls_leave_event_loop(collector, monkeypatch):
+    """Тест: запись, удаление и подсчет выполняются не в потоке цикла событий"""
+    threads = set()
+    for name in ("add_record", "flush", "purge_expired", "count"):
+        method = getattr(collector.store, name)
+
+        def traced(*args, method=method):
+            threads.add(threading.current_thread())
+            return method(*args)
+
+        monkeypatch.setattr(collector.store, name, traced)
+
+    transaction = TransactionRequest(transaction_id="TX", type="PAYMENT", amount=1.0)
+    await collector.log_transaction(transaction, 0.1, _assessment())
+    await collector.flush()
+    await collector.purge_expired()
+    assert (await collector.get_statistics())["records"] == 1
+    assert len(threads) == 1 and threading.current_thread() not in threads
+
+
+def test_evidence_store_retention(tmp_path):
+    """Тест удаления записей старше срока хранения"""
+    store = EvidenceStore(str(tmp_path / "evidence.db"), retention_days=30)
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    store.add_record(EvidenceRecord(transaction_id="OLD", timestamp=old, ip_logs=["log"]))
+    store.add_record(EvidenceRecord(transaction_id="NEW", ip_logs=["log"]))
+
+    assert store.purge_expired() == 1
+    assert store.get("OLD") is None
+    assert store.get("NEW") is not None
+    assert store.count() == 1
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_bulk_export_jsonl_and_zip(collector):
+    """Тест массового экспорта: документ на транзакцию и манифест"""
+    for i in range(4):
+        await collector.log_transaction(
+            TransactionRequest(transaction_id=f"TX{i}", type="PAYMENT", amount=100.0),
+            0.1,
+            _assessment()
+        )
+    ids = ["TX0", "TX1", "missing", "TX3"]
+
+    lines = b"".join([chunk async for chunk in stream_jsonl(collector, ids)]).splitlines()
+    documents = [json.loads(line) for line in lines]
+    assert [d["transaction_id"] for d in documents[:-1]] == ["TX0", "TX1", "TX3"]
+    assert documents[0] == await collector.export_for_chargeback("TX0")
+    assert documents[-1]["manifest"]["missing"] == ["missing"]
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join([chunk async for chunk in stream_zip(collector, ids)])))
+    assert sorted(archive.namelist()) == ["TX0.json", "TX1.json", "TX3.json", "manifest.json"]
+    manifest = json.loads(archive.read("manifest.json"))
+    assert manifest["exported"] == 3
+    assert json.loads(archive.read("TX1.json")) == await collector.export_for_chargeback("TX1")
+
+
+@pytest.mark.asyncio
+async def test_entity_index_links_transactions(tmp_path):
+    """Тест: связанные транзакции через общие сущности и восстановление из снимка"""
+    index = EntityIndex(snapshot_path=str(tmp_path / "entity_index.bin"), max_fanout=3)
+    collector = EvidenceCollector(
+        store=EvidenceStore(str(tmp_path / "evidence.db")),
+        entity_index=index
+    )
+    transactions = [
+        dict(transaction_id="FRAUD", ip_address="5.1.2.3", card_bin="411111", card_last4="1234"),
+        dict(transaction_id="SAME_IP", ip_address="5.1.2.3", device_id="DEV-1"),
+        dict(transaction_id="SAME_DEVICE", device_id="dev-1", nameDest="C1"),
+        dict(transaction_id="SAME_CARD", card_bin="411111", card_last4="1234", email="a@x.ru"),
+        dict(transaction_id="UNRELATED", ip_address="9.9.9.9"),
+    ] + [dict(transaction_id=f"HUB{i}", nameDest="C1") for i in range(3)]
+    for fields in transactions:
+        await collector.log_transaction(TransactionRequest(type="PAYMENT", amount=10.0, **fields), 0.1, _assessment())
+    collector.close()
+
+    result = index.linked("FRAUD", max_hops=2)
+    hops = {item["transaction_id"]: item["hops"] for item in result["linked"]}
+    assert hops == {"SAME_IP": 1, "SAME_CARD": 1, "SAME_DEVICE": 2}
+    assert index.linked("FRAUD", max_hops=3)["skipped_entities"] == ["dest:c1"]
+    assert index.linked("missing") is None
+
+    index.save_snapshot()
+    restored = EntityIndex(snapshot_path=str(tmp_path / "entity_index.bin"), max_fanout=3)
+    assert restored.load_snapshot()
+    assert restored.linked("FRAUD", max_hops=2)["linked"] == result["linked"]
+    assert restored.transactions("dest:c1") == ["SAME_DEVICE", "HUB0", "HUB1", "HUB2"]
+
+
+def test_entity_index_purge_and_process_snapshots(tmp_path):
+    """Тест: удаление по сроку хранения и снимки по процессам с забором снимков завершенных"""
+    index = EntityIndex(snapshot_path=str(tmp_path / "entity_index.bin"))
+    index.add("OLD", ["ip:1", "device:a"], timestamp=100.0)
+    index.add("NEW1", ["ip:1"], timestamp=200.0)
+    index.add("NEW2", ["device:b", "ip:1"], timestamp=300.0)
+    assert index.purge_expired(cutoff=150.0) == 1
+    assert index.transactions("ip:1") == ["NEW1", "NEW2"]
+    assert index.transactions("device:a") == []
+    assert [item["transaction_id"] for item in index.linked("NEW2")["linked"]] == ["NEW1"]
+
+    finished = multiprocessing.get_context("fork").Process(target=lambda: None)
+    finished.start()
+    finished.join()
+    dead = EntityIndex(snapshot_path=str(tmp_path / "entity_index.bin"))
+    dead.add("DEAD", ["ip:1"], timestamp=400.0)
+    dead_path = dead.process_snapshot_path(finished.pid)
+    dead.save_snapshot(dead_path)
+    index.save_snapshot()
+
+    restored = EntityIndex(snapshot_path=str(tmp_path / "entity_index.bin"))
+    assert restored.load_snapshot()
+    assert restored.transactions("ip:1") == ["NEW1", "NEW2", "DEAD"]
+    assert restored.purge_expired(cutoff=250.0) == 1
+    restored.save_snapshot()
+    assert os.listdir(tmp_path) == [os.path.basename(restored.process_snapshot_path())]
+
+
+@pytest.mark.asyncio
+async def test_evidence_artifacts_deduplicated(tmp_path):
+    """Тест: повторяющиеся артефакты хранятся один раз, экспорт не меняется"""
+    store = EvidenceStore(str(tmp_path / "evidence.db"), retention_days=30)
+    collector = EvidenceCollector(store=store)
+    for i in range(10):
+        await collector.log_transaction(
+            TransactionRequest(transaction_id=f"TX{i}", type="PAYMENT", amount=100.0), 0.1, _assessment()
+        )
+        await collector.add_screenshot(f"TX{i}", "https://example.com/checkout.png")
+        await collector.add_communication(
+            f"TX{i}", "email", "Ваш заказ отправлен", datetime(2024, 1, 1, tzinfo=timezone.utc)
+        )
+    expected = await collector.export_for_chargeback("TX3")
+
+    stats = await collector.get_statistics()
+    assert stats["blobs"] == 2
+    assert stats["references"] == 20
+    assert stats["saved_bytes"] > 0 and stats["dedup_ratio"] == 10.0
+    collector.close()
+
+    store = EvidenceStore(str(tmp_path / "evidence.db"), retention_days=30)
+    collector = EvidenceCollector(store=store)
+    assert await collector.export_for_chargeback("TX3") == expected
+
+    store.add_record(EvidenceRecord(transaction_id="TX0"))
+    assert (await collector.get_statistics())["references"] == 18
+    assert store.purge_expired(now=datetime.now(timezone.utc).timestamp() + 31 * 86400) == 10
+    assert (await collector.get_statistics())["blobs"] == 0
+    collector.close()
+
+
+def test_evidence_store_migrates_inline_payloads(tmp_path):
+    """Тест переноса содержимого событий из старого формата"""
+    path = str(tmp_path / "evidence.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE evidence (transaction_id TEXT PRIMARY KEY, created_at REAL NOT NULL,
+                               timestamp TEXT NOT NULL, device_fingerprint TEXT);
+        CREATE TABLE evidence_events (id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id TEXT NOT NULL,
+                                      kind TEXT NOT NULL, payload TEXT NOT NULL);
+        CREATE INDEX idx_evidence_events_tx ON evidence_events (transaction_id, id);
+    """)
+    conn.execute("INSERT INTO evidence VALUES ('TX1', 0, '2024-01-01T00:00:00+00:00', 'DEV')")
+    conn.execute("INSERT INTO evidence VALUES ('TX2', 0, '2024-01-01T00:00:00+00:00', 'DEV')")
+    conn.executemany(
+        "INSERT INTO evidence_events (transaction_id, kind, payload) VALUES (?, 'screenshot', ?)",
+        [("TX1", '"a.png"'), ("TX1", '"b.png"'), ("TX2", '"a.png"')]
+    )
+    conn.commit()
+    conn.close()
+
+    store = EvidenceStore(path)
+    assert store.get("TX1").screenshots == ["a.png", "b.png"]
+    assert store.storage_stats()["blobs"] == 2
+    store.close()
@@ -0,0 +1,99 @@
+"""
+Тесты скользящих окон статистики решений
+"""
+import multiprocessing
+
+import pytest
+
+from app.ml.fraud_detector import FraudDetector, Prediction
+from app.models import RiskLevel, TransactionResponse
+from services.live_stats import LiveStatistics
+
+
+class Clock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _response(probability: float, block: bool = False, three_ds: bool = False) -> TransactionResponse:
+    return TransactionResponse(
+        transaction_id="T",
+        is_fraud=probability > 0.5,
+        fraud_probability=probability,
+        risk_level=RiskLevel.LOW,
+        risk_score=probability * 100,
+        confidence=0.9,
+        recommendations=[],
+        requires_3d_secure=three_ds,
+        should_block=block,
+        risk_factors=[]
+    )
+
+
+def test_windows_roll_over():
+    """Тест: решения уходят из коротких окон и остаются в длинных"""
+    clock = Clock()
+    stats = LiveStatistics(clock=clock)
+    for index in range(100):
+        stats.record(_response(index / 100, block=index >= 90, three_ds=index % 4 == 0), latency_ms=1.0 + index / 10)
+
+    minute = stats.get_statistics()["1m"]
+    assert minute["decisions"] == 100
+    assert minute["tps"] == pytest.approx(100 / 60, abs=0.001)
+    assert minute["fraud_rate"] == 0.49
+    assert minute["block_rate"] == 0.1
+    assert minute["three_ds_rate"] == 0.25
+    assert minute["fraud_probability"]["p50"] == pytest.approx(0.5, abs=0.01)
+    assert minute["fraud_probability"]["p99"] == pytest.approx(0.99, abs=0.01)
+    assert minute["latency_ms"]["p50"] == pytest.approx(6.0, rel=0.125)
+
+    clock.now += 120
+    stats.record(_response(0.9, block=True), latency_ms=2.0)
+    windows = stats.get_statistics()
+    assert windows["1m"]["decisions"] == 1
+    assert windows["1m"]["block_rate"] == 1.0
+    assert windows["5m"]["decisions"] == 101
+    assert windows["24h"]["decisions"] == 101
+
+    clock.now += 2 * 3600
+    windows = stats.get_statistics()
+    assert windows["1h"]["decisions"] == 0
+    assert windows["1h"]["latency_ms"]["p50"] is None
+    assert windows["24h"]["decisions"] == 101
+
+
+def _record_in_worker(directory: str):
+    stats = LiveStatistics(directory)
+    stats.record(_response(0.1), latency_ms=5.0)
+    stats.close()
+
+
+def test_workers_are_aggregated(tmp_path):
+    """Тест: окна суммируются по файлам всех воркеров, включая завершенные"""
+    worker = multiprocessing.get_context("fork").Process(target=_record_in_worker, args=(str(tmp_path),))
+    worker.start()
+    worker.join()
+
+    stats = LiveStatistics(str(tmp_path))
+    for _ in range(3):
+        stats.record(_response(0.9, block=True), latency_ms=5.0)
+
+    windows = stats.get_statistics()
+    assert windows["worker_files"] == 2
+    assert windows["1m"]["decisions"] == 4
+    assert windows["1m"]["block_rate"] == 0.75
+    stats.close()
+
+
+def test_fraud_counted_at_configured_threshold(monkeypatch):
+    """Тест: мошенничество в статистике детектора - по FRAUD_THRESHOLD"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "FRAUD_THRESHOLD", 0.2)
+    detector = FraudDetector(model_path="missing")
+    detector._count(Prediction(0.3, "heuristic"))
+    detector._count(Prediction(0.1, "heuristic"))
+    assert detector.stats["fraud_detected"] == 1
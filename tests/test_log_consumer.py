@@ -0,0 +1,142 @@
+"""
+Тесты потребителя локального журнала транзакций
+"""
+import json
+import os
+
+import pytest
+
+from app.models import RiskLevel, TransactionResponse
+from services.log_consumer import LogConsumer
+
+scored = []
+
+
+async def _score_batch(transactions):
+    scored.extend(transaction.transaction_id for transaction in transactions)
+    return [
+        TransactionResponse(
+            transaction_id=transaction.transaction_id,
+            is_fraud=transaction.amount > 1000,
+            fraud_probability=0.9 if transaction.amount > 1000 else 0.1,
+            risk_level=RiskLevel.LOW,
+            risk_score=10.0,
+            confidence=0.9
+        )
+        for transaction in transactions
+    ]
+
+
+def _append(path, *lines, newline=True):
+    with open(path, 'a') as f:
+        for i, line in enumerate(lines):
+            last = i == len(lines) - 1
+            f.write(line + ("\n" if newline or not last else ""))
+
+
+def _tx(transaction_id, amount=100.0):
+    return json.dumps({"transaction_id": transaction_id, "type": "TRANSFER", "amount": amount})
+
+
+def _decisions(output_dir):
+    with open(os.path.join(output_dir, "p0.decisions.ndjson")) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.asyncio
+async def test_exactly_once_across_restarts(tmp_path):
+    """Тест: каждая запись попадает в журнал решений ровно один раз, в том числе после сбоя"""
+    scored.clear()
+    log_dir, output_dir = tmp_path / "in", str(tmp_path / "out")
+    partition = log_dir / "p0"
+    partition.mkdir(parents=True)
+    _append(partition / "00000000.ndjson", _tx("T1"), _tx("T2", 5000), '{"type": "PAYMENT", "amount": -1}')
+    # Последняя строка еще дописывается производителем
+    _append(partition / "00000000.ndjson", _tx("T3")[:10], newline=False)
+
+    consumer = LogConsumer(str(log_dir), output_dir, _score_batch, batch_size=2)
+    assert await consumer.run_once() == 3
+    decisions = _decisions(output_dir)
+    assert [d.get("decision", {}).get("transaction_id") for d in decisions] == ["T1", "T2", None]
+    assert decisions[1]["decision"]["is_fraud"] is True
+    assert "error" in decisions[2]
+    assert consumer.get_statistics()["lag_bytes"] == 10
+
+    # Сбой после записи решений, но до контрольной точки
+    with open(os.path.join(output_dir, "p0.decisions.ndjson"), 'a') as f:
+        f.write('{"partition": "p0", "uncommitted": true}\n')
+
+    _append(partition / "00000000.ndjson", _tx("T3")[10:])
+    _append(partition / "00000001.ndjson", _tx("T4"), _tx("T5"))
+
+    restarted = LogConsumer(str(log_dir), output_dir, _score_batch, batch_size=2)
+    assert await restarted.run_once() == 3
+    decisions = _decisions(output_dir)
+    ids = [d["decision"]["transaction_id"] for d in decisions if "decision" in d]
+    assert ids == ["T1", "T2", "T3", "T4", "T5"]
+    assert not any(d.get("uncommitted") for d in decisions)
+    assert [(d["segment"], d["offset"]) for d in decisions][-2:] == [
+        ("00000001.ndjson", 0), ("00000001.ndjson", len(_tx("T4")) + 1)
+    ]
+
+    stats = restarted.get_statistics()
+    assert stats == {
+        "lag_bytes": 0, "records": 6, "errors": 1,
+        "partitions": {"p0": {
+            "segment": "00000001.ndjson", "offset": 2 * (len(_tx("T4")) + 1),
+            "records": 6, "errors": 1, "lag_bytes": 0,
+        }},
+    }
+    assert scored == ["T1", "T2", "T3", "T4", "T5"]
+
+
+@pytest.mark.asyncio
+async def test_failures_become_error_decisions(tmp_path, monkeypatch):
+    """Тест: сбой декодера или оценки одной записи дает строку с error, позиция продвигается"""
+    from app.fastpath import transaction_decoder
+
+    decode = transaction_decoder.decode
+
+    def failing_decode(line):
+        if b"BROKEN" in line:
+            raise RuntimeError("decoder bug")
+        return decode(line)
+
+    async def score_batch(transactions):
+        if any(transaction.transaction_id == "POISON" for transaction in transactions):
+            raise RuntimeError("model failure")
+        return await _score_batch(transactions)
+
+    monkeypatch.setattr(transaction_decoder, "decode", failing_decode)
+    log_dir, output_dir = tmp_path / "in", str(tmp_path / "out")
+    partition = log_dir / "p0"
+    partition.mkdir(parents=True)
+    _append(partition / "00000000.ndjson", _tx("T1"), _tx("BROKEN"), _tx("POISON"), _tx("T2"))
+
+    consumer = LogConsumer(str(log_dir), output_dir, score_batch, batch_size=10)
+    assert await consumer.run_once() == 4
+    decisions = _decisions(output_dir)
+    assert [d.get("decision", {}).get("transaction_id") for d in decisions] == ["T1", None, None, "T2"]
+    assert "decoder bug" in decisions[1]["error"]
+    assert "model failure" in decisions[2]["error"]
+    stats = consumer.get_statistics()
+    assert stats["errors"] == 2 and stats["lag_bytes"] == 0
+
+
+@pytest.mark.asyncio
+async def test_side_effects_run_after_checkpoint(tmp_path):
+    """Тест: побочные эффекты получают только решения пакета, уже записанного в контрольную точку"""
+    log_dir, output_dir = tmp_path / "in", str(tmp_path / "out")
+    partition = log_dir / "p0"
+    partition.mkdir(parents=True)
+    _append(partition / "00000000.ndjson", _tx("T1"), '{"type": "PAYMENT", "amount": -1}', _tx("T2"))
+    committed = []
+
+    async def on_commit(responses):
+        with open(os.path.join(output_dir, "p0.checkpoint.json")) as f:
+            checkpoint = json.load(f)
+        committed.append((checkpoint["records"], [response.transaction_id for response in responses]))
+
+    consumer = LogConsumer(str(log_dir), output_dir, _score_batch, batch_size=2, on_commit=on_commit)
+    assert await consumer.run_once() == 3
+    assert committed == [(2, ["T1"]), (3, ["T2"])]
@@ -0,0 +1,50 @@
+"""
+Тесты гистограмм задержки
+"""
+import pytest
+
+from app.metrics import LatencyHistogram, Metrics, PROMETHEUS_BUCKETS
+
+
+def test_histogram_quantiles_within_precision():
+    """Тест: квантили в пределах погрешности ячеек, точные значения внизу шкалы"""
+    histogram = LatencyHistogram(precision_bits=7)
+    for value in range(1, 100_001):
+        histogram.record(value)
+
+    assert histogram.count == 100_000
+    assert histogram.max_us == 100_000
+    for q in (0.5, 0.9, 0.99, 0.999):
+        assert histogram.quantile(q) == pytest.approx(q * 100_000, rel=1 / 64)
+    assert histogram.quantile(1.0) == 100_000
+
+    small = LatencyHistogram(precision_bits=7)
+    for value in (3, 7, 100):
+        small.record(value)
+    assert [small.quantile(q) for q in (0.1, 0.5, 1.0)] == [4.0, 8.0, 100.0]
+    small.record(10 ** 15)  # больше диапазона - в последнюю ячейку
+    assert small.count == 4
+
+
+def test_prometheus_buckets_are_cumulative():
+    """Тест: ячейки le накопительные, +Inf и _count совпадают с числом измерений"""
+    metrics = Metrics()
+    for elapsed_ns in (50_000, 2_000_000, 2_000_000, 300_000_000):
+        metrics.observe_ns("stage", "model", elapsed_ns)
+    text = metrics.render_prometheus()
+
+    counts = [
+        int(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+        if line.startswith('fraudguard_stage_duration_seconds_bucket{stage="model"')
+    ]
+    assert len(counts) == len(PROMETHEUS_BUCKETS) + 1
+    assert counts == sorted(counts)
+    assert counts[PROMETHEUS_BUCKETS.index(0.0001)] == 1
+    assert counts[PROMETHEUS_BUCKETS.index(0.0025)] == 3
+    assert counts[-1] == 4
+    assert 'fraudguard_stage_duration_seconds_count{stage="model"} 4' in text
+
+    metrics.enabled = False
+    with metrics.stage("risk"):
+        pass
+    assert metrics.histogram("stage", "risk") is None
@@ -0,0 +1,126 @@
+"""
+Тесты деградации модели: срок запроса, выключатель, кэш предсказаний
+"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main
+from app.fastpath import transaction_decoder
+from app.deadline import Deadline
+from app.ml.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, LatencyCircuitBreaker
+from app.ml.fraud_detector import FraudDetector
+from app.models import TransactionRequest
+from services.risk_analyzer import RiskAnalyzer
+
+
+class SlowModel:
+    """Модель с настраиваемой задержкой предсказания"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, dmatrix):
+        self.calls += 1
+        time.sleep(self.delay)
+        return np.array([0.9])
+
+
+def _transaction(amount: float) -> TransactionRequest:
+    example = TransactionRequest.model_config["json_schema_extra"]["example"]
+    return TransactionRequest(**{**example, "amount": amount})
+
+
+def test_breaker_opens_on_slow_calls_and_recovers():
+    """Тест: доля медленных вызовов размыкает цепь, быстрые пробные вызовы замыкают"""
+    breaker = LatencyCircuitBreaker(slow_call_ms=10, window=4, min_calls=4, open_seconds=0.05, half_open_calls=2)
+    for elapsed in (1, 20, 1, 20):
+        assert breaker.allow()
+        breaker.record(elapsed)
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.allow()
+    assert breaker.state == STATE_HALF_OPEN
+    assert not breaker.allow()  # пробные вызовы исчерпаны
+    breaker.record(1)
+    breaker.record(1)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.get_statistics()["trips"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_model_falls_back_to_cache_then_heuristic():
+    """Тест: после срабатывания выключателя известные признаки - из кэша, новые - эвристика"""
+    breaker = LatencyCircuitBreaker(slow_call_ms=5, window=2, min_calls=2, open_seconds=60)
+    detector = FraudDetector(model_path="missing", breaker=breaker)
+    detector.model = SlowModel(delay=0.01)
+
+    first = await detector.score(_transaction(1000.0))
+    second = await detector.score(_transaction(2000.0))
+    assert (first.path, second.path) == ("model", "model")
+    assert breaker.state == STATE_OPEN
+
+    cached = await detector.score(_transaction(1000.0))
+    assert cached == (first.probability, "cache")
+    unseen = await detector.score(_transaction(3000.0))
+    assert unseen.path == "heuristic"
+    assert detector.model.calls == 2
+    assert detector.fallbacks == {"circuit_open": 2}
+
+
+@pytest.mark.asyncio
+async def test_model_skipped_when_budget_is_short():
+    """Тест: ожидаемая длительность вызова больше остатка срока - модель не вызывается"""
+    detector = FraudDetector(model_path="missing", breaker=LatencyCircuitBreaker(slow_call_ms=1000))
+    detector.model = SlowModel(delay=0.02)
+    assert (await detector.score(_transaction(1000.0), Deadline(1000))).path == "model"
+
+    result = await detector.score(_transaction(5000.0), Deadline(10), reserve_ms=1.0)
+    assert result.path == "heuristic"
+    assert detector.model.calls == 1
+    assert detector.fallbacks == {"deadline": 1}
+
+
+@pytest.mark.asyncio
+async def test_model_recovers_after_single_slow_call():
+    """Тест: после одного медленного вызова пробные вызовы возвращают оценку и модель"""
+    breaker = LatencyCircuitBreaker(slow_call_ms=1000, open_seconds=0.05, smoothing=0.5)
+    detector = FraudDetector(model_path="missing", breaker=breaker)
+    detector.model = SlowModel(delay=0.2)  # первый вызов после загрузки, пауза GC
+    assert (await detector.score(_transaction(1000.0), Deadline(1000))).path == "model"
+
+    detector.model.delay = 0.0
+    assert (await detector.score(_transaction(2000.0), Deadline(100))).path == "heuristic"
+    for attempt in range(20):
+        await asyncio.sleep(0.06)
+        await detector.score(_transaction(3000.0 + attempt), Deadline(100))
+        if breaker.expected_ms() < 20:
+            break
+    assert breaker.expected_ms() < 20
+    assert breaker.get_statistics()["probes"] >= 1
+    assert (await detector.score(_transaction(9000.0), Deadline(100))).path == "model"
+
+
+def test_deadline_header_selects_path(monkeypatch):
+    """Тест: X-Deadline-Ms доходит до модели через быстрый и обычный разбор тела"""
+    detector = FraudDetector(model_path="missing", breaker=LatencyCircuitBreaker(slow_call_ms=1000))
+    detector.model = SlowModel(delay=0.02)
+    monkeypatch.setattr(app.main, "fraud_detector", detector)
+    monkeypatch.setattr(app.main, "risk_analyzer", RiskAnalyzer())
+    client = TestClient(app.main.app)
+    body = TransactionRequest.model_config["json_schema_extra"]["example"]
+
+    assert client.post("/api/v1/analyze", json=body).json()["scoring_path"] == "model"
+    decoded = transaction_decoder.get_statistics()["fast"]
+    fast = client.post("/api/v1/analyze", json={**body, "amount": 77.0}, headers={"X-Deadline-Ms": "5"})
+    assert fast.json()["scoring_path"] == "heuristic"
+    assert transaction_decoder.get_statistics()["fast"] == decoded + 1
+
+    invalid = client.post("/api/v1/analyze", json=body, headers={"X-Deadline-Ms": "soon"})
+    assert invalid.status_code == 422
@@ -0,0 +1,104 @@
+"""
+Тесты ограничения частоты по клиентам
+"""
+import math
+from typing import List
+
+import httpx
+import pytest
+from fastapi import Body, FastAPI, Request
+
+from app.rate_limit import Bucket, RateLimiter, RateLimitMiddleware, TokenBucketTable, charge_rows
+
+TIERS = {
+    "ip": {"rate": 0.1, "burst": 10.0},
+    "default": {"rate": 0.1, "burst": 3.0},
+    "premium": {"rate": 0.1, "burst": 6.0},
+}
+
+
+def _app(limiter: RateLimiter) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, paths=["/api/v1/analyze", "/api/v1/batch-analyze"])
+
+    @app.post("/api/v1/analyze")
+    async def analyze():
+        return {"ok": True}
+
+    @app.post("/api/v1/batch-analyze")
+    async def batch_analyze(request: Request, rows: List[dict] = Body(...)):
+        await charge_rows(request, len(rows))
+        return {"rows": len(rows)}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+
+def test_lazy_refill_and_lru_eviction():
+    """Тест: токены пополняются по прошедшему времени, простаивающий клиент вытесняется"""
+    table = TokenBucketTable(max_entries=2)
+    a, b, c = (Bucket(name, rate=2.0, burst=4.0) for name in "abc")
+
+    assert table.take([a], 4, now=0.0) == 0.0
+    assert table.take([a], 1, now=0.0) == pytest.approx(0.5)
+    assert table.take([a], 1, now=0.5) == 0.0  # +1 токен за 0.5 с
+    assert table.take([a], 5, now=10.0) == math.inf  # больше burst
+
+    table.take([b], 1, now=11.0)
+    table.take([a], 1, now=12.0)
+    table.take([c], 1, now=13.0)  # вытесняет b - дольше всех без обращений
+    assert len(table) == 2 and table.evicted == 1
+    assert table.take([a], 3, now=13.0) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_tiers_and_ip_buckets():
+    """Тест: корзина ключа по уровню, неизвестный ключ - default, IP ограничивает все ключи вместе"""
+    limiter = RateLimiter(TIERS, api_keys={"partner": "premium", "other": "premium"})
+    transport = httpx.ASGITransport(app=_app(limiter))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def statuses(count, key=None):
+            headers = {"X-API-Key": key} if key else {}
+            return [(await client.post("/api/v1/analyze", headers=headers)).status_code for _ in range(count)]
+
+        assert await statuses(4, "partner") == [200] * 4
+        assert await statuses(4, "unknown") == [200] * 3 + [429]
+        # у IP осталось 10 - 4 - 3 = 3 токена на все ключи
+        assert await statuses(4, "other") == [200] * 3 + [429]
+        limited = await client.post("/api/v1/analyze")
+        health = await client.get("/health")
+
+    assert limited.status_code == 429
+    assert limited.headers["retry-after"] == "10"
+    assert health.status_code == 200
+    assert limiter.get_statistics()["clients"] == 4
+
+
+@pytest.mark.asyncio
+async def test_batch_is_weighted_by_rows():
+    """Тест: пакет списывает по токену на строку, пакет больше burst - 413 без списания"""
+    limiter = RateLimiter(TIERS)
+    transport = httpx.ASGITransport(app=_app(limiter))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        oversized = await client.post("/api/v1/batch-analyze", json=[{}] * 12)
+        first = await client.post("/api/v1/batch-analyze", json=[{}] * 7)
+        second = await client.post("/api/v1/batch-analyze", json=[{}] * 3)
+
+    assert oversized.status_code == 413 and "не больше 10 строк" in oversized.json()["detail"]
+    assert first.status_code == 200  # 1 токен за отклоненный пакет, 7 за этот
+    assert second.status_code == 429  # 1 токен при приеме, 2 на строки - осталось 1
+
+
+@pytest.mark.asyncio
+async def test_unreachable_backend_falls_back_to_memory():
+    """Тест: без Redis корзины ведутся в памяти воркера"""
+    limiter = RateLimiter(TIERS, backend_url="redis://127.0.0.1:1/0")
+    buckets = limiter.buckets("key", "10.0.0.1")
+    assert [await limiter.take(buckets) for _ in range(4)][:3] == [0.0] * 3
+    stats = limiter.get_statistics()
+    assert stats["backend_errors"] == 1
+    assert stats["limited"] == 1
+    await limiter.close()
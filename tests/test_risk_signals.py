@@ -0,0 +1,342 @@
+"""
+Тесты для индексов признаков риска
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from app.models import TransactionRequest
+from services.risk_analyzer import RiskAnalyzer
+from services.balance_tracker import BalanceTracker
+from services.blocklist import BlocklistManager, BloomFilter, entry_key
+from services.device_similarity import DeviceSimilarityIndex
+from services.enrichment import BinInfo, EnrichmentService, IpInfo, ip_to_int
+from services.transfer_graph import FraudLabelFeed, TransferGraph, UNREACHABLE
+
+
+def test_transfer_graph_degrees_and_components():
+    """Тест окон входящих переводов и компонент связности"""
+    graph = TransferGraph(window_seconds=3600)
+    graph.add_transfer("C1", "M1", 1000.0)
+    graph.add_transfer("C2", "M1", 2000.0)
+    graph.add_transfer("C3", "M1", 500.0)  # вне порядка
+    graph.add_transfer("C4", "C5", 2000.0)
+
+    assert graph.in_degree("M1", now=4200.0) == 2
+    assert graph.in_degree("M1", now=2000.0) == 3
+    assert graph.out_degree("C1", now=2000.0) == 1
+    assert graph.component_size("C1") == 4
+    assert graph.component_size("C4") == 2
+    assert graph.component_size("unknown") == 0
+
+
+def test_transfer_graph_distance_to_fraud():
+    """Тест расстояния до мошеннического счета"""
+    graph = TransferGraph(max_hops=3)
+    graph.add_transfer("A", "B", 1.0)
+    graph.add_transfer("B", "C", 2.0)
+    graph.add_transfer("X", "Y", 3.0)
+
+    assert graph.distance_to_fraud("A") == UNREACHABLE
+    graph.mark_fraud("C")
+    assert graph.distance_to_fraud("C") == 0
+    assert graph.distance_to_fraud("A") == 2
+    assert graph.distance_to_fraud("X") == UNREACHABLE
+
+
+def test_transfer_graph_prune_rebuilds_components():
+    """Тест очистки устаревших ребер"""
+    graph = TransferGraph(retention_seconds=100)
+    graph.add_transfer("A", "B", 0.0)
+    graph.add_transfer("B", "C", 500.0)
+
+    assert graph.prune(now=550.0) == 1
+    assert graph.edge_count == 1
+    assert graph.component_size("A") == 0  # ребер не осталось - счет освобожден
+    assert graph.component_size("C") == 2
+
+
+def test_transfer_graph_prune_in_thread_reuses_slots():
+    """Тест: очистка в потоке не теряет новые переводы, слоты устаревших счетов переиспользуются"""
+    graph = TransferGraph(retention_seconds=100)
+    for i in range(3 * 4096):
+        graph.add_transfer(f"OLD{i}", f"OLD{i + 1}", 0.0)
+    slots = graph.get_statistics()["accounts"]
+
+    async def prune_while_scoring():
+        task = asyncio.create_task(asyncio.to_thread(graph.prune, 1000.0))
+        i = 0
+        while not task.done():
+            graph.add_transfer(f"NEW{i}", f"NEW{i + 1}", 1000.0)
+            graph.get_features(f"NEW{i}", f"NEW{i + 1}", 1000.0)
+            i += 1
+            await asyncio.sleep(0)
+        return await task, i
+
+    removed, added = asyncio.run(prune_while_scoring())
+    assert removed == 3 * 4096
+    assert graph.edge_count == added
+    # Цепочка новых переводов - одна компонента, включая объединения за время пересчета
+    assert graph.component_size("NEW0") == added + 1
+    assert graph.component_size("OLD0") == 0
+
+    for i in range(slots):
+        graph.add_transfer(f"NEXT{i}", f"NEXT{i + 1}", 1000.0)
+    assert len(graph._names) <= slots + added + 2
+
+
+def test_fraud_labels_shared_between_workers(tmp_path):
+    """Тест: метка, добавленная одним воркером, попадает в граф другого через общий файл"""
+    path = str(tmp_path / "labels" / "fraud_labels.txt")
+    first, second = TransferGraph(), TransferGraph()
+    for graph in (first, second):
+        graph.add_transfer("A", "B", 1.0)
+    first_feed, second_feed = FraudLabelFeed(first, path), FraudLabelFeed(second, path)
+
+    assert first_feed.append(["B", " "]) == 1
+    assert first.distance_to_fraud("A") == 1
+    assert second.distance_to_fraud("A") == UNREACHABLE
+
+    with open(path, 'a') as f:
+        f.write("C")  # строка еще дописывается
+    assert second_feed.poll() == 1
+    assert second.distance_to_fraud("A") == 1
+    with open(path, 'a') as f:
+        f.write("\n")
+    assert second_feed.poll() == 1
+    assert second_feed.poll() == 0
+    assert second.get_statistics()["fraud_accounts"] == 2
+
+
+@pytest.mark.asyncio
+async def test_risk_analyzer_mule_pattern():
+    """Тест паттерна TRANSFER → CASH_OUT через счет-посредник"""
+    analyzer = RiskAnalyzer(transfer_graph=TransferGraph())
+
+    await analyzer.assess_risk(TransactionRequest(
+        type="TRANSFER", amount=1000.0, nameOrig="C_victim", nameDest="C_mule"
+    ), 0.1)
+    assessment = await analyzer.assess_risk(TransactionRequest(
+        type="CASH_OUT", amount=1000.0, nameOrig="C_mule", nameDest="C_out"
+    ), 0.1)
+
+    assert any("посредник" in factor for factor in assessment.risk_factors)
+
+
+def test_balance_tracker_discontinuity_and_eviction(tmp_path):
+    """Тест разрыва балансов, вытеснения и снимка"""
+    tracker = BalanceTracker(max_accounts=2, snapshot_path=str(tmp_path / "balances.json"))
+
+    first = tracker.observe("C1", 1000.0, 800.0, "C2", 0.0, 200.0)
+    assert first == {"orig_discontinuity": None, "dest_discontinuity": None}
+
+    second = tracker.observe("C1", 5000.0, 4900.0, "C2", 200.0, 300.0)
+    assert second["orig_discontinuity"] == 4200.0
+    assert second["dest_discontinuity"] == 0.0
+
+    tracker.update("C3", 10.0)
+    assert tracker.get("C1") is None  # вытеснен как давно не встречавшийся
+    assert tracker.evicted == 1
+
+    tracker.save_snapshot()
+    restored = BalanceTracker(max_accounts=2, snapshot_path=str(tmp_path / "balances.json"))
+    assert restored.load_snapshot() == 2
+    assert restored.get("C2") == 300.0
+    assert restored.get("C3") == 10.0
+
+
+def test_balance_snapshots_per_process(tmp_path):
+    """Тест: снимок в файле процесса, снимки завершенных процессов добавляются при загрузке"""
+    finished = multiprocessing.get_context("fork").Process(target=lambda: None)
+    finished.start()
+    finished.join()
+    path = str(tmp_path / "balances.json")
+    (tmp_path / "balances.json").write_text('[["OLD", 1.0]]')
+    (tmp_path / f"balances.{finished.pid}.json").write_text('[["DEAD", 2.0]]')
+    alive = tmp_path / f"balances.{os.getppid()}.json"
+    alive.write_text('[["ALIVE", 3.0]]')
+
+    tracker = BalanceTracker(snapshot_path=path)
+    assert tracker.load_snapshot() == 2
+    assert (tracker.get("OLD"), tracker.get("DEAD"), tracker.get("ALIVE")) == (1.0, 2.0, None)
+    tracker.update("NEW", 4.0)
+    tracker.save_snapshot()
+    assert sorted(os.listdir(tmp_path)) == sorted([alive.name, f"balances.{os.getpid()}.json"])
+
+
+def test_enrichment_lookup_and_atomic_reload(tmp_path):
+    """Тест индексов IP/BIN и перезагрузки нового файла"""
+    ip_csv = tmp_path / "ip_ranges.csv"
+    ip_csv.write_text(
+        "ip_start,ip_end,country,region,asn,is_hosting\n"
+        "5.0.0.0,5.255.255.255,RU,Москва,12389,0\n"
+        "2001:db8::,2001:db8::ffff,NL,Amsterdam,1136,0\n"
+        "not-an-ip,6.0.0.0,XX,,0,0\n"
+        "16777216,16777471,AU,Sydney,13335,1\n",
+        encoding="utf-8"
+    )
+    bin_csv = tmp_path / "bin_ranges.csv"
+    bin_csv.write_text(
+        "bin_start,bin_end,issuer_country,card_type\n"
+        "220000,220499,RU,MIR\n"
+        ",,XX,VISA\n"
+        "41x111,411111,XX,VISA\n"
+        "411111,411111,US,VISA\n",
+        encoding="utf-8"
+    )
+
+    service = EnrichmentService(str(ip_csv), str(bin_csv))
+    assert service.reload()
+
+    assert service.lookup_ip("5.1.2.3") == IpInfo("RU", "Москва", 12389, False)
+    assert service.lookup_ip("1.0.0.1").is_hosting
+    assert service.lookup_ip("2.0.0.1") is None
+    assert service.lookup_ip("::1") is None
+    assert service.lookup_bin("22004512") == BinInfo("RU", "MIR")
+    assert service.lookup_bin("411111") == BinInfo("US", "VISA")
+    assert service.lookup_bin("411112") is None
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+    # Новый файл подменяет индекс, старый объект продолжает работать
+    old_index = service.ip_index
+    ip_csv.write_text(
+        "ip_start,ip_end,country,region,asn,is_hosting\n"
+        "5.0.0.0,5.255.255.255,DE,Berlin,3320,0\n",
+        encoding="utf-8"
+    )
+    os.utime(ip_csv, (time.time() + 10, time.time() + 10))
+    assert service.reload()
+    assert service.lookup_ip("5.1.2.3").country == "DE"
+    assert old_index.lookup(ip_to_int("5.1.2.3"))[0] == "RU"
+
+    # Пересекающиеся диапазоны: ошибка в журнале, прежний индекс остается
+    ip_csv.write_text(
+        "ip_start,ip_end,country,region,asn,is_hosting\n"
+        "5.0.0.0,5.255.255.255,FR,Paris,3215,0\n"
+        "5.1.0.0,5.1.255.255,FR,Lyon,3215,0\n",
+        encoding="utf-8"
+    )
+    os.utime(ip_csv, (time.time() + 20, time.time() + 20))
+    assert not service.reload()
+    assert service.lookup_ip("5.1.2.3").country == "DE"
+
+
+@pytest.mark.asyncio
+async def test_risk_analyzer_uses_derived_countries(tmp_path):
+    """Тест: страны берутся из индексов, а не из запроса"""
+    ip_csv = tmp_path / "ip_ranges.csv"
+    ip_csv.write_text(
+        "ip_start,ip_end,country,region,asn,is_hosting\n"
+        "5.0.0.0,5.255.255.255,DE,Berlin,3320,0\n",
+        encoding="utf-8"
+    )
+    service = EnrichmentService(str(ip_csv), None)
+    service.reload()
+    analyzer = RiskAnalyzer(enrichment=service)
+
+    assessment = await analyzer.assess_risk(TransactionRequest(
+        type="PAYMENT", amount=1000.0, ip_address="5.1.2.3",
+        issuer_country="RU", ip_country="RU"
+    ), 0.1)
+
+    assert "Карта из RU, IP из DE" in assessment.risk_factors
+
+
+def test_blocklist_bloom_and_exact_set(tmp_path):
+    """Тест списков блокировки: импорт, проверка, массовое обновление"""
+    (tmp_path / "device.txt").write_text("bad-device-1\nBAD-DEVICE-2\n", encoding="utf-8")
+    manager = BlocklistManager(str(tmp_path), fp_rate=0.01)
+    assert manager.reload() == ["device"]
+
+    assert manager.check("device", "bad-device-2")
+    assert not manager.check("device", "good-device")
+    assert not manager.check("ip", "10.0.0.1")
+
+    assert manager.bulk_update("device", add=["bad-device-3"], remove=["bad-device-1"]) == 2
+    assert manager.check("device", "bad-device-3")
+    assert not manager.check("device", "bad-device-1")
+
+    # Скомпилированный список переживает перезапуск и не перетирается исходным файлом
+    restarted = BlocklistManager(str(tmp_path))
+    restarted.reload()
+    assert restarted.check("device", "bad-device-3")
+    assert restarted.get_statistics()["device"]["entries"] == 2
+
+    # Обновление через воркер, не загрузивший чужое изменение, его не теряет
+    restarted.bulk_update("device", add=["bad-device-4"])
+    assert manager.bulk_update("device", remove=["bad-device-2"]) == 2
+    assert manager.check("device", "bad-device-4")
+    assert not manager.check("device", "bad-device-2")
+
+
+def test_bloom_filter_false_positive_rate():
+    """Тест доли ложных срабатываний фильтра Блума"""
+    keys = np.array([entry_key(f"entry-{i}") for i in range(20000)], dtype=np.uint64)
+    bloom = BloomFilter.build(keys, fp_rate=0.01)
+
+    assert all(int(key) in bloom for key in keys[:1000])
+    false_positives = sum(entry_key(f"other-{i}") in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_device_similarity_links_farms_not_stock_browsers():
+    """Тест: одинаковый стоковый браузер не связывает клиентов, общее устройство и подсеть - связывают"""
+    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.6099.110 Safari/537.36"
+
+    def device(customer, ua=user_agent, device_id=None, ip=None, timestamp=None):
+        return TransactionRequest(
+            type="PAYMENT", amount=100.0, customer_id=customer, user_agent=ua, device_id=device_id,
+            ip_address=ip, device_os="Windows", browser="Chrome 120", timestamp=timestamp
+        )
+
+    now = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+    # Только общие токены: массовый отпечаток не дает сигнала
+    stock = DeviceSimilarityIndex(capacity=100, similarity_threshold=0.7, max_cluster_share=0.05)
+    assert [stock.observe(device(f"S{i}", timestamp=now), f"S{i}") for i in range(10)] == [0] * 10
+    assert stock.get_statistics()["common_suppressed"] == 9
+
+    index = DeviceSimilarityIndex(capacity=100, similarity_threshold=0.7, max_cluster_share=0.05)
+    customers = [
+        device(f"C{i}", device_id=f"dev-{i}", ip=f"10.{i}.0.1", timestamp=now) for i in range(50)
+    ]
+    assert [index.observe(transaction, transaction.customer_id) for transaction in customers] == [0] * 50
+
+    # Ферма: одно устройство и подсеть у разных клиентов
+    farm = dict(device_id="farm-1", timestamp=now)
+    assert index.observe(device("A", ip="203.0.113.5", **farm), "A") == 0
+    assert index.observe(device("A", ip="203.0.113.5", **farm), "A") == 0  # тот же клиент
+    assert index.observe(device("B", ip="203.0.113.6", **farm), "B") == 1
+    assert index.observe(device("C", user_agent + " Edg/120.0", ip="203.0.113.7", **farm), "C") == 2
+
+    # Записи старше окна не учитываются
+    later = now + timedelta(hours=25)
+    index.rebuild(now=later.timestamp())
+    assert index.observe(device("E", ip="203.0.113.8", device_id="farm-1", timestamp=later), "E") == 0
+
+
+def test_device_similarity_expires_incrementally():
+    """Тест: вытесненные и устаревшие записи уходят из корзин без перестройки"""
+    index = DeviceSimilarityIndex(capacity=4, window_seconds=100)
+    signatures = [index.signature({f"token:{i}", f"other:{i}"}) for i in range(6)]
+
+    for i, signature in enumerate(signatures[:4]):
+        index.add(f"C{i}", signature, timestamp=float(i))
+    assert index.get_statistics()["buckets"] == 4 * index.bands
+
+    # Пятая запись вытесняет первую
+    index.add("C4", signatures[4], timestamp=4.0)
+    assert index.count_similar_customers(signatures[0], now=4.0) == 0
+    assert index.get_statistics()["buckets"] == 4 * index.bands
+
+    # Окно истекло: каждое добавление удаляет до двух старых записей
+    index.add("C5", signatures[5], timestamp=1000.0)
+    index.add("C5", signatures[5], timestamp=1000.0)
+    assert index.get_statistics()["entries"] == 2
+    assert index.get_statistics()["buckets"] == index.bands
+    assert index.count_similar_customers(signatures[5], now=1000.0) == 1
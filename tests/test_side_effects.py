@@ -0,0 +1,134 @@
+"""
+Тесты конвейера побочных эффектов
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from services.side_effects import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_SPILL,
+    SideEffectPipeline,
+    Sink
+)
+
+
+def _sink(name, handler, overflow, tmp_path, capacity=3):
+    return Sink(
+        name, handler, capacity=capacity, batch_size=2, overflow=overflow,
+        spill_dir=str(tmp_path), encode=str, decode=str.strip
+    )
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_bounds_queue(tmp_path):
+    """Тест: медленный приемник не копит больше capacity событий"""
+    sink = _sink("slow", lambda events: None, OVERFLOW_DROP_OLDEST, tmp_path)
+    for i in range(10):
+        await sink.put(str(i))
+
+    stats = sink.get_statistics()
+    assert stats["depth"] == 3
+    assert stats["dropped"] == 7
+
+
+@pytest.mark.asyncio
+async def test_spill_preserves_order_across_restart(tmp_path):
+    """Тест: переполнение уходит в файл, события обрабатываются по порядку и после перезапуска"""
+    sink = _sink("evidence", lambda events: None, OVERFLOW_SPILL, tmp_path)
+    for i in range(6):
+        await sink.put(str(i))
+    assert sink.get_statistics()["spilled"] == 3
+    assert sink.spill_remaining() == 3
+
+    received = []
+    restarted = _sink("evidence", received.extend, OVERFLOW_SPILL, tmp_path)
+    pipeline = SideEffectPipeline([restarted])
+    pipeline.start()
+    await pipeline.submit("6")
+    await pipeline.stop(timeout=2.0)
+
+    assert received == ["0", "1", "2", "3", "4", "5", "6"]
+    assert restarted.get_statistics()["spilled_pending"] == 0
+
+
+def _drain_in_worker(spill_dir, barrier, results):
+    sink = _sink("evidence", lambda events: None, OVERFLOW_SPILL, spill_dir)
+    barrier.wait()  # оба воркера запущены и живы
+    events = []
+    while sink.get_statistics()["spilled_pending"]:
+        events.extend(event for _, event in sink._read_spilled(10))
+    results.put(events)
+
+
+def test_spill_files_claimed_by_one_worker(tmp_path):
+    """Тест: файл завершенного процесса забирает ровно один воркер, файл живого не трогается"""
+    context = multiprocessing.get_context("fork")
+    finished = context.Process(target=lambda: None)
+    finished.start()
+    finished.join()
+
+    (tmp_path / "evidence.jsonl").write_text("0\n1\n")
+    (tmp_path / f"evidence.{finished.pid}.jsonl").write_text("2\n3\n4\n")
+    alive = tmp_path / f"evidence.{os.getppid()}.jsonl"
+    alive.write_text("live\n")
+
+    barrier, results = context.Barrier(2), context.Queue()
+    workers = [context.Process(target=_drain_in_worker, args=(tmp_path, barrier, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    drained = [results.get(timeout=10) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    assert sorted(event for events in drained for event in events) == ["0", "1", "2", "3", "4"]
+    assert alive.read_text() == "live\n"
+
+
+@pytest.mark.asyncio
+async def test_truncated_spill_line_is_skipped(tmp_path):
+    """Тест: оборванная строка в файле завершенного процесса пропускается, остальные события обрабатываются"""
+    finished = multiprocessing.get_context("fork").Process(target=lambda: None)
+    finished.start()
+    finished.join()
+    (tmp_path / f"evidence.{finished.pid}.jsonl").write_text('"0"\n"1"\n"2\n"3"\n"4')
+
+    received = []
+    sink = Sink(
+        "evidence", received.extend, capacity=3, batch_size=2, overflow=OVERFLOW_SPILL,
+        spill_dir=str(tmp_path), encode=json.dumps, decode=json.loads
+    )
+    pipeline = SideEffectPipeline([sink])
+    pipeline.start()
+    await pipeline.submit("5")
+    await sink.join()
+    await pipeline.submit("6")
+    await pipeline.stop(timeout=2.0)
+
+    stats = sink.get_statistics()
+    assert received == ["0", "1", "3", "5", "6"]
+    assert (stats["corrupt"], stats["spilled_pending"], stats["spilled"]) == (2, 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_block_applies_backpressure(tmp_path):
+    """Тест: при политике block отправитель ждет освобождения места"""
+    received = []
+
+    async def handler(events):
+        await asyncio.sleep(0.01)
+        received.extend(events)
+
+    pipeline = SideEffectPipeline([_sink("blocking", handler, OVERFLOW_BLOCK, tmp_path, capacity=2)])
+    pipeline.start()
+    for i in range(8):
+        await pipeline.submit(i)
+        assert pipeline.get_statistics()["blocking"]["depth"] <= 2
+    await pipeline.stop(timeout=2.0)
+
+    assert received == list(range(8))
+    assert pipeline.get_statistics()["blocking"]["batches"] >= 4
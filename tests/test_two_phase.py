@@ -0,0 +1,173 @@
+"""
+Тесты двухфазных решений и доставки в webhook
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import BackgroundTasks
+
+import app.main
+from app.ml.fraud_detector import Prediction
+from app.models import RiskAssessment, RiskLevel, TransactionRequest
+from services import webhook
+from services.refinement import DecisionRefiner
+from services.side_effects import DecisionEvent, SideEffectPipeline, Sink
+from services.webhook import WebhookSender
+
+
+class WebhookStandIn:
+    """Локальный HTTP-сервер вместо webhook: первые fail_first запросов - 503"""
+
+    def __init__(self, fail_first: int = 0):
+        self.fail_first = fail_first
+        self.requests = 0
+        self.batches = []
+        self._server = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/decisions"
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = dict(
+                    line.lower().split(": ", 1) for line in head.decode().split("\r\n")[1:] if ": " in line
+                )
+                body = await reader.readexactly(int(headers["content-length"]))
+
+                self.requests += 1
+                if self.requests <= self.fail_first:
+                    status = b"503 Service Unavailable"
+                else:
+                    status = b"200 OK"
+                    self.batches.append(json.loads(body)["decisions"])
+                writer.write(b"HTTP/1.1 " + status + b"\r\ncontent-length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+
+def _assessment(level: RiskLevel, score: float, should_block: bool) -> RiskAssessment:
+    return RiskAssessment(
+        risk_level=level,
+        risk_score=score,
+        confidence=0.8,
+        requires_3d_secure=should_block,
+        should_block=should_block,
+        risk_factors=[]
+    )
+
+
+class GraphAwareAnalyzer:
+    """Анализатор, у которого полная оценка находит риск, невидимый предварительной"""
+
+    async def assess_risk(self, transaction, fraud_probability, stateful_checks=True):
+        if stateful_checks and transaction.nameDest.startswith("MULE"):
+            return _assessment(RiskLevel.CRITICAL, 95.0, True)
+        return _assessment(RiskLevel.LOW, 10.0, False)
+
+
+@pytest.mark.asyncio
+async def test_webhook_retries_and_batches():
+    """Тест: пакет доставляется одним запросом после временной ошибки 503"""
+    stand_in = WebhookStandIn(fail_first=2)
+    url = await stand_in.start()
+    sender = WebhookSender(url, max_retries=3, retry_backoff=0.01)
+    sink = Sink("webhook", sender.send, batch_size=10, overflow="drop_oldest")
+    pipeline = SideEffectPipeline([sink])
+    pipeline.start()
+
+    transaction = TransactionRequest(**TransactionRequest.model_config["json_schema_extra"]["example"])
+    assessment = _assessment(RiskLevel.LOW, 10.0, False)
+    for i in range(5):
+        response = app.main._build_response(transaction, 0.1, assessment, [], transaction_id=f"TX{i}")
+        await pipeline.submit(DecisionEvent(transaction, 0.1, assessment, response))
+    await pipeline.stop(timeout=5.0)
+    await sender.close()
+    await stand_in.close()
+
+    stats = sender.get_statistics()
+    assert stats["delivered"] == 5
+    assert stats["failed"] == 0
+    assert stats["retries"] == 2
+    assert [[decision["transaction_id"] for decision in batch] for batch in stand_in.batches] == [
+        [f"TX{i}" for i in range(5)]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_webhook_retry_after_is_capped(monkeypatch):
+    """Тест: Retry-After ответа не задерживает повтор дольше max_retry_delay"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(webhook.asyncio, "sleep", sleep)
+    statuses = iter([503, 429, 200])
+    sender = WebhookSender("http://webhook.test/decisions", max_retries=3, retry_backoff=0.5)
+    sender._client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(next(statuses), headers={"Retry-After": "86400"})
+    ))
+    await sender.send([])
+    await sender.close()
+
+    assert delays == [4.0, 4.0]  # 0.5 * 2^3
+    assert sender.get_statistics()["failed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_provisional_decision_is_refined(monkeypatch, tmp_path):
+    """Тест: ответ предварительный, окончательное решение уходит в побочные эффекты с тем же id"""
+    published = []
+    side_effects = SideEffectPipeline([Sink("capture", published.extend, overflow="drop_oldest")])
+    analyzer = GraphAwareAnalyzer()
+    refiner = DecisionRefiner(analyzer, app.main._finalize_decision, side_effects.submit)
+    refinement = SideEffectPipeline([Sink(
+        "refinement", refiner.refine_batch, overflow="spill", spill_dir=str(tmp_path)
+    )])
+
+    class Detector:
+        async def score(self, transaction, deadline=None, reserve_ms=0.0):
+            return Prediction(0.2, "model")
+
+    monkeypatch.setattr(app.main, "fraud_detector", Detector())
+    monkeypatch.setattr(app.main, "risk_analyzer", analyzer)
+    monkeypatch.setattr(app.main, "side_effects", side_effects)
+    monkeypatch.setattr(app.main, "refiner", refiner)
+    monkeypatch.setattr(app.main, "refinement", refinement)
+    side_effects.start()
+    refinement.start()
+
+    example = TransactionRequest.model_config["json_schema_extra"]["example"]
+    responses = []
+    for i, destination in enumerate(["M1", "MULE7", "M2", "M3"]):
+        transaction = TransactionRequest(**{**example, "transaction_id": f"TX{i}", "nameDest": destination})
+        responses.append(await app.main.analyze_transaction(transaction, BackgroundTasks()))
+
+    await refinement.stop(timeout=2.0)
+    await side_effects.stop(timeout=2.0)
+
+    assert {response.decision_stage for response in responses} == {"provisional"}
+    assert not any(response.should_block for response in responses)
+
+    finals = {event.response.transaction_id: event.response for event in published}
+    assert sorted(finals) == ["TX0", "TX1", "TX2", "TX3"]
+    assert {response.decision_stage for response in finals.values()} == {"final"}
+    assert finals["TX1"].should_block and finals["TX1"].risk_level == RiskLevel.CRITICAL
+
+    stats = refiner.get_statistics()
+    assert stats["provisional"] == 4
+    assert stats["refined"] == 4
+    assert stats["changed"] == 1
+    assert stats["escalated"] == 1
+    assert stats["change_rate"] == 0.25
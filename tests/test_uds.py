@@ -0,0 +1,103 @@
+"""
+Тесты приема транзакций через Unix-сокет
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.fastpath import transaction_decoder
+from app.models import RiskLevel, TransactionResponse
+from app.uds import ScoringServer
+from app.uds_client import ScoringClient, ScoringError
+
+
+async def _score(transaction):
+    if transaction.amount == 503:
+        raise HTTPException(status_code=503, detail="Модель не загружена")
+    # Крупные суммы обрабатываются дольше: ответы приходят не по порядку
+    await asyncio.sleep(transaction.amount / 10_000)
+    return TransactionResponse(
+        transaction_id=transaction.transaction_id,
+        is_fraud=False,
+        fraud_probability=0.1,
+        risk_level=RiskLevel.LOW,
+        risk_score=10.0,
+        confidence=0.9,
+        timestamp=datetime(2024, 1, 1, tzinfo=timezone.utc)
+    )
+
+
+@pytest.mark.asyncio
+async def test_pipelined_requests_over_unix_socket(tmp_path):
+    """Тест: много запросов в одном соединении, ответы сопоставляются по request_id"""
+    server = ScoringServer(str(tmp_path / "scoring.sock"), _score, max_in_flight=8)
+    await server.start()
+    try:
+        async with ScoringClient(server.path) as client:
+            results = await asyncio.gather(*(
+                client.analyze({"transaction_id": f"TX{i}", "type": "PAYMENT", "amount": 100 - i})
+                for i in range(50)
+            ))
+            assert [result["transaction_id"] for result in results] == [f"TX{i}" for i in range(50)]
+            assert results[0]["timestamp"] == "2024-01-01T00:00:00Z"
+
+            with pytest.raises(ScoringError) as invalid:
+                await client.analyze({"type": "PAYMENT", "amount": -1})
+            assert invalid.value.status == 422
+            assert invalid.value.detail[0]["loc"] == ["amount"]
+
+            with pytest.raises(ScoringError) as unavailable:
+                await client.analyze({"type": "PAYMENT", "amount": 503})
+            assert unavailable.value.status == 503
+
+        stats = server.get_statistics()
+        assert stats["requests"] == 52
+        assert stats["errors"] == 2
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_decoder_error_returns_frame(tmp_path, monkeypatch):
+    """Тест: исключение при разборе тела - кадр 500, а не зависший клиент"""
+    def broken(body):
+        raise RuntimeError("decoder")
+
+    monkeypatch.setattr(transaction_decoder, "decode", broken)
+    server = ScoringServer(str(tmp_path / "scoring.sock"), _score)
+    await server.start()
+    try:
+        async with ScoringClient(server.path) as client:
+            with pytest.raises(ScoringError) as failed:
+                await asyncio.wait_for(client.analyze({"type": "PAYMENT", "amount": 1}), 2)
+            assert failed.value.status == 500
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_single_owner_and_takeover(tmp_path):
+    """Тест: сокет обслуживает один процесс, после его остановки - следующий"""
+    path = str(tmp_path / "scoring.sock")
+    owner = ScoringServer(path, _score)
+    standby = ScoringServer(path, _score, takeover_interval=0.01)
+    await owner.start()
+    await standby.start()
+    try:
+        assert owner.serving and not standby.serving
+        async with ScoringClient(path) as client:
+            assert (await client.analyze({"transaction_id": "A", "type": "PAYMENT", "amount": 1}))["transaction_id"] == "A"
+
+        await owner.close()
+        for _ in range(100):
+            if standby.serving:
+                break
+            await asyncio.sleep(0.01)
+        assert standby.serving
+        async with ScoringClient(path) as client:
+            assert (await client.analyze({"transaction_id": "B", "type": "PAYMENT", "amount": 1}))["transaction_id"] == "B"
+    finally:
+        await owner.close()
+        await standby.close()
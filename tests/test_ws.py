@@ -0,0 +1,276 @@
+"""
+Тесты рассылки WebSocket
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.pubsub import Broadcaster, PubSubServer
+from app.ws_codec import decode_frame, encode_batch, encode_event
+from app.ws import (
+    SLOW_CLIENT_DISCONNECT,
+    SLOW_CLIENT_DROP_OLDEST,
+    AnalysisPublisher,
+    ConnectionManager,
+    SubscriptionFilter
+)
+
+
+class FakeWebSocket:
+    """Клиент с управляемой задержкой отправки"""
+
+    def __init__(self, blocked: bool = False):
+        self.received = []
+        self.closed = False
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def send_text(self, message: str):
+        await self.gate.wait()
+        self.received.append(message)
+
+    async def send_bytes(self, message: bytes):
+        await self.gate.wait()
+        self.received.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others():
+    """Тест: зависший клиент не задерживает остальных, его очередь ограничена"""
+    manager = ConnectionManager(max_queue=2, slow_client_policy=SLOW_CLIENT_DROP_OLDEST)
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    manager.register(fast)
+    manager.register(slow)
+
+    for i in range(5):
+        await manager.broadcast_message({"n": i})
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+    assert len(fast.received) == 5
+    assert manager.get_statistics()["max_queue_depth"] <= 2
+    assert manager.clients[slow].dropped >= 2
+
+    slow.gate.set()
+    await asyncio.sleep(0.01)
+    assert json.loads(slow.received[-1]) == {"n": 4, "seq": 5}
+
+    manager.disconnect(fast)
+    manager.disconnect(slow)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_disconnected_by_policy():
+    """Тест: при политике disconnect медленный клиент отключается"""
+    manager = ConnectionManager(max_queue=1, slow_client_policy=SLOW_CLIENT_DISCONNECT)
+    slow = FakeWebSocket(blocked=True)
+    manager.register(slow)
+
+    for i in range(3):
+        await manager.broadcast_message({"n": i})
+    await asyncio.sleep(0.01)
+
+    assert slow not in manager.active_connections
+    assert slow.closed
+    assert manager.get_statistics()["slow_disconnects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_subscription_filters_and_coalesces(monkeypatch):
+    """Тест: подписчики с одним фильтром в одной группе, кадры пакетные, потери в summary"""
+    monkeypatch.setattr(settings, "WS_MAX_EVENTS_PER_FRAME", 2)
+    manager = ConnectionManager()
+    first, second, plain = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    for websocket in (first, second, plain):
+        manager.register(websocket)
+
+    subscription = SubscriptionFilter.from_message(
+        {"action": "subscribe", "min_risk_score": 70, "types": ["transfer"], "max_fps": 20}
+    )
+    manager.subscribe(first, subscription)
+    manager.subscribe(second, subscription)
+    assert len(manager.groups) == 1
+
+    events = [
+        {"transaction_id": "LOW", "risk_score": 10.0, "is_fraud": False, "transaction_type": "TRANSFER"},
+        {"transaction_id": "PAYMENT", "risk_score": 90.0, "is_fraud": True, "transaction_type": "PAYMENT"},
+    ] + [
+        {"transaction_id": f"HIGH{i}", "risk_score": 80.0 + i, "is_fraud": True, "transaction_type": "TRANSFER"}
+        for i in range(4)
+    ]
+    for event in events:
+        await manager.broadcast_message(event)
+    await asyncio.sleep(0.15)
+
+    assert len(plain.received) == len(events)
+    assert first.received == second.received
+    batch, summary = [json.loads(frame) for frame in first.received]
+    assert [event["transaction_id"] for event in batch["events"]] == ["HIGH0", "HIGH1"]
+    assert summary == {"type": "summary", "dropped": 2, "dropped_fraud": 2, "dropped_max_risk_score": 83.0}
+
+    for websocket in (first, second, plain):
+        manager.disconnect(websocket)
+    assert not manager.groups
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_sockets_of_other_workers():
+    """Тест: сообщение, оцененное одним воркером, получают клиенты другого (через pub/sub по RESP)"""
+    server = PubSubServer(port=0)
+    await server.start()
+    url = f"redis://127.0.0.1:{server.port}"
+
+    workers = []
+    for _ in range(2):
+        connections = ConnectionManager()
+        websocket = FakeWebSocket()
+        connections.register(websocket)
+        publisher = AnalysisPublisher(Broadcaster(url), connections, interval_ms=5)
+        await publisher.start()
+        workers.append((connections, websocket, publisher))
+
+    first, second = workers
+    for i in range(3):
+        first[2].publish({"transaction_id": f"TX{i}", "risk_score": 10.0, "is_fraud": False})
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if len(second[1].received) == 3 and len(first[1].received) == 3:
+            break
+
+    assert [json.loads(m)["transaction_id"] for m in second[1].received] == ["TX0", "TX1", "TX2"]
+    assert len(first[1].received) == 3
+    # Номера выданы при публикации: одинаковые у всех воркеров
+    assert [json.loads(m)["seq"] for m in second[1].received] == [1, 2, 3]
+    assert first[0].replay.stream_id == second[0].replay.stream_id
+    assert first[0].replay.since(1) == second[0].replay.since(1)
+    stats = first[2].get_statistics()
+    assert stats["publishes"] == 1 and stats["published_messages"] == 3
+    assert second[2].get_statistics()["received_batches"] == 1
+
+    for connections, websocket, publisher in workers:
+        await publisher.stop()
+        connections.disconnect(websocket)
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_publisher_resubscribes_after_connection_drop():
+    """Тест: после обрыва соединения с pub/sub воркер переподписывается и снова получает сообщения"""
+    server = PubSubServer(port=0)
+    await server.start()
+    connections = ConnectionManager()
+    websocket = FakeWebSocket()
+    connections.register(websocket)
+    publisher = AnalysisPublisher(
+        Broadcaster(f"redis://127.0.0.1:{server.port}"), connections, interval_ms=5, reconnect_delay=0.01
+    )
+    await publisher.start()
+
+    # Обрыв подписки на стороне сервера
+    for writers in server.channels.values():
+        for writer in list(writers):
+            writer.close()
+    for _ in range(200):
+        await asyncio.sleep(0.01)
+        stats = publisher.get_statistics()
+        if stats["reconnects"] and stats["subscribed"]:
+            break
+    assert publisher.get_statistics()["subscribed"]
+
+    publisher.publish({"transaction_id": "TX1", "risk_score": 10.0, "is_fraud": False})
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if websocket.received:
+            break
+    assert [json.loads(m)["transaction_id"] for m in websocket.received] == ["TX1"]
+
+    await publisher.stop()
+    connections.disconnect(websocket)
+    await server.close()
+
+    # Недоступный бэкенд: старт завершается ошибкой, а не ждет подписки вечно
+    unreachable = AnalysisPublisher(Broadcaster("redis://127.0.0.1:1"), ConnectionManager(), subscribe_timeout=0.3)
+    with pytest.raises(ConnectionError):
+        await unreachable.start()
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_only_missed_events():
+    """Тест: переподключение с since получает только пропущенные события или resync"""
+    manager = ConnectionManager(replay_size=5)
+    for i in range(7):
+        await manager.broadcast_message({"transaction_id": f"TX{i}"})
+    stream = manager.replay.stream_id
+
+    resumed = FakeWebSocket()
+    manager.resume(manager.register(resumed), since=4, stream=stream)
+    await asyncio.sleep(0.01)
+    hello, *missed = [json.loads(frame) for frame in resumed.received]
+    assert hello == {"type": "hello", "stream": stream, "seq": 7}
+    assert [event["seq"] for event in missed] == [5, 6, 7]
+
+    cases = (
+        (1, stream, "gap too large"), (6, "other", "stream changed"),
+        (6, None, "stream required"), (9, stream, "ahead of stream"),
+    )
+    for since, other_stream, reason in cases:
+        websocket = FakeWebSocket()
+        manager.resume(manager.register(websocket), since=since, stream=other_stream)
+        await asyncio.sleep(0.01)
+        resync = json.loads(websocket.received[-1])
+        assert (resync["type"], resync["reason"]) == ("resync", reason)
+        assert (resync["oldest_seq"], resync["latest_seq"]) == (3, 7)
+        manager.disconnect(websocket)
+
+    manager.disconnect(resumed)
+
+
+@pytest.mark.asyncio
+async def test_binary_clients_receive_batched_frames(monkeypatch):
+    """Тест: клиенты бинарного подпротокола получают пакетные бинарные кадры"""
+    monkeypatch.setattr(settings, "WS_BINARY_FRAME_INTERVAL_MS", 20)
+    manager = ConnectionManager()
+    binary, text = FakeWebSocket(), FakeWebSocket()
+    manager.register(binary, binary=True)
+    manager.register(text)
+
+    for i in range(3):
+        await manager.broadcast_message({
+            "transaction_id": f"TX{i}", "risk_score": 91.25, "probability": 0.8731, "is_fraud": True,
+            "timestamp": "2024-01-01T00:00:00+00:00", "transaction_type": "TRANSFER",
+            "merchant": "M1", "risk_level": "CRITICAL",
+        })
+    await asyncio.sleep(0.1)
+
+    assert len(text.received) == 3
+    [frame] = binary.received
+    assert isinstance(frame, bytes)
+    assert len(frame) < sum(len(message) for message in text.received) / 2
+    events = decode_frame(frame)["events"]
+    assert [event["seq"] for event in events] == [1, 2, 3]
+    assert events[0] == {
+        "seq": 1, "timestamp_ms": 1704067200000, "risk_score": 91.25, "probability": 0.8731,
+        "is_fraud": True, "risk_level": "CRITICAL", "transaction_type": "TRANSFER",
+        "transaction_id": "TX0", "merchant": "M1",
+    }
+
+    manager.disconnect(binary)
+    manager.disconnect(text)
+    assert not manager.groups
+
+
+def test_binary_strings_are_trimmed_on_character_boundary():
+    """Тест: строка длиннее 255 байт обрезается по границе символа UTF-8"""
+    merchant = "я" * 200  # 400 байт
+    frame = encode_batch([encode_event({
+        "transaction_id": "TX1", "risk_score": 10.0, "probability": 0.1, "is_fraud": False,
+        "timestamp": 0, "merchant": merchant,
+    })])
+    [event] = decode_frame(frame)["events"]
+    assert event["merchant"] == "я" * 127